@@ -2,8 +2,18 @@
 # Copyright (C) 2019 Checkmk GmbH - License: GNU General Public License v2
 # This file is part of Checkmk (https://checkmk.com). It is subject to the terms and
 # conditions defined in the file COPYING, which is part of this source code package.
+"""The value stores of the plugins
+
+The values of a host are stored in a binary file, see `_JournaledDiskSyncedMapping`.
+Every value is encoded on its own, see `_encode_value`: Floats, ints, strings, booleans, None
+and tuples or lists thereof are stored binary, all other values as their `repr()`.
+"""
 
 import json
+import math
+import os
+import pickle
+import struct
 from ast import literal_eval
 from collections.abc import (
     Callable,
@@ -13,10 +23,11 @@ from collections.abc import (
     Iterator,
     Mapping,
     MutableMapping,
+    Sequence,
 )
 from contextlib import contextmanager
 from pathlib import Path
-from typing import Any, Final, TypeVar
+from typing import Any, cast, Final, TypeVar
 
 from cmk.ccc import store
 from cmk.ccc.exceptions import MKGeneralException
@@ -37,6 +48,142 @@ _TKey = TypeVar("_TKey", bound=Hashable)
 _TValue = TypeVar("_TValue")
 _TDefault = TypeVar("_TDefault")
 
+_MAGIC: Final = b"CMKVS\x01"
+_GENERATION_SIZE: Final = 16
+_FRAME_SIZE: Final = struct.Struct("<I")
+_INT32: Final = struct.Struct("<i")
+_INT64: Final = struct.Struct("<q")
+_FLOAT64: Final = struct.Struct("<d")
+_SIZE: Final = struct.Struct("<H")
+_ENCODING: Final = "utf-8"
+_ERRORS: Final = "surrogatepass"
+
+
+class _NotEncodable(Exception):
+    pass
+
+
+def _encode_native(buffer: bytearray, value: object) -> None:
+    # Only exact types: The repr of subclasses (enums, HostName, ...) is read back as base type.
+    if type(value) is float and math.isfinite(value):
+        buffer += b"f"
+        buffer += _FLOAT64.pack(value)
+    elif type(value) is int and -(2**31) <= value < 2**31:
+        buffer += b"i"
+        buffer += _INT32.pack(value)
+    elif type(value) is int and -(2**63) <= value < 2**63:
+        buffer += b"q"
+        buffer += _INT64.pack(value)
+    elif type(value) is str and len(encoded := value.encode(_ENCODING, _ERRORS)) < 2**16:
+        buffer += b"s"
+        buffer += _SIZE.pack(len(encoded))
+        buffer += encoded
+    elif (type(value) is tuple or type(value) is list) and len(value) < 2**16:
+        buffer += b"t" if type(value) is tuple else b"l"
+        buffer += _SIZE.pack(len(value))
+        for item in value:
+            _encode_native(buffer, item)
+    elif value is None:
+        buffer += b"N"
+    elif value is True:
+        buffer += b"T"
+    elif value is False:
+        buffer += b"F"
+    else:
+        raise _NotEncodable()
+
+
+def _encode_value(value: object) -> bytes:
+    """Encode a value of a value store
+
+    All values that can be stored are read back as `literal_eval(repr(value))` would,
+    values that can not be read back (e.g. `float("inf")`) are read as their `repr()`
+    and fail when they are read.
+    """
+    buffer = bytearray()
+    try:
+        _encode_native(buffer, value)
+    except _NotEncodable:
+        return b"r" + repr(value).encode(_ENCODING)
+    return bytes(buffer)
+
+
+def _decode_native(raw: bytes, pos: int) -> tuple[Any, int]:
+    tag = raw[pos]
+    pos += 1
+    if tag == 0x66:  # f
+        return _FLOAT64.unpack_from(raw, pos)[0], pos + _FLOAT64.size
+    if tag == 0x69:  # i
+        return _INT32.unpack_from(raw, pos)[0], pos + _INT32.size
+    if tag == 0x71:  # q
+        return _INT64.unpack_from(raw, pos)[0], pos + _INT64.size
+    if tag == 0x73:  # s
+        (size,) = _SIZE.unpack_from(raw, pos)
+        pos += _SIZE.size
+        return str(raw[pos : pos + size], _ENCODING, _ERRORS), pos + size
+    if tag == 0x74 or tag == 0x6C:  # t, l
+        (size,) = _SIZE.unpack_from(raw, pos)
+        pos += _SIZE.size
+        items = []
+        for _ in range(size):
+            item, pos = _decode_native(raw, pos)
+            items.append(item)
+        return (tuple(items) if tag == 0x74 else items), pos
+    if tag == 0x4E:  # N
+        return None, pos
+    if tag == 0x54:  # T
+        return True, pos
+    if tag == 0x46:  # F
+        return False, pos
+    raise ValueError(f"invalid value store value: {raw!r}")
+
+
+def _decode_value(raw: bytes) -> Any:
+    if raw[:1] == b"r":
+        return literal_eval(raw[1:].decode(_ENCODING))
+    value, _pos = _decode_native(raw, 0)
+    return value
+
+
+_Frame = tuple[Sequence[_ValueStoreKey], Mapping[_ValueStoreKey, bytes]]
+
+
+def _encode_frame(
+    removed: Sequence[_ValueStoreKey], updated: Mapping[_ValueStoreKey, bytes]
+) -> bytes:
+    frame: _Frame = (removed, updated)
+    encoded = pickle.dumps(frame, protocol=pickle.HIGHEST_PROTOCOL)
+    return _FRAME_SIZE.pack(len(encoded)) + encoded
+
+
+def _decode_frames(data: bytes, values: dict[_ValueStoreKey, bytes]) -> tuple[int, int]:
+    """Apply the frames to the values
+
+    Returns the size of all complete frames and the number of changes in them.
+    A frame at the end is incomplete if writing it has been interrupted.
+    """
+    pos = count = 0
+    while pos + _FRAME_SIZE.size <= len(data):
+        start = pos + _FRAME_SIZE.size
+        end = start + _FRAME_SIZE.unpack_from(data, pos)[0]
+        if end > len(data):
+            break
+        removed, updated = cast(_Frame, pickle.loads(data[start:end]))
+        for key in removed:
+            values.pop(key, None)
+        values.update(updated)
+        count += len(removed) + len(updated)
+        pos = end
+    return pos, count
+
+
+def _plain_key(key: _ValueStoreKey) -> _ValueStoreKey:
+    # Unpickling a HostName would validate it again.
+    host_name, plugin_name, item, user_key = key
+    if type(host_name) is str:
+        return key
+    return (cast(HostName, str(host_name)), plugin_name, item, user_key)
+
 
 class _DynamicDiskSyncedMapping(dict[_TKey, _TValue]):
     """Represents the values that have been changed in a session
@@ -67,35 +214,38 @@ class _DynamicDiskSyncedMapping(dict[_TKey, _TValue]):
         return super().pop(key, *args)
 
 
-class _StaticDiskSyncedMapping(Mapping[_TKey, _TValue]):
-    """Represents the values stored on disk
+class _JournaledDiskSyncedMapping(Mapping[_ValueStoreKey, bytes]):
+    """Represents the values stored on disk in a binary journal
 
-    This class provides a Mapping-interface for the values stored
-    on disk.
+    The file starts with `_MAGIC` and a random generation id, followed by frames
+    of changes (removed keys and updated values), see `_encode_frame`. Changes
+    are appended to the file as a new frame, the file is compacted (rewritten as
+    a single frame of the current values with a new generation id) when the
+    outdated changes outweigh the current values.
 
-    The only way to modify the values is the disksync method.
+    A file of the same generation as at the last sync is only read from the last
+    known position. Unlike the inode, the generation id is never reused by a
+    replaced file. Files in the former JSON format are read and compacted upon
+    the next change.
     """
 
-    def __init__(
-        self,
-        *,
-        path: Path,
-        log_debug: Callable[[str], None],
-        serializer: Callable[[Mapping[_TKey, _TValue]], str],
-        deserializer: Callable[[str], Mapping[_TKey, _TValue]],
-    ) -> None:
+    _COMPACTION_RATIO: Final = 4
+    _COMPACTION_MIN_CHANGES: Final = 64
+
+    def __init__(self, *, path: Path, log_debug: Callable[[str], None]) -> None:
         self._path: Final = path
-        self._last_sync: float | None = None
-        self._data: Mapping[_TKey, _TValue] = {}
-        self._log_debug = log_debug
-        self._serializer: Final = serializer
-        self._deserializer: Final = deserializer
+        self._log_debug: Final = log_debug
+        self._data: dict[_ValueStoreKey, bytes] = {}
+        self._generation: bytes | None = None
+        self._offset = 0
+        self._changes = 0
+        self._compact = False
         self.disksync()
 
-    def __getitem__(self, key: _TKey) -> _TValue:
+    def __getitem__(self, key: _ValueStoreKey) -> bytes:
         return self._data.__getitem__(key)
 
-    def __iter__(self) -> Iterator[_TKey]:
+    def __iter__(self) -> Iterator[_ValueStoreKey]:
         return self._data.__iter__()
 
     def __len__(self) -> int:
@@ -104,14 +254,11 @@ class _StaticDiskSyncedMapping(Mapping[_TKey, _TValue]):
     def disksync(
         self,
         *,
-        removed: Container[_TKey] = (),
-        updated: Collection[tuple[_TKey, _TValue]] = (),
+        removed: Container[_ValueStoreKey] = (),
+        updated: Collection[tuple[_ValueStoreKey, bytes]] = (),
     ) -> None:
         """Re-load and write the changes of the stored values
 
-        This method will reload the values from disk, apply the changes (remove keys
-        and update values) as specified by the arguments, and then write the result to disk.
-
         When this method returns, the data provided via the Mapping-interface and
         the data stored on disk must be in sync.
         """
@@ -121,67 +268,126 @@ class _StaticDiskSyncedMapping(Mapping[_TKey, _TValue]):
 
         with store.locked(self._path):
             try:
-                if self._path.stat().st_mtime == self._last_sync:
-                    self._log_debug("already loaded")
+                self._load()
+                removed_keys, updated_values = self._apply(removed, updated)
+                if not removed_keys and not updated_values:
+                    return
+                changes = len(removed_keys) + len(updated_values)
+                if self._compact or self._changes + changes > (
+                    self._COMPACTION_RATIO * len(self._data) + self._COMPACTION_MIN_CHANGES
+                ):
+                    self._log_debug("compacting")
+                    self._write_all()
                 else:
-                    self._log_debug("loading from disk")
-                    self._data = (
-                        self._deserializer(content)
-                        if (content := store.load_text_from_file(self._path, lock=False).strip())
-                        else {}
-                    )
-
-                if removed or updated:
-                    data = {k: v for k, v in self._data.items() if k not in removed}
-                    data.update(updated)
                     self._log_debug("writing to disk")
-                    store.save_text_to_file(self._path, self._serializer(data))
-                    self._data = data
-
-                self._last_sync = self._path.stat().st_mtime
+                    self._append(_encode_frame(removed_keys, updated_values), changes)
             except Exception as exc:
                 raise MKGeneralException from exc
 
+    def _load(self) -> None:
+        with self._path.open("rb") as f:
+            header = f.read(len(_MAGIC) + _GENERATION_SIZE)
+            if (
+                self._generation is not None
+                and header == _MAGIC + self._generation
+                and os.fstat(f.fileno()).st_size >= self._offset
+            ):
+                f.seek(self._offset)
+                if changes := f.read():
+                    self._log_debug("loading changes from disk")
+                    self._read_frames(changes)
+                else:
+                    self._log_debug("already loaded")
+                return
+
+            self._log_debug("loading from disk")
+            content = header + f.read()
+
+        self._data = {}
+        self._changes = 0
+        self._compact = False
+        if content.startswith(_MAGIC) and len(header) == len(_MAGIC) + _GENERATION_SIZE:
+            self._generation = header[len(_MAGIC) :]
+            self._offset = len(header)
+            self._read_frames(content[len(header) :])
+        elif content.strip():
+            self._data = {tuple(k): b"r" + v.encode(_ENCODING) for k, v in json.loads(content)}
+            self._generation = None
+            self._offset = len(content)
+            self._compact = True
+        else:
+            self._generation = None
+            self._offset = 0
+            self._compact = True
+
+    def _read_frames(self, data: bytes) -> None:
+        size, changes = _decode_frames(data, self._data)
+        self._offset += size
+        self._changes += changes
+        if size < len(data):
+            self._log_debug("ignoring incomplete changes")
+            self._compact = True
+
+    def _apply(
+        self,
+        removed: Container[_ValueStoreKey],
+        updated: Collection[tuple[_ValueStoreKey, bytes]],
+    ) -> tuple[list[_ValueStoreKey], dict[_ValueStoreKey, bytes]]:
+        removed_keys = [k for k in self._data if k in removed]
+        for key in removed_keys:
+            del self._data[key]
+        updated_values = {
+            _plain_key(key): value for key, value in updated if self._data.get(key) != value
+        }
+        self._data.update(updated_values)
+        return removed_keys, updated_values
+
+    def _append(self, frame: bytes, changes: int) -> None:
+        with self._path.open("ab") as f:
+            f.write(frame)
+        self._offset += len(frame)
+        self._changes += changes
+
+    def _write_all(self) -> None:
+        generation = os.urandom(_GENERATION_SIZE)
+        content = _MAGIC + generation + _encode_frame((), self._data)
+        # We hold the lock on the file, so no one else writes the temporary file.
+        tmp_path = self._path.with_name(f".{self._path.name}.new")
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o660)
+        try:
+            with open(fd, "wb", closefd=False) as f:
+                f.write(content)
+        finally:
+            os.close(fd)
+        tmp_path.rename(self._path)
+        self._generation = generation
+        self._offset = len(content)
+        self._changes = len(self._data)
+        self._compact = False
 
-class _DiskSyncedMapping(MutableMapping[_TKey, _TValue]):  # pylint: disable=too-many-ancestors
-    """Implements the overlay logic between dynamic and static value store"""
 
-    @classmethod
-    def make(
-        cls,
-        *,
-        path: Path,
-        log_debug: Callable[[str], None],
-        serializer: Callable[[Mapping[_TKey, _TValue]], str],
-        deserializer: Callable[[str], Mapping[_TKey, _TValue]],
-    ) -> "_DiskSyncedMapping":
-        return cls(
-            dynamic=_DynamicDiskSyncedMapping(),
-            static=_StaticDiskSyncedMapping(
-                path=path,
-                log_debug=log_debug,
-                serializer=serializer,
-                deserializer=deserializer,
-            ),
-        )
+class _DiskSyncedMapping(  # pylint: disable=too-many-ancestors
+    MutableMapping[_ValueStoreKey, bytes]
+):
+    """Implements the overlay logic between dynamic and static value store"""
 
     def __init__(
         self,
         *,
-        dynamic: _DynamicDiskSyncedMapping[_TKey, _TValue],
-        static: _StaticDiskSyncedMapping[_TKey, _TValue],
+        dynamic: _DynamicDiskSyncedMapping[_ValueStoreKey, bytes],
+        static: _JournaledDiskSyncedMapping,
     ) -> None:
         self._dynamic = dynamic
         self.static = static
 
-    def _keys(self) -> set[_TKey]:
+    def _keys(self) -> set[_ValueStoreKey]:
         return {
             k
             for k in (set(self._dynamic) | set(self.static))
             if k not in self._dynamic.removed_keys
         }
 
-    def __getitem__(self, key: _TKey) -> _TValue:
+    def __getitem__(self, key: _ValueStoreKey) -> bytes:
         if key in self._dynamic.removed_keys:
             raise KeyError(key)
         try:
@@ -189,7 +395,7 @@ class _DiskSyncedMapping(MutableMapping[_TKey, _TValue]):  # pylint: disable=too
         except KeyError:
             return self.static.__getitem__(key)
 
-    def __delitem__(self, key: _TKey) -> None:
+    def __delitem__(self, key: _ValueStoreKey) -> None:
         if key in self._dynamic.removed_keys:
             raise KeyError(key)
         try:
@@ -198,17 +404,17 @@ class _DiskSyncedMapping(MutableMapping[_TKey, _TValue]):  # pylint: disable=too
         except KeyError:
             _ = self.static[key]
 
-    def pop(self, key: _TKey, *args: _TValue | _TDefault) -> _TValue | _TDefault:
+    def pop(self, key: _ValueStoreKey, *args: bytes | _TDefault) -> bytes | _TDefault:
         try:
             return self._dynamic.pop(key)
             # key is now marked as removed.
         except KeyError:
             return self.static[key] if key in self.static else args[0]
 
-    def __setitem__(self, key: _TKey, value: _TValue) -> None:
+    def __setitem__(self, key: _ValueStoreKey, value: bytes) -> None:
         self._dynamic.__setitem__(key, value)
 
-    def __iter__(self) -> Iterator[_TKey]:
+    def __iter__(self) -> Iterator[_ValueStoreKey]:
         return iter(self._keys())
 
     def __len__(self) -> int:
@@ -233,7 +439,7 @@ class _ValueStore(MutableMapping[_UserKey, Any]):  # pylint: disable=too-many-an
     def __init__(
         self,
         *,
-        data: MutableMapping[_ValueStoreKey, str],
+        data: MutableMapping[_ValueStoreKey, bytes],
         service_id: tuple[CheckPluginName, Item],
         host_name: HostName,
     ) -> None:
@@ -251,7 +457,7 @@ class _ValueStore(MutableMapping[_UserKey, Any]):  # pylint: disable=too-many-an
         This is called in the plugins scope, so deserialization
         should only fail here, not for the whole value store file.
         """
-        return literal_eval(self._data.__getitem__(self._map_key(key)))
+        return _decode_value(self._data.__getitem__(self._map_key(key)))
 
     def __setitem__(self, key: _UserKey, value: Any) -> Any:
         """
@@ -260,7 +466,7 @@ class _ValueStore(MutableMapping[_UserKey, Any]):  # pylint: disable=too-many-an
         and failure to (de)serialize individual values will only affect the
         offending plugin.
         """
-        return self._data.__setitem__(self._map_key(key), repr(value))
+        return self._data.__setitem__(self._map_key(key), _encode_value(value))
 
     def __delitem__(self, key: _UserKey) -> Any:
         return self._data.__delitem__(self._map_key(key))
@@ -292,11 +498,12 @@ class ValueStoreManager:
     STORAGE_PATH = Path(cmk.utils.paths.counters_dir)
 
     def __init__(self, host_name: HostName) -> None:
-        self._value_store: _DiskSyncedMapping[_ValueStoreKey, str] = _DiskSyncedMapping.make(
-            path=self.STORAGE_PATH / host_name,
-            log_debug=lambda x: logger.debug("value store: %s", x),
-            serializer=lambda d: json.dumps(list(d.items())),
-            deserializer=lambda raw: {tuple(k): v for k, v in json.loads(raw)},
+        self._value_store = _DiskSyncedMapping(
+            dynamic=_DynamicDiskSyncedMapping(),
+            static=_JournaledDiskSyncedMapping(
+                path=self.STORAGE_PATH / host_name,
+                log_debug=lambda x: logger.debug("value store: %s", x),
+            ),
         )
         self.active_service_interface: MutableMapping[str, Any] | None = None
         self._host_name = host_name
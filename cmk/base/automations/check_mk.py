@@ -1681,6 +1681,7 @@ class AutomationDeleteHosts(ABCDeleteHosts, Automation):
             f"{discovered_host_labels_dir}/{hostname}.mk",
             f"{tcp_cache_dir}/{hostname}",
             f"{var_dir}/persisted/{hostname}",
+            f"{var_dir}/persisted/{hostname}.lock",
             f"{var_dir}/inventory/{hostname}",
             f"{var_dir}/inventory/{hostname}.gz",
             f"{var_dir}/agent_deployment/{hostname}",
@@ -1722,6 +1723,7 @@ class AutomationDeleteHostsKnownRemote(ABCDeleteHosts, Automation):
             f"{counters_dir}/{hostname}",
             f"{tcp_cache_dir}/{hostname}",
             f"{var_dir}/persisted/{hostname}",
+            f"{var_dir}/persisted/{hostname}.lock",
             f"{var_dir}/inventory/{hostname}",
             f"{var_dir}/inventory/{hostname}.gz",
         ]
@@ -7,9 +7,11 @@
 
 from __future__ import annotations
 
+import atexit
 import functools
 import itertools
 import logging
+import os
 import time
 from collections.abc import Callable, Container, Iterable, Iterator, Mapping, Sequence
 from dataclasses import dataclass
@@ -41,7 +43,15 @@ from cmk.utils.timeperiod import timeperiod_active
 
 from cmk.snmplib import SNMPBackendEnum, SNMPRawData
 
-from cmk.fetchers import Fetcher, get_raw_data, Mode, SNMPScanConfig, TLSConfig
+from cmk.fetchers import (
+    Fetcher,
+    get_raw_data,
+    Mode,
+    SNMPFetcher,
+    SNMPFetchScheduler,
+    SNMPScanConfig,
+    TLSConfig,
+)
 from cmk.fetchers.config import make_persisted_section_dir
 from cmk.fetchers.filecache import FileCache, FileCacheOptions, MaxAge
 
@@ -129,15 +139,73 @@ def _fetch_all(
     ]
 ]:
     console.verbose(f"{tty.yellow}+{tty.normal} FETCHING DATA")
-    return [
-        _do_fetch(
+    fetches = [
+        (
             source.source_info(),
             source.file_cache(simulation=simulation, file_cache_options=file_cache_options),
             source.fetcher(),
-            mode=mode,
         )
         for source in sources
     ]
+    scheduled: dict[int, tuple[SourceInfo, FileCache[SNMPRawData], SNMPFetcher]] = {}
+    for index, (source_info, file_cache, fetcher) in enumerate(fetches):
+        if (
+            isinstance(fetcher, SNMPFetcher)
+            and fetcher.snmp_config.snmp_backend is SNMPBackendEnum.ASYNC
+        ):
+            scheduled[index] = (source_info, file_cache, fetcher)
+    if len(scheduled) < 2:
+        return [_do_fetch(*fetch, mode=mode) for fetch in fetches]
+
+    # Cluster nodes and management boards: fetch all the devices at once.
+    fetched = dict(zip(scheduled, _do_fetch_scheduled(list(scheduled.values()), mode=mode)))
+    return [
+        fetched[index] if index in fetched else _do_fetch(*fetch, mode=mode)
+        for index, fetch in enumerate(fetches)
+    ]
+
+
+def _do_fetch_scheduled(
+    fetches: Sequence[tuple[SourceInfo, FileCache[SNMPRawData], SNMPFetcher]], *, mode: Mode
+) -> Sequence[
+    tuple[
+        SourceInfo,
+        result.Result[AgentRawData | SNMPRawData, Exception],
+        Snapshot,
+    ]
+]:
+    console.debug(f"  Sources: {', '.join(str(source_info) for source_info, *_ in fetches)}")
+    scheduler = _snmp_fetch_scheduler()
+    with CPUTracker(console.debug) as tracker:
+        raw_data = scheduler.fetch(
+            [(file_cache, fetcher) for _source_info, file_cache, fetcher in fetches], mode
+        )
+    # The CPU time of the concurrent fetches is accounted to the first one only.
+    return [
+        (source_info, fetched, tracker.duration if index == 0 else Snapshot.null())
+        for index, ((source_info, *_), fetched) in enumerate(zip(fetches, raw_data))
+    ]
+
+
+_scheduler: tuple[int, SNMPFetchScheduler] | None = None
+
+
+def _snmp_fetch_scheduler() -> SNMPFetchScheduler:
+    """The scheduler of this process, started on first use and shut down at exit
+
+    A forked process does not inherit the threads of the scheduler, it starts its own.
+    """
+    global _scheduler
+    if _scheduler is None or _scheduler[0] != os.getpid():
+        scheduler = SNMPFetchScheduler(logging.getLogger("cmk.helper.snmp")).__enter__()
+        atexit.register(_shut_down_scheduler, os.getpid(), scheduler)
+        _scheduler = os.getpid(), scheduler
+    return _scheduler[1]
+
+
+def _shut_down_scheduler(pid: int, scheduler: SNMPFetchScheduler) -> None:
+    if os.getpid() == pid:
+        scheduler.__exit__(None, None, None)
 
 
 def _do_fetch(
@@ -413,6 +481,8 @@ class CMKFetcher:
                             ),
                             on_error=self.on_error if not is_cluster else OnError.RAISE,
                             oid_cache_dir=Path(cmk.utils.paths.snmp_scan_cache_dir),
+                            # A full rescan detects all sections of the device again.
+                            use_detection_cache=not self.force_snmp_cache_refresh,
                         ),
                         selected_sections=(
                             self.selected_sections if not is_cluster else NO_SELECTION
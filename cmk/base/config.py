@@ -14,6 +14,7 @@ import ipaddress
 import itertools
 import logging
 import marshal
+import mmap
 import numbers
 import os
 import pickle
@@ -22,6 +23,7 @@ import socket
 import struct
 import sys
 import time
+from array import array
 from collections.abc import Callable, Container, Iterable, Iterator, Mapping, Sequence
 from enum import Enum
 from importlib.util import MAGIC_NUMBER as _MAGIC_NUMBER
@@ -30,6 +32,7 @@ from typing import (
     Any,
     AnyStr,
     assert_never,
+    cast,
     Final,
     Generic,
     Literal,
@@ -847,8 +850,63 @@ class PackedConfigGenerator:
         return helper_config
 
 
+class _PackedHostValues(Mapping[HostName, Any]):
+    """The values of a host keyed config variable, unpickled on access"""
+
+    def __init__(self, data: memoryview, hosts: Sequence[HostName], offsets: array[int]) -> None:
+        self._data: Final = data
+        self._hosts: Final = hosts
+        self._offsets: Final = offsets
+        self._positions: dict[HostName, int] | None = None
+        self._values: dict[HostName, Any] = {}
+
+    def _position(self, host_name: HostName) -> int:
+        if self._positions is None:
+            self._positions = {h: i for i, h in enumerate(self._hosts)}
+        return self._positions[host_name]
+
+    def __getitem__(self, host_name: HostName) -> Any:
+        with contextlib.suppress(KeyError):
+            return self._values[host_name]
+        i = self._position(host_name)
+        value = self._values[host_name] = pickle.loads(  # nosec B301 # BNS:c3c5e9
+            self._data[self._offsets[i] : self._offsets[i + 1]]
+        )
+        return value
+
+    def __contains__(self, host_name: object) -> bool:
+        try:
+            self._position(host_name)  # type: ignore[arg-type]
+        except KeyError:
+            return False
+        return True
+
+    def __iter__(self) -> Iterator[HostName]:
+        return iter(self._hosts)
+
+    def __len__(self) -> int:
+        return len(self._hosts)
+
+
 class PackedConfigStore:
-    """Caring about persistence of the packed configuration"""
+    """Caring about persistence of the packed configuration
+
+    The file starts with the global part of the configuration. The values of the
+    host keyed variables (see `_PER_HOST_VARIABLES`) follow as separately pickled
+    slices, one per host. The file is mapped into memory (and shared between the
+    helpers by the page cache). A helper only unpickles the slices of the hosts it
+    actually looks up.
+    """
+
+    _MAGIC: Final = b"CMKPACK\x01"
+    _HEADER: Final = struct.Struct("<Q")
+    _PER_HOST_VARIABLES: Final = (
+        "host_attributes",
+        "host_labels",
+        "ipaddresses",
+        "ipv6addresses",
+        "explicit_snmp_communities",
+    )
 
     def __init__(self, path: Path) -> None:
         self.path: Final = path
@@ -862,15 +920,52 @@ class PackedConfigStore:
         return Path(config_path) / "precompiled_check_config.mk"
 
     def write(self, helper_config: Mapping[str, Any]) -> None:
+        global_part = dict(helper_config)
+        index: dict[str, tuple[str, bytes]] = {}
+        slices: list[bytes] = []
+        offset = 0
+        for varname in self._PER_HOST_VARIABLES:
+            if not isinstance(values := global_part.get(varname), dict):
+                continue
+            del global_part[varname]
+            offsets = array("Q", [offset])
+            for value in values.values():
+                slices.append(pickle.dumps(value))
+                offset += len(slices[-1])
+                offsets.append(offset)
+            # One string is much faster to unpickle than many `HostName` objects
+            index[varname] = ("\0".join(values), offsets.tobytes())
+
+        packed_global = pickle.dumps((global_part, index))
         self.path.parent.mkdir(parents=True, exist_ok=True)
         tmp_path = self.path.with_suffix(f"{self.path.suffix}.compiled")
         with tmp_path.open("wb") as compiled_file:
-            pickle.dump(helper_config, compiled_file)
+            compiled_file.write(self._MAGIC + self._HEADER.pack(len(packed_global)))
+            compiled_file.write(packed_global)
+            compiled_file.writelines(slices)
         tmp_path.rename(self.path)
 
     def read(self) -> Mapping[str, Any]:
         with self.path.open("rb") as f:
-            return pickle.load(f)  # nosec B301 # BNS:c3c5e9
+            if f.read(len(self._MAGIC)) != self._MAGIC:
+                f.seek(0)
+                return pickle.load(f)  # nosec B301 # BNS:c3c5e9
+            # The mapping stays valid when the file is replaced by the next activation.
+            data = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+        start = len(self._MAGIC) + self._HEADER.size
+        (global_size,) = self._HEADER.unpack_from(data, len(self._MAGIC))
+        helper_config, index = pickle.loads(  # nosec B301 # BNS:c3c5e9
+            data[start : start + global_size]
+        )
+        slices = data[start + global_size :]
+        for varname, (hosts, raw_offsets) in index.items():
+            offsets = array("Q")
+            offsets.frombytes(raw_offsets)
+            # The host names have been validated when the config was created
+            host_names = cast(list[HostName], hosts.split("\0") if hosts else [])
+            helper_config[varname] = _PackedHostValues(slices, host_names, offsets)
+        return helper_config
 
 
 @contextlib.contextmanager
@@ -3112,12 +3207,16 @@ class ConfigCache:
                 return SNMPBackendEnum.INLINE
             if host_backend == "classic":
                 return SNMPBackendEnum.CLASSIC
+            if host_backend == "async":
+                return SNMPBackendEnum.ASYNC
             raise MKGeneralException(f"Bad Host SNMP Backend configuration: {host_backend}")
 
         if with_inline_snmp and snmp_backend_default == "inline":
             return SNMPBackendEnum.INLINE
         if snmp_backend_default == "classic":
             return SNMPBackendEnum.CLASSIC
+        if snmp_backend_default == "async":
+            return SNMPBackendEnum.ASYNC
         # Note: in the above case we raise here.
         # I am not sure if this different behavior is intentional.
         return SNMPBackendEnum.CLASSIC
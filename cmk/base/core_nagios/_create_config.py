@@ -6,13 +6,17 @@
 
 import base64
 import itertools
+import multiprocessing
+import re
 import socket
 import sys
+import tempfile
 from collections import Counter
 from collections.abc import Mapping, Sequence
 from contextlib import suppress
 from io import StringIO
-from typing import Any, cast, IO, Literal
+from pathlib import Path
+from typing import Any, cast, Final, IO, Literal, NamedTuple
 
 from cmk.ccc import store
 from cmk.ccc.exceptions import MKGeneralException
@@ -109,6 +113,7 @@ class NagiosCore(core_config.MonitoringCore):
             licensing_handler=licensing_handler,
             passwords=passwords,
             ip_address_of=ip_address_of,
+            processes=config.config_generation_processes,
         )
 
         store.save_text_to_file(cmk.utils.paths.nagios_objects_file, config_buffer.getvalue())
@@ -182,6 +187,7 @@ def create_config(
     licensing_handler: LicensingHandler,
     passwords: Mapping[str, str],
     ip_address_of: config.IPLookup,
+    processes: int = 1,
 ) -> None:
     cfg = NagiosConfig(outfile, hostnames)
 
@@ -189,10 +195,15 @@ def create_config(
 
     licensing_counter = Counter("services")
     all_notify_host_configs: dict[HostName, NotificationHostConfig] = {}
-    for hostname in hostnames:
-        all_notify_host_configs[hostname] = _create_nagios_config_host(
-            cfg, config_cache, hostname, passwords, licensing_counter, ip_address_of
+    if processes > 1 and len(hostnames) > 1:
+        all_notify_host_configs = _create_nagios_config_hosts_sharded(
+            cfg, config_cache, hostnames, passwords, licensing_counter, ip_address_of, processes
         )
+    else:
+        for hostname in hostnames:
+            all_notify_host_configs[hostname] = _create_nagios_config_host(
+                cfg, config_cache, hostname, passwords, licensing_counter, ip_address_of
+            )
 
     _validate_licensing(config_cache.hosts_config, licensing_handler, licensing_counter)
 
@@ -210,6 +221,157 @@ def create_config(
         cfg.write(config.extra_nagios_conf)
 
 
+# Several shards per process even out the differences between the hosts
+_SHARDS_PER_PROCESS: Final = 4
+
+_HOSTCHECK_COMMAND_REF: Final = re.compile(r"^(  check_command +)check-mk-host-custom-(\d+)$", re.M)
+
+
+class _ShardResult(NamedTuple):
+    """Everything a shard collects besides the object definitions"""
+
+    hostgroups_to_define: set[HostgroupName]
+    servicegroups_to_define: set[ServicegroupName]
+    contactgroups_to_define: set[_ContactgroupName]
+    checknames_to_define: set[CheckPluginName]
+    active_checks_to_define: dict[str, str]
+    custom_commands_to_define: set[CoreCommandName]
+    hostcheck_commands_to_define: list[tuple[CoreCommand, str]]
+    num_services: int
+    notify_host_configs: dict[HostName, NotificationHostConfig]
+    warnings: list[str]
+    failed_ip_lookups: dict[HostName, Exception]
+
+
+# Set before the worker processes are forked. They inherit it instead of having
+# the config cache pickled.
+_shard_context: tuple[ConfigCache, Mapping[str, str], config.IPLookup, Path] | None = None
+
+
+def _create_nagios_config_hosts_sharded(
+    cfg: NagiosConfig,
+    config_cache: ConfigCache,
+    hostnames: Sequence[HostName],
+    stored_passwords: Mapping[str, str],
+    license_counter: Counter,
+    ip_address_of: config.IPLookup,
+    processes: int,
+) -> dict[HostName, NotificationHostConfig]:
+    """Creates the host and service definitions in parallel
+
+    The hosts are split into consecutive shards, which are processed by forked worker processes.
+    Each worker writes the definitions of its shard to a file. The shards are then merged in
+    their original order, so the result is identical to creating the definitions one host
+    after the other.
+    """
+    global _shard_context
+
+    shard_size = -(-len(hostnames) // (processes * _SHARDS_PER_PROCESS))
+    shards = [hostnames[i : i + shard_size] for i in range(0, len(hostnames), shard_size)]
+
+    cmk.utils.paths.tmp_dir.mkdir(parents=True, exist_ok=True)
+    all_notify_host_configs: dict[HostName, NotificationHostConfig] = {}
+    with tempfile.TemporaryDirectory(dir=cmk.utils.paths.tmp_dir, prefix="nagios_shards_") as tmp:
+        shard_dir = Path(tmp)
+        _shard_context = (config_cache, stored_passwords, ip_address_of, shard_dir)
+        try:
+            with multiprocessing.get_context("fork").Pool(min(processes, len(shards))) as pool:
+                for shard, result in enumerate(
+                    pool.imap(_create_nagios_config_shard, enumerate(shards))
+                ):
+                    _merge_shard(cfg, _shard_path(shard_dir, shard), result, ip_address_of)
+                    license_counter["services"] += result.num_services
+                    all_notify_host_configs.update(result.notify_host_configs)
+                pool.close()
+                pool.join()
+        finally:
+            _shard_context = None
+
+    return all_notify_host_configs
+
+
+def _shard_path(shard_dir: Path, shard: int) -> Path:
+    return shard_dir / f"{shard:05d}.cfg"
+
+
+def _create_nagios_config_shard(job: tuple[int, Sequence[HostName]]) -> _ShardResult:
+    shard, hostnames = job
+    assert _shard_context is not None
+    config_cache, stored_passwords, ip_address_of, shard_dir = _shard_context
+
+    num_warnings = len(config_warnings.g_configuration_warnings)
+    failed_before = dict(_failed_ip_lookups(ip_address_of))
+    license_counter: Counter = Counter()
+    with _shard_path(shard_dir, shard).open("w", encoding="utf-8") as outfile:
+        cfg = NagiosConfig(outfile, hostnames)
+        notify_host_configs = {
+            hostname: _create_nagios_config_host(
+                cfg, config_cache, hostname, stored_passwords, license_counter, ip_address_of
+            )
+            for hostname in hostnames
+        }
+
+    return _ShardResult(
+        hostgroups_to_define=cfg.hostgroups_to_define,
+        servicegroups_to_define=cfg.servicegroups_to_define,
+        contactgroups_to_define=cfg.contactgroups_to_define,
+        checknames_to_define=cfg.checknames_to_define,
+        active_checks_to_define=cfg.active_checks_to_define,
+        custom_commands_to_define=cfg.custom_commands_to_define,
+        hostcheck_commands_to_define=cfg.hostcheck_commands_to_define,
+        num_services=license_counter["services"],
+        notify_host_configs=notify_host_configs,
+        warnings=config_warnings.g_configuration_warnings[num_warnings:],
+        failed_ip_lookups={
+            host_name: exc
+            for host_name, exc in _failed_ip_lookups(ip_address_of).items()
+            if host_name not in failed_before
+        },
+    )
+
+
+def _failed_ip_lookups(ip_address_of: config.IPLookup) -> Mapping[HostName, Exception]:
+    if isinstance(ip_address_of, config.ConfiguredIPLookup) and isinstance(
+        ip_address_of.error_handler, ip_lookup.CollectFailedHosts
+    ):
+        return ip_address_of.error_handler.failed_ip_lookups
+    return {}
+
+
+def _merge_shard(
+    cfg: NagiosConfig, shard_file: Path, result: _ShardResult, ip_address_of: config.IPLookup
+) -> None:
+    definitions = shard_file.read_text(encoding="utf-8")
+    # The custom host check commands are numbered per shard, continue the numbering
+    if (offset := len(cfg.hostcheck_commands_to_define)) and result.hostcheck_commands_to_define:
+        definitions = _HOSTCHECK_COMMAND_REF.sub(
+            lambda m: m.group(1) + _hostcheck_command_name(int(m.group(2)) + offset),
+            definitions,
+        )
+    cfg.write(definitions)
+
+    cfg.hostgroups_to_define.update(result.hostgroups_to_define)
+    cfg.servicegroups_to_define.update(result.servicegroups_to_define)
+    cfg.contactgroups_to_define.update(result.contactgroups_to_define)
+    cfg.checknames_to_define.update(result.checknames_to_define)
+    cfg.active_checks_to_define.update(result.active_checks_to_define)
+    cfg.custom_commands_to_define.update(result.custom_commands_to_define)
+    cfg.hostcheck_commands_to_define.extend(
+        (_hostcheck_command_name(offset + number), command_line)
+        for number, (_command, command_line) in enumerate(result.hostcheck_commands_to_define, 1)
+    )
+
+    # The workers already printed the warnings, just keep them for the summary
+    config_warnings.g_configuration_warnings.extend(result.warnings)
+    if isinstance(ip_address_of, config.ConfiguredIPLookup):
+        for host_name, exc in result.failed_ip_lookups.items():
+            ip_address_of.error_handler(host_name, exc)
+
+
+def _hostcheck_command_name(number: int) -> CoreCommand:
+    return "check-mk-host-custom-%d" % number
+
+
 def _output_conf_header(cfg: NagiosConfig) -> None:
     cfg.write(
         """#
@@ -290,7 +452,7 @@ def create_nagios_host_spec(  # pylint: disable=too-many-branches
             host_spec[key] = value
 
     def host_check_via_service_status(service: ServiceName) -> CoreCommand:
-        command = "check-mk-host-custom-%d" % (len(cfg.hostcheck_commands_to_define) + 1)
+        command = _hostcheck_command_name(len(cfg.hostcheck_commands_to_define) + 1)
         service_with_hostname = replace_macros_in_str(
             service,
             {"$HOSTNAME$": hostname},
@@ -865,7 +1027,7 @@ def create_nagios_config_commands(cfg: NagiosConfig) -> None:
         cfg.write("\n# ------------------------------------------------------------\n")
         cfg.write("# Dummy check commands and active check commands\n")
         cfg.write("# ------------------------------------------------------------\n\n")
-        for checkname in cfg.checknames_to_define:
+        for checkname in sorted(cfg.checknames_to_define):
             cfg.write(
                 format_nagios_object(
                     "command",
@@ -894,7 +1056,7 @@ def create_nagios_config_commands(cfg: NagiosConfig) -> None:
         )
 
     # custom_checks
-    for command_name in cfg.custom_commands_to_define:
+    for command_name in sorted(cfg.custom_commands_to_define):
         cfg.write(
             format_nagios_object(
                 "command",
@@ -52,6 +52,7 @@ tcp_connect_timeout = 5.0
 tcp_connect_timeouts: list[RuleSpec[float]] = []
 use_dns_cache = True  # prevent DNS by using own cache file
 delay_precompile = False  # delay Python compilation to Nagios execution
+config_generation_processes = 1  # > 1: create the core objects of the hosts in parallel
 restart_locking: Literal["abort", "wait"] | None = "abort"
 check_submission: Literal["file", "pipe"] = "file"
 default_host_group = "check_mk"
@@ -83,7 +84,7 @@ http_proxies: dict[str, dict[str, str]] = {}
 # SNMP communities and encoding
 
 # Global config for SNMP Backend
-snmp_backend_default: Literal["inline", "classic"] = "inline"
+snmp_backend_default: Literal["inline", "classic", "async"] = "inline"
 # Deprecated: Replaced by snmp_backend_hosts
 use_inline_snmp: bool = True
 
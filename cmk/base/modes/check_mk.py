@@ -178,6 +178,8 @@ def parse_snmp_backend(backend: object) -> SNMPBackendEnum | None:
             return SNMPBackendEnum.CLASSIC
         case "stored-walk":
             return SNMPBackendEnum.STORED_WALK
+        case "async":
+            return SNMPBackendEnum.ASYNC
         case _:
             raise ValueError(backend)
 
@@ -312,7 +314,7 @@ _SNMP_BACKEND_OPTION: Final = Option(
     long_option="snmp-backend",
     short_help="Override default SNMP backend",
     argument=True,
-    argument_descr="inline|classic|stored-walk",
+    argument_descr="inline|classic|stored-walk|async",
 )
 
 # .
@@ -6,11 +6,14 @@
 from __future__ import annotations
 
 import ast
+import copy
 import os
 import pickle
+import struct
 import time
+from dataclasses import dataclass
 from pathlib import Path
-from typing import TypedDict
+from typing import Any, BinaryIO, Final, TypedDict
 
 from redis import Redis
 
@@ -26,7 +29,8 @@ from cmk.bi.aggregation import BIAggregation
 from cmk.bi.data_fetcher import BIStructureFetcher, get_cache_dir, SiteProgramStart
 from cmk.bi.lib import SitesCallback
 from cmk.bi.packs import BIAggregationPacks
-from cmk.bi.searcher import BISearcher
+from cmk.bi.rule import BIRule
+from cmk.bi.searcher import BISearcher, HostQuery
 from cmk.bi.trees import BICompiledAggregation, BICompiledRule, FrozenBIInfo
 from cmk.bi.type_defs import frozen_aggregations_dir
 
@@ -37,8 +41,168 @@ class ConfigStatus(TypedDict):
     online_sites: set[SiteProgramStart]
 
 
+class CompilationDependencies(TypedDict):
+    program_starts: set[SiteProgramStart]
+    # The host queries and the referenced hosts of each aggregation
+    aggregations: dict[str, tuple[set[HostQuery], set[str]]]
+
+
+@dataclass
+class CompilationStats:
+    incremental: bool = False
+    num_aggregations: int = 0
+    num_compiled: int = 0
+    num_changed_hosts: int = 0
+    structure_duration: float = 0.0
+    planning_duration: float = 0.0
+    compile_duration: float = 0.0
+    save_duration: float = 0.0
+
+    def __str__(self) -> str:
+        return (
+            f"Compiled {self.num_compiled} of {self.num_aggregations} aggregations "
+            + (
+                f"(incremental, {self.num_changed_hosts} changed hosts)"
+                if self.incremental
+                else "(full)"
+            )
+            + f", structure: {self.structure_duration:.3f}s, planning:"
+            f" {self.planning_duration:.3f}s, compilation: {self.compile_duration:.3f}s,"
+            f" saving: {self.save_duration:.3f}s"
+        )
+
+
 path_compiled_aggregations = Path(get_cache_dir(), "compiled_aggregations")
 
+_FileSignature = tuple[int, int, int]
+# The aggregation without its branches, and the title and file range of each branch
+_AggregationIndex = tuple[dict[str, Any], list[tuple[str, int, int]]]
+
+
+class CompiledAggregationStore:
+    """Lazy access to the compiled aggregations
+
+    A compiled aggregation is stored as an index followed by its separately pickled branches,
+    so a single branch is loaded without unpickling the whole aggregation. The indices and the
+    loaded aggregations are kept across requests as long as their file does not change, so an
+    aggregation is unpickled once per process. The aggregations are shared by all requests and
+    must not be modified. A compilation (which is triggered by changes of the `ConfigStatus`,
+    i.e. the configuration or the program start of a site) replaces the files, so the next
+    access reads the new index and aggregation.
+
+    Files in the former format (the pickled schema of the aggregation) are read as a whole.
+    """
+
+    _MAGIC: Final = b"CMKBI\x01"
+    _HEADER: Final = struct.Struct("<Q")
+
+    def __init__(self, path: Path) -> None:
+        self._path = path
+        self._indices: dict[str, tuple[_FileSignature, _AggregationIndex]] = {}
+        self._aggregations: dict[str, tuple[_FileSignature, BICompiledAggregation]] = {}
+
+    def ids(self) -> list[str]:
+        return [
+            path_object.name
+            for path_object in self._path.iterdir()
+            if not path_object.is_dir() and not path_object.name.endswith(".new")
+        ]
+
+    def get(self, aggr_id: str) -> BICompiledAggregation | None:
+        try:
+            with (self._path / aggr_id).open("rb") as f:
+                signature = self._signature(os.fstat(f.fileno()))
+                cached = self._aggregations.get(aggr_id)
+                if cached is not None and cached[0] == signature:
+                    return cached[1]
+                if (index := self._index(aggr_id, f)) is None:
+                    f.seek(0)
+                    schema = pickle.load(f) if os.fstat(f.fileno()).st_size else None
+                else:
+                    schema = {
+                        **index[0],
+                        "branches": [
+                            pickle.loads(os.pread(f.fileno(), end - start, start))
+                            for _title, start, end in index[1]
+                        ],
+                    }
+        except FileNotFoundError:
+            self._indices.pop(aggr_id, None)
+            self._aggregations.pop(aggr_id, None)
+            return None
+        if schema is None:
+            return None
+        compiled_aggregation = BIAggregation.create_trees_from_schema(schema)
+        self._aggregations[aggr_id] = (signature, compiled_aggregation)
+        return compiled_aggregation
+
+    def get_branch(self, aggr_id: str, branch_title: str) -> BICompiledRule | None:
+        try:
+            with (self._path / aggr_id).open("rb") as f:
+                if (index := self._index(aggr_id, f)) is not None:
+                    for title, start, end in index[1]:
+                        if title == branch_title:
+                            return BIRule.create_tree_from_schema(
+                                pickle.loads(os.pread(f.fileno(), end - start, start))
+                            )
+                    return None
+        except FileNotFoundError:
+            self._indices.pop(aggr_id, None)
+            return None
+
+        if (compiled_aggregation := self.get(aggr_id)) is None:
+            return None
+        for branch in compiled_aggregation.branches:
+            if branch.properties.title == branch_title:
+                return branch
+        return None
+
+    def _index(self, aggr_id: str, f: BinaryIO) -> _AggregationIndex | None:
+        """The index of an aggregation file, None if the file has the former format"""
+        signature = self._signature(os.fstat(f.fileno()))
+        if (cached := self._indices.get(aggr_id)) is not None and cached[0] == signature:
+            return cached[1]
+        self._indices.pop(aggr_id, None)
+        if f.read(len(self._MAGIC)) != self._MAGIC:
+            return None
+        (index_size,) = self._HEADER.unpack(f.read(self._HEADER.size))
+        schema, sizes = pickle.loads(f.read(index_size))
+        ranges = []
+        offset = len(self._MAGIC) + self._HEADER.size + index_size
+        for title, size in sizes:
+            ranges.append((title, offset, offset + size))
+            offset += size
+        self._indices[aggr_id] = (signature, (schema, ranges))
+        return schema, ranges
+
+    def save(self, aggr_id: str, compiled_aggregation: BICompiledAggregation) -> None:
+        schema = compiled_aggregation.serialize()
+        branches = [pickle.dumps(branch) for branch in schema.pop("branches")]
+        packed_index = pickle.dumps(
+            (
+                schema,
+                [
+                    (branch.properties.title, len(packed_branch))
+                    for branch, packed_branch in zip(compiled_aggregation.branches, branches)
+                ],
+            )
+        )
+        store.save_bytes_to_file(
+            self._path / aggr_id,
+            b"".join([self._MAGIC, self._HEADER.pack(len(packed_index)), packed_index, *branches]),
+        )
+
+    def clear(self) -> None:
+        self._indices.clear()
+        self._aggregations.clear()
+
+    @staticmethod
+    def _signature(stat: os.stat_result) -> _FileSignature:
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+compiled_aggregation_store = CompiledAggregationStore(path_compiled_aggregations)
+
 
 class BICompiler:
     def __init__(self, bi_configuration_file: str, sites_callback: SitesCallback) -> None:
@@ -49,9 +213,11 @@ class BICompiler:
         self._compiled_aggregations: dict[str, BICompiledAggregation] = {}
         self._path_compilation_lock = Path(get_cache_dir(), "compilation.LOCK")
         self._path_compilation_timestamp = Path(get_cache_dir(), "last_compilation")
+        self._path_compilation_dependencies = Path(get_cache_dir(), "compilation_dependencies")
         path_compiled_aggregations.mkdir(parents=True, exist_ok=True)
 
         self._redis_client: Redis[str] | None = None
+        self.compilation_stats: CompilationStats | None = None
         self._setup()
 
     def _setup(self) -> None:
@@ -120,17 +286,13 @@ class BICompiler:
         aggr_hint_path.mkdir(exist_ok=True, parents=True)
         (aggr_hint_path / branch_name).touch()
 
-        original_branches = aggregation.branches
-        original_id = aggregation.id
-        try:
-            aggregation.branches = [branch]
-            aggregation.id = self.get_frozen_aggr_id(FrozenBIInfo(aggr_id, branch_name))
-            store.save_object_to_file(
-                self._frozen_branch_file(branch_name), aggregation.serialize()
-            )
-        finally:
-            aggregation.branches = original_branches
-            aggregation.id = original_id
+        # A copy: the aggregation may be shared, see CompiledAggregationStore
+        frozen_aggregation = copy.copy(aggregation)
+        frozen_aggregation.branches = [branch]
+        frozen_aggregation.id = self.get_frozen_aggr_id(FrozenBIInfo(aggr_id, branch_name))
+        store.save_object_to_file(
+            self._frozen_branch_file(branch_name), frozen_aggregation.serialize()
+        )
 
     def _unfreeze_all_branches(self, aggr_id: str) -> None:
         aggr_hint_path = self._frozen_aggr_hint_path(aggr_id)
@@ -181,8 +343,10 @@ class BICompiler:
                         self.get_frozen_aggr_id(frozen_aggregation.frozen_info)
                     ] = frozen_aggregation
 
-            # Remove all branches from the original aggregation, since all of them are now frozen
-            compiled_aggregation.branches = []
+            # Remove all branches from the original aggregation, since all of them are now frozen.
+            # A copy: the aggregation may be shared, see CompiledAggregationStore
+            updated_aggregations[aggr_id] = copy.copy(compiled_aggregation)
+            updated_aggregations[aggr_id].branches = []
 
         if computed_new_frozen_branch:
             self._generate_part_of_aggregation_lookup(updated_aggregations)
@@ -190,17 +354,13 @@ class BICompiler:
         return updated_aggregations
 
     def _load_compiled_aggregations(self) -> None:
-        for path_object in path_compiled_aggregations.iterdir():
-            if path_object.is_dir():
-                continue
-            aggr_id = path_object.name
-            if aggr_id.endswith(".new") or aggr_id in self._compiled_aggregations:
+        for aggr_id in compiled_aggregation_store.ids():
+            if aggr_id in self._compiled_aggregations:
                 continue
 
             self._logger.debug("Loading cached aggregation results %s" % aggr_id)
-            self._compiled_aggregations[aggr_id] = BIAggregation.create_trees_from_schema(
-                store.load_object_from_pickle_file(path_object, default={})
-            )
+            if compiled_aggregation := compiled_aggregation_store.get(aggr_id):
+                self._compiled_aggregations[aggr_id] = compiled_aggregation
 
         self._compiled_aggregations = self._manage_frozen_branches(self._compiled_aggregations)
 
@@ -218,26 +378,67 @@ class BICompiler:
                 self._logger.debug("No compilation required. An other process already compiled it")
                 return
 
+            stats = CompilationStats()
+            start = time.perf_counter()
             self.prepare_for_compilation(current_configstatus["online_sites"])
+            stats.structure_duration = time.perf_counter() - start
 
-            # Compile the raw tree
+            start = time.perf_counter()
             all_aggregations_by_id: dict[str, BIAggregation] = {
                 x.id: x for x in self._bi_packs.get_all_aggregations()
             }
-            for aggregation in all_aggregations_by_id.values():
-                start = time.time()
-                self._compiled_aggregations[aggregation.id] = aggregation.compile(self.bi_searcher)
-                self._logger.debug(f"Compilation of {aggregation.id} took {time.time() - start:f}")
+            dependencies = self._load_compilation_dependencies()
+            aggregations_to_compile = self._aggregations_to_compile(
+                current_configstatus, all_aggregations_by_id, dependencies, stats
+            )
+            stats.num_aggregations = len(all_aggregations_by_id)
+            stats.planning_duration = time.perf_counter() - start
+
+            # Compile the raw tree
+            start = time.perf_counter()
+            new_dependencies: CompilationDependencies = {
+                "program_starts": current_configstatus["online_sites"],
+                "aggregations": {
+                    aggr_id: dependencies["aggregations"][aggr_id]
+                    for aggr_id in all_aggregations_by_id
+                    if aggr_id not in aggregations_to_compile
+                },
+            }
+            for aggr_id in aggregations_to_compile:
+                aggregation_start = time.time()
+                with self.bi_searcher.recording_host_queries() as host_queries:
+                    compiled_aggregation = all_aggregations_by_id[aggr_id].compile(
+                        self.bi_searcher
+                    )
+                self._compiled_aggregations[aggr_id] = compiled_aggregation
+                new_dependencies["aggregations"][aggr_id] = (
+                    host_queries,
+                    {
+                        host_name
+                        for branch in compiled_aggregation.branches
+                        for _site, host_name, _service in branch.required_elements()
+                    },
+                )
+                self._logger.debug(
+                    f"Compilation of {aggr_id} took {time.time() - aggregation_start:f}"
+                )
+            stats.num_compiled = len(aggregations_to_compile)
+            stats.compile_duration = time.perf_counter() - start
             self._verify_aggregation_title_uniqueness(self._compiled_aggregations)
 
-            for aggr_id, compiled_aggr in self._compiled_aggregations.items():
-                start = time.time()
-                result = compiled_aggr.serialize()
+            start = time.perf_counter()
+            for aggr_id in aggregations_to_compile:
+                aggregation_start = time.time()
+                compiled_aggr = self._compiled_aggregations[aggr_id]
+                compiled_aggregation_store.save(aggr_id, compiled_aggr)
                 self._logger.debug(
                     "Schema dump %s took config took %f (%d branches)"
-                    % (aggr_id, time.time() - start, len(compiled_aggr.branches))
+                    % (aggr_id, time.time() - aggregation_start, len(compiled_aggr.branches))
                 )
-                self._save_data(path_compiled_aggregations.joinpath(aggr_id), result)
+            store.save_object_to_pickle_file(self._path_compilation_dependencies, new_dependencies)
+            stats.save_duration = time.perf_counter() - start
+            self.compilation_stats = stats
+            self._logger.info(str(stats))
 
             self._compiled_aggregations = self._manage_frozen_branches(self._compiled_aggregations)
             self._generate_part_of_aggregation_lookup(self._compiled_aggregations)
@@ -249,6 +450,73 @@ class BICompiler:
             str(self._path_compilation_timestamp), str(current_configstatus["configfile_timestamp"])
         )
 
+    def _load_compilation_dependencies(self) -> CompilationDependencies:
+        try:
+            return store.load_object_from_pickle_file(
+                self._path_compilation_dependencies,
+                default={"program_starts": set(), "aggregations": {}},
+            )
+        except Exception as e:
+            self._logger.warning("Can not load the compilation dependencies: %s" % e)
+            return {"program_starts": set(), "aggregations": {}}
+
+    def _aggregations_to_compile(
+        self,
+        current_configstatus: ConfigStatus,
+        all_aggregations_by_id: dict[str, BIAggregation],
+        dependencies: CompilationDependencies,
+        stats: CompilationStats,
+    ) -> list[str]:
+        """Determine the aggregations affected by the changes since the last compilation
+
+        If only the hosts of the sites changed (e.g. a core of a site has been restarted), only
+        aggregations which reference a changed host or have a host query that matches the
+        previous or the current version of a changed host are compiled. Everything is compiled
+        if the configuration changed or the previous structure data is not available anymore.
+        """
+        all_ids = list(all_aggregations_by_id)
+        if current_configstatus["configfile_timestamp"] > self._get_compilation_timestamp():
+            return all_ids
+
+        if set(dependencies["aggregations"]) != set(all_ids):
+            return all_ids
+
+        previous_hosts = self._bi_structure_fetcher.load_cached_hosts(
+            dependencies["program_starts"]
+        )
+        if previous_hosts is None:
+            return all_ids
+
+        for aggr_id in all_ids:
+            if (compiled_aggregation := compiled_aggregation_store.get(aggr_id)) is None:
+                return all_ids
+            self._compiled_aggregations[aggr_id] = compiled_aggregation
+
+        current_hosts = self.bi_searcher.hosts
+        changed_hosts = {
+            host_name
+            for host_name in previous_hosts.keys() | current_hosts.keys()
+            if previous_hosts.get(host_name) != current_hosts.get(host_name)
+        }
+        previous_searcher = BISearcher()
+        previous_searcher.set_hosts(
+            {x: previous_hosts[x] for x in changed_hosts if x in previous_hosts}
+        )
+        current_searcher = BISearcher()
+        current_searcher.set_hosts(
+            {x: current_hosts[x] for x in changed_hosts if x in current_hosts}
+        )
+
+        stats.incremental = True
+        stats.num_changed_hosts = len(changed_hosts)
+        return [
+            aggr_id
+            for aggr_id in all_ids
+            if not changed_hosts.isdisjoint(dependencies["aggregations"][aggr_id][1])
+            or previous_searcher.matches_any_host(dependencies["aggregations"][aggr_id][0])
+            or current_searcher.matches_any_host(dependencies["aggregations"][aggr_id][0])
+        ]
+
     def _cleanup_vanished_aggregations(self) -> None:
         valid_aggregations = list(self._compiled_aggregations.keys())
         for path_object in path_compiled_aggregations.iterdir():
@@ -352,9 +620,6 @@ class BICompiler:
 
         return latest_timestamp
 
-    def _save_data(self, filepath: Path, data: dict) -> None:
-        store.save_bytes_to_file(filepath, pickle.dumps(data))
-
     def _get_redis_client(self) -> Redis[str]:
         if self._redis_client is None:
             self._redis_client = get_redis_client()
@@ -233,9 +233,30 @@ class BIStructureFetcher:
         # ("alias", str),
         # ("name", str),
 
+        self._hosts.update(self._create_host_data(hosts))
+        self._have_sites.add(site_id)
+
+    def load_cached_hosts(
+        self, program_starts: set[SiteProgramStart]
+    ) -> dict[str, BIHostData] | None:
+        """The cached structure of the given program starts, None if some of it is missing"""
+        hosts: dict[str, BIHostData] = {}
+        for site_id, timestamp in program_starts:
+            path = self._path_site_structure_data.joinpath(
+                self._site_data_filename(site_id, timestamp)
+            )
+            try:
+                hosts.update(self._create_host_data(self._marshal_load_data(path)))
+            except (OSError, EOFError, ValueError, TypeError):
+                return None
+        return hosts
+
+    @staticmethod
+    def _create_host_data(hosts: Mapping[HostName, tuple]) -> dict[str, BIHostData]:
+        host_data: dict[str, BIHostData] = {}
         for host_name, values in hosts.items():
             site_id, tags, labels, folder, services, children, parents, alias, name = values
-            self._hosts[host_name] = BIHostData(
+            host_data[host_name] = BIHostData(
                 site_id,
                 tags,
                 labels,
@@ -246,8 +267,7 @@ class BIStructureFetcher:
                 alias,
                 name,
             )
-
-        self._have_sites.add(site_id)
+        return host_data
 
     def cleanup_orphaned_files(self, known_sites: Mapping[SiteId, int]) -> None:
         for path_object, (site_id, timestamp) in self._get_site_data_files():
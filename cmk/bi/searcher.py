@@ -3,13 +3,21 @@
 # This file is part of Checkmk (https://checkmk.com). It is subject to the terms and
 # conditions defined in the file COPYING, which is part of this source code package.
 
-from collections.abc import Iterable, Mapping
+import sys
+from bisect import bisect_left
+from collections.abc import Collection, Iterable, Iterator, Mapping
+from contextlib import contextmanager
 from typing import Any
 
-from cmk.utils.labels import LabelGroups
+from cmk.utils.labels import AndOrNotLiteral, LabelGroups
 from cmk.utils.regex import regex
-from cmk.utils.rulesets.ruleset_matcher import matches_labels, matches_tag_condition, TagCondition
-from cmk.utils.tags import TagGroupID
+from cmk.utils.rulesets.ruleset_matcher import (
+    is_tag_condition_or,
+    matches_labels,
+    matches_tag_condition,
+    TagCondition,
+)
+from cmk.utils.tags import TagGroupID, TagID
 
 from cmk.bi.lib import ABCBISearcher, BIHostData, BIHostSearchMatch, BIServiceSearchMatch
 
@@ -24,6 +32,254 @@ from cmk.bi.lib import ABCBISearcher, BIHostData, BIHostSearchMatch, BIServiceSe
 
 # Search data used by bi_searcher
 
+# The result of a host name regex only depends on the pattern and the host name. The caches are
+# therefore shared by all searchers of the process and survive new compilations, until they
+# exceed _HOST_REGEX_CACHE_LIMIT results (e.g. of vanished hosts or patterns).
+_host_regex_match_cache: dict[str, dict] = {}
+_host_regex_miss_cache: dict[str, dict] = {}
+_HOST_REGEX_CACHE_LIMIT = 1_000_000
+
+# A host selection made during a compilation: the type of the host choice and its pattern
+HostQuery = tuple[str, str]
+
+_REGEX_SPECIAL_CHARACTERS = frozenset(".^$*+?{}[]()|\\")
+
+
+def _is_regex(pattern: str) -> bool:
+    return any(map(lambda x: x in pattern, ["(", ")", "*", "$", "|", "[", "]"]))
+
+
+def _split_alternatives(pattern: str) -> list[str]:
+    alternatives = []
+    depth = 0
+    in_class = False
+    start = 0
+    escaped = False
+    for i, char in enumerate(pattern):
+        if escaped:
+            escaped = False
+        elif char == "\\":
+            escaped = True
+        elif in_class:
+            in_class = char != "]"
+        elif char == "[":
+            in_class = True
+        elif char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+        elif char == "|" and depth == 0:
+            alternatives.append(pattern[start:i])
+            start = i + 1
+    alternatives.append(pattern[start:])
+    return alternatives
+
+
+def _literal_prefix(pattern: str) -> str:
+    prefix = []
+    i = 1 if pattern.startswith("^") else 0
+    while i < len(pattern):
+        if pattern[i] == "\\":
+            if pattern[i + 1 : i + 2].isalnum() or i + 1 == len(pattern):
+                break  # A character class like \d or an anchor like \b
+            char, i = pattern[i + 1], i + 2
+        elif pattern[i] in _REGEX_SPECIAL_CHARACTERS:
+            break
+        else:
+            char, i = pattern[i], i + 1
+
+        quantifier = pattern[i : i + 1]
+        if quantifier in ("*", "?", "{"):
+            break  # The character is optional
+        prefix.append(char)
+        if quantifier == "+":
+            break
+    return "".join(prefix)
+
+
+def literal_prefixes(pattern: str) -> list[str] | None:
+    """The literal prefixes of a regex as used by `re.match`
+
+    Every string matched by the regex starts with one of the prefixes. None if the regex may match
+    strings starting with anything.
+
+    >>> literal_prefixes("Interface 1.*|CPU (load|utilization)")
+    ['Interface 1', 'CPU ']
+    >>> literal_prefixes("ab?c")
+    ['a']
+    >>> literal_prefixes("(?i)abc") is None
+    True
+    """
+    prefixes = []
+    for alternative in _split_alternatives(pattern):
+        if not (prefix := _literal_prefix(alternative)):
+            return None
+        prefixes.append(prefix)
+    return prefixes
+
+
+class _PrefixIndex:
+    """Sorted (key, value) pairs to look up the entries whose key has a given prefix"""
+
+    def __init__(self, entries: Iterable[tuple[str, str]]) -> None:
+        sorted_entries = sorted(entries)
+        self._keys = [key for key, _value in sorted_entries]
+        self._values = [value for _key, value in sorted_entries]
+
+    def _range(self, prefix: str) -> range:
+        start = bisect_left(self._keys, prefix)
+        if (last := ord(prefix[-1])) < sys.maxunicode:
+            # All keys with the prefix are smaller than the prefix with its last character
+            # incremented, all other keys after the start are not.
+            return range(start, bisect_left(self._keys, prefix[:-1] + chr(last + 1), start))
+        end = start
+        while end < len(self._keys) and self._keys[end].startswith(prefix):
+            end += 1
+        return range(start, end)
+
+    def count(self, prefixes: Iterable[str]) -> int:
+        return sum(len(self._range(prefix)) for prefix in prefixes)
+
+    def entries(self, prefixes: Iterable[str]) -> Iterator[tuple[str, str]]:
+        for prefix in prefixes:
+            for i in self._range(prefix):
+                yield self._keys[i], self._values[i]
+
+    def values(self, prefixes: Iterable[str]) -> set[str]:
+        return {value for _key, value in self.entries(prefixes)}
+
+
+def _and_or_not_hosts(
+    given_group_match: set[str], new_single_match: set[str], operator: AndOrNotLiteral
+) -> set[str]:
+    """Like `_and_or_not_group_match` of the ruleset matcher, but for sets of hosts"""
+    match operator:
+        case "and":
+            return given_group_match & new_single_match
+        case "or":
+            return given_group_match | new_single_match
+        case "not":
+            return given_group_match - new_single_match
+
+
+class _SearchIndex:
+    """Inverted indexes of the hosts (and services) of a BISearcher
+
+    The indexes only narrow down the candidates of a search. The search conditions (and regexes)
+    are still evaluated on the candidates, so they are always a superset of the matches.
+    """
+
+    def __init__(self, hosts: Mapping[str, BIHostData]) -> None:
+        self._hosts = hosts
+        self._positions = {host_name: i for i, host_name in enumerate(hosts)}
+        self._all_hosts = set(self._positions)
+        self._tags: dict[tuple[TagGroupID, TagID | None], set[str]] = {}
+        self._labels: dict[tuple[str, str], set[str]] = {}
+        self._folders: dict[str, set[str]] = {}
+        for host_name, host in hosts.items():
+            for tag in host.tags:
+                self._tags.setdefault(tag, set()).add(host_name)
+            for label in host.labels.items():
+                self._labels.setdefault(label, set()).add(host_name)
+            self._folders.setdefault(host.folder, set()).add(host_name)
+        self.names = _PrefixIndex((host_name, host_name) for host_name in hosts)
+        self.aliases = _PrefixIndex((host.alias, host_name) for host_name, host in hosts.items())
+        self._services: _PrefixIndex | None = None
+
+    @property
+    def services(self) -> _PrefixIndex:
+        # By far the biggest index, only built if services are searched
+        if self._services is None:
+            self._services = _PrefixIndex(
+                [
+                    (service_description, host_name)
+                    for host_name, host in self._hosts.items()
+                    for service_description in host.services
+                ]
+            )
+        return self._services
+
+    def hosts_of(self, host_names: Collection[str]) -> list[BIHostData]:
+        """The given hosts in the order of the searcher"""
+        if len(host_names) * 8 < len(self._hosts):
+            return [
+                self._hosts[host_name]
+                for host_name in sorted(host_names, key=self._positions.__getitem__)
+            ]
+        return [host for host_name, host in self._hosts.items() if host_name in host_names]
+
+    def candidates(self, conditions: dict) -> set[str] | None:
+        """The hosts which may match the conditions of a host search, None for all hosts"""
+        candidates: set[str] | None = None
+        for host_names in (
+            self._choice_candidates(conditions["host_choice"]),
+            self._folder_candidates(conditions["host_folder"]),
+            self._tag_candidates(conditions["host_tags"]),
+            self._label_candidates(conditions["host_label_groups"]),
+        ):
+            if host_names is not None:
+                candidates = host_names if candidates is None else candidates & host_names
+        return candidates
+
+    def _choice_candidates(self, condition: dict) -> set[str] | None:
+        if condition["type"] == "host_name_regex":
+            if not _is_regex(pattern := condition["pattern"]):
+                return {pattern} & self._all_hosts
+            if (prefixes := literal_prefixes(pattern)) is not None:
+                return self.names.values(prefixes)
+        elif condition["type"] == "host_alias_regex":
+            if (prefixes := literal_prefixes(condition["pattern"])) is not None:
+                return self.aliases.values(prefixes)
+        return None
+
+    def _folder_candidates(self, folder_path: str) -> set[str] | None:
+        if not folder_path:
+            return None
+        folder_path = f"{folder_path}/"
+        return set().union(
+            *(
+                host_names
+                for folder, host_names in self._folders.items()
+                if folder.startswith(folder_path)
+            )
+        )
+
+    def _tag_candidates(
+        self, tag_conditions: Mapping[TagGroupID, TagCondition]
+    ) -> set[str] | None:
+        candidates: set[str] | None = None
+        for taggroup_id, tag_condition in tag_conditions.items():
+            if is_tag_condition_or(tag_condition):
+                host_names = set().union(
+                    *(self._tags.get((taggroup_id, tag_id), ()) for tag_id in tag_condition["$or"])
+                )
+            elif isinstance(tag_condition, dict):
+                continue  # Negated conditions do not narrow down the hosts
+            else:
+                host_names = self._tags.get((taggroup_id, tag_condition), set())
+            candidates = host_names if candidates is None else candidates & host_names
+        return candidates
+
+    def _label_candidates(self, required_label_groups: LabelGroups) -> set[str] | None:
+        if not required_label_groups:
+            return None
+        # Same logic as matches_labels, but evaluated for all hosts at once
+        overall_match = self._all_hosts
+        for group_operator, label_group in required_label_groups:
+            group_match = self._all_hosts
+            for label_operator, label in label_group:
+                if not label:
+                    continue
+                try:
+                    key, value = label.split(":")
+                except ValueError:
+                    return None  # Let the label condition itself complain
+                group_match = _and_or_not_hosts(
+                    group_match, self._labels.get((key, value), set()), label_operator
+                )
+            overall_match = _and_or_not_hosts(overall_match, group_match, group_operator)
+        return overall_match
+
 #   .--BISearcher----------------------------------------------------------.
 #   |         ____ ___ ____                      _                         |
 #   |        | __ )_ _/ ___|  ___  __ _ _ __ ___| |__   ___ _ __           |
@@ -35,21 +291,65 @@ from cmk.bi.lib import ABCBISearcher, BIHostData, BIHostSearchMatch, BIServiceSe
 
 
 class BISearcher(ABCBISearcher):
+    def __init__(self) -> None:
+        super().__init__()
+        self._host_regex_match_cache = _host_regex_match_cache
+        self._host_regex_miss_cache = _host_regex_miss_cache
+        self._recorded_host_queries: set[HostQuery] | None = None
+        self._index = _SearchIndex(self.hosts)
+
     def set_hosts(self, hosts: dict[str, BIHostData]) -> None:
-        self.cleanup()
+        if (
+            sum(map(len, self._host_regex_match_cache.values()))
+            + sum(map(len, self._host_regex_miss_cache.values()))
+            > _HOST_REGEX_CACHE_LIMIT
+        ):
+            self._host_regex_match_cache.clear()
+            self._host_regex_miss_cache.clear()
         # The key may be a pattern / regex, so `str` is the correct type for the key.
         self.hosts = hosts
+        self._index = _SearchIndex(hosts)
 
     def cleanup(self) -> None:
         # Note: Do not call clear() on hosts
         #       This would clear the reference we've got on set_hosts
         self.hosts = {}
+        self._index = _SearchIndex(self.hosts)
         self._host_regex_match_cache.clear()
         self._host_regex_miss_cache.clear()
 
+    @contextmanager
+    def recording_host_queries(self) -> Iterator[set[HostQuery]]:
+        """Record the host selections, i.e. the hosts a compilation depends on
+
+        Every search and action selects its hosts with one of the host choices, the other
+        conditions only narrow the selection down. A compilation can therefore only change if
+        a host matching one of the recorded host queries changes.
+        """
+        recorded: set[HostQuery] = set()
+        self._recorded_host_queries = recorded
+        try:
+            yield recorded
+        finally:
+            self._recorded_host_queries = None
+
+    def _record_host_query(self, choice_type: str, pattern: str) -> None:
+        if self._recorded_host_queries is not None:
+            self._recorded_host_queries.add((choice_type, pattern))
+
+    def matches_any_host(self, host_queries: Iterable[HostQuery]) -> bool:
+        """Whether any of the (recorded) host queries selects any of the hosts"""
+        hosts = list(self.hosts.values())
+        return bool(hosts) and any(
+            self.filter_host_choice(hosts, {"type": choice_type, "pattern": pattern})[0]
+            for choice_type, pattern in host_queries
+        )
+
     def search_hosts(self, conditions: dict) -> list[BIHostSearchMatch]:
+        candidates = self._index.candidates(conditions)
         hosts, matched_re_groups = self.filter_host_choice(
-            list(self.hosts.values()), conditions["host_choice"]
+            list(self.hosts.values()) if candidates is None else self._index.hosts_of(candidates),
+            conditions["host_choice"],
         )
         matched_hosts = self.filter_host_folder(hosts, conditions["host_folder"])
         matched_hosts = self.filter_host_tags(matched_hosts, conditions["host_tags"])
@@ -62,6 +362,7 @@ class BISearcher(ABCBISearcher):
         condition: dict,
     ) -> tuple[list[BIHostData], dict]:
         if condition["type"] == "all_hosts":
+            self._record_host_query("all_hosts", "")
             return hosts, self._host_match_groups(hosts)
 
         if condition["type"] == "host_name_regex":
@@ -80,11 +381,11 @@ class BISearcher(ABCBISearcher):
         hosts: list[BIHostData],
         pattern: str,
     ) -> tuple[list[BIHostData], dict]:
+        self._record_host_query("host_name_regex", pattern)
         if pattern == "(.*)":
             return hosts, self._host_match_groups(hosts)
 
-        is_regex_match = any(map(lambda x: x in pattern, ["(", ")", "*", "$", "|", "[", "]"]))
-        if not is_regex_match:
+        if not _is_regex(pattern):
             host = self.hosts.get(pattern)
             if host:
                 return [host], {pattern: (pattern,)}
@@ -98,6 +399,8 @@ class BISearcher(ABCBISearcher):
         matched_hosts = []
         matched_re_groups = {}
         regex_pattern = regex(pattern_with_anchor)
+        if (prefixes := literal_prefixes(pattern)) is not None:
+            hosts = self._narrow_hosts(hosts, self._index.names.values(prefixes))
         pattern_match_cache = self._host_regex_match_cache.setdefault(pattern_with_anchor, {})
         pattern_miss_cache = self._host_regex_miss_cache.setdefault(pattern_with_anchor, {})
         for host in hosts:
@@ -125,14 +428,15 @@ class BISearcher(ABCBISearcher):
         hosts: list[BIHostData],
         pattern: str,
     ) -> tuple[list[BIHostData], dict]:
+        self._record_host_query("host_alias_regex", pattern)
         if pattern == "(.*)":
             return hosts, self._host_match_groups(hosts, "alias")
 
-        # TODO: alias matches currently costs way more performance than the host matches
-        #       requires alias lookup cache to fix
         matched_hosts = []
         matched_re_groups = {}
         regex_pattern = regex(pattern)
+        if (prefixes := literal_prefixes(pattern)) is not None:
+            hosts = self._narrow_hosts(hosts, self._index.aliases.values(prefixes))
         for host in hosts:
             match = regex_pattern.match(host.alias)
             if match is None:
@@ -148,14 +452,40 @@ class BISearcher(ABCBISearcher):
     ) -> list[BIServiceSearchMatch]:
         matched_services = []
         regex_pattern = regex(pattern)
+        candidates = self._service_candidates(host_matches, pattern)
         for host_match in host_matches:
-            for service_description in host_match.host.services.keys():
+            service_descriptions: Iterable[str] = host_match.host.services.keys()
+            if candidates is not None:
+                if not (host_candidates := candidates.get(host_match.host.name)):
+                    continue
+                service_descriptions = [x for x in service_descriptions if x in host_candidates]
+            for service_description in service_descriptions:
                 if match := regex_pattern.match(service_description):
                     matched_services.append(
                         BIServiceSearchMatch(host_match, service_description, tuple(match.groups()))
                     )
         return matched_services
 
+    def _service_candidates(
+        self, host_matches: list[BIHostSearchMatch], pattern: str
+    ) -> dict[str, set[str]] | None:
+        """The service descriptions per host which may match the pattern, None for all"""
+        # Scanning the services of a few hosts is cheaper than building or using the index
+        if len(host_matches) * 8 < len(self.hosts):
+            return None
+        if (prefixes := literal_prefixes(pattern)) is None:
+            return None
+        if self._index.services.count(prefixes) > sum(len(x.host.services) for x in host_matches):
+            return None
+        candidates: dict[str, set[str]] = {}
+        for service_description, host_name in self._index.services.entries(prefixes):
+            candidates.setdefault(host_name, set()).add(service_description)
+        return candidates
+
+    @staticmethod
+    def _narrow_hosts(hosts: list[BIHostData], candidates: set[str]) -> list[BIHostData]:
+        return [host for host in hosts if host.name in candidates]
+
     def search_services(self, conditions: dict) -> list[BIServiceSearchMatch]:
         host_matches: list[BIHostSearchMatch] = self.search_hosts(conditions)
         service_matches = self.get_service_description_matches(
@@ -603,6 +603,7 @@ class AgentParser(Parser[AgentRawData, AgentRawDataSection]):
             lambda valid_until, now: valid_until < now,
             now=now,
             keep_outdated=self.keep_outdated,
+            section_names=None if selection is NO_SELECTION else selection,
         )
         return HostSections[AgentRawDataSection](
             new_sections,
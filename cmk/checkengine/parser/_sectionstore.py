@@ -1,12 +1,11 @@
-#!/usr/bin/env python3
-# Copyright (C) 2019 Checkmk GmbH - License: GNU General Public License v2
-# This file is part of Checkmk (https://checkmk.com). It is subject to the terms and
-# conditions defined in the file COPYING, which is part of this source code package.
-
 import logging
-from collections.abc import Callable
+import os
+import pickle
+from collections import ChainMap
+from collections.abc import Callable, Iterable, Iterator
+from contextlib import contextmanager, nullcontext
 from pathlib import Path
-from typing import Final, Generic, TypeVar
+from typing import ContextManager, Final, Generic, TypeVar
 
 import cmk.ccc.store as _store
 
@@ -18,6 +17,19 @@ _T = TypeVar("_T")
 
 
 class SectionStore(Generic[_T]):
+    """The persisted sections of a host
+
+    The store is a directory with one file per section. A section file holds two
+    pickles: the validity `(created_at, valid_until)` and the section content.
+    Thus the validity can be read without the content, and an update only writes
+    the sections that have changed.
+
+    Older versions kept all sections in one pickle file at the same path. Such a
+    file is still read, and converted by the next write.
+
+    The store is locked by a file next to it, `<path>.lock`.
+    """
+
     def __init__(
         self,
         path: str | Path,
@@ -31,23 +43,130 @@ class SectionStore(Generic[_T]):
     def __repr__(self) -> str:
         return f"{type(self).__name__}({self.path!r}, logger={self._logger!r})"
 
-    def store(self, sections: MutableSectionMap[tuple[int, int, _T]]) -> None:
-        if not sections:
-            self._logger.debug("No persisted sections")
-            self.path.unlink(missing_ok=True)
-            return
+    @property
+    def _disabled(self) -> bool:
+        return self.path == Path(os.devnull)
 
-        self.path.parent.mkdir(parents=True, exist_ok=True)
-        _store.save_object_to_pickle_file(
-            self.path,
-            {str(k): v for k, v in sections.items()},
-        )
-        self._logger.debug("Stored persisted sections: %s", ", ".join(str(s) for s in sections))
+    def _section_path(self, section_name: SectionName) -> Path:
+        return self.path / str(section_name)
 
-    def load(self) -> MutableSectionMap[tuple[int, int, _T]]:
+    def _locked(self) -> ContextManager[None]:
+        return nullcontext() if self._disabled else self._locked_store()
+
+    @property
+    def _lock_path(self) -> Path:
+        # Not in the store: the directory replaces the file of older versions.
+        return self.path.with_name(f"{self.path.name}.lock")
+
+    @contextmanager
+    def _locked_store(self) -> Iterator[None]:
+        with _store.locked(self._lock_path):
+            if self.path.is_file():
+                self._convert_single_file()
+            yield
+
+    def _convert_single_file(self) -> None:
+        sections = self._load_single_file()
+        self.path.unlink(missing_ok=True)
+        self.path.mkdir(parents=True, exist_ok=True)
+        for section_name, entry in sections.items():
+            if len(entry) == 3:
+                self._write_section(section_name, entry)
+        self._logger.debug("Converted persisted sections to one file per section")
+
+    def _load_single_file(self) -> MutableSectionMap[tuple[int, int, _T]]:
         raw_sections_data = _store.load_object_from_pickle_file(self.path, default={})
         return {SectionName(k): v for k, v in raw_sections_data.items()}
 
+    def _write_section(self, section_name: SectionName, entry: tuple[int, int, _T]) -> bool:
+        """Write the section unless the file already holds it, True if written"""
+        created_at, valid_until, content = entry
+        path = self._section_path(section_name)
+        data = pickle.dumps((created_at, valid_until)) + pickle.dumps(content)
+        try:
+            if path.read_bytes() == data:
+                return False
+        except OSError:
+            pass
+        _store.save_bytes_to_file(path, data)
+        return True
+
+    def _read_sections(
+        self, *, with_content: bool, section_names: Iterable[SectionName] | None = None
+    ) -> Iterator[tuple[SectionName, tuple]]:
+        try:
+            paths = (
+                [p for p in self.path.iterdir() if not p.name.startswith(".")]
+                if section_names is None
+                else [self._section_path(section_name) for section_name in section_names]
+            )
+        except (FileNotFoundError, NotADirectoryError):
+            return
+        for path in paths:
+            try:
+                with path.open("rb") as f:
+                    validity = pickle.load(f)
+                    yield SectionName(path.name), (
+                        (*validity, pickle.load(f)) if with_content else validity
+                    )
+            except (FileNotFoundError, NotADirectoryError):
+                continue  # removed in the meantime
+            except (EOFError, pickle.UnpicklingError, ValueError) as e:
+                # empty while being written, or broken: it will be replaced by the next update
+                self._logger.debug("Ignoring persisted section %s: %s", path.name, e)
+
+    def store(
+        self,
+        sections: MutableSectionMap[tuple[int, int, _T]],
+        *,
+        removed: Iterable[SectionName] | None = None,
+    ) -> None:
+        """Make the store contain exactly these sections, only writing the changed ones
+
+        If `removed` is given, only these sections are removed and all others are kept.
+        """
+        if self._disabled:
+            return
+        with self._locked():
+            for section_name in (
+                self.load_validity().keys() - sections.keys() if removed is None else removed
+            ):
+                self._section_path(section_name).unlink(missing_ok=True)
+
+            changed = [
+                section_name
+                for section_name, entry in sections.items()
+                if len(entry) == 3 and self._write_section(section_name, entry)
+            ]
+
+        if not sections:
+            self._logger.debug("No persisted sections")
+        else:
+            self._logger.debug(
+                "Stored persisted sections: %s", ", ".join(str(s) for s in changed)
+            )
+
+    def load(
+        self, section_names: Iterable[SectionName] | None = None
+    ) -> MutableSectionMap[tuple[int, int, _T]]:
+        """The persisted sections, or only the given ones"""
+        if self._disabled:
+            return {}
+        if self.path.is_file():
+            sections = self._load_single_file()
+            if section_names is None:
+                return sections
+            return {name: sections[name] for name in section_names if name in sections}
+        return dict(self._read_sections(with_content=True, section_names=section_names))
+
+    def load_validity(self) -> MutableSectionMap[tuple[int, int]]:
+        """The creation and expiry times of the persisted sections, without their content"""
+        if self._disabled:
+            return {}
+        if self.path.is_file():
+            return {name: (entry[0], entry[1]) for name, entry in self._load_single_file().items()}
+        return dict(self._read_sections(with_content=False))
+
     def update(
         self,
         sections: SectionMap[_T],
@@ -56,13 +175,19 @@ class SectionStore(Generic[_T]):
         section_outdated: Callable[[int, int], bool],
         now: int,
         keep_outdated: bool,
+        section_names: Iterable[SectionName] | None = None,
     ) -> SectionMap[_T]:
+        """Persist the new sections and add the persisted ones
+
+        Only the persisted sections in `section_names` are loaded, if given.
+        """
         persisted_sections = self._update(
             sections,
             lookup_persist,
             section_outdated,
             now=now,
             keep_outdated=keep_outdated,
+            section_names=section_names,
         )
         return self._add_persisted_sections(
             sections,
@@ -78,30 +203,43 @@ class SectionStore(Generic[_T]):
         *,
         now: int,
         keep_outdated: bool,
+        section_names: Iterable[SectionName] | None = None,
     ) -> MutableSectionMap[tuple[int, int, _T]]:
-        # TODO: This is not race condition free when modifying the data. Either remove
-        # the possible write here and simply ignore the outdated sections or lock when
-        # reading and unlock after writing
-        persisted_sections = self.load()
-
         new_sections = {
-            section_name: persist_info + (section_content,)
-            for section_name, section_content in sections.items()
+            section_name: persist_info + (sections[section_name],)
+            for section_name in sections
             if (persist_info := lookup_persist(section_name)) is not None
         }
-        store_sections = bool(new_sections)
-        persisted_sections.update(new_sections)
-
-        if not keep_outdated:
-            for section_name in tuple(persisted_sections):
-                (_created_at, valid_until, _section_content) = persisted_sections[section_name]
-                if section_outdated(valid_until, now):
-                    store_sections = True
-                    del persisted_sections[section_name]
+        # Locked from reading to writing: checks of the same host may run concurrently.
+        # Without anything to persist, a missing store is not created by the lock.
+        with self._locked() if new_sections or self.path.exists() else nullcontext():
+            # Only the validity is read for all sections: the content of the replaced,
+            # the outdated and the unneeded ones is never unpickled.
+            stored = self.load_validity()
+            validity = ChainMap({name: entry[:2] for name, entry in new_sections.items()}, stored)
+            outdated = (
+                set()
+                if keep_outdated
+                else {
+                    section_name
+                    for section_name, (_created_at, valid_until) in validity.items()
+                    if section_outdated(valid_until, now)
+                }
+            )
+            persisted_sections: MutableSectionMap[tuple[int, int, _T]] = {
+                section_name: entry
+                for section_name, entry in new_sections.items()
+                if section_name not in outdated
+            }
+            if new_sections or outdated:
+                # The sections that are not needed now are left as they are.
+                self.store(persisted_sections, removed=outdated & stored.keys())
 
-        if store_sections:
-            self.store(persisted_sections)
-        return persisted_sections
+            needed = stored.keys() - new_sections.keys() - outdated
+            persisted_sections.update(
+                self.load(needed if section_names is None else needed & set(section_names))
+            )
+            return persisted_sections
 
     def _add_persisted_sections(
         self,
@@ -116,7 +254,7 @@ class SectionStore(Generic[_T]):
                 if section_name not in sections
             }
         )
-        result: MutableSectionMap[_T] = dict(sections.items())
+        result: MutableSectionMap[_T] = {}
         for section_name, entry in persisted_sections.items():
             if len(entry) == 2:
                 continue  # Skip entries of "old" format
@@ -131,4 +269,6 @@ class SectionStore(Generic[_T]):
 
             self._logger.debug("Using persisted section %r", section_name)
             result[section_name] = entry[-1]
-        return result
+        # Don't copy the sections, they may be decoded lazily (see SNMPFileCache).
+        # The ChainMap only ever writes to its first mapping.
+        return ChainMap(result, sections) if result else sections  # type: ignore[arg-type]
@@ -12,7 +12,7 @@ from cmk.utils.sectionname import MutableSectionMap, SectionMap, SectionName
 
 from cmk.snmplib import SNMPRawData, SNMPRawDataElem
 
-from ._parser import HostSections, Parser, SectionNameCollection
+from ._parser import HostSections, NO_SELECTION, Parser, SectionNameCollection
 from ._sectionstore import SectionStore
 
 __all__ = ["SNMPParser"]
@@ -48,11 +48,12 @@ class SNMPParser(Parser[SNMPRawData, SNMPRawData]):
         self,
         raw_data: SNMPRawData,
         *,
-        # The selection argument is ignored: Selection is done
-        # in the fetcher for SNMP.
+        # Selection is done in the fetcher for SNMP: the selection argument
+        # only limits the persisted sections that are loaded.
         selection: SectionNameCollection,
     ) -> HostSections[SNMPRawData]:
-        sections = dict(raw_data)
+        # Not copied: The sections read from the cache are only decoded when needed.
+        sections = raw_data
         now = int(time.time())
 
         def lookup_persist(section_name: SectionName) -> tuple[int, int] | None:
@@ -71,5 +72,7 @@ class SNMPParser(Parser[SNMPRawData, SNMPRawData]):
             lambda valid_until, now: valid_until + self.host_check_interval < now,
             now=now,
             keep_outdated=self.keep_outdated,
+            # Only the sections with a fetch interval are persisted.
+            section_names=self.check_intervals if selection is NO_SELECTION else selection,
         )
         return HostSections[SNMPRawData](new_sections, cache_info=cache_info)
@@ -317,7 +317,7 @@ class SNMPCredential(SNMPCredentialBase, total=False):
 # This is what we get from the outside.
 class ConfigFromWATO(TypedDict):
     actions: Sequence[Action]
-    archive_mode: Literal["file", "mongodb", "sqlite"]
+    archive_mode: Literal["file", "indexed_file", "mongodb", "sqlite"]
     archive_orphans: bool
     debug_rules: bool
     event_limit: EventLimits
@@ -337,6 +337,7 @@ class ConfigFromWATO(TypedDict):
     rules: Collection[Rule]
     sqlite_housekeeping_interval: int
     sqlite_freelist_size: int
+    sqlite_async_writes: bool
     snmp_credentials: Collection[SNMPCredential]
     socket_queue_len: int
     statistics_interval: int
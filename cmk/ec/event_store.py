@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+# Copyright (C) 2024 Checkmk GmbH - License: GNU General Public License v2
+# This file is part of Checkmk (https://checkmk.com). It is subject to the terms and
+# conditions defined in the file COPYING, which is part of this source code package.
+
+from collections import OrderedDict
+from collections.abc import Iterable, Iterator
+from typing import NamedTuple, TypeVar
+
+from .event import Event, EventPhase
+
+_K = TypeVar("_K")
+
+# .
+#   .--Event store---------------------------------------------------------.
+#   |       _____                 _         _                              |
+#   |      | ____|_   _____ _ __ | |_   ___| |_ ___  _ __ ___              |
+#   |      |  _| \ \ / / _ \ '_ \| __| / __| __/ _ \| '__/ _ \             |
+#   |      | |___ \ V /  __/ | | | |_  \__ \ || (_) | | |  __/             |
+#   |      |_____| \_/ \___|_| |_|\__| |___/\__\___/|_|  \___|             |
+#   |                                                                      |
+#   +----------------------------------------------------------------------+
+#   | Container for the open events with secondary indexes, so that the    |
+#   | hot paths of the event processing do not need to scan all events.   |
+#   '----------------------------------------------------------------------'
+
+# An ordered set of events, keyed by event id. OrderedDict instead of dict,
+# because we frequently pop from the front ("oldest event") and a plain dict
+# has to skip over the deleted slots when iterating from the start.
+_Bucket = OrderedDict[int, Event]
+
+
+class _IndexKeys(NamedTuple):
+    rule_id: str | None
+    host: str
+    core_host: str | None
+    phase: EventPhase | None
+
+
+def _index_keys(event: Event) -> _IndexKeys:
+    return _IndexKeys(
+        rule_id=event.get("rule_id"),
+        host=event.get("host", ""),
+        core_host=event.get("core_host"),
+        phase=event.get("phase"),
+    )
+
+
+class EventStore:
+    """Keeps the open events in insertion order together with secondary indexes
+
+    The indexes cover the event id, rule id, host, core host and phase. Events are
+    mutable dicts, so whoever changes one of the indexed fields of an event that is
+    part of the store has to call reindex() afterwards. The store is not thread safe,
+    it is protected by the lock of the EventStatus.
+    """
+
+    def __init__(self, events: Iterable[Event] = ()) -> None:
+        self._events: _Bucket = OrderedDict()
+        self._keys: dict[int, _IndexKeys] = {}
+        # The position of an event in the insertion order. The buckets of the
+        # indexes are always sorted by it, so "oldest" means the same everywhere.
+        self._positions: dict[int, int] = {}
+        self._next_position = 0
+        self._by_rule: dict[str | None, _Bucket] = {}
+        self._by_host: dict[str, _Bucket] = {}
+        self._by_core_host: dict[str | None, _Bucket] = {}
+        self._by_phase: dict[EventPhase | None, _Bucket] = {}
+        for event in events:
+            self.add(event)
+
+    def __len__(self) -> int:
+        return len(self._events)
+
+    def __iter__(self) -> Iterator[Event]:
+        return iter(self._events.values())
+
+    def __contains__(self, event: Event) -> bool:
+        return self._events.get(event["id"]) is event
+
+    def add(self, event: Event) -> None:
+        event_id = event["id"]
+        if event_id in self._events:
+            raise ValueError(f"Event {event_id} is already present")
+        self._events[event_id] = event
+        self._positions[event_id] = self._next_position
+        self._next_position += 1
+        self._insert(event_id, event, _index_keys(event))
+
+    def remove(self, event: Event) -> None:
+        """Remove the given event, raises KeyError if it is not part of the store"""
+        event_id = event["id"]
+        if self._events.get(event_id) is not event:
+            raise KeyError(event_id)
+        del self._events[event_id]
+        del self._positions[event_id]
+        self._discard(event_id, self._keys.pop(event_id))
+
+    def reindex(self, event: Event) -> None:
+        """Update the indexes after the indexed fields of an event have been changed"""
+        event_id = event["id"]
+        if self._events.get(event_id) is not event:
+            return
+        old_keys = self._keys[event_id]
+        new_keys = _index_keys(event)
+        if old_keys == new_keys:
+            return
+        self._discard(event_id, old_keys)
+        self._insert(event_id, event, new_keys)
+
+    def get(self, event_id: int) -> Event | None:
+        return self._events.get(event_id)
+
+    def oldest(self) -> Event | None:
+        return _first(self._events)
+
+    def by_rule(self, rule_id: str | None) -> list[Event]:
+        return list(self._by_rule.get(rule_id, {}).values())
+
+    def oldest_by_rule(self, rule_id: str | None) -> Event | None:
+        return _first(self._by_rule.get(rule_id))
+
+    def by_host(self, host: str) -> list[Event]:
+        return list(self._by_host.get(host, {}).values())
+
+    def oldest_by_host(self, host: str) -> Event | None:
+        return _first(self._by_host.get(host))
+
+    def by_core_host(self, core_host: str | None) -> list[Event]:
+        return list(self._by_core_host.get(core_host, {}).values())
+
+    def by_phase(self, phase: EventPhase) -> list[Event]:
+        return list(self._by_phase.get(phase, {}).values())
+
+    def by_rule_and_phase(self, rule_id: str | None, phase: EventPhase) -> list[Event]:
+        # Walk the smaller one of both buckets
+        by_rule = self._by_rule.get(rule_id, {})
+        by_phase = self._by_phase.get(phase, {})
+        if len(by_rule) <= len(by_phase):
+            return [e for i, e in by_rule.items() if i in by_phase]
+        return [e for i, e in by_phase.items() if i in by_rule]
+
+    def _insert(self, event_id: int, event: Event, keys: _IndexKeys) -> None:
+        self._keys[event_id] = keys
+        self._insert_into(_bucket(self._by_rule, keys.rule_id), event_id, event)
+        self._insert_into(_bucket(self._by_host, keys.host), event_id, event)
+        self._insert_into(_bucket(self._by_core_host, keys.core_host), event_id, event)
+        self._insert_into(_bucket(self._by_phase, keys.phase), event_id, event)
+
+    def _insert_into(self, bucket: _Bucket, event_id: int, event: Event) -> None:
+        position = self._positions[event_id]
+        needs_sorting = bool(bucket) and self._positions[next(reversed(bucket))] > position
+        bucket[event_id] = event
+        if needs_sorting:
+            # A reindexed event moved into the bucket, restore the insertion order
+            for other_id in [i for i in bucket if self._positions[i] > position]:
+                bucket.move_to_end(other_id)
+
+    def _discard(self, event_id: int, keys: _IndexKeys) -> None:
+        _discard_from(self._by_rule, keys.rule_id, event_id)
+        _discard_from(self._by_host, keys.host, event_id)
+        _discard_from(self._by_core_host, keys.core_host, event_id)
+        _discard_from(self._by_phase, keys.phase, event_id)
+
+
+def _bucket(index: dict[_K, _Bucket], key: _K) -> _Bucket:
+    if (bucket := index.get(key)) is None:
+        bucket = index[key] = OrderedDict()
+    return bucket
+
+
+def _discard_from(index: dict[_K, _Bucket], key: _K, event_id: int) -> None:
+    bucket = index[key]
+    del bucket[event_id]
+    if not bucket:
+        del index[key]
+
+
+def _first(bucket: _Bucket | None) -> Event | None:
+    if not bucket:
+        return None
+    return next(iter(bucket.values()))
@@ -5,6 +5,7 @@
 
 import itertools
 import shlex
+import shutil
 import subprocess
 import threading
 import time
@@ -88,8 +89,8 @@ class FileHistory(History):
             (f.operator_name, f.argument) for f in filters if f.column_name.split("_")[-1] == "time"
         ]
         time_range = (
-            _greatest_lower_bound_for_filters(time_filters),
-            _least_upper_bound_for_filters(time_filters),
+            greatest_lower_bound_for_filters(time_filters),
+            least_upper_bound_for_filters(time_filters),
         )
         self._logger.debug("time range: %r", time_range)
 
@@ -111,7 +112,7 @@ class FileHistory(History):
             if limit is not None and limit <= 0:
                 self._logger.debug("query limit reached")
                 break
-            if not _intersects(time_range, _get_logfile_timespan(path)):
+            if not intersects(time_range, _get_logfile_timespan(path)):
                 self._logger.debug("skipping history file %s because of time filters", path)
                 continue
             tac = f"nl -b a {shlex.quote(str(path))} | tac"  # Process younger lines first
@@ -152,12 +153,18 @@ def _expire_logfiles(
                         "Deleting log file %s (age %s)", path, date_and_time(path.stat().st_mtime)
                     )
                     path.unlink()
+                    shutil.rmtree(index_dir(path), ignore_errors=True)
         except Exception as e:
             if settings.options.debug:
                 raise
             logger.warning("Error expiring log files: %s", e)
 
 
+def index_dir(path: Path) -> Path:
+    """The directory of the segment index of a log file, see IndexedFileHistory"""
+    return path.with_suffix(".idx")
+
+
 # Please note: Keep this in sync with packages/neb/src/TableEventConsole.cc.
 _GREPABLE_COLUMNS = {
     "event_id",
@@ -211,7 +218,7 @@ def _grep_pattern(argument: str) -> str:
     return f"-e {shlex.quote(argument)}"
 
 
-def _greatest_lower_bound_for_filters(
+def greatest_lower_bound_for_filters(
     filters: Iterable[tuple[OperatorName, float]],
 ) -> float | None:
     result: float | None = None
@@ -232,7 +239,7 @@ def _greatest_lower_bound_for_filter(operator: OperatorName, value: float) -> fl
     return None
 
 
-def _least_upper_bound_for_filters(filters: Iterable[tuple[OperatorName, float]]) -> float | None:
+def least_upper_bound_for_filters(filters: Iterable[tuple[OperatorName, float]]) -> float | None:
     result: float | None = None
     for operator, value in filters:
         lub = _least_upper_bound_for_filter(operator, value)
@@ -251,7 +258,7 @@ def _least_upper_bound_for_filter(operator: OperatorName, value: float) -> float
     return None
 
 
-def _intersects(
+def intersects(
     interval1: tuple[float | None, float | None],
     interval2: tuple[float | None, float | None],
 ) -> bool:
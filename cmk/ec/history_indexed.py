@@ -0,0 +1,394 @@
+#!/usr/bin/env python3
+# Copyright (C) 2024 Checkmk GmbH - License: GNU General Public License v2
+# This file is part of Checkmk (https://checkmk.com). It is subject to the terms and
+# conditions defined in the file COPYING, which is part of this source code package.
+"""EC History file backend with columnar segment indexes
+
+The history is written to the same tab separated log files as with the plain
+file backend, one per history period. Next to each log file we keep a segment
+index (a directory "<period>.idx") with
+
+* the minimum and maximum history time and event id of the segment,
+* the frequently filtered columns in a columnar layout: history time, event id
+  and the offset of each line as arrays, the string columns (host, core host,
+  application, rule id, what) dictionary encoded,
+* in memory a host and an event id index derived from these columns.
+
+A query first skips the segments whose time/id range does not fit, evaluates
+the filters on the indexed columns (the string filters only once per distinct
+value) and then only reads and decodes the lines which can still match.
+
+The log files stay the single source of truth: The indexes are updated lazily
+from the end of the log files, rebuilt when they do not fit and deleted together
+with their log files.
+"""
+
+import json
+import shutil
+from array import array
+from collections.abc import Iterable, Sequence
+from dataclasses import dataclass, field
+from logging import Logger
+from pathlib import Path
+from typing import Any, Final
+
+from cmk.ccc import store
+
+from .config import Config
+from .history import get_logfile
+from .history_file import (
+    convert_history_line,
+    FileHistory,
+    greatest_lower_bound_for_filters,
+    index_dir,
+    intersects,
+    least_upper_bound_for_filters,
+)
+from .query import Columns, QueryFilter, QueryGET
+from .settings import Settings
+
+_FORMAT_VERSION: Final = 1
+
+# column name -> array type code
+_NUMERIC_COLUMNS: Final = {
+    "history_line": "q",
+    "history_time": "d",
+    "event_id": "q",
+}
+_DICTIONARY_COLUMNS: Final = (
+    "history_what",
+    "event_host",
+    "event_core_host",
+    "event_application",
+    "event_rule_id",
+)
+
+
+@dataclass
+class _Segment:
+    """The index of one history log file"""
+
+    indexed_bytes: int = 0
+    indexed_lines: int = 0
+    min_time: float | None = None
+    max_time: float | None = None
+    min_id: int | None = None
+    max_id: int | None = None
+    offsets: array[int] = field(default_factory=lambda: array("q"))
+    numbers: dict[str, array[Any]] = field(
+        default_factory=lambda: {name: array(code) for name, code in _NUMERIC_COLUMNS.items()}
+    )
+    codes: dict[str, array[int]] = field(
+        default_factory=lambda: {name: array("I") for name in _DICTIONARY_COLUMNS}
+    )
+    dictionaries: dict[str, list[object]] = field(
+        default_factory=lambda: {name: [] for name in _DICTIONARY_COLUMNS}
+    )
+    _code_of: dict[str, dict[object, int]] = field(default_factory=dict, init=False, repr=False)
+    _rows_by_host: dict[int, list[int]] | None = field(default=None, init=False, repr=False)
+    _rows_by_id: dict[int, list[int]] | None = field(default=None, init=False, repr=False)
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    def code_of(self, column: str, value: object) -> int:
+        if (code_of := self._code_of.get(column)) is None:
+            code_of = self._code_of[column] = {v: c for c, v in enumerate(self.dictionaries[column])}
+        if (code := code_of.get(value)) is None:
+            code = code_of[value] = len(self.dictionaries[column])
+            self.dictionaries[column].append(value)
+        return code
+
+    def rows_by_host(self) -> dict[int, list[int]]:
+        if self._rows_by_host is None:
+            self._rows_by_host = _rows_by_value(self.codes["event_host"])
+        return self._rows_by_host
+
+    def rows_by_id(self) -> dict[int, list[int]]:
+        if self._rows_by_id is None:
+            self._rows_by_id = _rows_by_value(self.numbers["event_id"])
+        return self._rows_by_id
+
+    def invalidate_indexes(self) -> None:
+        self._rows_by_host = None
+        self._rows_by_id = None
+
+    def may_match(
+        self,
+        time_range: tuple[float | None, float | None],
+        id_range: tuple[float | None, float | None],
+    ) -> bool:
+        return intersects(time_range, (self.min_time, self.max_time)) and intersects(
+            id_range, (self.min_id, self.max_id)
+        )
+
+    def matching_rows(self, filters: Iterable[QueryFilter]) -> Sequence[int]:
+        """The rows which fulfill all filters on the indexed columns, in ascending order"""
+        candidates: set[int] | None = None
+        dictionary_filters: list[tuple[array[int], set[int]]] = []
+        numeric_filters: list[tuple[array[Any], QueryFilter]] = []
+        for f in filters:
+            if f.column_name in _DICTIONARY_COLUMNS:
+                allowed = {
+                    code
+                    for code, value in enumerate(self.dictionaries[f.column_name])
+                    if f.predicate(value)
+                }
+                if f.column_name == "event_host":
+                    by_host = self.rows_by_host()
+                    rows = {row for code in allowed for row in by_host.get(code, ())}
+                    candidates = rows if candidates is None else candidates & rows
+                else:
+                    dictionary_filters.append((self.codes[f.column_name], allowed))
+            elif f.column_name == "event_id" and f.operator_name in ("=", "in"):
+                by_id = self.rows_by_id()
+                ids = f.argument if f.operator_name == "in" else [f.argument]
+                rows = {row for event_id in ids for row in by_id.get(event_id, ())}
+                candidates = rows if candidates is None else candidates & rows
+            elif f.column_name in _NUMERIC_COLUMNS:
+                numeric_filters.append((self.numbers[f.column_name], f))
+
+        result: Sequence[int] = range(len(self)) if candidates is None else sorted(candidates)
+        for codes, allowed in dictionary_filters:
+            result = [row for row in result if codes[row] in allowed]
+        for values, f in numeric_filters:
+            result = [row for row in result if f.predicate(values[row])]
+        return result
+
+
+def _rows_by_value(values: array[int]) -> dict[int, list[int]]:
+    rows: dict[int, list[int]] = {}
+    for row, value in enumerate(values):
+        rows.setdefault(value, []).append(row)
+    return rows
+
+
+class _SegmentStore:
+    """Reading, updating and writing the segment index of a log file"""
+
+    def __init__(self, history_columns: Columns, logger: Logger) -> None:
+        self._history_columns = history_columns
+        self._logger = logger
+        self._column_index = {name: index for index, (name, _default) in enumerate(history_columns)}
+
+    def load(self, log_path: Path) -> _Segment:
+        directory = index_dir(log_path)
+        try:
+            meta = json.loads((directory / "meta.json").read_text())
+            if meta["version"] != _FORMAT_VERSION:
+                return _Segment()
+            segment = _Segment(
+                indexed_bytes=meta["indexed_bytes"],
+                indexed_lines=meta["indexed_lines"],
+                min_time=meta["min_time"],
+                max_time=meta["max_time"],
+                min_id=meta["min_id"],
+                max_id=meta["max_id"],
+                dictionaries=meta["dictionaries"],
+            )
+            num_rows = meta["rows"]
+            _read_column(directory / "offsets", segment.offsets, num_rows)
+            for name, values in segment.numbers.items():
+                _read_column(directory / name, values, num_rows)
+            for name, codes in segment.codes.items():
+                _read_column(directory / name, codes, num_rows)
+            return segment
+        except FileNotFoundError:
+            return _Segment()
+        except Exception:
+            self._logger.exception("Cannot read history index %s, rebuilding it", directory)
+            return _Segment()
+
+    def update(self, log_path: Path, segment: _Segment) -> _Segment:
+        """Index the lines which have been appended to the log file since the last update"""
+        try:
+            size = log_path.stat().st_size
+        except FileNotFoundError:
+            return _Segment()
+        if size < segment.indexed_bytes:  # the log file has been replaced
+            segment = _Segment()
+            shutil.rmtree(index_dir(log_path), ignore_errors=True)
+        if size == segment.indexed_bytes:
+            return segment
+
+        first_new_row = len(segment)
+        with log_path.open("rb") as f:
+            f.seek(segment.indexed_bytes)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # still being written, index it next time
+                offset = segment.indexed_bytes
+                segment.indexed_bytes += len(line)
+                segment.indexed_lines += 1
+                self._add_row(segment, offset, line)
+        segment.invalidate_indexes()
+        self._save(log_path, segment, first_new_row)
+        return segment
+
+    def _add_row(self, segment: _Segment, offset: int, line: bytes) -> None:
+        try:
+            values: list[Any] = [segment.indexed_lines, *line.decode("utf-8")[:-1].split("\t")]
+            convert_history_line(self._history_columns, values)
+        except Exception:
+            return  # Invalid lines are reported when they are read for a query
+        segment.offsets.append(offset)
+        for name, numbers in segment.numbers.items():
+            numbers.append(values[self._column_index[name]])
+        for name, codes in segment.codes.items():
+            codes.append(segment.code_of(name, values[self._column_index[name]]))
+        history_time, event_id = values[1], values[5]
+        segment.min_time = _min(segment.min_time, history_time)
+        segment.max_time = _max(segment.max_time, history_time)
+        segment.min_id = _min(segment.min_id, event_id)
+        segment.max_id = _max(segment.max_id, event_id)
+
+    def _save(self, log_path: Path, segment: _Segment, first_new_row: int) -> None:
+        directory = index_dir(log_path)
+        directory.mkdir(exist_ok=True)
+        # Append the new rows first, the meta data tells how many of them are valid
+        _append_column(directory / "offsets", segment.offsets, first_new_row)
+        for name, numbers in segment.numbers.items():
+            _append_column(directory / name, numbers, first_new_row)
+        for name, codes in segment.codes.items():
+            _append_column(directory / name, codes, first_new_row)
+        store.save_text_to_file(
+            directory / "meta.json",
+            json.dumps(
+                {
+                    "version": _FORMAT_VERSION,
+                    "rows": len(segment),
+                    "indexed_bytes": segment.indexed_bytes,
+                    "indexed_lines": segment.indexed_lines,
+                    "min_time": segment.min_time,
+                    "max_time": segment.max_time,
+                    "min_id": segment.min_id,
+                    "max_id": segment.max_id,
+                    "dictionaries": segment.dictionaries,
+                }
+            ),
+        )
+
+
+def _read_column(path: Path, values: array[Any], num_rows: int) -> None:
+    with path.open("rb") as f:
+        values.fromfile(f, num_rows)
+
+
+def _append_column(path: Path, values: array[Any], first_new_row: int) -> None:
+    with path.open("r+b" if path.exists() else "wb") as f:
+        # Cut off rows which have been written without updating the meta data
+        f.truncate(first_new_row * values.itemsize)
+        f.seek(0, 2)
+        values[first_new_row:].tofile(f)
+
+
+def _min(current: Any, value: Any) -> Any:
+    return value if current is None else min(current, value)
+
+
+def _max(current: Any, value: Any) -> Any:
+    return value if current is None else max(current, value)
+
+
+class IndexedFileHistory(FileHistory):
+    def __init__(
+        self,
+        settings: Settings,
+        config: Config,
+        logger: Logger,
+        event_columns: Columns,
+        history_columns: Columns,
+    ) -> None:
+        super().__init__(settings, config, logger, event_columns, history_columns)
+        self._segment_store = _SegmentStore(history_columns, logger)
+        self._segments: dict[Path, _Segment] = {}
+
+    def flush(self) -> None:
+        super().flush()
+        with self._lock:
+            self._segments.clear()
+
+    def get(self, query: QueryGET) -> Iterable[Sequence[object]]:
+        history_dir = self._settings.paths.history_dir.value
+        if not history_dir.exists():
+            return []
+
+        filters = query.filters
+        limit = query.limit
+        time_filters = [
+            (f.operator_name, f.argument) for f in filters if f.column_name == "history_time"
+        ]
+        time_range = (
+            greatest_lower_bound_for_filters(time_filters),
+            least_upper_bound_for_filters(time_filters),
+        )
+        id_filters = [(f.operator_name, f.argument) for f in filters if f.column_name == "event_id"]
+        id_range = (
+            greatest_lower_bound_for_filters(id_filters),
+            least_upper_bound_for_filters(id_filters),
+        )
+
+        # Newest files and, within the files, newest lines first. See FileHistory.get().
+        history_entries: list[Sequence[object]] = []
+        for path in sorted(history_dir.glob("*.log"), reverse=True):
+            if limit is not None and len(history_entries) >= limit:
+                self._logger.debug("query limit reached")
+                break
+            with self._lock:
+                segment = self._updated_segment(path)
+            if not segment.may_match(time_range, id_range):
+                self._logger.debug("skipping history file %s because of its index", path)
+                continue
+            history_entries += self._read_rows(
+                path,
+                segment,
+                reversed(segment.matching_rows(filters)),
+                query,
+                None if limit is None else limit - len(history_entries),
+            )
+        return history_entries
+
+    def housekeeping(self) -> None:
+        super().housekeeping()
+        with self._lock:
+            for path in [p for p in self._segments if not p.exists()]:
+                del self._segments[path]
+            # Keep the index of the active log file up to date, so queries don't have to
+            self._updated_segment(
+                get_logfile(
+                    self._config,
+                    self._settings.paths.history_dir.value,
+                    self._active_history_period,
+                )
+            )
+
+    def _updated_segment(self, path: Path) -> _Segment:
+        if (segment := self._segments.get(path)) is None:
+            segment = self._segment_store.load(path)
+        segment = self._segments[path] = self._segment_store.update(path, segment)
+        return segment
+
+    def _read_rows(
+        self,
+        path: Path,
+        segment: _Segment,
+        rows: Iterable[int],
+        query: QueryGET,
+        limit: int | None,
+    ) -> list[Sequence[object]]:
+        entries: list[Sequence[object]] = []
+        line_numbers = segment.numbers["history_line"]
+        with path.open("rb") as f:
+            for row in rows:
+                if limit is not None and len(entries) >= limit:
+                    break
+                f.seek(segment.offsets[row])
+                line = f.readline()
+                try:
+                    values: list[Any] = [line_numbers[row], *line.decode("utf-8")[:-1].split("\t")]
+                    convert_history_line(self._history_columns, values)
+                    if query.filter_row(values):
+                        entries.append(values)
+                except Exception:
+                    self._logger.exception("Invalid line '%r' in history file %s", line, path)
+        return entries
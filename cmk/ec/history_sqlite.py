@@ -7,8 +7,10 @@
 import itertools
 import json
 import sqlite3
+import threading
 import time
-from collections.abc import Iterable, Sequence
+from collections import deque
+from collections.abc import Callable, Iterable, Sequence
 from dataclasses import dataclass
 from datetime import timedelta
 from logging import Logger
@@ -18,6 +20,7 @@ from typing import Final, Literal
 from .config import Config
 from .event import Event
 from .history import History, HistoryWhat
+from .perfcounters import Perfcounters
 from .query import Columns, QueryFilter, QueryGET
 from .settings import Options, Paths, Settings
 
@@ -66,6 +69,15 @@ SQLITE_PRAGMAS = {
     "PRAGMA busy_timeout = 2000;": "2 seconds timeout for busy handler. Avoids database is locked errors",
 }
 
+# With background writes the WAL is checkpointed by the writer when it is idle,
+# the automatic checkpoints are only a safety net against a growing WAL file.
+SQLITE_ASYNC_WAL_AUTOCHECKPOINT: Final = 10000  # pages
+
+# Maximum number of history entries waiting for the background writer
+WRITE_BUFFER_SIZE: Final = 10000
+# Maximum number of entries committed in one transaction
+WRITE_BATCH_SIZE: Final = 1000
+
 SQLITE_INDEXES = [
     f"CREATE INDEX IF NOT EXISTS idx_{column} ON history ({column});" for column in INDEXED_COLUMNS
 ]
@@ -143,6 +155,136 @@ class SQLiteSettings:
         return cls(paths=settings.paths, options=settings.options, database=database)
 
 
+_INSERT_STATEMENT: Final = f"""INSERT INTO
+                    history ({', '.join(TABLE_COLUMNS[1:])})
+                        VALUES ({', '.join(itertools.repeat('?', len(TABLE_COLUMNS[1:])))});"""
+
+
+class BackgroundWriter:
+    """Buffers history entries in memory and commits them in batches from a separate thread
+
+    When the buffer is full, adding blocks until the writer has caught up: We slow
+    down the event processing rather than losing history entries.
+
+    The thread is started on demand, so it survives daemonizing (forking) after
+    the creation of the history.
+    """
+
+    def __init__(
+        self,
+        write: Callable[[Sequence[Sequence[object]]], None],
+        checkpoint: Callable[[], None],
+        logger: Logger,
+        perfcounters: Perfcounters | None,
+        buffer_size: int = WRITE_BUFFER_SIZE,
+        batch_size: int = WRITE_BATCH_SIZE,
+    ) -> None:
+        self._write = write
+        self._checkpoint = checkpoint
+        self._logger = logger
+        self._perfcounters = perfcounters
+        self._buffer_size = buffer_size
+        self._batch_size = batch_size
+        self._buffer: deque[Sequence[object]] = deque()
+        self._condition = threading.Condition()
+        self._thread: threading.Thread | None = None
+        self._num_added = 0
+        self._num_written = 0
+        self._stopping = False
+
+    def add(self, entry: Sequence[object]) -> None:
+        with self._condition:
+            self._ensure_running()
+            while len(self._buffer) >= self._buffer_size:
+                self._condition.wait()
+            self._buffer.append(entry)
+            self._num_added += 1
+            self._update_fill_level()
+            self._condition.notify_all()
+
+    def flush(self) -> None:
+        """Wait until all entries added so far have been written"""
+        with self._condition:
+            if self._buffer:
+                self._ensure_running()
+            target = self._num_added
+            while self._num_written < target:
+                self._condition.wait()
+
+    def stop(self) -> None:
+        """Write all buffered entries and terminate the thread"""
+        with self._condition:
+            self._stopping = True
+            self._condition.notify_all()
+            thread = self._thread
+        if thread is not None and thread.is_alive():
+            thread.join()
+        with self._condition:
+            self._stopping = False
+            if self._buffer:  # The thread is gone, e.g. after a fork: write the rest ourselves
+                batch = list(self._buffer)
+                self._buffer.clear()
+                self._write_batch(batch)
+                self._num_written += len(batch)
+                self._update_fill_level()
+                self._condition.notify_all()
+
+    def _ensure_running(self) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            self._stopping = False
+            self._thread = threading.Thread(
+                target=self._run, name="HistoryWriter", daemon=True
+            )
+            self._thread.start()
+
+    def _run(self) -> None:
+        needs_checkpoint = False
+        while True:
+            with self._condition:
+                # Being idle is a good moment to move the WAL into the database
+                if idle := needs_checkpoint and not self._buffer and not self._stopping:
+                    batch = []
+                else:
+                    while not self._buffer and not self._stopping:
+                        self._condition.wait()
+                    if not self._buffer:
+                        return
+                    batch = [
+                        self._buffer.popleft()
+                        for _ in range(min(len(self._buffer), self._batch_size))
+                    ]
+            if idle:
+                self._run_checkpoint()
+                needs_checkpoint = False
+                continue
+
+            self._write_batch(batch)
+            needs_checkpoint = True
+            with self._condition:
+                self._num_written += len(batch)
+                self._update_fill_level()
+                self._condition.notify_all()
+
+    def _write_batch(self, batch: Sequence[Sequence[object]]) -> None:
+        before = time.time()
+        try:
+            self._write(batch)
+        except Exception:
+            self._logger.exception("Cannot write %d entries to the history database", len(batch))
+        if self._perfcounters is not None:
+            self._perfcounters.count_time("history_commit", time.time() - before)
+
+    def _run_checkpoint(self) -> None:
+        try:
+            self._checkpoint()
+        except Exception:
+            self._logger.exception("Cannot checkpoint the history database")
+
+    def _update_fill_level(self) -> None:
+        if self._perfcounters is not None:
+            self._perfcounters.set_gauge("history_buffer_fill", len(self._buffer))
+
+
 class SQLiteHistory(History):
     def __init__(
         self,
@@ -151,6 +293,7 @@ class SQLiteHistory(History):
         logger: Logger,
         event_columns: Columns,
         history_columns: Columns,
+        perfcounters: Perfcounters | None = None,
     ):
         self._settings = settings
         self._config = config
@@ -173,6 +316,8 @@ class SQLiteHistory(History):
         )
 
         self.conn.row_factory = sqlite3.Row
+        # The background writer uses the connection concurrently with the other threads
+        self._conn_lock = threading.RLock()
 
         with self.conn as connection:
             for pragma_string in SQLITE_PRAGMAS:
@@ -220,58 +365,71 @@ class SQLiteHistory(History):
             for index_statement in SQLITE_INDEXES:
                 connection.execute(index_statement)
 
+        self._writer: BackgroundWriter | None = None
+        if self._config["sqlite_async_writes"]:
+            self._writer = BackgroundWriter(
+                self._insert, self._checkpoint, self._logger, perfcounters
+            )
+            with self.conn as connection:
+                connection.execute(
+                    f"PRAGMA wal_autocheckpoint = {SQLITE_ASYNC_WAL_AUTOCHECKPOINT};"
+                )
+
     def flush(self) -> None:
         """Delete all entries the history table."""
-        with self.conn as connection:
+        if self._writer is not None:
+            self._writer.flush()
+        with self._conn_lock, self.conn as connection:
             connection.execute("DELETE FROM history;")
 
     def add(self, event: Event, what: HistoryWhat, who: str = "", addinfo: str = "") -> None:
         """Add a single entry to the history table.
 
         No need to include the line column, as it is autoincremented.
+        With background writes the entry is only queued here.
         """
-        with self.conn as connection:
-            cur = connection.cursor()
-            cur.execute(
-                f"""INSERT INTO
-                    history ({', '.join(TABLE_COLUMNS[1:])})
-                        VALUES ({', '.join(itertools.repeat('?', len(TABLE_COLUMNS[1:])))});""",
-                tuple(
-                    itertools.chain(
-                        (time.time(), what, who, addinfo),
-                        [
-                            event.get(colname.removeprefix("event_"), defval)
-                            for colname, defval in self._event_columns
-                        ],
-                    )
-                ),
+        entry = tuple(
+            itertools.chain(
+                (time.time(), what, who, addinfo),
+                [
+                    event.get(colname.removeprefix("event_"), defval)
+                    for colname, defval in self._event_columns
+                ],
             )
+        )
+        if self._writer is None:
+            self._insert([entry])
+        else:
+            self._writer.add(entry)
 
     def add_entries(self, entries: Sequence[Sequence[object]]) -> None:
         """Add multiple entries to the history table.
 
-        Used only by the cmk-update-config during EC history migration to sqlite.
+        Used by the cmk-update-config during EC history migration to sqlite.
         The first column is the line number, which is autoincremented, so ignored in TABLE_COLUMNS.
         """
-        with self.conn as connection:
-            cur = connection.cursor()
-            cur.executemany(
-                f"""INSERT INTO
-                    history ({', '.join(TABLE_COLUMNS[1:])})
-                        VALUES ({', '.join(itertools.repeat('?', len(TABLE_COLUMNS[1:])))});""",
-                (entry[1:] for entry in entries),
-            )
+        self._insert(entry[1:] for entry in entries)
+
+    def _insert(self, entries: Iterable[Sequence[object]]) -> None:
+        with self._conn_lock, self.conn as connection:
+            connection.executemany(_INSERT_STATEMENT, entries)
+
+    def _checkpoint(self) -> None:
+        with self._conn_lock:
+            self.conn.execute("PRAGMA wal_checkpoint(PASSIVE);")
 
     def get(self, query: QueryGET) -> Iterable[Sequence[object]]:
         """Retrieve entries from the history table.
 
         Always return all columns, since they are filtered elsewhere.
         """
+        if self._writer is not None:
+            self._writer.flush()  # make the entries added so far visible
         sqlite_query, sqlite_arguments = filters_to_sqlite_query(query.filters)
         if query.limit:
             sqlite_query += " LIMIT ?"
             sqlite_arguments += f" {query.limit + 1}"
-        with self.conn as connection:
+        with self._conn_lock, self.conn as connection:
             cur = connection.cursor()
             cur.execute(sqlite_query, sqlite_arguments)
             return cur.fetchall()
@@ -284,11 +442,12 @@ class SQLiteHistory(History):
         now = time.time()
         if now - self._last_housekeeping > self._config["sqlite_housekeeping_interval"]:
             delta = now - timedelta(days=self._config["history_lifetime"]).total_seconds()
-            with self.conn as connection:
-                cur = connection.cursor()
-                cur.execute("DELETE FROM history WHERE time <= ?;", (delta,))
-            # should be executed outside of the transaction
-            self._vacuum()
+            with self._conn_lock:
+                with self.conn as connection:
+                    cur = connection.cursor()
+                    cur.execute("DELETE FROM history WHERE time <= ?;", (delta,))
+                # should be executed outside of the transaction
+                self._vacuum()
             self._last_housekeeping = now
 
     def _vacuum(self) -> None:
@@ -306,5 +465,9 @@ class SQLiteHistory(History):
         Used during a new object instantiation,
         to avoid sqlite3.OperationalError: database is locked.
         """
+        if self._writer is not None:
+            self._writer.stop()
+            if isinstance(self._settings.database, Path):
+                self.conn.execute("PRAGMA wal_checkpoint(TRUNCATE);")
         self.conn.commit()
         self.conn.close()
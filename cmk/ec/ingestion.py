@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+# Copyright (C) 2024 Checkmk GmbH - License: GNU General Public License v2
+# This file is part of Checkmk (https://checkmk.com). It is subject to the terms and
+# conditions defined in the file COPYING, which is part of this source code package.
+
+"""Batched ingestion of incoming messages
+
+By default the EventServer thread parses and classifies every message right
+after it has been received. During bursts the kernel socket buffers overflow
+while we are busy with the rule matching, and the datagrams are lost without
+anybody noticing. The IngestionPipeline decouples both sides:
+
+* The EventServer thread only drains the sockets (in batches, see
+  receive_datagrams) and submits the raw messages.
+* A pool of worker threads parses the messages into events.
+* A single processing thread feeds the parsed events into the rule matching,
+  strictly in the order the messages have been submitted. Thus the order of the
+  messages of each host is preserved.
+
+The number of queued messages is bounded. Sources which can wait (pipe, unix
+socket, TCP, spool files) are blocked when the queue is full, which pushes back
+to the sender. UDP messages are dropped instead, but in contrast to a kernel
+buffer overflow these drops are counted.
+"""
+
+import socket
+import threading
+from collections import deque
+from collections.abc import Callable, Sequence
+from concurrent.futures import Future, ThreadPoolExecutor
+from logging import Logger
+from typing import Final
+
+from .event import Event
+from .perfcounters import Perfcounters
+
+# host/port of the sender, None for local sources like the event pipe
+Address = tuple[str, int] | None
+Message = tuple[bytes, Address]
+
+MAX_QUEUED_MESSAGES: Final = 100000
+MAX_DATAGRAMS_PER_BATCH: Final = 256
+
+
+def receive_datagrams(
+    sock: socket.socket, max_datagrams: int, bufsize: int
+) -> list[tuple[bytes, object]]:
+    """Read all datagrams which are waiting on a readable socket, up to max_datagrams
+
+    Python offers no recvmmsg(), so we read the datagrams one by one, but without
+    going back to select() in between.
+    """
+    datagrams = [sock.recvfrom(bufsize)]  # the socket is readable, so this does not block
+    while len(datagrams) < max_datagrams:
+        try:
+            datagrams.append(sock.recvfrom(bufsize, socket.MSG_DONTWAIT))
+        except BlockingIOError:
+            break
+    return datagrams
+
+
+class IngestionPipeline:
+    def __init__(
+        self,
+        logger: Logger,
+        perfcounters: Perfcounters,
+        parse: Callable[[Sequence[Message]], list[Event]],
+        process: Callable[[Sequence[Event]], None],
+        num_workers: int,
+        max_queued_messages: int = MAX_QUEUED_MESSAGES,
+    ) -> None:
+        self._logger = logger
+        self._perfcounters = perfcounters
+        self._parse = parse
+        self._process = process
+        self._max_queued_messages = max_queued_messages
+        self._executor = ThreadPoolExecutor(num_workers, thread_name_prefix="EventParser")
+        self._processor = threading.Thread(target=self._process_batches, name="EventProcessor")
+        self._condition = threading.Condition()
+        # The batches in the order of their submission, together with their size
+        self._batches: deque[tuple[int, Future[list[Event]]]] = deque()
+        self._queue_depth = 0
+        self._max_queue_depth = 0
+        self._stopping = False
+
+    @property
+    def queue_depth(self) -> int:
+        """Number of messages which have been submitted, but are not processed yet"""
+        return self._queue_depth
+
+    @property
+    def max_queue_depth(self) -> int:
+        return self._max_queue_depth
+
+    def start(self) -> None:
+        self._processor.start()
+
+    def stop(self) -> None:
+        """Process all queued messages and terminate the threads"""
+        with self._condition:
+            self._stopping = True
+            self._condition.notify_all()
+        if self._processor.is_alive():
+            self._processor.join()
+        self._executor.shutdown()
+
+    def submit(self, messages: Sequence[Message], *, may_drop: bool) -> bool:
+        """Queue messages for parsing and processing
+
+        When the queue is full, the messages are either dropped (returns False)
+        or we wait until there is enough room.
+        """
+        if not messages:
+            return True
+        with self._condition:
+            if may_drop and self._is_full(len(messages)):
+                self._perfcounters.count("ingest_drops", len(messages))
+                return False
+            while self._is_full(len(messages)) and not self._stopping:
+                self._condition.wait()
+            self._enqueue(len(messages), self._executor.submit(self._parse, messages))
+        return True
+
+    def submit_events(self, events: Sequence[Event]) -> None:
+        """Queue already parsed events, e.g. SNMP traps, keeping them in line with the rest"""
+        if not events:
+            return
+        future: Future[list[Event]] = Future()
+        future.set_result(list(events))
+        with self._condition:
+            while self._is_full(len(events)) and not self._stopping:
+                self._condition.wait()
+            self._enqueue(len(events), future)
+
+    def _is_full(self, num_messages: int) -> bool:
+        # A single batch larger than the queue is accepted when the queue is empty
+        return (
+            self._queue_depth > 0
+            and self._queue_depth + num_messages > self._max_queued_messages
+        )
+
+    def _enqueue(self, num_messages: int, future: Future[list[Event]]) -> None:
+        self._batches.append((num_messages, future))
+        self._queue_depth += num_messages
+        self._max_queue_depth = max(self._max_queue_depth, self._queue_depth)
+        self._condition.notify_all()
+
+    def _process_batches(self) -> None:
+        while True:
+            with self._condition:
+                while not self._batches and not self._stopping:
+                    self._condition.wait()
+                if not self._batches:
+                    return
+                num_messages, future = self._batches[0]
+            try:
+                self._process(future.result())
+            except Exception:
+                self._logger.exception("Exception while processing %d messages", num_messages)
+            with self._condition:
+                self._batches.popleft()
+                self._queue_depth -= num_messages
+                self._condition.notify_all()
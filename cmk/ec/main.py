@@ -63,13 +63,21 @@ from .config import (
 )
 from .core_queries import HostInfo, query_hosts_scheduled_downtime_depth
 from .crash_reporting import CrashReportStore, ECCrashReport
-from .event import create_events_from_syslog_messages, Event, scrub_string
+from .event import (
+    create_event_from_syslog_message,
+    create_events_from_syslog_messages,
+    Event,
+    scrub_string,
+)
+from .event_store import EventStore
 from .helpers import ECLock, parse_bytes_into_syslog_messages
 from .history import ActiveHistoryPeriod, get_logfile, History, HistoryWhat, quote_tab, TimedHistory
 from .history_file import FileHistory
+from .history_indexed import IndexedFileHistory
 from .history_mongo import MongoDBHistory
 from .history_sqlite import SQLiteHistory, SQLiteSettings
 from .host_config import HostConfig
+from .ingestion import IngestionPipeline, MAX_DATAGRAMS_PER_BATCH, Message, receive_datagrams
 from .perfcounters import Perfcounters
 from .query import (
     Columns,
@@ -83,6 +91,7 @@ from .query import (
 )
 from .rule_matcher import compile_rule, match, MatchFailure, MatchResult, MatchSuccess, RuleMatcher
 from .rule_packs import load_active_config
+from .rule_prefilter import RulePrefilter
 from .settings import create_settings, FileDescriptor, PortNumber, Settings
 from .snmp import SNMPTrapParser
 from .syslog import SyslogFacility, SyslogPriority
@@ -182,11 +191,14 @@ def create_history_raw(
     logger: Logger,
     event_columns: Columns,
     history_columns: Columns,
+    perfcounters: Perfcounters | None = None,
 ) -> History:
     """Factory for History objects based on the current configuration."""
     match config["archive_mode"]:
         case "file":
             return FileHistory(settings, config, logger, event_columns, history_columns)
+        case "indexed_file":
+            return IndexedFileHistory(settings, config, logger, event_columns, history_columns)
         case "mongodb":
             return MongoDBHistory(settings, config, logger, event_columns, history_columns)
         case "sqlite":
@@ -199,6 +211,7 @@ def create_history_raw(
                 logger,
                 event_columns,
                 history_columns,
+                perfcounters,
             )
         case _ as default:
             assert_never(default)
@@ -210,9 +223,12 @@ def create_history(
     logger: Logger,
     event_columns: Columns,
     history_columns: Columns,
+    perfcounters: Perfcounters | None = None,
 ) -> History:
     """Factory for History objects based on the current configuration, optionally augmented with timing information."""
-    history = create_history_raw(settings, config, logger, event_columns, history_columns)
+    history = create_history_raw(
+        settings, config, logger, event_columns, history_columns, perfcounters
+    )
     return TimedHistory(history) if logger.isEnabledFor(DEBUG) else history
 
 
@@ -386,10 +402,12 @@ class EventServer(ECServerThread):
         self._syslog_udp: socket.socket | None = None
         self._syslog_tcp: socket.socket | None = None
         self._snmp_trap_socket: socket.socket | None = None
+        self._ingestion: IngestionPipeline | None = None
 
         self._rules: list[Rule] = []
         self._rule_by_id: dict[str | None, Rule] = {}
         self._rule_hash: dict[int, dict[int, Any]] = {}
+        self._rule_prefilter: RulePrefilter | None = None
         self._hash_stats: list[list[int]] = []  # facility/priority
         for _unused_facility in range(32):
             self._hash_stats.append([0] * 8)
@@ -430,6 +448,7 @@ class EventServer(ECServerThread):
                 Perfcounters.status_columns(),
                 cls._replication_columns(),
                 cls._event_limit_columns(),
+                cls._ingestion_columns(),
             )
         )
 
@@ -460,6 +479,13 @@ class EventServer(ECServerThread):
             ("status_event_limit_active_overall", False),
         ]
 
+    @classmethod
+    def _ingestion_columns(cls) -> Columns:
+        return [
+            ("status_ingest_queue_depth", 0),
+            ("status_ingest_queue_max_depth", 0),
+        ]
+
     def get_status(self) -> Iterable[Sequence[object]]:
         return [
             [
@@ -467,6 +493,7 @@ class EventServer(ECServerThread):
                 *self._perfcounters.get_status(),
                 *self._add_replication_status(),
                 *self._add_event_limit_status(),
+                *self._add_ingestion_status(),
             ]
         ]
 
@@ -500,6 +527,11 @@ class EventServer(ECServerThread):
             self.is_overall_event_limit_active(),
         ]
 
+    def _add_ingestion_status(self) -> list[object]:
+        if (ingestion := self._ingestion) is None:
+            return [0, 0]
+        return [ingestion.queue_depth, ingestion.max_queue_depth]
+
     def create_pipe(self) -> None:
         path = self.settings.paths.event_pipe.value
         with contextlib.suppress(Exception):
@@ -656,7 +688,24 @@ class EventServer(ECServerThread):
         # http://www.outflux.net/blog/archives/2008/03/09/using-select-on-a-fifo/
         return os.open(str(self.settings.paths.event_pipe.value), os.O_RDWR | os.O_NONBLOCK)
 
-    def serve(self) -> None:  # pylint: disable=too-many-branches
+    def serve(self) -> None:
+        if num_workers := self.settings.options.ingestion_workers:
+            self._ingestion = IngestionPipeline(
+                self._logger.getChild("ingestion"),
+                self._perfcounters,
+                self._parse_syslog_messages,
+                self.process_potential_event_instrumented,
+                num_workers,
+            )
+            self._ingestion.start()
+        try:
+            self._serve_sockets()
+        finally:
+            if self._ingestion is not None:
+                self._ingestion.stop()
+                self._ingestion = None
+
+    def _serve_sockets(self) -> None:  # pylint: disable=too-many-branches
         pipe = self.open_pipe()
         listen_list = [
             f
@@ -716,7 +765,7 @@ class EventServer(ECServerThread):
                         messages, unprocessed = parse_bytes_into_syslog_messages(
                             previous_data + new_data
                         )
-                        self.process_syslog_messages(messages, address)
+                        self._ingest_syslog_messages(messages, address)
                         client_sockets[fd] = (cs, address, unprocessed)
                     else:  # the other side is gone, no more data will ever come
                         del client_sockets[fd]  # discarding previous_data is OK, it's incomplete
@@ -732,26 +781,40 @@ class EventServer(ECServerThread):
                 messages, unprocessed_pipe_data = parse_bytes_into_syslog_messages(
                     unprocessed_pipe_data
                 )
-                self.process_syslog_messages(messages, None)
+                self._ingest_syslog_messages(messages, None)
 
             # Read events from builtin syslog server
             if self._syslog_udp is not None and self._syslog_udp in readable:
-                message, address = self._syslog_udp.recvfrom(4096)
-                self.process_syslog_messages(
-                    [message], parse_address("syslog socket (UDP)", address)
-                )
+                if self._ingestion is None:
+                    message, address = self._syslog_udp.recvfrom(4096)
+                    self.process_syslog_messages(
+                        [message], parse_address("syslog socket (UDP)", address)
+                    )
+                else:
+                    self._ingestion.submit(
+                        [
+                            (message, parse_address("syslog socket (UDP)", address))
+                            for message, address in receive_datagrams(
+                                self._syslog_udp, MAX_DATAGRAMS_PER_BATCH, 4096
+                            )
+                        ],
+                        may_drop=True,
+                    )
 
             # Read events from builtin snmptrap server
             if self._snmp_trap_socket is not None and self._snmp_trap_socket in readable:
                 message, address = self._snmp_trap_socket.recvfrom(65535)
-                self.process_potential_event_instrumented(
-                    self.create_events_from_trap(message, parse_address("SNMP trap", address))
-                )
+                events = self.create_events_from_trap(message, parse_address("SNMP trap", address))
+                if self._ingestion is None:
+                    self.process_potential_event_instrumented(events)
+                else:
+                    # The trap parser is not thread safe, so only the processing is deferred
+                    self._ingestion.submit_events(list(events))
 
             if spool_files := sorted(
                 self.settings.paths.spool_dir.value.glob("[!.]*"), key=lambda x: x.stat().st_mtime
             ):
-                self.process_syslog_messages(spool_files[0].read_bytes().splitlines(), None)
+                self._ingest_syslog_messages(spool_files[0].read_bytes().splitlines(), None)
                 spool_files[0].unlink()
                 select_timeout = 0  # enable fast processing to process further files
             else:
@@ -792,6 +855,21 @@ class EventServer(ECServerThread):
             )
         )
 
+    def _ingest_syslog_messages(
+        self, messages: Iterable[bytes], address: tuple[str, int] | None
+    ) -> None:
+        if self._ingestion is None:
+            self.process_syslog_messages(messages, address)
+        else:
+            self._ingestion.submit([(message, address) for message in messages], may_drop=False)
+
+    def _parse_syslog_messages(self, messages: Sequence[Message]) -> list[Event]:
+        logger = self._logger if self._config["debug_rules"] else None
+        return [
+            create_event_from_syslog_message(message, address, logger)
+            for message, address in messages
+        ]
+
     def do_housekeeping(self) -> None:
         with self._event_status.lock, self._lock_configuration:
             self.hk_handle_event_timeouts()
@@ -917,6 +995,7 @@ class EventServer(ECServerThread):
                         event["rule_id"],
                     )
                     event["phase"] = "open"
+                    self._event_status.reindex_event(event)
                     self._history.add(event, "DELAYOVER")
                     if rule:
                         event_has_opened(
@@ -993,9 +1072,8 @@ class EventServer(ECServerThread):
                 # First look for case 1: rule that already have at least one hit
                 # and this events in the state "counting" exist.
                 events_to_delete: list[tuple[Event, HistoryWhat]] = []
-                events = self._event_status.events()
-                for event in events:
-                    if event["rule_id"] == rule["id"] and event["phase"] == "counting":
+                for event in self._event_status.events_of_rule(rule["id"]):
+                    if event["phase"] == "counting":
                         # time has elapsed. Now lets see if we have reached
                         # the necessary count:
                         if event["count"] < expect["count"]:  # no -> trigger alarm
@@ -1046,10 +1124,8 @@ class EventServer(ECServerThread):
             merge, reset_ack = merge  # type: ignore[unreachable]
 
         if merge != "never":
-            for event in self._event_status.events():
-                if event["rule_id"] == rule["id"] and (
-                    event["phase"] == "open" or (event["phase"] == "ack" and merge == "acked")
-                ):
+            for event in self._event_status.events_of_rule(rule["id"]):
+                if event["phase"] == "open" or (event["phase"] == "ack" and merge == "acked"):
                     merge_event = event
                     break
 
@@ -1068,6 +1144,7 @@ class EventServer(ECServerThread):
             # Better rewrite (again). Rule might have changed. Also we have changed
             # the text and the user might have his own text added via set_text.
             self.rewrite_event(rule, merge_event, MatchGroups(), set_first=False)
+            self._event_status.reindex_event(merge_event)
             self._history.add(merge_event, "COUNTFAILED")
         else:
             # Create artificial event from scratch. Make sure that all important
@@ -1178,6 +1255,12 @@ class EventServer(ECServerThread):
         self._logger.info(
             "Compiled %d active rules (ignoring %d disabled rules)", count_rules, count_disabled
         )
+        # With rule debugging enabled, the users want to see why each single rule did not match.
+        self._rule_prefilter = (
+            RulePrefilter(self._rules)
+            if self._config["rule_optimizer"] and not self._config["debug_rules"]
+            else None
+        )
         if self._config["rule_optimizer"]:
             self._logger.info(
                 "Rule hash: %d rules - %d hashed, %d unspecific",
@@ -1185,6 +1268,12 @@ class EventServer(ECServerThread):
                 len(self._rules) - count_unspecific,
                 count_unspecific,
             )
+            if self._rule_prefilter is not None:
+                self._logger.info(
+                    "Rule prefilter: %d of %d rules indexed by host, text or application",
+                    self._rule_prefilter.num_indexed_rules,
+                    len(self._rules),
+                )
             for facility in list(range(23)) + [31]:
                 if facility in self._rule_hash:
                     stats = [
@@ -1262,6 +1351,13 @@ class EventServer(ECServerThread):
         else:
             rule_candidates = self._rules
 
+        # The throughput of the rule matching, up to the first matching rule
+        matching_started: float | None = time.perf_counter()
+        if self._rule_prefilter is not None:
+            num_candidates = len(rule_candidates)
+            rule_candidates = self._rule_prefilter.select(rule_candidates, event)
+            self._perfcounters.count("prefilter_skips", num_candidates - len(rule_candidates))
+
         skip_pack = None
         for rule in rule_candidates:
             # TODO: Rewrite this skipping logic, so it's blindingly obvious, even for mypy.
@@ -1278,6 +1374,11 @@ class EventServer(ECServerThread):
                 self._logger.exception(result.reason)
 
             if isinstance(result, MatchSuccess):
+                if matching_started is not None:
+                    self._perfcounters.count_time(
+                        "rule_matching", time.perf_counter() - matching_started
+                    )
+                    matching_started = None
                 self._perfcounters.count("rule_hits")
                 if self._config["debug_rules"]:
                     self._logger.info("  matching groups:\n%s", pprint.pformat(result.match_groups))
@@ -1354,6 +1455,7 @@ class EventServer(ECServerThread):
                                 )
                             existing_event["delay_until"] = time.time() + rule["delay"]
                             existing_event["phase"] = "delayed"
+                            self._event_status.reindex_event(existing_event)
                         else:
                             event_has_opened(
                                 self._history,
@@ -1403,6 +1505,8 @@ class EventServer(ECServerThread):
                 return
 
         # End of loop over rules.
+        if matching_started is not None:
+            self._perfcounters.count_time("rule_matching", time.perf_counter() - matching_started)
         if self._config["archive_orphans"]:
             self._event_status.archive_event(event)
 
@@ -2252,14 +2356,14 @@ class StatusServer(ECServerThread):
         if len(arguments) != 2:
             raise MKClientError("Wrong number of arguments for DELETE")
         event_ids, user = arguments
-        ids = {int(event_id) for event_id in event_ids.split(",")}
-        self._event_status.delete_events_by(lambda event: event["id"] in ids, user)
+        ids = sorted({int(event_id) for event_id in event_ids.split(",")})
+        self._event_status.delete_events_by_ids(ids, user)
 
     def handle_command_delete_events_of_host(self, arguments: list[str]) -> None:
         if len(arguments) != 2:
             raise MKClientError("Wrong number of arguments for DELETE_EVENTS_OF_HOST")
         hostname, user = arguments
-        self._event_status.delete_events_by(lambda event: event["host"] == hostname, user)
+        self._event_status.delete_events_of_host(hostname, user)
 
     def handle_command_update(self, arguments: list[str]) -> None:
         event_ids, user, acknowledged, comment, contact = arguments
@@ -2273,6 +2377,7 @@ class StatusServer(ECServerThread):
                 if ack and event["phase"] not in {"open", "ack"}:
                     raise MKClientError("You cannot acknowledge an event that is not open.")
                 event["phase"] = "ack" if ack else "open"
+                self._event_status.reindex_event(event)
             if comment:
                 event["comment"] = comment
             if contact:
@@ -2305,12 +2410,16 @@ class StatusServer(ECServerThread):
             getLogger("cmk.mkeventd"),
             self._lock_configuration,
             self._history,
+            self._perfcounters,
             self._event_status,
             self._event_server,
             self,
             self._slave_status,
         )
 
+    def close_history(self) -> None:
+        self._history.close()
+
     def handle_command_reopenlog(self) -> None:
         self._logger.info("Closing this logfile")
         open_log(self.settings.paths.log_file.value)
@@ -2500,6 +2609,7 @@ def run_eventd(  # pylint: disable=too-many-branches
                     logger,
                     lock_configuration,
                     history,
+                    perfcounters,
                     event_status,
                     event_server,
                     status_server,
@@ -2512,6 +2622,8 @@ def run_eventd(  # pylint: disable=too-many-branches
     # Now wait for termination of the server threads
     event_server.join()
     status_server.join()
+    # The history may have been replaced by a reload, so ask for the current one
+    status_server.close_history()
 
 
 # .
@@ -2555,8 +2667,7 @@ class EventStatus:
         self._history = history
 
     def flush(self) -> None:
-        # TODO: Improve types!
-        self._events: list[Event] = []
+        self._events = EventStore()
         self._next_event_id = 1
         self._rule_stats: dict[str, int] = {}
         # needed for expecting rules
@@ -2569,14 +2680,18 @@ class EventStatus:
         # - number of rule misses
 
     def events(self) -> list[Event]:
-        # TODO: Improve type!
-        return self._events
+        """A snapshot of all events, so the caller may remove events while iterating"""
+        return list(self._events)
 
     def event(self, eid: int) -> Event | None:
-        for event in self._events:
-            if event["id"] == eid:
-                return event
-        return None
+        return self._events.get(eid)
+
+    def events_of_rule(self, rule_id: str | None) -> list[Event]:
+        return self._events.by_rule(rule_id)
+
+    def reindex_event(self, event: Event) -> None:
+        """Needs to be called after changing the rule, host or phase of a stored event"""
+        self._events.reindex(event)
 
     def interval_start(self, rule_id: str, interval: ExpectInterval) -> int:
         """
@@ -2621,16 +2736,17 @@ class EventStatus:
     def pack_status(self) -> PackedEventStatus:
         return PackedEventStatus(
             next_event_id=self._next_event_id,
-            events=self._events,
+            events=list(self._events),
             rule_stats=self._rule_stats,
             interval_starts=self._interval_starts,
         )
 
     def unpack_status(self, status: PackedEventStatus) -> None:
         self._next_event_id = status["next_event_id"]
-        self._events = status["events"]
+        self._events = EventStore(status["events"])
         self._rule_stats = status["rule_stats"]
         self._interval_starts = status["interval_starts"]
+        self._initialize_event_limit_status()
 
     def save_status(self) -> None:
         now = time.time()
@@ -2660,7 +2776,7 @@ class EventStatus:
             try:
                 status = ast.literal_eval(path.read_text(encoding="utf-8"))
                 self._next_event_id = status["next_event_id"]
-                self._events = status["events"]
+                self._events = EventStore(status["events"])
                 self._rule_stats = status["rule_stats"]
                 self._interval_starts = status.get("interval_starts", {})
                 self._logger.info("Loaded event state from %s.", path)
@@ -2678,6 +2794,7 @@ class EventStatus:
             if "core_host" not in event:
                 event_server.add_core_host_to_event(event)
                 event["host_in_downtime"] = False
+            self._events.reindex(event)
 
         # core_host is needed to initialize the status
         self._initialize_event_limit_status()
@@ -2718,7 +2835,7 @@ class EventStatus:
         self._perfcounters.count("events")
         event["id"] = self._next_event_id
         self._next_event_id += 1
-        self._events.append(event)
+        self._events.add(event)
         self.num_existing_events += 1
         self._count_event_add(event)
         self._history.add(event, "NEW")
@@ -2733,17 +2850,18 @@ class EventStatus:
     def remove_event(self, event: Event, delete_reason: HistoryWhat, user: str = "") -> None:
         try:
             self._events.remove(event)
-            self._history.add(event, delete_reason, user)
-            self._count_event_remove(event)
-        except ValueError:
+        except KeyError:
             self._logger.exception("Cannot remove event %d: not present", event["id"])
+            return
+        self._history.add(event, delete_reason, user)
+        self._count_event_remove(event)
 
     # protected by self.lock
     def remove_oldest_event(self, ty: LimitKind, event: Event) -> None:
         if ty == "overall":
             self._logger.log(VERBOSE, "  Removing oldest event")
-            oldest_event = self._events[0]
-            self.remove_event(oldest_event, "AUTODELETE")
+            if (oldest_event := self._events.oldest()) is not None:
+                self.remove_event(oldest_event, "AUTODELETE")
         elif ty == "by_rule" and event["rule_id"] is not None:
             self._logger.log(VERBOSE, '  Removing oldest event of rule "%s"', event["rule_id"])
             self._remove_oldest_event_of_rule(event["rule_id"])
@@ -2753,17 +2871,13 @@ class EventStatus:
 
     # protected by self.lock
     def _remove_oldest_event_of_rule(self, rule_id: str) -> None:
-        for event in self._events:
-            if event["rule_id"] == rule_id:
-                self.remove_event(event, "AUTODELETE")
-                return
+        if (event := self._events.oldest_by_rule(rule_id)) is not None:
+            self.remove_event(event, "AUTODELETE")
 
     # protected by self.lock
     def _remove_oldest_event_of_host(self, hostname: str) -> None:
-        for event in self._events:
-            if event["host"] == hostname:
-                self.remove_event(event, "AUTODELETE")
-                return
+        if (event := self._events.oldest_by_host(hostname)) is not None:
+            self.remove_event(event, "AUTODELETE")
 
     # protected by self.lock
     def get_num_existing_events_by(self, ty: LimitKind, event: Event) -> int:
@@ -2791,10 +2905,8 @@ class EventStatus:
         """
         with self.lock:
             to_delete = []
-            for event in self._events:
-                if event["rule_id"] == rule["id"] and self.cancelling_match(
-                    match_groups, new_event, event, rule
-                ):
+            for event in self._events.by_rule(rule["id"]):
+                if self.cancelling_match(match_groups, new_event, event, rule):
                     # Fill a few fields of the cancelled event with data from
                     # the cancelling event so that action scripts have useful
                     # values and the logfile entry if more relevant.
@@ -2967,12 +3079,12 @@ class EventStatus:
                 preserve["contact"] = found["contact"]
         found.update(event)
         found.update(preserve)
+        self._events.reindex(found)
 
     def count_expected_event(self, event_server: EventServer, event: Event) -> None:
-        for ev in self._events:
-            if ev["rule_id"] == event["rule_id"] and ev["phase"] == "counting":
-                self.count_event_up(ev, event)
-                return
+        for ev in self._events.by_rule_and_phase(event["rule_id"], "counting"):
+            self.count_event_up(ev, event)
+            return
 
         # None found, create one
         event["count"] = 1
@@ -2987,31 +3099,30 @@ class EventStatus:
         since the event has been created because the count was too
         low in the specified period of time.
         """
-        for ev in self._events:
-            if ev["rule_id"] == event["rule_id"]:
-                if ev["phase"] == "ack" and not count["count_ack"]:
-                    continue  # skip acknowledged events
+        for ev in self._events.by_rule(event["rule_id"]):
+            if ev["phase"] == "ack" and not count["count_ack"]:
+                continue  # skip acknowledged events
 
-                if count["separate_host"] and ev["host"] != event["host"]:
-                    continue  # treat events with separated hosts separately
+            if count["separate_host"] and ev["host"] != event["host"]:
+                continue  # treat events with separated hosts separately
 
-                if count["separate_application"] and ev["application"] != event["application"]:
-                    continue  # same for application
+            if count["separate_application"] and ev["application"] != event["application"]:
+                continue  # same for application
 
-                if count["separate_match_groups"] and ev["match_groups"] != event["match_groups"]:
-                    continue
+            if count["separate_match_groups"] and ev["match_groups"] != event["match_groups"]:
+                continue
 
-                count_duration = count.get("count_duration")
-                if count_duration is not None and ev["first"] + count_duration < event["time"]:
-                    # Counting has been discontinued on this event after a certain time
-                    continue
+            count_duration = count.get("count_duration")
+            if count_duration is not None and ev["first"] + count_duration < event["time"]:
+                # Counting has been discontinued on this event after a certain time
+                continue
 
-                if ev["host_in_downtime"] != event["host_in_downtime"]:
-                    continue  # treat events with different downtime states separately
+            if ev["host_in_downtime"] != event["host_in_downtime"]:
+                continue  # treat events with different downtime states separately
 
-                found = ev
-                self.count_event_up(found, event)
-                break
+            found = ev
+            self.count_event_up(found, event)
+            break
         else:
             event["count"] = 1
             event["phase"] = "counting"
@@ -3021,19 +3132,28 @@ class EventStatus:
         # Did we just count the event that was just one too much?
         if found["phase"] == "counting" and found["count"] >= count["count"]:
             found["phase"] = "open"
+            self._events.reindex(found)
             return found  # do event action, return found copy of event
         return None  # do not do event action
 
     def delete_events_by(self, predicate: Callable[[Event], bool], user: str) -> None:
-        for event in self._events[:]:
-            if predicate(event):
-                event["phase"] = "closed"
-                if user:
-                    event["owner"] = user
-                self.remove_event(event, "DELETE", user)
+        self.delete_events([event for event in self._events if predicate(event)], user)
+
+    def delete_events_by_ids(self, ids: Iterable[int], user: str) -> None:
+        self.delete_events([e for eid in ids if (e := self._events.get(eid)) is not None], user)
+
+    def delete_events_of_host(self, hostname: str, user: str) -> None:
+        self.delete_events(self._events.by_host(hostname), user)
+
+    def delete_events(self, events: Iterable[Event], user: str) -> None:
+        for event in events:
+            event["phase"] = "closed"
+            if user:
+                event["owner"] = user
+            self.remove_event(event, "DELETE", user)
 
     def get_events(self) -> Iterable[Event]:
-        return self._events
+        return list(self._events)
 
     def get_rule_stats(self) -> Iterable[tuple[str, int]]:
         return sorted(self._rule_stats.items(), key=lambda x: x[0])
@@ -3347,6 +3467,7 @@ def reload_configuration(
     logger: Logger,
     lock_configuration: ECLock,
     history: History,
+    perfcounters: Perfcounters,
     event_status: EventStatus,
     event_server: EventServer,
     status_server: StatusServer,
@@ -3357,7 +3478,12 @@ def reload_configuration(
 
         history.close()
         history = create_history(
-            settings, config, logger, StatusTableEvents.columns, StatusTableHistory.columns
+            settings,
+            config,
+            logger,
+            StatusTableEvents.columns,
+            StatusTableHistory.columns,
+            perfcounters,
         )
         event_server.reload_configuration(config, history)
 
@@ -3399,8 +3525,14 @@ def main() -> None:
 
         slave_status = default_slave_status_master()
         config = load_configuration(settings, logger, slave_status)
+        perfcounters = Perfcounters(logger.getChild("lock.perfcounters"))
         history = create_history(
-            settings, config, logger, StatusTableEvents.columns, StatusTableHistory.columns
+            settings,
+            config,
+            logger,
+            StatusTableEvents.columns,
+            StatusTableHistory.columns,
+            perfcounters,
         )
 
         pid_path = settings.paths.pid_file.value
@@ -3423,7 +3555,6 @@ def main() -> None:
         settings.paths.status_file.value.parent.mkdir(parents=True, exist_ok=True)
 
         # First do all things that might fail, before daemonizing
-        perfcounters = Perfcounters(logger.getChild("lock.perfcounters"))
         event_status = EventStatus(
             settings, config, perfcounters, history, logger.getChild("EventStatus")
         )
@@ -23,8 +23,10 @@ class Perfcounters:
     _counter_names: Sequence[str] = [
         "messages",
         "rule_tries",
+        "prefilter_skips",
         "rule_hits",
         "drops",
+        "ingest_drops",
         "overflows",
         "events",
         "connects",
@@ -33,10 +35,17 @@ class Perfcounters:
     # Average processing times
     _weights: Mapping[str, float] = {
         "processing": 0.99,  # event processing
+        "rule_matching": 0.99,  # finding the first matching rule of an event
         "sync": 0.95,  # Replication sync
         "request": 0.95,  # Client requests
+        "history_commit": 0.95,  # Commits of the history background writer
     }
 
+    # Current levels, not accumulated
+    _gauge_names: Sequence[str] = [
+        "history_buffer_fill",
+    ]
+
     # TODO: Why aren't self._times / self._rates / ... not initialized with their defaults?
     def __init__(self, logger: Logger) -> None:
         self._lock = ECLock(logger)
@@ -47,13 +56,14 @@ class Perfcounters:
         self._rates: dict[str, float] = {}
         self._average_rates: dict[str, float] = {}
         self._times: dict[str, float] = {}
+        self._gauges = {n: 0 for n in self._gauge_names}
         self._last_statistics: float | None = None
 
         self._logger = logger.getChild("Perfcounters")
 
-    def count(self, counter: str) -> None:
+    def count(self, counter: str, amount: int = 1) -> None:
         with self._lock:
-            self._counters[counter] += 1
+            self._counters[counter] += amount
 
     def count_time(self, counter: str, ptime: float) -> None:
         with self._lock:
@@ -62,6 +72,10 @@ class Perfcounters:
             else:
                 self._times[counter] = ptime
 
+    def set_gauge(self, gauge: str, value: int) -> None:
+        with self._lock:
+            self._gauges[gauge] = value
+
     def do_statistics(self) -> None:
         with self._lock:
             now = time.time()
@@ -96,6 +110,9 @@ class Perfcounters:
         for name in cls._weights:
             columns.append((f"status_average_{name}_time", 0.0))
 
+        for name in cls._gauge_names:
+            columns.append((f"status_{name}", 0))
+
         return columns
 
     def get_status(self) -> Sequence[float]:
@@ -114,4 +131,7 @@ class Perfcounters:
             for name in self._weights:
                 row.append(self._times.get(name, 0.0))
 
+            for name in self._gauge_names:
+                row.append(self._gauges[name])
+
             return row
@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+# Copyright (C) 2024 Checkmk GmbH - License: GNU General Public License v2
+# This file is part of Checkmk (https://checkmk.com). It is subject to the terms and
+# conditions defined in the file COPYING, which is part of this source code package.
+
+"""Cheap pre-selection of the rules which could possibly match an event
+
+The full matching of a rule (see RuleMatcher) evaluates several regular
+expressions. With thousands of rules most of them can be excluded much cheaper:
+
+* Rules with a plain (non-regex) host condition are indexed by that host name.
+* For the message and the syslog application we extract literal strings from the
+  patterns which have to be contained in every matching text. All of these
+  literals are searched at once with an Aho-Corasick automaton.
+
+A rule survives the prefilter when all of its indexed conditions are fulfilled.
+The prefilter never excludes a rule that would match, so the first matching rule
+stays the same. Rules we can not reason about (e.g. inverted matching) always
+survive.
+"""
+
+import re
+from collections.abc import Collection, Iterable, Mapping, Sequence
+from typing import Final, Literal
+
+from .config import Rule, TextPattern
+from .event import Event
+
+# The parser of the re module is private and may change with any Python version.
+# Without it (or when it fails) the patterns are simply not used for prefiltering.
+try:
+    from re import _parser  # type: ignore[attr-defined]
+except ImportError:
+    _parser = None
+
+# Shorter literals are not selective enough to be worth it
+_MIN_LITERAL_LENGTH: Final = 3
+
+# The non-ASCII characters a case insensitive regex matches for an ASCII letter.
+# str.lower() does not map them to that letter (or, for "İ", adds a combining dot).
+_IGNORECASE_EXTRAS: Final = str.maketrans({"İ": "i", "ı": "i", "ſ": "s", "K": "k"})
+
+_RuleRequirement = frozenset[str]  # at least one of these literals must be found
+
+
+def normalize_text(text: str) -> str:
+    """Bring a text into the form the literals are searched in"""
+    return text.lower() if text.isascii() else text.translate(_IGNORECASE_EXTRAS).lower()
+
+
+def required_literals(pattern: TextPattern) -> _RuleRequirement | None:
+    """Literals of which at least one is contained in every text the pattern matches
+
+    The literals are lower case ASCII strings, they have to be searched in texts
+    processed by normalize_text(). Returns None when we can not find any such
+    literals.
+
+    >>> sorted(required_literals("foo bar"))
+    ['foo bar']
+    >>> sorted(required_literals(re.compile("^Link (up|down) on port [0-9]+", re.I)))
+    [' on port ']
+    >>> sorted(required_literals(re.compile("(Disk|Filesystem) full", re.I)))
+    [' full']
+    >>> sorted(required_literals(re.compile("(timeout|refused)$", re.I)))
+    ['refused', 'timeout']
+    >>> sorted(required_literals(re.compile("[0-9]+ errors?", re.I)))
+    [' error']
+    >>> required_literals(re.compile("(abc)?xy", re.I)) is None
+    True
+    """
+    if isinstance(pattern, str):
+        return _best_requirement(_requirement_of_run(run) for run in _ascii_runs(pattern))
+    if _parser is None:
+        return None
+    try:
+        return _requirement_of_items(_parser.parse(pattern.pattern, pattern.flags))
+    except (re.error, AttributeError, AssertionError, TypeError, ValueError):
+        return None
+
+
+def _ascii_runs(text: str) -> Iterable[str]:
+    run: list[str] = []
+    for char in text:
+        if char.isascii():
+            run.append(char)
+        elif run:
+            yield "".join(run)
+            run = []
+    if run:
+        yield "".join(run)
+
+
+def _requirement_of_run(run: str) -> _RuleRequirement | None:
+    return frozenset([run.lower()]) if len(run) >= _MIN_LITERAL_LENGTH else None
+
+
+def _requirement_of_items(items: Iterable[tuple[object, object]]) -> _RuleRequirement | None:
+    """Find the most selective requirement within a sequence of parsed regex items
+
+    Every item of a sequence has to match, so we are free to pick any of them.
+    """
+    candidates: list[_RuleRequirement | None] = []
+    run: list[str] = []
+    for op, av in items:
+        if op is _parser.LITERAL and isinstance(av, int) and av < 128:
+            run.append(chr(av))
+            continue
+        candidates.append(_requirement_of_run("".join(run)))
+        run = []
+        candidates.append(_requirement_of_item(op, av))
+    candidates.append(_requirement_of_run("".join(run)))
+    return _best_requirement(candidates)
+
+
+def _requirement_of_item(op: object, av: object) -> _RuleRequirement | None:
+    if op is _parser.SUBPATTERN:
+        assert isinstance(av, tuple)
+        return _requirement_of_items(av[3])
+    if op is _parser.ATOMIC_GROUP:
+        assert isinstance(av, _parser.SubPattern)
+        return _requirement_of_items(av)
+    if op in (_parser.MAX_REPEAT, _parser.MIN_REPEAT, _parser.POSSESSIVE_REPEAT):
+        assert isinstance(av, tuple)
+        min_repeat, _max_repeat, item = av
+        return _requirement_of_items(item) if min_repeat >= 1 else None
+    if op is _parser.BRANCH:
+        assert isinstance(av, tuple)
+        union: set[str] = set()
+        for branch in av[1]:
+            if (alternative := _requirement_of_items(branch)) is None:
+                return None
+            union |= alternative
+        return frozenset(union)
+    return None  # character classes, anchors, back references, lookarounds, ...
+
+
+def _best_requirement(
+    requirements: Iterable[_RuleRequirement | None],
+) -> _RuleRequirement | None:
+    """Prefer long literals, they are found less often"""
+    return max(
+        (r for r in requirements if r is not None),
+        key=lambda r: (min(len(literal) for literal in r), -len(r)),
+        default=None,
+    )
+
+
+def _either_requirement(
+    rule: Rule,
+    key: Literal["match", "match_application"],
+    alternative_key: Literal["match_ok", "cancel_application"],
+) -> _RuleRequirement | None:
+    """The requirement of a condition which is also fulfilled by its cancelling counterpart"""
+    if key not in rule:
+        return None  # the condition always matches
+    requirement = required_literals(rule[key])
+    if alternative_key not in rule or requirement is None:
+        return requirement
+    alternative = required_literals(rule[alternative_key])
+    return None if alternative is None else requirement | alternative
+
+
+class LiteralMatcher:
+    """Aho-Corasick automaton finding all of a set of literals in a text at once
+
+    Each literal is associated with a collection of values (rule positions in our
+    case). find() returns the union of the values of all literals in the text.
+    """
+
+    def __init__(self, literals: Mapping[str, Collection[int]]) -> None:
+        self._goto: list[dict[str, int]] = [{}]
+        outputs: list[set[int]] = [set()]
+        for literal, values in literals.items():
+            state = 0
+            for char in literal:
+                if (next_state := self._goto[state].get(char)) is None:
+                    next_state = len(self._goto)
+                    self._goto[state][char] = next_state
+                    self._goto.append({})
+                    outputs.append(set())
+                state = next_state
+            outputs[state].update(values)
+
+        # Breadth first, so the failure states are always complete before they are used
+        self._fail = [0] * len(self._goto)
+        queue = list(self._goto[0].values())
+        for state in queue:
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[next_state] = self._goto[fail].get(char, 0)
+                outputs[next_state] |= outputs[self._fail[next_state]]
+        self._outputs = [frozenset(output) for output in outputs]
+
+    def find(self, text: str) -> set[int]:
+        goto = self._goto
+        fail = self._fail
+        outputs = self._outputs
+        found: set[int] = set()
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if outputs[state]:
+                found |= outputs[state]
+        return found
+
+
+class RulePrefilter:
+    def __init__(self, rules: Sequence[Rule]) -> None:
+        self._position_by_id = {id(rule): position for position, rule in enumerate(rules)}
+        self._unconditional: set[int] = set()
+        self._num_requirements: dict[int, int] = {}
+        self._by_host: dict[str, list[int]] = {}
+        text_literals: dict[str, list[int]] = {}
+        application_literals: dict[str, list[int]] = {}
+
+        for position, rule in enumerate(rules):
+            if rule.get("invert_matching") or rule.get("disabled"):
+                self._unconditional.add(position)
+                continue
+
+            num_requirements = 0
+            if isinstance(host := rule.get("match_host"), str):
+                self._by_host.setdefault(host, []).append(position)
+                num_requirements += 1
+
+            if (text := _either_requirement(rule, "match", "match_ok")) is not None:
+                for literal in text:
+                    text_literals.setdefault(literal, []).append(position)
+                num_requirements += 1
+
+            if (
+                application := _either_requirement(rule, "match_application", "cancel_application")
+            ) is not None:
+                for literal in application:
+                    application_literals.setdefault(literal, []).append(position)
+                num_requirements += 1
+
+            if num_requirements:
+                self._num_requirements[position] = num_requirements
+            else:
+                self._unconditional.add(position)
+
+        self._text_matcher = LiteralMatcher(text_literals)
+        self._application_matcher = LiteralMatcher(application_literals)
+
+    @property
+    def num_indexed_rules(self) -> int:
+        return len(self._num_requirements)
+
+    def select(self, rules: Iterable[Rule], event: Event) -> list[Rule]:
+        """Filter the given rules (in their order) down to the ones which could match"""
+        survivors = self._survivors(event)
+        return [rule for rule in rules if self._position_by_id[id(rule)] in survivors]
+
+    def _survivors(self, event: Event) -> set[int]:
+        hits: dict[int, int] = {}
+        for position in self._by_host.get(event["host"].lower(), ()):
+            hits[position] = hits.get(position, 0) + 1
+        for position in self._text_matcher.find(normalize_text(event["text"])):
+            hits[position] = hits.get(position, 0) + 1
+        if application := event["application"]:
+            for position in self._application_matcher.find(normalize_text(application)):
+                hits[position] = hits.get(position, 0) + 1
+        survivors = {p for p, num in hits.items() if num == self._num_requirements[p]}
+        survivors |= self._unconditional
+        return survivors
@@ -179,6 +179,26 @@ class ECArgumentParser(ArgumentParser):
             action="store_true",
             help="create performance profile for event thread",
         )
+        self.add_argument(
+            "--ingestion-workers",
+            metavar="N",
+            type=self._non_negative_int,
+            default=0,
+            help=(
+                "receive messages in batches and parse them with N worker threads, "
+                "decoupled from the rule matching (default: 0, process inline)"
+            ),
+        )
+
+    @staticmethod
+    def _non_negative_int(value: str) -> int:
+        try:
+            number = int(value)
+            if number < 0:
+                raise ValueError
+        except ValueError as e:
+            raise ArgumentTypeError(f"invalid non-negative number: {repr(value)}") from e
+        return number
 
     @staticmethod
     def _file_descriptor(value: str) -> FileDescriptor:
@@ -220,6 +240,7 @@ class Options(NamedTuple):
     debug: bool
     profile_status: bool
     profile_event: bool
+    ingestion_workers: int
 
 
 class Settings(NamedTuple):
@@ -244,6 +265,7 @@ def create_settings(version: str, omd_root: Path, argv: list[str]) -> Settings:
         debug=args.debug,
         profile_status=args.profile_status,
         profile_event=args.profile_event,
+        ingestion_workers=args.ingestion_workers,
     )
     return Settings(paths=paths, options=options)
 
@@ -17,10 +17,12 @@ from ._nofetcher import NoFetcher, NoFetcherError
 from ._piggyback import PiggybackFetcher
 from ._program import ProgramFetcher
 from ._snmp import SNMPFetcher, SNMPScanConfig, SNMPSectionMeta
+from ._snmpscheduler import DeviceLimits, SNMPFetchScheduler
 from ._tcp import TCPFetcher, TLSConfig
 
 __all__ = [
     "decrypt_by_agent_protocol",
+    "DeviceLimits",
     "NoFetcherError",
     "Fetcher",
     "get_raw_data",
@@ -32,6 +34,7 @@ __all__ = [
     "ProgramFetcher",
     "SNMPScanConfig",
     "SNMPFetcher",
+    "SNMPFetchScheduler",
     "SNMPSectionMeta",
     "TCPEncryptionHandling",
     "TCPFetcher",
@@ -17,6 +17,7 @@ from cmk.utils.sectionname import SectionMap, SectionName
 
 from cmk.snmplib import (
     get_snmp_table,
+    prefetch_snmp_tables,
     SNMPBackend,
     SNMPHostConfig,
     SNMPRawData,
@@ -28,6 +29,7 @@ from cmk.checkengine.parser import SectionStore
 
 from ._abstract import Fetcher, Mode
 from ._snmpscan import gather_available_raw_section_names, SNMPScanConfig
+from ._walkcache import CachedWalks, encode_walks
 from .snmp import make_backend, SNMPPluginStore
 
 __all__ = ["SNMPFetcher", "SNMPSectionMeta", "SNMPScanConfig"]
@@ -42,82 +44,128 @@ class WalkCache(MutableMapping[tuple[str, str, bool], SNMPRowInfo]):  # pylint:
     The fetched data is always saved to a file *if* the respective OID is marked as being cached
     by the plug-in using `OIDCached` (that is: if the save_to_cache attribute of the OID object
     is true).
+
+    All walks of a host are saved to one file, see `cmk.fetchers._walkcache`.  Loading
+    the cache only reads the index of the file, the walks are decoded when they are used.
+    The file is only written if a cached walk was added or removed.
     """
 
-    __slots__ = ("_store", "_path", "_logger")
+    __slots__ = ("_store", "_path", "_logger", "_cached", "_cached_keys", "_changed")
 
     def __init__(self, walk_cache: Path, logger: logging.Logger) -> None:
         self._store: dict[tuple[str, str, bool], SNMPRowInfo] = {}
         self._path = walk_cache
         self._logger = logger
+        self._cached: Mapping[tuple[str, str], SNMPRowInfo] = {}
+        # The walks of the cache file not decoded (or removed) yet
+        self._cached_keys: set[tuple[str, str]] = set()
+        self._changed = False
 
-    def _read_row(self, path: Path) -> SNMPRowInfo:
-        return store.load_object_from_file(path, default=None)
-
-    def _write_row(self, path: Path, rowinfo: SNMPRowInfo) -> None:
-        return store.save_object_to_file(path, rowinfo, pretty=False)
-
-    @staticmethod
-    def _oid2name(fetchoid: str, context_hash: str) -> str:
-        return f"OID{fetchoid}-{context_hash}"
-
-    @staticmethod
-    def _name2oid(basename: str) -> tuple[str, str]:
-        name_parts = basename[3:].split("-", 1)
-        return name_parts[0], name_parts[1]
+    @property
+    def _file_path(self) -> Path:
+        return self._path / "walks"
 
     def _iterfiles(self) -> Iterable[Path]:
         return self._path.iterdir() if self._path.is_dir() else ()
 
     def __repr__(self) -> str:
-        return f"{type(self).__name__}({self._store!r})"
+        return f"{type(self).__name__}({self._store!r}, cached={sorted(self._cached_keys)!r})"
 
     def __getitem__(self, key: tuple[str, str, bool]) -> SNMPRowInfo:
-        return self._store.__getitem__(key)
+        try:
+            return self._store[key]
+        except KeyError:
+            fetchoid, context_hash, save_flag = key
+            if not save_flag or (fetchoid, context_hash) not in self._cached_keys:
+                raise
+
+        self._logger.debug(f"  Loading {fetchoid} from walk cache {self._file_path}")
+        try:
+            rowinfo = self._cached[(fetchoid, context_hash)]
+        except MKTimeout:
+            raise
+        except Exception:
+            self._logger.debug(f"  Failed to load {fetchoid} from walk cache {self._file_path}")
+            self._cached_keys.discard((fetchoid, context_hash))
+            self._changed = True
+            raise KeyError(key)
+
+        self._cached_keys.discard((fetchoid, context_hash))
+        self._store[key] = rowinfo
+        return rowinfo
+
+    def __contains__(self, key: object) -> bool:
+        return key in self._store or (
+            isinstance(key, tuple) and len(key) == 3 and key[2] and key[:2] in self._cached_keys
+        )
 
     def __setitem__(self, key: tuple[str, str, bool], value: SNMPRowInfo) -> None:
+        fetchoid, context_hash, save_flag = key
+        if save_flag:
+            self._cached_keys.discard((fetchoid, context_hash))
+            self._changed = True
         return self._store.__setitem__(key, value)
 
     def __delitem__(self, key: tuple[str, str, bool]) -> None:
-        return self._store.__delitem__(key)
+        fetchoid, context_hash, save_flag = key
+        if save_flag and (fetchoid, context_hash) in self._cached_keys:
+            self._cached_keys.remove((fetchoid, context_hash))
+        else:
+            self._store.__delitem__(key)
+        self._changed |= save_flag
 
     def __iter__(self) -> Iterator[tuple[str, str, bool]]:
-        return self._store.__iter__()
+        yield from self._store
+        for fetchoid, context_hash in list(self._cached_keys):
+            yield fetchoid, context_hash, True
 
     def __len__(self) -> int:
-        return self._store.__len__()
+        return len(self._store) + len(self._cached_keys)
 
     def clear(self) -> None:
         for path in self._iterfiles():
             path.unlink(missing_ok=True)
+        self._cached = {}
+        self._cached_keys.clear()
+        self._changed = True
 
     def load(self) -> None:
-        """Try to read the OIDs data from cache files"""
-        for path in self._iterfiles():
-            fetchoid, context_hash = self._name2oid(path.name)
+        """Read the index of the cache file"""
+        try:
+            self._cached = CachedWalks.load(self._file_path)
+        except FileNotFoundError:
+            return
+        except MKTimeout:
+            raise
+        except Exception:
+            # Also empty or old files, the cache is written anew on the next save.
+            self._logger.debug(f"  Failed to load walk cache {self._file_path}")
+            self._changed = True
+            return
+        self._cached_keys = set(self._cached)
 
-            self._logger.debug(f"  Loading {fetchoid} from walk cache {path}")
+    def save(self) -> None:
+        if not self._changed:
+            return
+
+        walks = {
+            (fetchoid, context_hash): rowinfo
+            for (fetchoid, context_hash, save_flag), rowinfo in self._store.items()
+            if save_flag
+        }
+        for key in list(self._cached_keys):
             try:
-                read_walk = self._read_row(path)
-            except MKTimeout:
-                raise
-            except Exception:
-                self._logger.debug(f"  Failed to load {fetchoid} from walk cache {path}")
+                walks[key] = self[(*key, True)]
+            except KeyError:
                 continue
 
-            if read_walk is not None:
-                self._store[(fetchoid, context_hash, True)] = read_walk
-
-    def save(self) -> None:
         self._path.mkdir(parents=True, exist_ok=True)
-
-        for (fetchoid, context_hash, save_flag), rowinfo in self._store.items():
-            if not save_flag:
-                continue
-
-            path = self._path / self._oid2name(fetchoid, context_hash)
-            self._logger.debug(f"  Saving walk of {fetchoid} to walk cache {path}")
-            self._write_row(path, rowinfo)
+        for path in self._iterfiles():
+            if path.name.startswith("OID"):
+                path.unlink(missing_ok=True)  # A walk in the old format, one file per walk
+        self._logger.debug(f"  Saving {len(walks)} walks to walk cache {self._file_path}")
+        store.save_bytes_to_file(self._file_path, encode_walks(walks))
+        self._changed = False
 
 
 @dataclasses.dataclass(init=False)
@@ -181,6 +229,7 @@ class SNMPFetcher(Fetcher[SNMPRawData]):
             section_store_path,
             logger=self._logger,
         )
+        self._injected_backend: SNMPBackend | None = None
         self._backend: SNMPBackend | None = None
 
     def __eq__(self, other: object) -> bool:
@@ -228,9 +277,15 @@ class SNMPFetcher(Fetcher[SNMPRawData]):
             + ")"
         )
 
+    def use_backend(self, backend: SNMPBackend | None) -> None:
+        """Open the fetcher with the given backend instead of its own one, if any"""
+        self._injected_backend = backend
+
     def open(self) -> None:
-        self._backend = make_backend(
-            self.snmp_config, self._logger, stored_walk_path=self.stored_walk_path
+        self._backend = (
+            make_backend(self.snmp_config, self._logger, stored_walk_path=self.stored_walk_path)
+            if self._injected_backend is None
+            else self._injected_backend
         )
 
     def close(self) -> None:
@@ -304,7 +359,7 @@ class SNMPFetcher(Fetcher[SNMPRawData]):
             raise MKFetcherError("missing backend")
 
         now = int(time.time())
-        persisted_sections = self._section_store.load() if mode is Mode.CHECKING else {}
+        persisted_sections = self._section_store.load_validity() if mode is Mode.CHECKING else {}
         section_names = self._get_selection(mode)
         section_names |= self._detect(
             select_from=self._get_detected_sections(mode) - section_names, backend=self._backend
@@ -321,25 +376,35 @@ class SNMPFetcher(Fetcher[SNMPRawData]):
             walk_cache.clear()
             walk_cache_msg = "SNMP walk cache cleared"
 
+        outdated_section_names = [
+            section_name
+            for section_name in self._sort_section_names(section_names)
+            if section_name not in persisted_sections or now > persisted_sections[section_name][1]
+        ]
+        prefetch_snmp_tables(
+            (
+                (section_name, tree)
+                for section_name in outdated_section_names
+                for tree in self.plugin_store[section_name].trees
+            ),
+            walk_cache=walk_cache,
+            backend=self._backend,
+        )
+
         fetched_data: dict[SectionName, SNMPRawDataElem] = {}
-        for section_name in self._sort_section_names(section_names):
-            try:
-                _from, until, _section = persisted_sections[section_name]
-                if now > until:
-                    raise LookupError(section_name)
-            except LookupError:
-                self._logger.debug("%s: Fetching data (%s)", section_name, walk_cache_msg)
-
-                fetched_data[section_name] = [
-                    get_snmp_table(
-                        section_name=section_name,
-                        tree=tree,
-                        walk_cache=walk_cache,
-                        backend=self._backend,
-                        log=self._logger.debug,
-                    )
-                    for tree in self.plugin_store[section_name].trees
-                ]
+        for section_name in outdated_section_names:
+            self._logger.debug("%s: Fetching data (%s)", section_name, walk_cache_msg)
+
+            fetched_data[section_name] = [
+                get_snmp_table(
+                    section_name=section_name,
+                    tree=tree,
+                    walk_cache=walk_cache,
+                    backend=self._backend,
+                    log=self._logger.debug,
+                )
+                for tree in self.plugin_store[section_name].trees
+            ]
 
         walk_cache.save()
 
@@ -4,15 +4,20 @@
 # conditions defined in the file COPYING, which is part of this source code package.
 """SNMP caching"""
 
+import hashlib
 import os
+import time
+from collections.abc import Iterable, Mapping, Sequence
 from pathlib import Path
+from typing import Final
 
 from cmk.ccc import store
 
 import cmk.utils.cleanup
 from cmk.utils.hostaddress import HostAddress, HostName
+from cmk.utils.sectionname import SectionName
 
-from cmk.snmplib import OID, SNMPDecodedString
+from cmk.snmplib import OID, SNMPDecodedString, SNMPDetectBaseType
 
 # TODO: Replace this by generic caching
 _g_single_oid_hostname: HostName | None = None
@@ -62,6 +67,131 @@ def single_oid_cache() -> dict[OID, SNMPDecodedString | None]:
     return _g_single_oid_cache
 
 
+_DetectionKey = tuple[tuple[OID, SNMPDecodedString | None], ...]
+
+
+class DetectionCache:
+    """The results of the SNMP detection, by the OID values known beforehand
+
+    Usually these are the system description and object, which are identical
+    for devices of the same model and firmware.  Only the sections decided by
+    these values alone are recorded as found or not.  The detection of the
+    other sections needs more OIDs, they are recorded as undecided and have to
+    be detected for every device.  A result is used for a day after it has been
+    recorded.
+
+    The results are kept per fingerprint of the sections and their detection
+    specifications, so they are not used anymore once a plugin changes.
+    """
+
+    MAX_AGE: Final = 86400
+    """The time in seconds a result is used for"""
+    MAX_RESULTS: Final = 10000
+    """The number of results kept per fingerprint"""
+    MAX_FINGERPRINTS: Final = 8
+    """The number of fingerprints kept, the least recently used are dropped"""
+
+    def __init__(self, path: Path) -> None:
+        self.path: Final = path
+        self._results: dict[str, dict[_DetectionKey, tuple[float, list[str], list[str]]]] = {}
+        self._changed = False
+        self._fingerprinted: tuple[Sequence[tuple[SectionName, SNMPDetectBaseType]], str] = (
+            [],
+            "",
+        )
+
+    @classmethod
+    def load(cls, path: Path) -> "DetectionCache":
+        cache = cls(path)
+        try:
+            stored = store.load_object_from_file(path, default={})
+        except (SyntaxError, ValueError):
+            return cache  # A broken file is replaced on the next save
+        if isinstance(stored, dict) and stored.get("version") == 2:
+            cache._results = stored["results"]
+        return cache
+
+    def save(self) -> None:
+        if not self._changed:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        store.save_object_to_file(
+            self.path,
+            {
+                "version": 2,
+                "results": dict(list(self._results.items())[-self.MAX_FINGERPRINTS :]),
+            },
+            pretty=False,
+        )
+        self._changed = False
+
+    def fingerprint(self, sections: Sequence[tuple[SectionName, SNMPDetectBaseType]]) -> str:
+        # Usually all hosts have the same sections.  Comparing them to the last
+        # ones is cheap, as their specifications are the same objects.
+        if sections != self._fingerprinted[0]:
+            fingerprint = hashlib.sha256(
+                repr(sorted((str(name), spec) for name, spec in sections)).encode()
+            ).hexdigest()
+            self._fingerprinted = (list(sections), fingerprint)
+        return self._fingerprinted[1]
+
+    @staticmethod
+    def key(
+        known_values: Mapping[OID, SNMPDecodedString | None], oids: Sequence[OID]
+    ) -> _DetectionKey | None:
+        """The key of the values of the OIDs, None if any of them is not known"""
+        if not all(oid in known_values for oid in oids):
+            return None
+        return tuple((oid, known_values[oid]) for oid in oids)
+
+    def lookup(
+        self, fingerprint: str, key: _DetectionKey
+    ) -> tuple[frozenset[SectionName], frozenset[SectionName]] | None:
+        """The found and the undecided sections, if recorded"""
+        if (results := self._results.get(fingerprint)) is None:
+            return None
+        # Keep the recently used fingerprints at the end
+        self._results[fingerprint] = self._results.pop(fingerprint)
+        if (recorded := results.get(key)) is None:
+            return None
+        timestamp, found, undecided = recorded
+        if not 0 <= time.time() - timestamp < self.MAX_AGE:
+            return None
+        return (
+            frozenset(SectionName(name) for name in found),
+            frozenset(SectionName(name) for name in undecided),
+        )
+
+    def add(
+        self,
+        fingerprint: str,
+        key: _DetectionKey,
+        found: Iterable[SectionName],
+        undecided: Iterable[SectionName],
+    ) -> None:
+        results = self._results.setdefault(fingerprint, {})
+        results.pop(key, None)
+        results[key] = (
+            time.time(),
+            sorted(str(name) for name in found),
+            sorted(str(name) for name in undecided),
+        )
+        while len(results) > self.MAX_RESULTS:
+            del results[next(iter(results))]
+        self._changed = True
+
+
+_g_detection_caches: dict[Path, DetectionCache] = {}
+
+
+def detection_cache(cache_dir: Path) -> DetectionCache:
+    """The detection cache of all hosts, loaded once per process"""
+    path = cache_dir / ".detection"
+    if (cache := _g_detection_caches.get(path)) is None:
+        cache = _g_detection_caches[path] = DetectionCache.load(path)
+    return cache
+
+
 def cleanup_host_caches() -> None:
     _clear_other_hosts_oid_cache(None)
 
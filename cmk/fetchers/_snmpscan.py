@@ -5,7 +5,7 @@
 
 import functools
 import re
-from collections.abc import Callable, Collection, Iterable
+from collections.abc import Callable, Collection, Iterable, Mapping
 from dataclasses import dataclass
 from logging import Logger
 from pathlib import Path
@@ -17,7 +17,14 @@ from cmk.utils.regex import regex
 from cmk.utils.sectionname import SectionName
 from cmk.utils.tty import format_warning
 
-from cmk.snmplib import get_single_oid, SNMPBackend, SNMPDetectAtom, SNMPDetectBaseType
+from cmk.snmplib import (
+    get_single_oid,
+    OID,
+    SNMPBackend,
+    SNMPDecodedString,
+    SNMPDetectAtom,
+    SNMPDetectBaseType,
+)
 
 import cmk.fetchers._snmpcache as snmp_cache
 
@@ -29,6 +36,7 @@ class SNMPScanConfig:
     on_error: OnError
     missing_sys_description: bool
     oid_cache_dir: Path
+    use_detection_cache: bool = True
 
 
 # gather auto_discovered check_plugin_names for this host
@@ -74,11 +82,19 @@ def _snmp_scan(
     else:
         _prefetch_description_object(backend=backend)
 
+    detection_cache = (
+        snmp_cache.detection_cache(scan_config.oid_cache_dir)
+        if scan_config.use_detection_cache
+        else None
+    )
     found_sections = _find_sections(
         sections,
         on_error=scan_config.on_error,
         backend=backend,
+        detection_cache=detection_cache,
     )
+    if detection_cache is not None:
+        detection_cache.save()
     _output_snmp_check_plugins("SNMP scan found", found_sections, backend.logger)
     snmp_cache.write_single_oid_cache(
         backend.config.hostname, backend.config.ipaddress, cache_dir=scan_config.oid_cache_dir
@@ -121,6 +137,64 @@ def _find_sections(
     *,
     on_error: OnError,
     backend: SNMPBackend,
+    detection_cache: snmp_cache.DetectionCache | None = None,
+) -> frozenset[SectionName]:
+    if (
+        detection_cache is None
+        or (
+            key := detection_cache.key(
+                snmp_cache.single_oid_cache(), (OID_SYS_DESCR, OID_SYS_OBJ)
+            )
+        )
+        is None
+    ):
+        return _detect_sections(sections, on_error=on_error, backend=backend)
+
+    sections = list(sections)
+    fingerprint = detection_cache.fingerprint(sections)
+    if (recorded := detection_cache.lookup(fingerprint, key)) is None:
+        recorded = _decide_sections(sections, dict(key))
+        detection_cache.add(fingerprint, key, *recorded)
+    else:
+        backend.logger.debug("   Using the detection of a device with the same OID values")
+
+    found_sections, undecided = recorded
+    return found_sections | _detect_sections(
+        [(name, specs) for name, specs in sections if name in undecided],
+        on_error=on_error,
+        backend=backend,
+    )
+
+
+def _decide_sections(
+    sections: Iterable[SNMPScanSection], known_values: Mapping[OID, SNMPDecodedString | None]
+) -> tuple[frozenset[SectionName], frozenset[SectionName]]:
+    """The sections detected by the known OID values alone, and the undecided ones
+
+    A detection is undecided if its evaluation needs any other OID.
+    """
+    found_sections: set[SectionName] = set()
+    undecided: set[SectionName] = set()
+    for name, specs in sections:
+        try:
+            if _evaluate_snmp_detection(
+                detect_spec=specs,
+                oid_value_getter=known_values.__getitem__,
+            ):
+                found_sections.add(name)
+        except MKTimeout:
+            raise
+        except Exception:
+            # Other OIDs (KeyError) and errors, both are left to the detection of the device.
+            undecided.add(name)
+    return frozenset(found_sections), frozenset(undecided)
+
+
+def _detect_sections(
+    sections: Iterable[SNMPScanSection],
+    *,
+    on_error: OnError,
+    backend: SNMPBackend,
 ) -> frozenset[SectionName]:
     found_sections: set[SectionName] = set()
     for name, specs in sections:
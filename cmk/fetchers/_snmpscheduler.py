@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+# Copyright (C) 2024 Checkmk GmbH - License: GNU General Public License v2
+# This file is part of Checkmk (https://checkmk.com). It is subject to the terms and
+# conditions defined in the file COPYING, which is part of this source code package.
+"""Fetch the SNMP data of many devices at once
+
+The fetchers run in threads of their own, but all their SNMP requests are sent
+and received by one event loop.  A slow device thus only occupies a thread
+waiting for its responses, and not the whole helper.
+"""
+
+import asyncio
+import logging
+import threading
+from collections.abc import Callable, Sequence
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from types import TracebackType
+from typing import Final
+
+import cmk.utils.resulttype as result
+from cmk.utils.hostaddress import HostName
+
+from cmk.snmplib import SNMPBackendEnum, SNMPHostConfig, SNMPRawData
+
+from ._abstract import Mode
+from ._api import get_raw_data
+from ._snmp import SNMPFetcher
+from .filecache import FileCache
+from .snmp import get_force_stored_walks
+from .snmp_backend.asynchronous import AsyncSNMPBackend, Engine, LatencyHistogram
+
+__all__ = ["DeviceLimits", "SNMPFetchScheduler"]
+
+
+@dataclass(frozen=True)
+class DeviceLimits:
+    max_in_flight: int = 10
+    """The number of requests waiting for a response at a time"""
+    budget: float | None = None
+    """The time in seconds for all requests of a fetch, unlimited if None"""
+
+
+def _default_limits(_snmp_config: SNMPHostConfig) -> DeviceLimits:
+    return DeviceLimits()
+
+
+class SNMPFetchScheduler:
+    """Runs the SNMP fetchers of many devices concurrently
+
+        with SNMPFetchScheduler(logger) as scheduler:
+            results = scheduler.fetch(list(zip(file_caches, fetchers)), Mode.CHECKING)
+
+    At most `max_devices` devices are fetched at a time, each of them with the
+    `DeviceLimits` returned by `limits`.  The response times of every device
+    are collected in `latencies` over all fetches, as a basis for tuning the
+    bulk walk size and the timeouts.
+
+    Only the fetchers of hosts with the asynchronous backend are scheduled,
+    the others fetch as usual.
+
+    The event loop, its thread and the fetcher threads are kept from entering to
+    exiting the scheduler, so one scheduler can serve all fetches of a process.
+    """
+
+    def __init__(
+        self,
+        logger: logging.Logger,
+        *,
+        max_devices: int = 32,
+        limits: Callable[[SNMPHostConfig], DeviceLimits] = _default_limits,
+    ) -> None:
+        self.max_devices: Final = max_devices
+        self.latencies: Final[dict[HostName, LatencyHistogram]] = {}
+        self._logger: Final = logger
+        self._limits: Final = limits
+        self._engines: Final[dict[HostName, Engine]] = {}
+        self._lock: Final = threading.Lock()
+        self._loop: Final = asyncio.new_event_loop()
+        self._thread: Final = threading.Thread(
+            target=self._loop.run_forever, name="snmp-scheduler", daemon=True
+        )
+        self._executor: Final = ThreadPoolExecutor(
+            max_workers=self.max_devices, thread_name_prefix="snmp-fetcher"
+        )
+
+    def __enter__(self) -> "SNMPFetchScheduler":
+        self._thread.start()
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc_val: BaseException | None,
+        exc_tb: TracebackType | None,
+    ) -> None:
+        self._executor.shutdown()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+    def fetch(
+        self, fetches: Sequence[tuple[FileCache[SNMPRawData], SNMPFetcher]], mode: Mode
+    ) -> Sequence[result.Result[SNMPRawData, Exception]]:
+        """The results of the fetchers, in the same order
+
+        As with `get_raw_data()`, the file caches are used if valid and updated otherwise.
+        """
+        if not self._thread.is_alive():
+            raise RuntimeError("SNMP fetch scheduler is not running")
+        return list(self._executor.map(lambda fetch: self._fetch(*fetch, mode=mode), fetches))
+
+    def _fetch(
+        self, file_cache: FileCache[SNMPRawData], fetcher: SNMPFetcher, *, mode: Mode
+    ) -> result.Result[SNMPRawData, Exception]:
+        snmp_config = fetcher.snmp_config
+        if get_force_stored_walks() or snmp_config.snmp_backend is not SNMPBackendEnum.ASYNC:
+            return get_raw_data(file_cache, fetcher, mode)
+
+        limits = self._limits(snmp_config)
+        with self._lock:
+            latencies = self.latencies.setdefault(snmp_config.hostname, LatencyHistogram())
+            engine = self._engines.get(snmp_config.hostname)
+        backend = AsyncSNMPBackend(
+            snmp_config,
+            self._logger,
+            max_in_flight=limits.max_in_flight,
+            budget=limits.budget,
+            latencies=latencies,
+            engine=engine,
+            loop=self._loop,
+        )
+        fetcher.use_backend(backend)
+        try:
+            return get_raw_data(file_cache, fetcher, mode)
+        finally:
+            fetcher.use_backend(None)
+            if backend.engine is not None:
+                with self._lock:
+                    self._engines[snmp_config.hostname] = backend.engine
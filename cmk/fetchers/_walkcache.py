@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+# Copyright (C) 2024 Checkmk GmbH - License: GNU General Public License v2
+# This file is part of Checkmk (https://checkmk.com). It is subject to the terms and
+# conditions defined in the file COPYING, which is part of this source code package.
+"""Walk cache files
+
+All cached walks of a host are stored in one file:
+
+    MAGIC
+    number of walks, number of OIDs                 2 x uint32
+    per walk:
+        size of fetch OID, size of context hash     2 x uint16
+        offset, size of the rows                    2 x uint64
+        fetch OID, context hash                     utf-8
+    OID offsets                                     (number of OIDs + 1) x uint32
+    OIDs                                            utf-8
+    per walk, the rows:
+        number of rows                              uint32
+        OID references                              uint32 array
+        value offsets                               (number of rows + 1) x uint32
+        values
+
+The OIDs of the rows are stored relative to the fetch OID of their walk, so the
+columns of a table share the OIDs of their rows.  The references of OIDs not
+below the fetch OID have the top bit set.
+
+The file is mapped into memory, and a walk is only decoded when it is accessed.
+"""
+
+import functools
+import mmap
+import struct
+import sys
+from array import array
+from collections.abc import Iterator, Mapping
+from pathlib import Path
+from typing import Final
+
+from cmk.snmplib import SNMPRowInfo
+
+__all__ = ["CachedWalks", "encode_walks"]
+
+_MAGIC: Final = b"CMKWALK\x01"
+_HEADER: Final = struct.Struct("<II")
+_INDEX_ENTRY: Final = struct.Struct("<HHQQ")
+_COUNT: Final = struct.Struct("<I")
+_ABSOLUTE: Final = 0x80000000
+_ENCODING: Final = "utf-8"
+
+_WalkKey = tuple[str, str]
+
+
+def _to_bytes(values: array) -> bytes:
+    if sys.byteorder == "big":
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def _from_bytes(data: memoryview) -> array:
+    values = array("I")
+    values.frombytes(data)
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values
+
+
+def encode_walks(walks: Mapping[_WalkKey, SNMPRowInfo]) -> bytes:
+    oids: dict[str, int] = {}
+
+    def _reference(fetchoid: str, oid: str) -> int:
+        if oid.startswith(fetchoid):
+            return oids.setdefault(oid[len(fetchoid) :], len(oids))
+        return oids.setdefault(oid, len(oids)) | _ABSOLUTE
+
+    payloads = []
+    for (fetchoid, _context_hash), rows in walks.items():
+        references = array("I", (_reference(fetchoid, oid) for oid, _value in rows))
+        value_offsets = array("I", [0])
+        for _oid, value in rows:
+            value_offsets.append(value_offsets[-1] + len(value))
+        payloads.append(
+            b"".join(
+                (
+                    _COUNT.pack(len(rows)),
+                    _to_bytes(references),
+                    _to_bytes(value_offsets),
+                    *(value for _oid, value in rows),
+                )
+            )
+        )
+
+    encoded_oids = [oid.encode(_ENCODING) for oid in oids]
+    oid_offsets = array("I", [0])
+    for encoded_oid in encoded_oids:
+        oid_offsets.append(oid_offsets[-1] + len(encoded_oid))
+    encoded_keys = [
+        (fetchoid.encode(_ENCODING), context_hash.encode(_ENCODING))
+        for fetchoid, context_hash in walks
+    ]
+
+    offset = (
+        len(_MAGIC)
+        + _HEADER.size
+        + sum(_INDEX_ENTRY.size + len(f) + len(c) for f, c in encoded_keys)
+        + oid_offsets.itemsize * len(oid_offsets)
+        + oid_offsets[-1]
+    )
+    index = []
+    for (fetchoid_bytes, context_hash_bytes), payload in zip(encoded_keys, payloads):
+        index.append(
+            _INDEX_ENTRY.pack(len(fetchoid_bytes), len(context_hash_bytes), offset, len(payload))
+        )
+        index += (fetchoid_bytes, context_hash_bytes)
+        offset += len(payload)
+
+    return b"".join(
+        (
+            _MAGIC,
+            _HEADER.pack(len(walks), len(encoded_oids)),
+            *index,
+            _to_bytes(oid_offsets),
+            *encoded_oids,
+            *payloads,
+        )
+    )
+
+
+class CachedWalks(Mapping[_WalkKey, SNMPRowInfo]):
+    """The walks of a walk cache file, decoded on access"""
+
+    def __init__(self, data: bytes | mmap.mmap) -> None:
+        if data[: len(_MAGIC)] != _MAGIC:
+            raise ValueError("not a walk cache file")
+        self._data: Final = memoryview(data)
+        num_walks, self._num_oids = _HEADER.unpack_from(self._data, len(_MAGIC))
+        pos = len(_MAGIC) + _HEADER.size
+        self._index: Final[dict[_WalkKey, tuple[int, int]]] = {}
+        for _ in range(num_walks):
+            fetchoid_size, context_hash_size, offset, size = _INDEX_ENTRY.unpack_from(
+                self._data, pos
+            )
+            pos += _INDEX_ENTRY.size
+            fetchoid = str(self._data[pos : (pos := pos + fetchoid_size)], _ENCODING)
+            context_hash = str(self._data[pos : (pos := pos + context_hash_size)], _ENCODING)
+            if offset + size > len(self._data):
+                raise ValueError(f"truncated walk cache file (walk of {fetchoid})")
+            self._index[(fetchoid, context_hash)] = (offset, size)
+        self._oid_table: Final = pos
+
+    @classmethod
+    def load(cls, path: Path) -> "CachedWalks":
+        with path.open("rb") as f:
+            # The mapping stays valid when the file is replaced by the next save.
+            return cls(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+    @functools.cached_property
+    def _oids(self) -> list[str]:
+        pos = self._oid_table
+        offsets = _from_bytes(self._data[pos : (pos := pos + _COUNT.size * (self._num_oids + 1))])
+        oid_data = self._data[pos : pos + offsets[-1]]
+        return [str(oid_data[start:end], _ENCODING) for start, end in zip(offsets, offsets[1:])]
+
+    def _oid(self, fetchoid: str, reference: int) -> str:
+        if reference & _ABSOLUTE:
+            return self._oids[reference & ~_ABSOLUTE]
+        return fetchoid + self._oids[reference]
+
+    def __getitem__(self, key: _WalkKey) -> SNMPRowInfo:
+        offset, size = self._index[key]
+        payload = self._data[offset : offset + size]
+        (num_rows,) = _COUNT.unpack_from(payload)
+        pos = _COUNT.size
+        references = _from_bytes(payload[pos : (pos := pos + _COUNT.size * num_rows)])
+        value_offsets = _from_bytes(payload[pos : (pos := pos + _COUNT.size * (num_rows + 1))])
+        values = payload[pos:]
+        if len(values) != value_offsets[-1]:
+            raise ValueError(f"corrupt walk cache file (walk of {key[0]})")
+        fetchoid = key[0]
+        return [
+            (self._oid(fetchoid, reference), bytes(values[start:end]))
+            for reference, start, end in zip(references, value_offsets, value_offsets[1:])
+        ]
+
+    def __iter__(self) -> Iterator[_WalkKey]:
+        return iter(self._index)
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def __contains__(self, key: object) -> bool:
+        return key in self._index
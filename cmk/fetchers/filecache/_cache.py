@@ -218,20 +218,24 @@ class FileCache(Generic[_TRawData], abc.ABC):
             )
             return None
 
-        # TODO: Use some generic store file read function to generalize error handling,
-        # but there is currently no function that simply reads data from the file
         try:
-            cache_file = path.read_bytes()
+            raw_data = self._load_cache_file(path)
         except FileNotFoundError:
             self._logger.debug("Not using cache (Does not exist)")
             return None
 
-        if not cache_file:
+        if raw_data is None:
             self._logger.debug("Not using cache (Empty)")
             return None
 
         self._logger.log(VERBOSE, "Using data from cache file %s", path)
-        return self._from_cache_file(cache_file)
+        return raw_data
+
+    def _load_cache_file(self, path: Path) -> _TRawData | None:
+        # TODO: Use some generic store file read function to generalize error handling,
+        # but there is currently no function that simply reads data from the file
+        cache_file = path.read_bytes()
+        return self._from_cache_file(cache_file) if cache_file else None
 
     def write(self, raw_data: _TRawData, mode: Mode) -> None:
         if FileCacheMode.WRITE not in self.file_cache_mode or not self._do_cache(mode):
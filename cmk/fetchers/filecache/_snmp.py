@@ -2,25 +2,275 @@
 # Copyright (C) 2019 Checkmk GmbH - License: GNU General Public License v2
 # This file is part of Checkmk (https://checkmk.com). It is subject to the terms and
 # conditions defined in the file COPYING, which is part of this source code package.
+"""SNMP cache files
+
+The SNMP data used to be written with `repr()` and read back with
+`ast.literal_eval()`, which is slow for big walks (e.g. interface tables).
+Cache files are now written in a binary format:
+
+    MAGIC
+    number of sections            uint32
+    per section:
+        name length, name         uint16, utf-8
+        offset, size of payload   uint64, uint64
+    section payloads
+
+Every section payload is self contained:
+
+    number of strings, size of string data, number of tokens    3 x uint32
+    size of a token                                             uint8
+    string offsets                                              uint32 array
+    string data                                                 utf-8
+    tokens                                                      int16 or int32 array
+
+Every distinct string of a section is stored only once (the OIDs end columns,
+interface types, states, ...) and referenced by its index. The structure of the
+section (lists, binary values, ...) is a flat stream of tokens, see `_Op`.
+
+The file is mapped into memory and a section is only decoded when it is accessed.
+Cache files in the old format are still read.
+"""
 
 from __future__ import annotations
 
 import ast
+import enum
+import mmap
+import struct
+import sys
+from array import array
+from collections.abc import Iterator, Mapping
+from pathlib import Path
+from typing import Final, TypeGuard
 
 from cmk.utils.sectionname import SectionName
 
-from cmk.snmplib import SNMPRawData
+from cmk.snmplib import SNMPRawData, SNMPRawDataElem
 
 from ._cache import FileCache
 
 __all__ = ["SNMPFileCache"]
 
+_MAGIC: Final = b"CMKSNMP\x01"
+_COUNT: Final = struct.Struct("<I")
+_INDEX_ENTRY: Final = struct.Struct("<HQQ")
+_SECTION_HEADER: Final = struct.Struct("<IIIB")
+_TOKEN_TYPECODES: Final = {array(c).itemsize: c for c in ("h", "i")}
+_ENCODING: Final = "utf-8"
+_ERRORS: Final = "surrogatepass"
+
+
+class _Op(enum.IntEnum):
+    """Structure tokens. Non negative tokens are string indices"""
+
+    LIST = -1  # followed by the number of items and the items
+    TUPLE = -2  # followed by the number of items and the items
+    INTS = -3  # followed by the number of ints and the ints (binary values)
+    INT = -4  # followed by the int
+    NONE = -5
+    STRINGS = -6  # followed by the number of strings and the string indices (table rows)
+    BIG_INT = -7  # followed by the index of the string representation
+
+
+def _is_small_int(value: object) -> TypeGuard[int]:
+    return type(value) is int and -(2**31) <= value < 2**31
+
+
+class _Encoder:
+    def __init__(self) -> None:
+        self.strings: dict[str, int] = {}
+        self.tokens: list[int] = []
+
+    def _intern(self, value: str) -> int:
+        try:
+            return self.strings[value]
+        except KeyError:
+            return self.strings.setdefault(value, len(self.strings))
+
+    def encode(self, value: object) -> None:
+        if isinstance(value, str):
+            self.tokens.append(self._intern(value))
+        elif isinstance(value, list | tuple):
+            self._encode_sequence(value)
+        elif value is None:
+            self.tokens.append(_Op.NONE)
+        elif _is_small_int(value):
+            self.tokens += (_Op.INT, value)
+        elif type(value) is int:
+            self.tokens += (_Op.BIG_INT, self._intern(str(value)))
+        else:
+            raise TypeError(f"cannot encode {type(value).__name__}")
+
+    def _encode_sequence(self, value: list | tuple) -> None:
+        if isinstance(value, list) and value:
+            if all(type(v) is str for v in value):
+                self.tokens += (_Op.STRINGS, len(value))
+                self.tokens += (self._intern(v) for v in value)
+                return
+            if all(_is_small_int(v) for v in value):
+                self.tokens += (_Op.INTS, len(value))
+                self.tokens += value
+                return
+        self.tokens += (_Op.LIST if isinstance(value, list) else _Op.TUPLE, len(value))
+        for item in value:
+            self.encode(item)
+
+    def to_bytes(self) -> bytes:
+        encoded = [s.encode(_ENCODING, _ERRORS) for s in self.strings]
+        offsets = array("I", [0])
+        for string in encoded:
+            offsets.append(offsets[-1] + len(string))
+        small = all(-(2**15) <= t < 2**15 for t in self.tokens)
+        tokens = array("h" if small else "i", self.tokens)
+        if sys.byteorder == "big":
+            offsets.byteswap()
+            tokens.byteswap()
+        return b"".join(
+            (
+                _SECTION_HEADER.pack(len(encoded), offsets[-1], len(tokens), tokens.itemsize),
+                offsets.tobytes(),
+                *encoded,
+                tokens.tobytes(),
+            )
+        )
+
+
+def _encode_section(section: SNMPRawDataElem) -> bytes:
+    encoder = _Encoder()
+    encoder.encode(section)
+    return encoder.to_bytes()
+
+
+def _decode_section(payload: memoryview) -> SNMPRawDataElem:
+    num_strings, strings_size, num_tokens, token_size = _SECTION_HEADER.unpack_from(payload)
+    pos = _SECTION_HEADER.size
+
+    offsets = array("I")
+    offsets.frombytes(payload[pos : (pos := pos + offsets.itemsize * (num_strings + 1))])
+    string_data = payload[pos : (pos := pos + strings_size)]
+    raw_tokens = array(_TOKEN_TYPECODES[token_size])
+    raw_tokens.frombytes(payload[pos : pos + token_size * num_tokens])
+    if sys.byteorder == "big":
+        offsets.byteswap()
+        raw_tokens.byteswap()
+
+    strings = [
+        str(string_data[start:end], _ENCODING, _ERRORS)
+        for start, end in zip(offsets, offsets[1:])
+    ]
+    tokens = raw_tokens.tolist()
+
+    def decode(pos: int) -> tuple[object, int]:
+        token = tokens[pos]
+        if token >= 0:
+            return strings[token], pos + 1
+        if token == _Op.STRINGS:
+            end = pos + 2 + tokens[pos + 1]
+            return [strings[i] for i in tokens[pos + 2 : end]], end
+        if token == _Op.INTS:
+            end = pos + 2 + tokens[pos + 1]
+            return tokens[pos + 2 : end], end
+        if token == _Op.LIST or token == _Op.TUPLE:
+            items = []
+            pos += 2
+            for _ in range(tokens[pos - 1]):
+                item, pos = decode(pos)
+                items.append(item)
+            return (items if token == _Op.LIST else tuple(items)), pos
+        if token == _Op.INT:
+            return tokens[pos + 1], pos + 2
+        if token == _Op.NONE:
+            return None, pos + 1
+        if token == _Op.BIG_INT:
+            return int(strings[tokens[pos + 1]]), pos + 2
+        raise ValueError(f"invalid token: {token}")
+
+    section, _pos = decode(0)
+    return section  # type: ignore[return-value]
+
+
+def _encode(raw_data: SNMPRawData) -> bytes:
+    payloads = {str(name): _encode_section(section) for name, section in raw_data.items()}
+    encoded_names = {name: name.encode(_ENCODING) for name in payloads}
+    offset = (
+        len(_MAGIC)
+        + _COUNT.size
+        + sum(_INDEX_ENTRY.size + len(n) for n in encoded_names.values())
+    )
+    index = []
+    for name, payload in payloads.items():
+        index.append(_INDEX_ENTRY.pack(len(encoded_names[name]), offset, len(payload)))
+        index.append(encoded_names[name])
+        offset += len(payload)
+    return b"".join((_MAGIC, _COUNT.pack(len(payloads)), *index, *payloads.values()))
+
+
+class _CachedSections(Mapping[SectionName, SNMPRawDataElem]):
+    """The sections of a binary cache file, decoded on access"""
+
+    def __init__(self, data: memoryview) -> None:
+        self._data: Final = data
+        self._index: Final = self._read_index(data)
+        self._decoded: dict[SectionName, SNMPRawDataElem] = {}
+
+    @staticmethod
+    def _read_index(data: memoryview) -> dict[SectionName, tuple[int, int]]:
+        pos = len(_MAGIC)
+        (num_sections,) = _COUNT.unpack_from(data, pos)
+        pos += _COUNT.size
+        index = {}
+        for _ in range(num_sections):
+            name_size, offset, size = _INDEX_ENTRY.unpack_from(data, pos)
+            pos += _INDEX_ENTRY.size
+            name = SectionName(str(data[pos : pos + name_size], _ENCODING))
+            pos += name_size
+            if offset + size > len(data):
+                raise ValueError(f"truncated cache file (section {name})")
+            index[name] = (offset, size)
+        return index
+
+    def __getitem__(self, key: SectionName) -> SNMPRawDataElem:
+        try:
+            return self._decoded[key]
+        except KeyError:
+            pass
+        offset, size = self._index[key]
+        section = self._decoded[key] = _decode_section(self._data[offset : offset + size])
+        return section
+
+    def __iter__(self) -> Iterator[SectionName]:
+        return iter(self._index)
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def __repr__(self) -> str:
+        return repr(dict(self))
+
+
+def _from_legacy_cache_file(raw_data: bytes) -> SNMPRawData:
+    return {SectionName(k): v for k, v in ast.literal_eval(raw_data.decode("utf-8")).items()}
+
 
 class SNMPFileCache(FileCache[SNMPRawData]):
     @staticmethod
     def _from_cache_file(raw_data: bytes) -> SNMPRawData:
-        return {SectionName(k): v for k, v in ast.literal_eval(raw_data.decode("utf-8")).items()}
+        if raw_data.startswith(_MAGIC):
+            return _CachedSections(memoryview(raw_data))
+        return _from_legacy_cache_file(raw_data)
 
     @staticmethod
     def _to_cache_file(raw_data: SNMPRawData) -> bytes:
-        return (repr({str(k): v for k, v in raw_data.items()}) + "\n").encode("utf-8")
+        try:
+            return _encode(raw_data)
+        except TypeError:
+            # Not expected from the SNMP backends, but the old format handles any literal
+            return (repr({str(k): v for k, v in raw_data.items()}) + "\n").encode("utf-8")
+
+    def _load_cache_file(self, path: Path) -> SNMPRawData | None:
+        with path.open("rb") as f:
+            if not f.read(len(_MAGIC)).startswith(_MAGIC):
+                return super()._load_cache_file(path)
+            # The mapping stays valid when the file is replaced by the next write.
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return _CachedSections(memoryview(data))
@@ -8,6 +8,7 @@ from collections.abc import Iterator, Mapping, Sequence
 from pathlib import Path
 from typing import Any, Final, NamedTuple
 
+import cmk.utils.paths
 from cmk.utils.sectionname import SectionMap, SectionName
 
 from cmk.snmplib import (
@@ -18,7 +19,7 @@ from cmk.snmplib import (
     SNMPHostConfig,
 )
 
-from .snmp_backend import ClassicSNMPBackend, StoredWalkSNMPBackend
+from .snmp_backend import AsyncSNMPBackend, ClassicSNMPBackend, StoredWalkSNMPBackend
 
 try:
     from .cee.snmp_backend import inline  # type: ignore[import,unused-ignore]
@@ -53,7 +54,10 @@ def make_backend(
 
     if use_cache or snmp_config.snmp_backend is SNMPBackendEnum.STORED_WALK:
         return StoredWalkSNMPBackend(
-            snmp_config, logger, path=stored_walk_path / snmp_config.hostname
+            snmp_config,
+            logger,
+            path=stored_walk_path / snmp_config.hostname,
+            index_dir=cmk.utils.paths.tmp_dir / "snmpwalk_index",
         )
 
     if inline and snmp_config.snmp_backend is SNMPBackendEnum.INLINE:
@@ -62,6 +66,9 @@ def make_backend(
     if snmp_config.snmp_backend is SNMPBackendEnum.CLASSIC:
         return ClassicSNMPBackend(snmp_config, logger)
 
+    if snmp_config.snmp_backend is SNMPBackendEnum.ASYNC:
+        return AsyncSNMPBackend(snmp_config, logger)
+
     raise NotImplementedError(f"Unknown SNMP backend: {snmp_config.snmp_backend}")
 
 
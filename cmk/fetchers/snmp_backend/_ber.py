@@ -0,0 +1,410 @@
+#!/usr/bin/env python3
+# Copyright (C) 2024 Checkmk GmbH - License: GNU General Public License v2
+# This file is part of Checkmk (https://checkmk.com). It is subject to the terms and
+# conditions defined in the file COPYING, which is part of this source code package.
+"""BER encoding of SNMP messages (RFC 3416, RFC 3412 and RFC 3414)
+
+Only the part of BER SNMP needs is implemented: definite lengths, and the
+universal and application types of the SNMPv2-SMI. Malformed data raises
+`ValueError`.
+"""
+
+import enum
+from collections.abc import Sequence
+from dataclasses import dataclass
+from typing import Final, NamedTuple
+
+from cmk.snmplib import OID, SNMPRawValue
+
+__all__ = [
+    "Tag",
+    "PDU",
+    "VarBind",
+    "USMParameters",
+    "V3Message",
+    "decode_community_message",
+    "decode_encrypted_pdu",
+    "decode_pdu",
+    "decode_scoped_pdu",
+    "decode_usm_parameters",
+    "decode_v3_message",
+    "encode_community_message",
+    "encode_encrypted_pdu",
+    "encode_pdu",
+    "encode_scoped_pdu",
+    "encode_v3_message",
+    "message_version",
+    "render_value",
+]
+
+
+class Tag(enum.IntEnum):
+    INTEGER = 0x02
+    OCTET_STRING = 0x04
+    NULL = 0x05
+    OBJECT_IDENTIFIER = 0x06
+    SEQUENCE = 0x30
+    IP_ADDRESS = 0x40
+    COUNTER32 = 0x41
+    GAUGE32 = 0x42
+    TIMETICKS = 0x43
+    OPAQUE = 0x44
+    COUNTER64 = 0x46
+    NO_SUCH_OBJECT = 0x80
+    NO_SUCH_INSTANCE = 0x81
+    END_OF_MIB_VIEW = 0x82
+    GET_REQUEST = 0xA0
+    GET_NEXT_REQUEST = 0xA1
+    RESPONSE = 0xA2
+    GET_BULK_REQUEST = 0xA5
+    REPORT = 0xA8
+
+
+_UNSIGNED: Final = frozenset(
+    {Tag.COUNTER32, Tag.GAUGE32, Tag.TIMETICKS, Tag.COUNTER64},
+)
+_EXCEPTIONS: Final = frozenset({Tag.NO_SUCH_OBJECT, Tag.NO_SUCH_INSTANCE, Tag.END_OF_MIB_VIEW})
+# The octets net-snmp prints as text, all others make it print the string in hex
+_PRINTABLE: Final = bytes(range(0x20, 0x7F)) + b"\t\n\x0b\x0c\r"
+
+
+class VarBind(NamedTuple):
+    oid: OID
+    tag: int
+    value: bytes
+    """The content octets of the value"""
+
+
+@dataclass(frozen=True)
+class PDU:
+    tag: int
+    request_id: int
+    error_status: int
+    """The non-repeaters of a GetBulkRequest"""
+    error_index: int
+    """The max-repetitions of a GetBulkRequest"""
+    varbinds: Sequence[VarBind]
+
+
+@dataclass(frozen=True, kw_only=True)
+class USMParameters:
+    engine_id: bytes
+    engine_boots: int
+    engine_time: int
+    user_name: bytes
+    auth_parameters: bytes
+    priv_parameters: bytes
+
+
+@dataclass(frozen=True, kw_only=True)
+class V3Message:
+    msg_id: int
+    max_size: int
+    flags: int
+    security_parameters: bytes
+    data: bytes
+    """The scoped PDU, or the encrypted scoped PDU if the privacy flag is set"""
+    auth_parameters: slice
+    """The position of the authentication parameters in the whole message"""
+
+
+def _encode_length(length: int) -> bytes:
+    if length < 0x80:
+        return bytes((length,))
+    encoded = length.to_bytes((length.bit_length() + 7) // 8, "big")
+    return bytes((0x80 | len(encoded),)) + encoded
+
+
+def _tlv(tag: int, content: bytes) -> bytes:
+    return bytes((tag,)) + _encode_length(len(content)) + content
+
+
+def _integer(value: int) -> bytes:
+    return _tlv(Tag.INTEGER, value.to_bytes(value.bit_length() // 8 + 1, "big", signed=True))
+
+
+def _octet_string(value: bytes) -> bytes:
+    return _tlv(Tag.OCTET_STRING, value)
+
+
+def _oid(oid: OID) -> bytes:
+    """
+    >>> _oid(".1.3.6.1.4.1.311").hex()
+    '06072b060104018237'
+    """
+    try:
+        arcs = [int(arc) for arc in oid.strip(".").split(".")]
+    except ValueError:
+        raise ValueError(f"Invalid OID {oid}")
+    if len(arcs) < 2 or arcs[0] > 2 or min(arcs) < 0:
+        raise ValueError(f"Invalid OID {oid}")
+
+    content = bytearray()
+    for arc in [40 * arcs[0] + arcs[1], *arcs[2:]]:
+        chunk = [arc & 0x7F]
+        while arc := arc >> 7:
+            chunk.append(0x80 | (arc & 0x7F))
+        content += bytes(reversed(chunk))
+    return _tlv(Tag.OBJECT_IDENTIFIER, bytes(content))
+
+
+def _sequence(tag: int, *items: bytes) -> bytes:
+    return _tlv(tag, b"".join(items))
+
+
+def encode_pdu(pdu: PDU) -> bytes:
+    return _sequence(
+        pdu.tag,
+        _integer(pdu.request_id),
+        _integer(pdu.error_status),
+        _integer(pdu.error_index),
+        _sequence(
+            Tag.SEQUENCE,
+            *(_sequence(Tag.SEQUENCE, _oid(vb.oid), _tlv(vb.tag, vb.value)) for vb in pdu.varbinds),
+        ),
+    )
+
+
+def encode_community_message(version: int, community: bytes, pdu: bytes) -> bytes:
+    """A SNMPv1 (version 0) or SNMPv2c (version 1) message"""
+    return _sequence(Tag.SEQUENCE, _integer(version), _octet_string(community), pdu)
+
+
+def encode_scoped_pdu(context_engine_id: bytes, context_name: bytes, pdu: bytes) -> bytes:
+    return _sequence(
+        Tag.SEQUENCE, _octet_string(context_engine_id), _octet_string(context_name), pdu
+    )
+
+
+def encode_encrypted_pdu(ciphertext: bytes) -> bytes:
+    return _octet_string(ciphertext)
+
+
+def encode_v3_message(
+    *, msg_id: int, max_size: int, flags: int, usm: USMParameters, data: bytes
+) -> tuple[bytes, slice]:
+    """A SNMPv3 message with the position of its authentication parameters"""
+    usm_before_auth = b"".join(
+        (
+            _octet_string(usm.engine_id),
+            _integer(usm.engine_boots),
+            _integer(usm.engine_time),
+            _octet_string(usm.user_name),
+            bytes((Tag.OCTET_STRING,)),
+            _encode_length(len(usm.auth_parameters)),
+        )
+    )
+    usm_after_auth = _octet_string(usm.priv_parameters)
+    security_parameters = _sequence(
+        Tag.SEQUENCE, usm_before_auth, usm.auth_parameters, usm_after_auth
+    )
+
+    before_security_parameters = b"".join(
+        (
+            _integer(3),
+            _sequence(
+                Tag.SEQUENCE,
+                _integer(msg_id),
+                _integer(max_size),
+                _octet_string(bytes((flags,))),
+                _integer(3),  # USM
+            ),
+            bytes((Tag.OCTET_STRING,)),
+            _encode_length(len(security_parameters)),
+        )
+    )
+    content = before_security_parameters + security_parameters + data
+    header = bytes((Tag.SEQUENCE,)) + _encode_length(len(content))
+
+    auth_start = (
+        len(header)
+        + len(before_security_parameters)
+        + len(security_parameters)
+        - len(usm_after_auth)
+        - len(usm.auth_parameters)
+    )
+    return header + content, slice(auth_start, auth_start + len(usm.auth_parameters))
+
+
+def _decode_tlv(data: bytes, pos: int, end: int | None = None) -> tuple[int, int, int]:
+    """Decode the TLV at pos: its tag, and the start and end of its content"""
+    end = len(data) if end is None else end
+    if pos + 2 > end:
+        raise ValueError("Truncated BER data")
+    tag = data[pos]
+    length = data[pos + 1]
+    pos += 2
+    if length & 0x80:
+        num_octets = length & 0x7F
+        if not num_octets or num_octets > 4 or pos + num_octets > end:
+            raise ValueError("Invalid BER length")
+        length = int.from_bytes(data[pos : pos + num_octets], "big")
+        pos += num_octets
+    if pos + length > end:
+        raise ValueError("Truncated BER data")
+    return tag, pos, pos + length
+
+
+def _expect(data: bytes, pos: int, tag: int, end: int | None = None) -> tuple[int, int]:
+    actual, start, stop = _decode_tlv(data, pos, end)
+    if actual != tag:
+        raise ValueError(f"Expected BER tag {tag:#x}, got {actual:#x}")
+    return start, stop
+
+
+def _decode_integer(data: bytes, pos: int, end: int | None = None) -> tuple[int, int]:
+    start, stop = _expect(data, pos, Tag.INTEGER, end)
+    return int.from_bytes(data[start:stop], "big", signed=True), stop
+
+
+def _decode_octet_string(data: bytes, pos: int, end: int | None = None) -> tuple[bytes, int]:
+    start, stop = _expect(data, pos, Tag.OCTET_STRING, end)
+    return data[start:stop], stop
+
+
+def _decode_oid(content: bytes) -> OID:
+    """
+    >>> _decode_oid(bytes.fromhex("2b06010401823701"))
+    '.1.3.6.1.4.1.311.1'
+    """
+    if not content or content[-1] & 0x80:
+        raise ValueError("Invalid OID")
+    arcs = []
+    arc = 0
+    for octet in content:
+        arc = (arc << 7) | (octet & 0x7F)
+        if not octet & 0x80:
+            arcs.append(arc)
+            arc = 0
+    first = min(arcs[0] // 40, 2)
+    return "." + ".".join(map(str, (first, arcs[0] - 40 * first, *arcs[1:])))
+
+
+def message_version(data: bytes) -> int:
+    start, stop = _expect(data, 0, Tag.SEQUENCE)
+    return _decode_integer(data, start, stop)[0]
+
+
+def decode_pdu(data: bytes, pos: int = 0) -> PDU:
+    tag, start, stop = _decode_tlv(data, pos)
+    request_id, pos = _decode_integer(data, start, stop)
+    error_status, pos = _decode_integer(data, pos, stop)
+    error_index, pos = _decode_integer(data, pos, stop)
+    pos, varbinds_end = _expect(data, pos, Tag.SEQUENCE, stop)
+
+    varbinds = []
+    while pos < varbinds_end:
+        start, pos = _expect(data, pos, Tag.SEQUENCE, varbinds_end)
+        oid_start, oid_end = _expect(data, start, Tag.OBJECT_IDENTIFIER, pos)
+        value_tag, value_start, value_end = _decode_tlv(data, oid_end, pos)
+        varbinds.append(
+            VarBind(_decode_oid(data[oid_start:oid_end]), value_tag, data[value_start:value_end])
+        )
+    return PDU(tag, request_id, error_status, error_index, varbinds)
+
+
+def decode_community_message(data: bytes) -> tuple[int, bytes, PDU]:
+    start, stop = _expect(data, 0, Tag.SEQUENCE)
+    version, pos = _decode_integer(data, start, stop)
+    community, pos = _decode_octet_string(data, pos, stop)
+    return version, community, decode_pdu(data[pos:stop])
+
+
+def decode_v3_message(data: bytes) -> V3Message:
+    start, stop = _expect(data, 0, Tag.SEQUENCE)
+    version, pos = _decode_integer(data, start, stop)
+    if version != 3:
+        raise ValueError(f"Not a SNMPv3 message: version {version}")
+
+    pos, header_end = _expect(data, pos, Tag.SEQUENCE, stop)
+    msg_id, pos = _decode_integer(data, pos, header_end)
+    max_size, pos = _decode_integer(data, pos, header_end)
+    flags, pos = _decode_octet_string(data, pos, header_end)
+    security_model, _pos = _decode_integer(data, pos, header_end)
+    if len(flags) != 1 or security_model != 3:
+        raise ValueError("Unsupported SNMPv3 message")
+
+    usm_start, usm_end = _expect(data, header_end, Tag.OCTET_STRING, stop)
+    # Locate the authentication parameters within the security parameters
+    pos, _end = _expect(data, usm_start, Tag.SEQUENCE, usm_end)
+    for _field in range(4):
+        pos = _decode_tlv(data, pos, usm_end)[2]
+    auth_start, auth_end = _expect(data, pos, Tag.OCTET_STRING, usm_end)
+
+    return V3Message(
+        msg_id=msg_id,
+        max_size=max_size,
+        flags=flags[0],
+        security_parameters=data[usm_start:usm_end],
+        data=data[usm_end:stop],
+        auth_parameters=slice(auth_start, auth_end),
+    )
+
+
+def decode_usm_parameters(data: bytes) -> USMParameters:
+    start, stop = _expect(data, 0, Tag.SEQUENCE)
+    engine_id, pos = _decode_octet_string(data, start, stop)
+    engine_boots, pos = _decode_integer(data, pos, stop)
+    engine_time, pos = _decode_integer(data, pos, stop)
+    user_name, pos = _decode_octet_string(data, pos, stop)
+    auth_parameters, pos = _decode_octet_string(data, pos, stop)
+    priv_parameters, pos = _decode_octet_string(data, pos, stop)
+    return USMParameters(
+        engine_id=engine_id,
+        engine_boots=engine_boots,
+        engine_time=engine_time,
+        user_name=user_name,
+        auth_parameters=auth_parameters,
+        priv_parameters=priv_parameters,
+    )
+
+
+def decode_scoped_pdu(data: bytes) -> tuple[bytes, bytes, PDU]:
+    """The context engine ID, context name and PDU
+
+    Trailing data (the padding of a decrypted PDU) is ignored.
+    """
+    start, stop = _expect(data, 0, Tag.SEQUENCE)
+    context_engine_id, pos = _decode_octet_string(data, start, stop)
+    context_name, pos = _decode_octet_string(data, pos, stop)
+    return context_engine_id, context_name, decode_pdu(data[pos:stop])
+
+
+def decode_encrypted_pdu(data: bytes) -> bytes:
+    """The encrypted scoped PDU of a message with privacy"""
+    start, stop = _expect(data, 0, Tag.OCTET_STRING)
+    return data[start:stop]
+
+
+def render_value(varbind: VarBind) -> SNMPRawValue | None:
+    """The value as the other backends return it, None for the exceptions
+
+    >>> render_value(VarBind(".1.3", Tag.INTEGER, b"\\xff"))
+    b'-1'
+    >>> render_value(VarBind(".1.3", Tag.COUNTER32, b"\\xff"))
+    b'255'
+    >>> render_value(VarBind(".1.3", Tag.IP_ADDRESS, b"\\x0a\\x00\\x00\\x01"))
+    b'10.0.0.1'
+    >>> render_value(VarBind(".1.3", Tag.OBJECT_IDENTIFIER, b"\\x2b\\x06"))
+    b'.1.3.6'
+    >>> render_value(VarBind(".1.3", Tag.OCTET_STRING, b" eth0 "))
+    b'eth0'
+    """
+    tag, value = varbind.tag, varbind.value
+    if tag in _EXCEPTIONS:
+        return None
+    if tag == Tag.INTEGER:
+        return str(int.from_bytes(value, "big", signed=True)).encode()
+    if tag in _UNSIGNED:
+        # Some agents forget the leading zero octet of large unsigned values.
+        return str(int.from_bytes(value, "big")).encode()
+    if tag == Tag.OBJECT_IDENTIFIER:
+        return _decode_oid(value).encode()
+    if tag == Tag.IP_ADDRESS:
+        return ".".join(map(str, value)).encode()
+    if tag == Tag.NULL:
+        return b""
+    if tag == Tag.OCTET_STRING and not value.translate(None, _PRINTABLE):
+        # Text is stripped like the classic backend strips the output of net-snmp.
+        return value.strip()
+    return value
@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+# Copyright (C) 2024 Checkmk GmbH - License: GNU General Public License v2
+# This file is part of Checkmk (https://checkmk.com). It is subject to the terms and
+# conditions defined in the file COPYING, which is part of this source code package.
+"""The user-based security model of SNMPv3 (RFC 3414, RFC 3826 and RFC 7860)"""
+
+import functools
+import hashlib
+import hmac
+from collections.abc import Sequence
+from dataclasses import dataclass
+from typing import Final, Literal
+
+from cryptography.hazmat.decrepit.ciphers.algorithms import TripleDES
+from cryptography.hazmat.primitives.ciphers import algorithms, Cipher, modes
+
+from cmk.ccc.exceptions import MKGeneralException
+
+__all__ = ["AuthProtocol", "PrivProtocol", "USMUser"]
+
+
+@dataclass(frozen=True)
+class AuthProtocol:
+    hash_name: str
+    mac_length: int
+
+
+@dataclass(frozen=True)
+class PrivProtocol:
+    cipher: Literal["DES", "AES"]
+    key_length: int
+
+
+AUTH_PROTOCOLS: Final = {
+    "md5": AuthProtocol("md5", 12),
+    "sha": AuthProtocol("sha1", 12),
+    "SHA-224": AuthProtocol("sha224", 16),
+    "SHA-256": AuthProtocol("sha256", 24),
+    "SHA-384": AuthProtocol("sha384", 32),
+    "SHA-512": AuthProtocol("sha512", 48),
+}
+
+PRIV_PROTOCOLS: Final = {
+    "DES": PrivProtocol("DES", 16),
+    "AES": PrivProtocol("AES", 16),
+    "AES-192": PrivProtocol("AES", 24),
+    "AES-256": PrivProtocol("AES", 32),
+}
+
+
+@functools.lru_cache
+def password_to_key(password: bytes, hash_name: str) -> bytes:
+    """The key of a password, hashed with a megabyte of it (RFC 3414 A.2)"""
+    if not password:
+        raise MKGeneralException("Empty SNMPv3 password")
+    repeated = password * (1048576 // len(password) + 1)
+    return hashlib.new(hash_name, repeated[:1048576]).digest()
+
+
+def localize_key(key: bytes, engine_id: bytes, hash_name: str) -> bytes:
+    return hashlib.new(hash_name, key + engine_id + key).digest()
+
+
+def _extend_key(key: bytes, length: int, hash_name: str) -> bytes:
+    # AES-192 and AES-256 may need longer keys than the hash provides
+    # (draft-blumenthal-aes-usm-04, as used by Net-SNMP)
+    while len(key) < length:
+        key += hashlib.new(hash_name, key).digest()
+    return key[:length]
+
+
+@dataclass(frozen=True, kw_only=True)
+class USMUser:
+    security_level: Literal["noAuthNoPriv", "authNoPriv", "authPriv"]
+    user_name: bytes
+    auth_protocol: AuthProtocol | None = None
+    auth_password: bytes = b""
+    priv_protocol: PrivProtocol | None = None
+    priv_password: bytes = b""
+
+    @classmethod
+    def from_credentials(cls, credentials: Sequence[str]) -> "USMUser":
+        """The user of SNMPv3 credentials, see `SNMPCredentials`"""
+        match credentials:
+            case (security_level, user_name):
+                return cls(
+                    security_level=_security_level(security_level), user_name=user_name.encode()
+                )
+            case (security_level, auth_protocol, user_name, auth_password):
+                return cls(
+                    security_level=_security_level(security_level),
+                    user_name=user_name.encode(),
+                    auth_protocol=_auth_protocol(auth_protocol),
+                    auth_password=auth_password.encode(),
+                )
+            case (
+                security_level,
+                auth_protocol,
+                user_name,
+                auth_password,
+                priv_protocol,
+                priv_password,
+            ):
+                return cls(
+                    security_level=_security_level(security_level),
+                    user_name=user_name.encode(),
+                    auth_protocol=_auth_protocol(auth_protocol),
+                    auth_password=auth_password.encode(),
+                    priv_protocol=_priv_protocol(priv_protocol),
+                    priv_password=priv_password.encode(),
+                )
+        raise MKGeneralException(
+            f"Invalid SNMP credentials '{credentials!r}': must be 2-tuple, 4-tuple or 6-tuple"
+        )
+
+    @property
+    def authenticates(self) -> bool:
+        return self.security_level != "noAuthNoPriv"
+
+    @property
+    def encrypts(self) -> bool:
+        return self.security_level == "authPriv"
+
+    def keys(self, engine_id: bytes) -> tuple[bytes, bytes]:
+        """The localized authentication and privacy keys"""
+        if not self.authenticates:
+            return b"", b""
+        if self.auth_protocol is None:
+            raise MKGeneralException(f"Missing SNMPv3 auth protocol of {self.user_name!r}")
+        hash_name = self.auth_protocol.hash_name
+        auth_key = localize_key(
+            password_to_key(self.auth_password, hash_name), engine_id, hash_name
+        )
+        if not self.encrypts:
+            return auth_key, b""
+        if self.priv_protocol is None:
+            raise MKGeneralException(f"Missing SNMPv3 priv protocol of {self.user_name!r}")
+        priv_key = _extend_key(
+            localize_key(password_to_key(self.priv_password, hash_name), engine_id, hash_name),
+            self.priv_protocol.key_length,
+            hash_name,
+        )
+        return auth_key, priv_key
+
+    @property
+    def mac_length(self) -> int:
+        return self.auth_protocol.mac_length if self.auth_protocol and self.authenticates else 0
+
+    def mac(self, auth_key: bytes, message: bytes) -> bytes:
+        assert self.auth_protocol is not None
+        return hmac.digest(auth_key, message, self.auth_protocol.hash_name)[
+            : self.auth_protocol.mac_length
+        ]
+
+    def encrypt(
+        self, priv_key: bytes, engine_boots: int, engine_time: int, counter: int, plaintext: bytes
+    ) -> tuple[bytes, bytes]:
+        """The ciphertext and the privacy parameters (the salt)"""
+        assert self.priv_protocol is not None
+        if self.priv_protocol.cipher == "DES":
+            # RFC 3414 8.1.1.1: the salt is made of the boots and a local counter
+            salt = engine_boots.to_bytes(4, "big") + (counter & 0xFFFFFFFF).to_bytes(4, "big")
+            plaintext += bytes(-len(plaintext) % 8)
+        else:
+            salt = (counter & 0xFFFFFFFFFFFFFFFF).to_bytes(8, "big")
+        encryptor = self._cipher(priv_key, engine_boots, engine_time, salt).encryptor()
+        return encryptor.update(plaintext) + encryptor.finalize(), salt
+
+    def decrypt(
+        self, priv_key: bytes, engine_boots: int, engine_time: int, salt: bytes, ciphertext: bytes
+    ) -> bytes:
+        assert self.priv_protocol is not None
+        if len(salt) != 8 or (self.priv_protocol.cipher == "DES" and len(ciphertext) % 8):
+            raise ValueError("Invalid SNMPv3 encrypted PDU")
+        decryptor = self._cipher(priv_key, engine_boots, engine_time, salt).decryptor()
+        return decryptor.update(ciphertext) + decryptor.finalize()
+
+    def _cipher(self, priv_key: bytes, engine_boots: int, engine_time: int, salt: bytes) -> Cipher:
+        assert self.priv_protocol is not None
+        if self.priv_protocol.cipher == "DES":
+            iv = bytes(a ^ b for a, b in zip(priv_key[8:16], salt))
+            # Three times the same key is single DES
+            return Cipher(TripleDES(priv_key[:8] * 3), modes.CBC(iv))
+        # RFC 3826 3.1.2.1
+        iv = engine_boots.to_bytes(4, "big") + engine_time.to_bytes(4, "big") + salt
+        return Cipher(algorithms.AES(priv_key[: self.priv_protocol.key_length]), modes.CFB(iv))
+
+
+def _security_level(level: str) -> Literal["noAuthNoPriv", "authNoPriv", "authPriv"]:
+    match level:
+        case "noAuthNoPriv" | "authNoPriv" | "authPriv":
+            return level
+    raise MKGeneralException(f"Invalid SNMP security level: {level}")
+
+
+def _auth_protocol(name: str) -> AuthProtocol:
+    try:
+        return AUTH_PROTOCOLS[name]
+    except KeyError:
+        raise MKGeneralException(f"Invalid SNMP auth protocol: {name}")
+
+
+def _priv_protocol(name: str) -> PrivProtocol:
+    try:
+        return PRIV_PROTOCOLS[name]
+    except KeyError:
+        raise MKGeneralException(f"Invalid SNMP priv protocol: {name}")
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+# Copyright (C) 2024 Checkmk GmbH - License: GNU General Public License v2
+# This file is part of Checkmk (https://checkmk.com). It is subject to the terms and
+# conditions defined in the file COPYING, which is part of this source code package.
+"""Sorted index of the lines of a stored walk
+
+A stored walk is parsed once into an index, which is kept in memory and written
+to a file for the other processes:
+
+    MAGIC
+    mtime (ns) and size of the walk       2 x uint64
+    size of the walk path                 uint32
+    number of entries                     uint32
+    walk path                             utf-8
+    offsets of the keys, then the lines   (2 n + 1) x uint64
+    keys
+    lines                                 utf-8
+
+The numbers are in native byte order, index files are not shared between hosts.
+The key of an OID are its sub-identifiers as big endian uint32. Comparing the
+keys bytewise thus compares the OIDs numerically, and the keys of all OIDs of a
+subtree start with the key of its root. The entries are sorted by their keys.
+
+Large index files are mapped into memory instead of being read.
+"""
+
+import bisect
+import mmap
+import struct
+from array import array
+from collections.abc import Sequence
+from pathlib import Path
+from typing import Final
+
+from cmk.ccc.exceptions import MKGeneralException
+
+__all__ = ["WalkIndex", "oid_key"]
+
+_MAGIC: Final = b"CMKWIDX\x01"
+_HEADER: Final = struct.Struct("=QQII")
+_OFFSET: Final = struct.Struct("=Q")
+_MMAP_MIN_SIZE = 1024 * 1024
+
+
+def oid_key(oid: str) -> bytes:
+    """The key of an OID
+
+    >>> oid_key(".1.3.6.300").hex(" ", 4)
+    '00000001 00000003 00000006 0000012c'
+    """
+    try:
+        sub_ids = [int(s) for s in oid.strip(".").split(".")]
+        return struct.pack(f">{len(sub_ids)}I", *sub_ids)
+    except (ValueError, struct.error):
+        raise MKGeneralException(f"Invalid OID {oid}")
+
+
+def _subtree_end(key: bytes) -> bytes | None:
+    """The smallest key greater than the keys of the subtree, None if there is none
+
+    >>> _subtree_end(b"\\x00\\x01\\xff")
+    b'\\x00\\x02\\x00'
+    >>> _subtree_end(b"\\xff\\xff") is None
+    True
+    """
+    stripped = key.rstrip(b"\xff")
+    if not stripped:
+        return None
+    return stripped[:-1] + bytes([stripped[-1] + 1]) + bytes(len(key) - len(stripped))
+
+
+class _Keys:
+    """The keys of an index, for bisect"""
+
+    def __init__(self, index: "WalkIndex") -> None:
+        self._index = index
+
+    def __getitem__(self, i: int) -> bytes:
+        return self._index.key(i)
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+
+class WalkIndex:
+    def __init__(self, data: bytes | mmap.mmap) -> None:
+        if data[: len(_MAGIC)] != _MAGIC:
+            raise ValueError("not an index of a walk")
+        self.mtime_ns, self.size, path_size, self._num_entries = _HEADER.unpack_from(
+            data, len(_MAGIC)
+        )
+        pos = len(_MAGIC) + _HEADER.size
+        self.walk_path: Final = str(data[pos : pos + path_size], "utf-8")
+        self._key_offsets: Final = pos + path_size
+        self._line_offsets: Final = self._key_offsets + _OFFSET.size * self._num_entries
+        self._data: Final = data
+        if self._offset(self._line_offsets, self._num_entries) != len(data):
+            raise ValueError("truncated index of a walk")
+
+    @classmethod
+    def serialize(cls, walk_path: str, mtime_ns: int, size: int, lines: Sequence[str]) -> bytes:
+        entries = sorted(
+            ((oid_key(line.split(None, 1)[0]), line.encode("utf-8")) for line in lines),
+            key=lambda entry: entry[0],
+        )
+        encoded_path = walk_path.encode("utf-8")
+        header = b"".join(
+            (_MAGIC, _HEADER.pack(mtime_ns, size, len(encoded_path), len(entries)), encoded_path)
+        )
+
+        offsets = array("Q", [len(header) + _OFFSET.size * (2 * len(entries) + 1)])
+        for key, _line in entries:
+            offsets.append(offsets[-1] + len(key))
+        for _key, line in entries:
+            offsets.append(offsets[-1] + len(line))
+
+        return b"".join(
+            (
+                header,
+                offsets.tobytes(),
+                *(key for key, _line in entries),
+                *(line for _key, line in entries),
+            )
+        )
+
+    @classmethod
+    def load(cls, path: Path, walk_path: str, mtime_ns: int, size: int) -> "WalkIndex | None":
+        """Load an index file, None if it is missing or not up to date"""
+        try:
+            with path.open("rb") as f:
+                if path.stat().st_size < _MMAP_MIN_SIZE:
+                    index = cls(f.read())
+                else:
+                    # The mapping stays valid when the file is replaced by a new index.
+                    index = cls(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+        except (OSError, ValueError, struct.error):
+            return None
+        if (index.walk_path, index.mtime_ns, index.size) != (walk_path, mtime_ns, size):
+            return None
+        return index
+
+    def __len__(self) -> int:
+        return self._num_entries
+
+    def _offset(self, start: int, i: int) -> int:
+        return _OFFSET.unpack_from(self._data, start + _OFFSET.size * i)[0]
+
+    def _slice(self, start: int, i: int) -> bytes:
+        return self._data[self._offset(start, i) : self._offset(start, i + 1)]
+
+    def key(self, i: int) -> bytes:
+        return self._slice(self._key_offsets, i)
+
+    def line(self, i: int) -> str:
+        return str(self._slice(self._line_offsets, i), "utf-8")
+
+    def subtree(self, oid: str) -> range:
+        """The entries of the OID and all OIDs below it"""
+        key = oid_key(oid)
+        keys = _Keys(self)
+        begin = bisect.bisect_left(keys, key)
+        if (end_key := _subtree_end(key)) is None:
+            return range(begin, len(self))
+        return range(begin, bisect.bisect_left(keys, end_key, lo=begin))
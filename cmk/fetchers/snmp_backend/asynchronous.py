@@ -0,0 +1,617 @@
+#!/usr/bin/env python3
+# Copyright (C) 2024 Checkmk GmbH - License: GNU General Public License v2
+# This file is part of Checkmk (https://checkmk.com). It is subject to the terms and
+# conditions defined in the file COPYING, which is part of this source code package.
+"""SNMP engine running in the fetcher process on top of asyncio
+
+The classic backend runs a Net-SNMP command for every OID.  This backend speaks
+SNMP itself: all requests to a device share one UDP socket, and the columns of
+the tables are walked concurrently.
+"""
+
+import asyncio
+import bisect
+import hmac
+import itertools
+import logging
+import random
+import socket
+import time
+from collections.abc import Awaitable, Callable, Iterable, Mapping, Sequence
+from dataclasses import dataclass
+from typing import Final, TypeVar
+
+from cmk.ccc.exceptions import MKSNMPError
+
+from cmk.utils import tty
+from cmk.utils.log import VERBOSE
+from cmk.utils.sectionname import SectionName
+
+from cmk.snmplib import (
+    OID,
+    SNMPBackend,
+    SNMPContext,
+    SNMPContextTimeout,
+    SNMPHostConfig,
+    SNMPRawValue,
+    SNMPRowInfo,
+    SNMPVersion,
+)
+
+from . import _ber as ber
+from ._usm import USMUser
+
+__all__ = ["AsyncSNMPBackend", "Engine", "LatencyHistogram", "SNMPSession"]
+
+_T = TypeVar("_T")
+
+_MAX_MESSAGE_SIZE: Final = 65507
+
+_FLAG_AUTH: Final = 0x01
+_FLAG_PRIV: Final = 0x02
+_FLAG_REPORTABLE: Final = 0x04
+
+_ERROR_STATUS: Final = (
+    "noError",
+    "tooBig",
+    "noSuchName",
+    "badValue",
+    "readOnly",
+    "genErr",
+    "noAccess",
+    "wrongType",
+    "wrongLength",
+    "wrongEncoding",
+    "wrongValue",
+    "noCreation",
+    "inconsistentValue",
+    "resourceUnavailable",
+    "commitFailed",
+    "undoFailed",
+    "authorizationError",
+    "notWritable",
+    "inconsistentName",
+)
+_NO_SUCH_NAME: Final = 2
+
+_NOT_IN_TIME_WINDOW: Final = ".1.3.6.1.6.3.15.1.1.2.0"
+_UNKNOWN_ENGINE_ID: Final = ".1.3.6.1.6.3.15.1.1.4.0"
+_REPORTS: Final = {
+    ".1.3.6.1.6.3.15.1.1.1.0": "Unsupported security level",
+    _NOT_IN_TIME_WINDOW: "Not in time window",
+    ".1.3.6.1.6.3.15.1.1.3.0": "Unknown user name",
+    _UNKNOWN_ENGINE_ID: "Unknown engine ID",
+    ".1.3.6.1.6.3.15.1.1.5.0": "Authentication failure (incorrect password, community or key)",
+    ".1.3.6.1.6.3.15.1.1.6.0": "Decryption error",
+    ".1.3.6.1.6.3.12.1.5.0": "Unknown context",
+}
+
+
+@dataclass
+class Engine:
+    """The authoritative SNMPv3 engine of a device, as discovered"""
+
+    engine_id: bytes
+    engine_boots: int
+    engine_time: int
+    timestamp: float
+    auth_key: bytes
+    priv_key: bytes
+
+    def time(self) -> int:
+        return self.engine_time + int(time.monotonic() - self.timestamp)
+
+
+class LatencyHistogram:
+    """The response times of a device
+
+    Every answered request is counted in the first bucket whose upper bound
+    (in seconds) is not exceeded, unanswered attempts are counted as timeouts.
+    """
+
+    BOUNDS: Final = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self, bounds: Sequence[float] = BOUNDS) -> None:
+        self.bounds: Final = tuple(bounds)
+        self.counts: Final = [0] * (len(self.bounds) + 1)
+        self.total = 0.0
+        self.timeouts = 0
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.serialize()!r})"
+
+    @property
+    def count(self) -> int:
+        return sum(self.counts)
+
+    def observe(self, seconds: float) -> None:
+        self.counts[bisect.bisect_left(self.bounds, seconds)] += 1
+        self.total += seconds
+
+    def quantile(self, q: float) -> float:
+        """The upper bound of the bucket of the q-quantile
+
+        >>> histogram = LatencyHistogram((0.1, 0.2, 0.5))
+        >>> for seconds in (0.05, 0.15, 0.18, 0.3, 0.7):
+        ...     histogram.observe(seconds)
+        >>> histogram.quantile(0.5), histogram.quantile(0.8), histogram.quantile(1.0)
+        (0.2, 0.5, inf)
+        """
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip((*self.bounds, float("inf")), self.counts):
+            seen += count
+            if count and seen >= rank:
+                return bound
+        return 0.0
+
+    def serialize(self) -> Mapping[str, object]:
+        return {
+            "bounds": self.bounds,
+            "counts": tuple(self.counts),
+            "sum": self.total,
+            "timeouts": self.timeouts,
+        }
+
+
+_Result = tuple[ber.PDU, ber.USMParameters | None]
+
+
+class _Protocol(asyncio.DatagramProtocol):
+    def __init__(self, session: "SNMPSession") -> None:
+        self._session = session
+
+    def datagram_received(self, data: bytes, addr: tuple[str | int, ...]) -> None:
+        self._session.datagram_received(data)
+
+    def error_received(self, exc: Exception) -> None:
+        # E.g. ICMP port unreachable: the request is retried until it times out.
+        self._session.logger.debug("SNMP transport error: %s", exc)
+
+
+class SNMPSession:
+    """Asynchronous SNMP requests to a single device
+
+    All requests share one UDP socket, at most `max_in_flight` of them are
+    waiting for their responses at a time:
+
+        async with SNMPSession(snmp_config, logger) as session:
+            rows = await session.walk(".1.3.6.1.2.1.2.2.1.2", context="")
+
+    The timeout (per attempt) and the retries are taken from the timing
+    settings of the host, as for the classic backend.  No request is sent after
+    the `deadline` (of `time.monotonic()`), if any.  The response times are
+    counted in `latencies`.
+    """
+
+    def __init__(
+        self,
+        snmp_config: SNMPHostConfig,
+        logger: logging.Logger,
+        *,
+        max_repetitions: int | None = None,
+        max_in_flight: int = 10,
+        engine: Engine | None = None,
+        deadline: float | None = None,
+        latencies: LatencyHistogram | None = None,
+    ) -> None:
+        self.config: Final = snmp_config
+        self.logger: Final = logger
+        self.max_repetitions: Final = (
+            snmp_config.bulk_walk_size_of if max_repetitions is None else max_repetitions
+        )
+        self.timeout: Final = float(snmp_config.timing.get("timeout", 1.0))
+        self.retries: Final = int(snmp_config.timing.get("retries", 5))
+        self.engine = engine
+        self.deadline: Final = deadline
+        self.latencies: Final = LatencyHistogram() if latencies is None else latencies
+        self.address: Final = snmp_config.ipaddress or "0.0.0.0"
+
+        self._community = b""
+        self._user: USMUser | None = None
+        if snmp_config.snmp_version is SNMPVersion.V3:
+            if not isinstance(snmp_config.credentials, tuple):
+                raise TypeError()
+            self._user = USMUser.from_credentials(snmp_config.credentials)
+        else:
+            if not isinstance(snmp_config.credentials, str):
+                raise TypeError()
+            self._community = snmp_config.credentials.encode()
+
+        self._in_flight: Final = asyncio.Semaphore(max_in_flight)
+        self._discovery: Final = asyncio.Lock()
+        self._pending: Final[dict[int, asyncio.Future[_Result]]] = {}
+        self._ids: Final = itertools.count(random.randrange(1, 2**30))
+        self._salts: Final = itertools.count(random.getrandbits(63))
+        self._transport: asyncio.DatagramTransport | None = None
+
+    async def __aenter__(self) -> "SNMPSession":
+        self._transport, _protocol = await asyncio.get_running_loop().create_datagram_endpoint(
+            lambda: _Protocol(self),
+            remote_addr=(self.address, self.config.port),
+            family=socket.AF_INET6 if self.config.is_ipv6_primary else socket.AF_INET,
+        )
+        return self
+
+    async def __aexit__(self, *exc_info: object) -> None:
+        if self._transport is not None:
+            self._transport.close()
+            self._transport = None
+
+    async def get(self, oid: OID, *, context: SNMPContext) -> SNMPRawValue | None:
+        """Fetch a single OID, or the first one below it if it ends with .*"""
+        if getnext := oid.endswith(".*"):
+            oid = oid[:-2]
+        oid = "." + oid.strip(".")
+
+        try:
+            response = await self._request(
+                ber.Tag.GET_NEXT_REQUEST if getnext else ber.Tag.GET_REQUEST, [oid], context
+            )
+        except MKSNMPError as e:
+            self.logger.log(VERBOSE, f"{tty.red}{tty.bold}ERROR: {tty.normal}SNMP error: {e}")
+            return None
+
+        if response.error_status or not response.varbinds:
+            return None
+        varbind = response.varbinds[0]
+        if getnext and not varbind.oid.startswith(oid + "."):
+            return None
+        return ber.render_value(varbind)
+
+    async def walk(self, oid: OID, *, context: SNMPContext) -> SNMPRowInfo:
+        """Fetch the subtree of an OID, with GetBulk requests if enabled"""
+        root = "." + oid.strip(".")
+        rows: SNMPRowInfo = []
+        current: OID | None = root
+        while current is not None:
+            if self.config.use_bulkwalk:
+                response = await self._request(
+                    ber.Tag.GET_BULK_REQUEST,
+                    [current],
+                    context,
+                    max_repetitions=self.max_repetitions,
+                )
+            else:
+                response = await self._request(ber.Tag.GET_NEXT_REQUEST, [current], context)
+
+            if response.error_status:
+                if (
+                    response.error_status == _NO_SUCH_NAME
+                    and self.config.snmp_version is SNMPVersion.V1
+                ):
+                    break  # The end of the MIB view of SNMPv1
+                raise MKSNMPError(
+                    f"SNMP Error on {self.address}: {_error_status(response.error_status)}"
+                )
+            current = _collect_rows(root, current, response.varbinds, rows)
+
+        # Like snmpwalk: the root may be a single instance, which is only found by a Get.
+        if not rows and (value := await self.get(root, context=context)) is not None:
+            rows.append((root, value))
+        return rows
+
+    async def walk_many(
+        self, oids: Iterable[tuple[OID, SNMPContext]]
+    ) -> dict[tuple[OID, SNMPContext], SNMPRowInfo | MKSNMPError]:
+        """Walk the subtrees concurrently, the errors are returned per subtree"""
+
+        async def _walk(oid: OID, context: SNMPContext) -> SNMPRowInfo | MKSNMPError:
+            try:
+                return await self.walk(oid, context=context)
+            except MKSNMPError as e:
+                return e
+
+        keys = list(dict.fromkeys(oids))
+        return dict(zip(keys, await asyncio.gather(*(_walk(*key) for key in keys))))
+
+    async def _request(
+        self,
+        tag: ber.Tag,
+        oids: Sequence[OID],
+        context: SNMPContext,
+        *,
+        max_repetitions: int = 0,
+    ) -> ber.PDU:
+        async with self._in_flight:
+            request_id = next(self._ids)
+            pdu = ber.PDU(
+                tag,
+                request_id,
+                0,
+                max_repetitions,
+                [ber.VarBind(oid, ber.Tag.NULL, b"") for oid in oids],
+            )
+            if self._user is None:
+                message = ber.encode_community_message(
+                    0 if self.config.snmp_version is SNMPVersion.V1 else 1,
+                    self._community,
+                    ber.encode_pdu(pdu),
+                )
+                return (await self._send(request_id, lambda: message))[0]
+            return await self._request_v3(self._user, request_id, pdu, context)
+
+    async def _request_v3(
+        self, user: USMUser, request_id: int, pdu: ber.PDU, context: SNMPContext
+    ) -> ber.PDU:
+        # Reports may ask us to rediscover the engine or to adjust the time once.
+        for _attempt in range(3):
+            engine = await self._discover(user)
+            response, usm = await self._send(
+                request_id, lambda: self._encode_v3(user, engine, request_id, pdu, context)
+            )
+            if response.tag != ber.Tag.REPORT:
+                return response
+
+            report = response.varbinds[0].oid if response.varbinds else ""
+            if report == _NOT_IN_TIME_WINDOW and usm is not None:
+                engine.engine_boots = usm.engine_boots
+                engine.engine_time = usm.engine_time
+                engine.timestamp = time.monotonic()
+            elif report == _UNKNOWN_ENGINE_ID:
+                self.engine = None
+            else:
+                break
+
+        raise MKSNMPError(f"SNMP Error on {self.address}: {_REPORTS.get(report, report)}")
+
+    async def _discover(self, user: USMUser) -> Engine:
+        async with self._discovery:
+            if self.engine is not None:
+                return self.engine
+
+            request_id = next(self._ids)
+            message, _auth = ber.encode_v3_message(
+                msg_id=request_id,
+                max_size=_MAX_MESSAGE_SIZE,
+                flags=_FLAG_REPORTABLE,
+                usm=ber.USMParameters(
+                    engine_id=b"",
+                    engine_boots=0,
+                    engine_time=0,
+                    user_name=b"",
+                    auth_parameters=b"",
+                    priv_parameters=b"",
+                ),
+                data=ber.encode_scoped_pdu(
+                    b"", b"", ber.encode_pdu(ber.PDU(ber.Tag.GET_REQUEST, request_id, 0, 0, []))
+                ),
+            )
+            _response, usm = await self._send(request_id, lambda: message)
+            if usm is None or not usm.engine_id:
+                raise MKSNMPError(f"SNMP Error on {self.address}: Engine discovery failed")
+
+            auth_key, priv_key = user.keys(usm.engine_id)
+            self.engine = Engine(
+                usm.engine_id,
+                usm.engine_boots,
+                usm.engine_time,
+                time.monotonic(),
+                auth_key,
+                priv_key,
+            )
+            return self.engine
+
+    def _encode_v3(
+        self, user: USMUser, engine: Engine, request_id: int, pdu: ber.PDU, context: SNMPContext
+    ) -> bytes:
+        engine_time = engine.time()
+        data = ber.encode_scoped_pdu(engine.engine_id, context.encode(), ber.encode_pdu(pdu))
+        priv_parameters = b""
+        if user.encrypts:
+            ciphertext, priv_parameters = user.encrypt(
+                engine.priv_key, engine.engine_boots, engine_time, next(self._salts), data
+            )
+            data = ber.encode_encrypted_pdu(ciphertext)
+
+        message, auth_parameters = ber.encode_v3_message(
+            msg_id=request_id,
+            max_size=_MAX_MESSAGE_SIZE,
+            flags=(
+                _FLAG_REPORTABLE
+                | (_FLAG_AUTH if user.authenticates else 0)
+                | (_FLAG_PRIV if user.encrypts else 0)
+            ),
+            usm=ber.USMParameters(
+                engine_id=engine.engine_id,
+                engine_boots=engine.engine_boots,
+                engine_time=engine_time,
+                user_name=user.user_name,
+                auth_parameters=bytes(user.mac_length),
+                priv_parameters=priv_parameters,
+            ),
+            data=data,
+        )
+        if not user.authenticates:
+            return message
+        return b"".join(
+            (
+                message[: auth_parameters.start],
+                user.mac(engine.auth_key, message),
+                message[auth_parameters.stop :],
+            )
+        )
+
+    async def _send(self, key: int, encode: Callable[[], bytes]) -> _Result:
+        if self._transport is None:
+            raise MKSNMPError("SNMP session is not open")
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending[key] = future
+        try:
+            for _attempt in range(self.retries + 1):
+                timeout = self.timeout
+                if self.deadline is not None:
+                    if (timeout := min(timeout, self.deadline - time.monotonic())) <= 0:
+                        raise SNMPContextTimeout(
+                            f"SNMP Error on {self.address}: Timeout budget exceeded"
+                        )
+                sent = time.monotonic()
+                self._transport.sendto(encode())
+                try:
+                    result = await asyncio.wait_for(asyncio.shield(future), timeout)
+                except TimeoutError:
+                    self.latencies.timeouts += 1
+                    continue
+                self.latencies.observe(time.monotonic() - sent)
+                return result
+        finally:
+            del self._pending[key]
+
+        raise SNMPContextTimeout(
+            f"SNMP Error on {self.address}: Timeout: No Response from {self.address}"
+        )
+
+    def datagram_received(self, data: bytes) -> None:
+        try:
+            key, result = self._decode(data)
+        except ValueError as e:
+            self.logger.debug("Dropping invalid SNMP message from %s: %s", self.address, e)
+            return
+        if (future := self._pending.get(key)) is not None and not future.done():
+            future.set_result(result)
+
+    def _decode(self, data: bytes) -> tuple[int, _Result]:
+        if self._user is None:
+            _version, _community, pdu = ber.decode_community_message(data)
+            return pdu.request_id, (pdu, None)
+
+        user = self._user
+        message = ber.decode_v3_message(data)
+        usm = ber.decode_usm_parameters(message.security_parameters)
+        engine = self.engine if self.engine and self.engine.engine_id == usm.engine_id else None
+
+        if message.flags & _FLAG_AUTH:
+            if engine is None or not user.authenticates:
+                raise ValueError("Unexpected authenticated message")
+            auth = message.auth_parameters
+            zeroed = data[: auth.start] + bytes(auth.stop - auth.start) + data[auth.stop :]
+            expected = user.mac(engine.auth_key, zeroed)
+            if not hmac.compare_digest(expected, usm.auth_parameters):
+                raise ValueError("Authentication failure")
+
+        scoped_pdu = message.data
+        if message.flags & _FLAG_PRIV:
+            if engine is None or not user.encrypts:
+                raise ValueError("Unexpected encrypted message")
+            scoped_pdu = user.decrypt(
+                engine.priv_key,
+                usm.engine_boots,
+                usm.engine_time,
+                usm.priv_parameters,
+                ber.decode_encrypted_pdu(scoped_pdu),
+            )
+
+        _context_engine_id, _context_name, pdu = ber.decode_scoped_pdu(scoped_pdu)
+        if user.authenticates and not message.flags & _FLAG_AUTH and pdu.tag != ber.Tag.REPORT:
+            raise ValueError("Unauthenticated response")
+        return message.msg_id, (pdu, usm)
+
+
+def _oid_arcs(oid: OID) -> tuple[int, ...]:
+    return tuple(map(int, oid.strip(".").split(".")))
+
+
+def _collect_rows(
+    root: OID, current: OID, varbinds: Sequence[ber.VarBind], rows: SNMPRowInfo
+) -> OID | None:
+    """Append the rows within the subtree, return the OID to continue with
+
+    >>> rows = []
+    >>> _collect_rows(".1.3", ".1.3", [
+    ...     ber.VarBind(".1.3.2", ber.Tag.INTEGER, b"\\x02"),
+    ...     ber.VarBind(".1.3.10", ber.Tag.INTEGER, b"\\x0a"),
+    ... ], rows)
+    '.1.3.10'
+    >>> _collect_rows(".1.3", ".1.3.10", [ber.VarBind(".1.3.9", ber.Tag.INTEGER, b"\\x09")], rows)
+    >>> rows
+    [('.1.3.2', b'2'), ('.1.3.10', b'10')]
+    """
+    last = _oid_arcs(current)
+    for varbind in varbinds:
+        if varbind.tag == ber.Tag.END_OF_MIB_VIEW or not varbind.oid.startswith(root + "."):
+            return None
+        if (arcs := _oid_arcs(varbind.oid)) <= last:
+            return None  # The agent does not advance, stop here instead of looping.
+        if (value := ber.render_value(varbind)) is not None:
+            rows.append((varbind.oid, value))
+        current, last = varbind.oid, arcs
+    return current if varbinds else None
+
+
+def _error_status(status: int) -> str:
+    return _ERROR_STATUS[status] if 0 <= status < len(_ERROR_STATUS) else str(status)
+
+
+class AsyncSNMPBackend(SNMPBackend):
+    """Runs an `SNMPSession` for every request, or for all prefetched walks at once
+
+    The sessions run in an event loop of their own, or in the given `loop`
+    running in another thread.  The `budget` limits the time (in seconds) for
+    all requests made through the backend.
+    """
+
+    def __init__(
+        self,
+        snmp_config: SNMPHostConfig,
+        logger: logging.Logger,
+        *,
+        max_repetitions: int | None = None,
+        max_in_flight: int = 10,
+        budget: float | None = None,
+        latencies: LatencyHistogram | None = None,
+        engine: Engine | None = None,
+        loop: asyncio.AbstractEventLoop | None = None,
+    ) -> None:
+        super().__init__(snmp_config, logger)
+        self.max_repetitions: Final = max_repetitions
+        self.max_in_flight: Final = max_in_flight
+        self.deadline: Final = None if budget is None else time.monotonic() + budget
+        self.latencies: Final = LatencyHistogram() if latencies is None else latencies
+        self.engine = engine
+        self._loop: Final = loop
+        self._prefetched: dict[tuple[OID, SNMPContext], SNMPRowInfo | MKSNMPError] = {}
+
+    def get(self, /, oid: OID, *, context: SNMPContext) -> SNMPRawValue | None:
+        return self._run(lambda session: session.get(oid, context=context))
+
+    def walk(
+        self,
+        /,
+        oid: OID,
+        *,
+        context: SNMPContext,
+        section_name: SectionName | None = None,
+        table_base_oid: OID | None = None,
+    ) -> SNMPRowInfo:
+        try:
+            rows = self._prefetched.pop((oid, context))
+        except KeyError:
+            return self._run(lambda session: session.walk(oid, context=context))
+        if isinstance(rows, MKSNMPError):
+            raise rows
+        return rows
+
+    def prefetch(self, oids: Iterable[tuple[OID, SNMPContext]]) -> None:
+        self._prefetched.update(self._run(lambda session: session.walk_many(oids)))
+
+    def _run(self, request: Callable[[SNMPSession], Awaitable[_T]]) -> _T:
+        if self._loop is None:
+            return asyncio.run(self._session(request))
+        return asyncio.run_coroutine_threadsafe(self._session(request), self._loop).result()
+
+    async def _session(self, request: Callable[[SNMPSession], Awaitable[_T]]) -> _T:
+        async with SNMPSession(
+            self.config,
+            self._logger,
+            max_repetitions=self.max_repetitions,
+            max_in_flight=self.max_in_flight,
+            engine=self.engine,
+            deadline=self.deadline,
+            latencies=self.latencies,
+        ) as session:
+            try:
+                return await request(session)
+            finally:
+                # Spare the engine discovery of the next session
+                self.engine = session.engine
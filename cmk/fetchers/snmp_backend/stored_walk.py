@@ -9,21 +9,37 @@ from collections.abc import Sequence
 from pathlib import Path
 from typing import Final
 
-from cmk.ccc.exceptions import MKException, MKGeneralException, MKSNMPError
+from cmk.ccc import store
+from cmk.ccc.exceptions import MKGeneralException, MKSNMPError
 
 from cmk.utils.sectionname import SectionName
 
 from cmk.snmplib import OID, SNMPBackend, SNMPContext, SNMPHostConfig, SNMPRawValue, SNMPRowInfo
 
 from ._utils import strip_snmp_value
+from ._walk_index import WalkIndex
 
 __all__ = ["StoredWalkSNMPBackend"]
 
 
 class StoredWalkSNMPBackend(SNMPBackend):
-    def __init__(self, snmp_config: SNMPHostConfig, logger: logging.Logger, path: Path) -> None:
+    """Serves the SNMP data from a stored walk
+
+    The walk is parsed into a `WalkIndex` once per process.  If `index_dir` is
+    given, the index is also written there, so other processes only have to load it.
+    """
+
+    def __init__(
+        self,
+        snmp_config: SNMPHostConfig,
+        logger: logging.Logger,
+        path: Path,
+        *,
+        index_dir: Path | None = None,
+    ) -> None:
         super().__init__(snmp_config, logger)
         self.path: Final = path
+        self.index_dir: Final = index_dir
         if not self.path.exists():
             raise MKSNMPError(f"No snmpwalk file {self.path}")
 
@@ -57,35 +73,41 @@ class StoredWalkSNMPBackend(SNMPBackend):
             dot_star = False
 
         self._logger.debug(f"  Loading {oid}")
-        lines = self.read_walk_data()
-
-        begin = 0
-        end = len(lines)
-        hit = None
-        while end - begin > 0:
-            current = (begin + end) // 2
-            parts = lines[current].split(None, 1)
-            comp = parts[0]
-            hit = StoredWalkSNMPBackend._compare_oids(oid_prefix, comp)
-            if hit == 0:
-                break
-            if hit == 1:  # we are too low
-                begin = current + 1
-            else:
-                end = current
-
-        if hit != 0:
-            return []  # not found
-
-        rowinfo = StoredWalkSNMPBackend._collect_until(oid, oid_prefix, lines, current, -1)
-        rowinfo.reverse()
-        rowinfo += StoredWalkSNMPBackend._collect_until(oid, oid_prefix, lines, current + 1, 1)
-
-        if dot_star:
-            return [rowinfo[0]]
+        index = self._load_index()
+
+        rowinfo = []
+        for entry in index.subtree(oid_prefix):
+            parts = index.line(entry).split(None, 1)
+            o = parts[0]
+            if o.startswith("."):
+                o = o[1:]
+            if o == oid or o.startswith(oid_prefix + "."):
+                # Fix for missing starting oids
+                rowinfo.append(("." + o, strip_snmp_value(parts[1] if len(parts) > 1 else "")))
+                if dot_star:
+                    break
 
         return rowinfo
 
+    def _load_index(self) -> WalkIndex:
+        try:
+            stat = self.path.stat()
+        except OSError:
+            raise MKSNMPError(f"No snmpwalk file {self.path}")
+        # The modification time and the size are checked: a changed walk is parsed again.
+        if (cached := _INDEX_CACHE.pop(self.path, None)) is not None and cached[:2] == (
+            stat.st_mtime_ns,
+            stat.st_size,
+        ):
+            _INDEX_CACHE[self.path] = cached
+            return cached[2]
+
+        index = _load_index(self.path, self.index_dir, stat.st_mtime_ns, stat.st_size, self._logger)
+        if len(_INDEX_CACHE) >= _INDEX_CACHE_SIZE:
+            del _INDEX_CACHE[next(iter(_INDEX_CACHE))]
+        _INDEX_CACHE[self.path] = (stat.st_mtime_ns, stat.st_size, index)
+        return index
+
     @staticmethod
     def read_walk_from_path(path: Path, logger: logging.Logger) -> Sequence[str]:
         logger.debug(f"  Opening {path}")
@@ -106,51 +128,33 @@ class StoredWalkSNMPBackend(SNMPBackend):
         except OSError:
             raise MKSNMPError(f"No snmpwalk file {self.path}")
 
-    @staticmethod
-    def _compare_oids(a: OID, b: OID) -> int:
-        aa = StoredWalkSNMPBackend._to_bin_string(a)
-        bb = StoredWalkSNMPBackend._to_bin_string(b)
-        if len(aa) <= len(bb) and bb[: len(aa)] == aa:
-            result = 0
-        else:
-            result = (aa > bb) - (aa < bb)
-        return result
 
-    @staticmethod
-    def _to_bin_string(oid: OID) -> tuple[int, ...]:
+_INDEX_CACHE_SIZE: Final = 256
+
+# Least recently used walk indices of this process by the path of the walk
+_INDEX_CACHE: dict[Path, tuple[int, int, WalkIndex]] = {}
+
+
+def _load_index(
+    path: Path, index_dir: Path | None, mtime_ns: int, size: int, logger: logging.Logger
+) -> WalkIndex:
+    if index_dir is not None and (
+        index := WalkIndex.load(index_dir / path.name, str(path), mtime_ns, size)
+    ) is not None:
+        return index
+
+    try:
+        lines = StoredWalkSNMPBackend.read_walk_from_path(path, logger)
+    except OSError:
+        raise MKSNMPError(f"No snmpwalk file {path}")
+    data = WalkIndex.serialize(str(path), mtime_ns, size, lines)
+
+    if index_dir is not None:
         try:
-            return tuple(map(int, oid.strip(".").split(".")))
-        except MKException:
-            raise
-        except Exception:
-            raise MKGeneralException(f"Invalid OID {oid}")
+            index_dir.mkdir(parents=True, exist_ok=True)
+            store.save_bytes_to_file(index_dir / path.name, data)
+        except (OSError, MKGeneralException) as e:
+            # Not fatal, the next process simply parses the walk again.
+            logger.debug(f"  Cannot write the index of {path}: {e}")
 
-    @staticmethod
-    def _collect_until(
-        oid: OID, oid_prefix: OID, lines: Sequence[str], index: int, direction: int
-    ) -> SNMPRowInfo:
-        rows = []
-        # Handle case, where we run after the end of the lines list
-        if index >= len(lines):
-            if direction > 0:
-                return []
-            index -= 1
-        while True:
-            line = lines[index]
-            parts = line.split(None, 1)
-            o = parts[0]
-            if o.startswith("."):
-                o = o[1:]
-            if o == oid or o.startswith(oid_prefix + "."):
-                if len(parts) > 1:
-                    value = parts[1]
-                else:
-                    value = ""
-                # Fix for missing starting oids
-                rows.append(("." + o, strip_snmp_value(value)))
-                index += direction
-                if index < 0 or index >= len(lines):
-                    break
-            else:
-                break
-        return rows
+    return WalkIndex(data)
@@ -8,7 +8,6 @@ from pathlib import Path
 
 from livestatus import LivestatusOutputFormat, LivestatusResponse, SiteId
 
-from cmk.ccc import store
 from cmk.ccc.exceptions import MKGeneralException
 
 from cmk.utils.paths import default_config_dir
@@ -17,12 +16,11 @@ from cmk.gui import sites
 from cmk.gui.hooks import request_memoize
 from cmk.gui.i18n import _
 
-from cmk.bi.aggregation import BIAggregation
-from cmk.bi.compiler import BICompiler, path_compiled_aggregations
+from cmk.bi.compiler import BICompiler, compiled_aggregation_store
 from cmk.bi.computer import BIComputer
 from cmk.bi.data_fetcher import BIStatusFetcher
 from cmk.bi.lib import SitesCallback
-from cmk.bi.trees import BICompiledAggregation, BICompiledRule
+from cmk.bi.trees import BICompiledRule
 
 
 class BIManager:
@@ -62,15 +60,6 @@ def bi_livestatus_query(
 
 @request_memoize(maxsize=10000)
 def load_compiled_branch(aggr_id: str, branch_title: str) -> BICompiledRule:
-    compiled_aggregation = _load_compiled_aggregation(aggr_id)
-    for branch in compiled_aggregation.branches:
-        if branch.properties.title == branch_title:
-            return branch
-    raise MKGeneralException(f"Branch {branch_title} not found in aggregation {aggr_id}")
-
-
-@request_memoize(maxsize=10000)
-def _load_compiled_aggregation(aggr_id: str) -> BICompiledAggregation:
-    return BIAggregation.create_trees_from_schema(
-        store.load_object_from_pickle_file(path_compiled_aggregations.joinpath(aggr_id), default={})
-    )
+    if (branch := compiled_aggregation_store.get_branch(aggr_id, branch_title)) is None:
+        raise MKGeneralException(f"Branch {branch_title} not found in aggregation {aggr_id}")
+    return branch
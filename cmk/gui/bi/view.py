@@ -9,7 +9,6 @@ from typing import Any, Literal
 
 from livestatus import OnlySites, SiteId
 
-from cmk.ccc import store
 from cmk.ccc.exceptions import MKGeneralException
 
 from cmk.utils.hostaddress import HostName
@@ -56,9 +55,8 @@ from cmk.gui.views.command.base import CommandSpecWithoutSite
 from cmk.gui.visuals import get_livestatus_filter_headers
 from cmk.gui.visuals.filter import Filter
 
-from cmk.bi.aggregation import BIAggregation
+from cmk.bi.compiler import compiled_aggregation_store
 from cmk.bi.computer import BIAggregationFilter
-from cmk.bi.data_fetcher import get_cache_dir
 from cmk.bi.lib import FrozenMarker
 from cmk.bi.trees import BICompiledRule
 from cmk.bi.type_defs import frozen_aggregations_dir
@@ -915,16 +913,10 @@ def convert_tree_to_frozen_diff_tree(row: Row) -> tuple[Row, bool]:
         raise MKGeneralException("Unable to find source aggregation for diff tree")
     bi_ref_aggregation, bi_ref_branch = found_aggr
 
-    # Load other aggregation from disk
-    other_aggr_path = Path(get_cache_dir(), "compiled_aggregations", other_aggregation)
-    other_aggr = BIAggregation.create_trees_from_schema(
-        store.load_object_from_pickle_file(other_aggr_path, default={})
-    )
-
+    # Load the branch of the other aggregation from disk
     aggregations_are_equal = True
-    for bi_other_branch in other_aggr.branches:
-        if bi_other_branch.properties.title == other_branch:
-            aggregations_are_equal = combine_branches(bi_ref_branch, bi_other_branch)
+    if bi_other_branch := compiled_aggregation_store.get_branch(other_aggregation, other_branch):
+        aggregations_are_equal = combine_branches(bi_ref_branch, bi_other_branch)
 
     required_aggregations = [(bi_ref_aggregation, [bi_ref_branch])]
     required_elements = bi_manager.computer.get_required_elements(required_aggregations)
@@ -5,13 +5,11 @@
 """Core for getting the actual raw data points via Livestatus from RRD"""
 
 import collections
-import contextlib
 import time
-from collections.abc import Callable, Iterable, Iterator, Mapping
+from collections.abc import Callable, Iterable, Iterator, Mapping, Sequence
 from functools import lru_cache
 
-import livestatus
-from livestatus import livestatus_lql, SiteId
+from livestatus import lq_logic, SiteId
 
 import cmk.ccc.version as cmk_version
 from cmk.ccc.exceptions import MKGeneralException
@@ -35,7 +33,7 @@ from ._legacy import (
     LegacyUnitSpecification,
 )
 from ._metrics import get_metric_spec
-from ._timeseries import op_func_wrapper, time_series_operators
+from ._timeseries import time_series_math
 from ._translated_metrics import find_matching_translation, TranslationSpec
 from ._type_defs import GraphConsolidationFunction, RRDData, RRDDataKey
 
@@ -55,30 +53,12 @@ def fetch_rrd_data_for_graph(
         for key in metric.operation.keys()
         if isinstance(key, RRDDataKey)
     )
-    rrd_data: dict[RRDDataKey, TimeSeries] = {}
-    for (site, host_name, service_description), metrics in by_service.items():
-        with contextlib.suppress(livestatus.MKLivestatusNotFoundError):
-            for (metric_name, consolidation_function, scale), data in _fetch_rrd_data(
-                site,
-                host_name,
-                service_description,
-                metrics,
-                graph_recipe.consolidation_function,
-                graph_data_range,
-            ):
-                rrd_data[
-                    RRDDataKey(
-                        site,
-                        host_name,
-                        service_description,
-                        metric_name,
-                        consolidation_function,
-                        scale,
-                    )
-                ] = TimeSeries(
-                    data,
-                    conversion=conversion,
-                )
+    rrd_data: dict[RRDDataKey, TimeSeries] = {
+        key: TimeSeries(data, conversion=conversion)
+        for key, data in _fetch_rrd_data(
+            by_service, graph_recipe.consolidation_function, graph_data_range
+        )
+    }
     _align_and_resample_rrds(rrd_data, graph_recipe.consolidation_function)
     _chop_last_empty_step(graph_data_range, rrd_data)
 
@@ -143,7 +123,7 @@ def _chop_last_empty_step(graph_data_range: GraphDataRange, rrd_data: RRDData) -
 
 def _chop_end_of_the_curve(rrd_data: RRDData, step: int) -> None:
     for data in rrd_data.values():
-        del data.values[-1]
+        data.values = data.values[:-1]
         data.end -= step
 
 
@@ -168,13 +148,16 @@ def _group_needed_rrd_data_by_service(
 
 
 def _fetch_rrd_data(
-    site: SiteId,
-    host_name: HostName,
-    service_description: ServiceName,
-    metrics: set[MetricProperties],
+    by_service: Mapping[tuple[SiteId, HostName, ServiceName], set[MetricProperties]],
     consolidation_function: GraphConsolidationFunction | None,
     graph_data_range: GraphDataRange,
-) -> list[tuple[MetricProperties, TimeSeriesValues]]:
+) -> Iterator[tuple[RRDDataKey, TimeSeriesValues]]:
+    """Fetch the RRD data of all services with one query per set of needed metrics
+
+    Graphs of many services (combined graphs, aggregations over hosts, ...) typically need the
+    same metrics of all of them. These services are fetched from all their sites with a single
+    query, which the sites answer in parallel, instead of one round trip per service.
+    """
     start_time, end_time = graph_data_range.time_range
 
     step = graph_data_range.step
@@ -183,11 +166,64 @@ def _fetch_rrd_data(
         step = max(1, step)
 
     point_range = ":".join(map(str, (start_time, end_time, step)))
-    lql_columns = list(rrd_columns(metrics, consolidation_function, point_range))
-    query = livestatus_lql([host_name], lql_columns, service_description)
 
-    with sites.only_sites(site):
-        return list(zip(metrics, sites.live().query_row(query)))
+    by_metrics: dict[
+        tuple[bool, frozenset[MetricProperties]],
+        list[tuple[SiteId, HostName, ServiceName]],
+    ] = collections.defaultdict(list)
+    for service, needed_metrics in by_service.items():
+        by_metrics[(service[2] == "_HOST_", frozenset(needed_metrics))].append(service)
+
+    for (is_host, metrics), services in by_metrics.items():
+        ordered_metrics = list(metrics)
+        lql_columns = list(rrd_columns(ordered_metrics, consolidation_function, point_range))
+        query = _batched_rrd_data_query(is_host, services, lql_columns)
+        requested: dict[tuple[str, str, str], tuple[SiteId, HostName, ServiceName]] = {
+            service: service for service in services
+        }
+
+        with sites.only_sites(sorted({site for site, _host, _service in services})):
+            with sites.prepend_site():
+                rows = sites.live().query(query)
+
+        for row in rows:
+            if is_host:
+                site, host_name, *columns = row
+                service_description = "_HOST_"
+            else:
+                site, host_name, service_description, *columns = row
+            # The sites all get the same query, ignore matches of services of other sites.
+            if (found := requested.get((site, host_name, service_description))) is None:
+                continue
+            for (metric_name, metric_cf, scale), data in zip(ordered_metrics, columns):
+                yield RRDDataKey(*found, metric_name, metric_cf, scale), data
+
+
+def _batched_rrd_data_query(
+    is_host: bool,
+    services: Iterable[tuple[SiteId, HostName, ServiceName]],
+    lql_columns: Sequence[ColumnName],
+) -> str:
+    if is_host:
+        host_names = sorted({host_name for _site, host_name, _service in services})
+        return (
+            f"GET hosts\nColumns: host_name {' '.join(lql_columns)}\n"
+            + lq_logic("Filter: host_name =", host_names, "Or")
+        )
+
+    by_host: dict[HostName, set[ServiceName]] = collections.defaultdict(set)
+    for _site, host_name, service_description in services:
+        by_host[host_name].add(service_description)
+
+    query = f"GET services\nColumns: host_name service_description {' '.join(lql_columns)}\n"
+    for host_name, service_descriptions in sorted(by_host.items()):
+        query += lq_logic("Filter: host_name =", [host_name], "Or")
+        query += lq_logic("Filter: service_description =", sorted(service_descriptions), "Or")
+        if len(by_host) > 1:
+            query += "And: 2\n"
+    if len(by_host) > 1:
+        query += "Or: %d\n" % len(by_host)
+    return query
 
 
 def rrd_columns(
@@ -298,11 +334,11 @@ def translate_and_merge_rrd_columns(
     if not relevant_ts:
         return TimeSeries([0, 0, 0])
 
-    _op_title, op_func = time_series_operators()["MERGE"]
-    single_value_series = [op_func_wrapper(op_func, list(tsp)) for tsp in zip(*relevant_ts)]
+    merged = time_series_math("MERGE", relevant_ts)
+    assert merged is not None
 
     return TimeSeries(
-        single_value_series,
-        time_window=relevant_ts[0].twindow,
+        merged.array,
+        time_window=merged.twindow,
         conversion=get_conversion_function(get_metric_spec(metric_name).unit_spec),
     )
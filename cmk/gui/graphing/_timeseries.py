@@ -5,10 +5,13 @@
 
 import functools
 import operator
-from collections.abc import Callable
+from collections.abc import Callable, Sequence
 from dataclasses import dataclass
 from typing import Literal, TypeVar
 
+import numpy as np
+import numpy.typing as npt
+
 from cmk.ccc.exceptions import MKGeneralException
 
 from cmk.gui.i18n import _
@@ -17,6 +20,8 @@ from cmk.gui.utils import escaping
 
 from ._type_defs import LineType, Operators, RRDData
 
+_Array = npt.NDArray[np.float64]
+
 
 @dataclass(frozen=True)
 class TimeSeriesMetaData:
@@ -60,14 +65,44 @@ def time_series_math(
         # Silently return so to get an empty graph slot
         return None
 
-    _op_title, op_func = operators[operator_id]
-    twindow = operands_evaluated[0].twindow
-
     return TimeSeries(
-        [op_func_wrapper(op_func, list(tsp)) for tsp in zip(*operands_evaluated)], twindow
+        _evaluate_operator(operator_id, [ts.array for ts in operands_evaluated]),
+        operands_evaluated[0].twindow,
     )
 
 
+def _evaluate_operator(operator_id: Operators, operands: Sequence[_Array]) -> _Array:
+    """Apply the operator to all points of the operands at once
+
+    This is equivalent to applying the operator functions of `time_series_operators` point by
+    point (see `op_func_wrapper`): missing values (NaN) are ignored by the sum, maximum, minimum,
+    average and merge and make the result of the other operators missing.
+    """
+    length = min(len(operand) for operand in operands)
+    stacked = np.vstack([operand[:length] for operand in operands])
+    known = ~np.isnan(stacked)
+    all_known = known.all(axis=0)
+    with np.errstate(all="ignore"):
+        match operator_id:
+            case "+":
+                result = np.where(known.any(axis=0), np.nansum(stacked, axis=0), np.nan)
+            case "*":
+                result = np.where(all_known, np.prod(stacked, axis=0), np.nan)
+            case "-":
+                result = np.where(all_known, stacked[0] - stacked[1], np.nan)
+            case "/":
+                result = np.where(all_known & (stacked[1] != 0), stacked[0] / stacked[1], np.nan)
+            case "MAX":
+                result = np.fmax.reduce(stacked, axis=0)
+            case "MIN":
+                result = np.fmin.reduce(stacked, axis=0)
+            case "AVERAGE":
+                result = np.nansum(stacked, axis=0) / known.sum(axis=0)
+            case "MERGE":
+                result = stacked[np.argmax(known, axis=0), np.arange(stacked.shape[1])]
+    return result
+
+
 _TOperatorReturn = TypeVar("_TOperatorReturn")
 
 
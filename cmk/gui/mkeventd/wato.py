@@ -242,6 +242,7 @@ def register(
     config_var_registry.register(ConfigVariableEventConsoleServiceLevels)
     config_var_registry.register(ConfigVariableEventConsoleSqliteHousekeepingInterval)
     config_var_registry.register(ConfigVariableEventConsoleSqliteFreelistSize)
+    config_var_registry.register(ConfigVariableEventConsoleSqliteAsyncWrites)
 
     rulespec_group_registry.register(RulespecGroupEventConsole)
     rulespec_registry.register(ECEventLimitRulespec)
@@ -4098,6 +4099,29 @@ class ConfigVariableEventConsoleSqliteFreelistSize(ConfigVariable):
         )
 
 
+class ConfigVariableEventConsoleSqliteAsyncWrites(ConfigVariable):
+    def group(self) -> type[ConfigVariableGroup]:
+        return ConfigVariableGroupEventConsoleGeneric
+
+    def domain(self) -> type[ABCConfigDomain]:
+        return ConfigDomainEventConsole
+
+    def ident(self) -> str:
+        return "sqlite_async_writes"
+
+    def valuespec(self) -> ValueSpec:
+        return Checkbox(
+            title=_("Event Console history background writes"),
+            label=_("write the history in the background"),
+            help=_(
+                "Usually every history entry is written to the Event Console history database "
+                "before the processing of an event continues. With this option the entries are "
+                "buffered in memory and written in batches by a background thread, so a slow "
+                "disk does not slow down the event processing. Only used with the SQLite history."
+            ),
+        )
+
+
 class ConfigVariableEventConsoleStatisticsInterval(ConfigVariable):
     def group(self) -> type[ConfigVariableGroup]:
         return ConfigVariableGroupEventConsoleGeneric
@@ -3,8 +3,12 @@
 # This file is part of Checkmk (https://checkmk.com). It is subject to the terms and
 # conditions defined in the file COPYING, which is part of this source code package.
 
-from collections.abc import Callable, Iterator, Sequence
+from collections.abc import Callable, Iterator, Mapping, Sequence
 from statistics import fmean
+from typing import Final
+
+import numpy as np
+import numpy.typing as npt
 
 Timestamp = int
 
@@ -38,6 +42,48 @@ def aggregation_functions(series: TimeSeriesValues, aggr: str | None) -> TimeSer
             raise ValueError(f"Invalid Aggregation function {aggr}, only max, min, average allowed")
 
 
+_Array = npt.NDArray[np.float64]
+
+_CONSOLIDATIONS: Final[Mapping[str, np.ufunc]] = {
+    "average": np.add,
+    "max": np.maximum,
+    "min": np.minimum,
+}
+
+
+def _identity(v: float) -> float:
+    return v
+
+
+def _to_array(values: TimeSeriesValues | _Array) -> _Array:
+    # None becomes NaN
+    return np.array(values, dtype=np.float64)
+
+
+def _to_list(array: _Array) -> list[TimeSeriesValue]:
+    values = array.astype(object)
+    values[np.isnan(array)] = None
+    return values.tolist()
+
+
+def _convert(array: _Array, conversion: Callable[[float], float]) -> _Array:
+    if conversion is _identity:
+        return array
+    missing = np.isnan(array)
+    try:
+        with np.errstate(all="ignore"):
+            converted = np.asarray(conversion(array), dtype=np.float64)  # type: ignore[arg-type]
+    except (TypeError, ValueError, ArithmeticError):
+        # Not every conversion works on a whole array, e.g. if it uses `math` functions
+        converted = np.empty(0)
+    if converted.shape != array.shape:
+        converted = _to_array(
+            [None if m else conversion(v) for v, m in zip(array.tolist(), missing.tolist())]
+        )
+    converted[missing] = np.nan
+    return converted
+
+
 class TimeSeries:
     """Describes the returned time series returned by livestatus
 
@@ -47,6 +93,9 @@ class TimeSeries:
     - The Series describes the interval [start; end[
     - Start has no associated value to it.
 
+    The values are kept in a float array, missing values (None) are NaN. Resampling,
+    consolidation and the operators of the graph recipes work on the whole array.
+
     args:
         data : list
             Includes [start, end, step, *values]
@@ -59,12 +108,12 @@ class TimeSeries:
 
     def __init__(
         self,
-        data: TimeSeriesValues,
+        data: TimeSeriesValues | _Array,
         time_window: TimeWindow | None = None,
-        conversion: Callable[[float], float] = lambda v: v,
+        conversion: Callable[[float], float] = _identity,
     ) -> None:
         if time_window is None:
-            if not data or data[0] is None or data[1] is None or data[2] is None:
+            if not len(data) or data[0] is None or data[1] is None or data[2] is None:
                 raise ValueError(data)
 
             time_window = int(data[0]), int(data[1]), int(data[2])
@@ -74,7 +123,26 @@ class TimeSeries:
         self.start = int(time_window[0])
         self.end = int(time_window[1])
         self.step = int(time_window[2])
-        self.values = [v if v is None else conversion(v) for v in data]
+        self._array = _convert(_to_array(data), conversion)
+        self._values: list[TimeSeriesValue] | None = None
+
+    @property
+    def array(self) -> _Array:
+        """The values as (read only) array, None is NaN"""
+        array = self._array.view()
+        array.flags.writeable = False
+        return array
+
+    @property
+    def values(self) -> list[TimeSeriesValue]:
+        if self._values is None:
+            self._values = _to_list(self._array)
+        return self._values
+
+    @values.setter
+    def values(self, values: TimeSeriesValues) -> None:
+        self._array = _to_array(values)
+        self._values = None
 
     @property
     def twindow(self) -> TimeWindow:
@@ -89,12 +157,8 @@ class TimeSeries:
         if twindow == self.twindow:
             return self.values
 
-        idx_max = len(self.values) - 1
-
-        return [
-            self.values[max(0, min(int((t - self.start) / self.step), idx_max))]
-            for t in range(*twindow)
-        ]
+        indices = np.trunc((np.arange(*twindow) - self.start) / self.step).astype(np.int64)
+        return _to_list(self._array[np.clip(indices, 0, len(self._array) - 1)])
 
     def downsample(self, twindow: TimeWindow, cf: str | None = "max") -> TimeSeriesValues:
         """Downsample time series by consolidation function
@@ -107,23 +171,35 @@ class TimeSeries:
         if twindow == self.twindow:
             return self.values
 
-        dwsa = []
-        co: list[TimeSeriesValue] = []
-        desired_times = rrd_timestamps(twindow)
-        i = 0
-        for t, val in self.time_data_pairs():
-            if t > desired_times[i]:
-                dwsa.append(aggregation_functions(co, cf))
-                co = []
-                i += 1
-            co.append(val)
+        desired_times = np.array(rrd_timestamps(twindow), dtype=np.int64)
+        if not len(desired_times):
+            return []
+        # A value belongs to the first desired time not before it. Consecutive values
+        # advance by at most one desired time, like the consolidation of rrdtool.
+        positions = np.arange(len(self._array))
+        first_not_before = np.searchsorted(
+            desired_times, self.start + self.step * (positions + 1), side="left"
+        )
+        bins = positions + np.minimum(np.minimum.accumulate(first_not_before - positions), 1)
+
+        known = ~np.isnan(self._array) & (bins < len(desired_times))
+        known_bins = bins[known]
+        known_values = self._array[known]
+        if not len(known_values):
+            return [None] * len(desired_times)
+
+        cf = "max" if cf is None else cf.lower()
+        if (consolidation := _CONSOLIDATIONS.get(cf)) is None:
+            raise ValueError(f"Invalid Aggregation function {cf}, only max, min, average allowed")
 
-        diff_len = len(desired_times) - len(dwsa)
-        if diff_len > 0:
-            dwsa.append(aggregation_functions(co, cf))
-            dwsa += [None] * (diff_len - 1)
+        used_bins, starts = np.unique(known_bins, return_index=True)
+        consolidated = consolidation.reduceat(known_values, starts)
+        if cf == "average":
+            consolidated /= np.diff(starts, append=len(known_values))
 
-        return dwsa
+        downsampled = np.full(len(desired_times), np.nan)
+        downsampled[used_bins] = consolidated
+        return _to_list(downsampled)
 
     def time_data_pairs(self) -> list[tuple[Timestamp, TimeSeriesValue]]:
         return list(zip(rrd_timestamps(self.twindow), self.values))
@@ -139,17 +215,19 @@ class TimeSeries:
             self.start == other.start
             and self.end == other.end
             and self.step == other.step
-            and self.values == other.values
+            and np.array_equal(self._array, other._array, equal_nan=True)
         )
 
     def __getitem__(self, i: int) -> TimeSeriesValue:
         return self.values[i]
 
     def __len__(self) -> int:
-        return len(self.values)
+        return len(self._array)
 
     def __iter__(self) -> Iterator[TimeSeriesValue]:
         yield from self.values
 
     def count(self, /, v: TimeSeriesValue) -> int:
+        if v is None:
+            return int(np.count_nonzero(np.isnan(self._array)))
         return self.values.count(v)
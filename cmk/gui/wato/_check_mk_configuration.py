@@ -206,6 +206,7 @@ def register(
     config_variable_registry.register(ConfigVariableSimulationMode)
     config_variable_registry.register(ConfigVariableRestartLocking)
     config_variable_registry.register(ConfigVariableDelayPrecompile)
+    config_variable_registry.register(ConfigVariableConfigGenerationProcesses)
     config_variable_registry.register(ConfigVariableClusterMaxCachefileAge)
     config_variable_registry.register(ConfigVariablePiggybackMaxCachefileAge)
     config_variable_registry.register(ConfigVariableCheckMKPerfdataWithTimes)
@@ -3106,6 +3107,32 @@ class ConfigVariableDelayPrecompile(ConfigVariable):
         )
 
 
+class ConfigVariableConfigGenerationProcesses(ConfigVariable):
+    def group(self) -> type[ConfigVariableGroup]:
+        return ConfigVariableGroupCheckExecution
+
+    def domain(self) -> type[ABCConfigDomain]:
+        return ConfigDomainCore
+
+    def ident(self) -> str:
+        return "config_generation_processes"
+
+    def valuespec(self) -> ValueSpec:
+        return Integer(
+            title=_("Processes for creating the core configuration"),
+            help=_(
+                "When activating the changes, the configuration of the Nagios core is created "
+                "host by host. With more than one process, the hosts are split into shards "
+                "which are processed in parallel. The resulting configuration is the same. "
+                "This speeds up the activation of large sites, at the cost of a higher load "
+                "and memory usage during the activation."
+            ),
+            minvalue=1,
+            maxvalue=64,
+            default_value=1,
+        )
+
+
 class ConfigVariableClusterMaxCachefileAge(ConfigVariable):
     def group(self) -> type[ConfigVariableGroup]:
         return ConfigVariableGroupCheckExecution
@@ -3202,20 +3229,25 @@ class ConfigVariableUseDNSCache(ConfigVariable):
 
 
 def transform_snmp_backend_default_to_valuespec(
-    backend: Literal["classic", "inline"],
+    backend: Literal["classic", "inline", "async"],
 ) -> SNMPBackendEnum:
     return {
         "classic": SNMPBackendEnum.CLASSIC,
         "inline": SNMPBackendEnum.INLINE,
+        "async": SNMPBackendEnum.ASYNC,
     }[backend]
 
 
-def transform_snmp_backend_from_valuespec(backend: SNMPBackendEnum) -> Literal["classic", "inline"]:
+def transform_snmp_backend_from_valuespec(
+    backend: SNMPBackendEnum,
+) -> Literal["classic", "inline", "async"]:
     match backend:
         case SNMPBackendEnum.CLASSIC:
             return "classic"
         case SNMPBackendEnum.INLINE:
             return "inline"
+        case SNMPBackendEnum.ASYNC:
+            return "async"
         case _:
             raise MKConfigError("SNMPBackendEnum %r not implemented" % backend)
 
@@ -3239,6 +3271,7 @@ class ConfigVariableChooseSNMPBackend(ConfigVariable):
                 choices=[
                     (SNMPBackendEnum.CLASSIC, _("Use Classic SNMP Backend")),
                     (SNMPBackendEnum.INLINE, _("Use Inline SNMP Backend")),
+                    (SNMPBackendEnum.ASYNC, _("Use Asynchronous SNMP Backend")),
                 ],
                 help=_(
                     "By default Checkmk uses command line calls of Net-SNMP tools like snmpget or "
@@ -5677,6 +5710,8 @@ def transform_snmp_backend_hosts_to_valuespec(backend):
         # We dropped pysnmp during the 2.1 beta because it is currently slow
         # and unreliable.
         return SNMPBackendEnum.CLASSIC
+    if backend == "async":
+        return SNMPBackendEnum.ASYNC
     raise MKConfigError("SNMPBackendEnum %r not implemented" % backend)
 
 
@@ -5687,6 +5722,7 @@ def _valuespec_snmp_backend():
             choices=[
                 (SNMPBackendEnum.INLINE, _("Use Inline SNMP backend")),
                 (SNMPBackendEnum.CLASSIC, _("Use Classic backend")),
+                (SNMPBackendEnum.ASYNC, _("Use Asynchronous backend")),
             ],
         ),
         to_valuespec=transform_snmp_backend_hosts_to_valuespec,
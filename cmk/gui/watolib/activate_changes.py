@@ -34,7 +34,8 @@ from datetime import datetime
 from itertools import filterfalse
 from multiprocessing.pool import AsyncResult, ThreadPool
 from pathlib import Path
-from typing import Any, Literal, NamedTuple, TypedDict
+from stat import S_ISLNK
+from typing import Any, Final, Literal, NamedTuple, TypedDict
 from urllib.parse import urlparse
 
 from setproctitle import setthreadtitle
@@ -2228,6 +2229,7 @@ class ReplicationPathType(enum.StrEnum):
 
 def _get_config_sync_file_infos_per_inode(
     replication_paths: Sequence[ReplicationPath],
+    hash_cache: ConfigSyncFileHashCache | None = None,
 ) -> Mapping[int, ConfigSyncFileInfo]:
     inode_sync_states = {}
 
@@ -2239,11 +2241,11 @@ def _get_config_sync_file_infos_per_inode(
 
         if replication_path.ty == ReplicationPathType.FILE:
             inode_sync_states[os.stat(replication_path_full).st_ino] = _get_config_sync_file_info(
-                replication_path_full
+                replication_path_full, hash_cache
             )
         elif replication_path.ty == ReplicationPathType.DIR:
             _get_replication_dir_config_sync_file_infos_per_inode(
-                inode_sync_states, replication_path_full, replication_path.excludes
+                inode_sync_states, replication_path_full, replication_path.excludes, hash_cache
             )
         else:
             raise NotImplementedError()
@@ -2255,6 +2257,7 @@ def _get_replication_dir_config_sync_file_infos_per_inode(
     inode_sync_states: MutableMapping[int, ConfigSyncFileInfo],
     replication_path: str,
     replication_path_excludes: Sequence[str],
+    hash_cache: ConfigSyncFileHashCache | None = None,
 ) -> None:
     # Use os functionality instead of pathlib since it is faster
     for root, dir_names, file_names in os.walk(replication_path):
@@ -2269,12 +2272,16 @@ def _get_replication_dir_config_sync_file_infos_per_inode(
                 and os.path.islink(dir_path)
                 and not dir_name == GENERAL_DIR_EXCLUDE
             ):
-                inode_sync_states[os.stat(dir_path).st_ino] = _get_config_sync_file_info(dir_path)
+                inode_sync_states[os.stat(dir_path).st_ino] = _get_config_sync_file_info(
+                    dir_path, hash_cache
+                )
 
         for file_name in file_names:
             file_path = os.path.join(root, file_name)
             if os.path.exists(file_path):
-                inode_sync_states[os.stat(file_path).st_ino] = _get_config_sync_file_info(file_path)
+                inode_sync_states[os.stat(file_path).st_ino] = _get_config_sync_file_info(
+                    file_path, hash_cache
+                )
 
 
 def _prepare_for_activation_tasks(
@@ -2284,8 +2291,9 @@ def _prepare_for_activation_tasks(
     time_started: float,
     source: ActivationSource,
 ) -> tuple[Mapping[SiteId, ConfigSyncFileInfos], Mapping[SiteId, SiteActivationState]]:
+    hash_cache = ConfigSyncFileHashCache.load()
     config_sync_file_infos_per_inode = _get_config_sync_file_infos_per_inode(
-        get_replication_paths()
+        get_replication_paths(), hash_cache
     )
     central_file_infos_per_site = {}
     site_activation_states_per_site = {}
@@ -2303,13 +2311,16 @@ def _prepare_for_activation_tasks(
 
             if activate_changes.is_sync_needed(site_id):
                 central_file_infos_per_site[site_id] = _get_site_central_file_infos(
-                    site_id, snapshot_settings, config_sync_file_infos_per_inode
+                    site_id, snapshot_settings, config_sync_file_infos_per_inode, hash_cache
                 )
         except Exception as e:
             _handle_activation_changes_exception(
                 logger.getChild(f"site[{site_id}]"), str(e), site_activation_state
             )
             _cleanup_activation(site_id, activation_id, source)
+
+    hash_cache.log_statistics(logger)
+    hash_cache.save()
     return central_file_infos_per_site, site_activation_states_per_site
 
 
@@ -2317,6 +2328,7 @@ def _get_site_central_file_infos(
     site_id: SiteId,
     snapshot_settings: SnapshotSettings,
     config_sync_file_infos_per_inode: Mapping[int, ConfigSyncFileInfo],
+    hash_cache: ConfigSyncFileHashCache | None = None,
 ) -> ConfigSyncFileInfos:
     # In case we experience performance issues here, we could postpone the hashing of the
     # central files to only be done ad-hoc in get_file_names_to_sync when the other attributes
@@ -2327,6 +2339,7 @@ def _get_site_central_file_infos(
         snapshot_settings.snapshot_components,
         site_config_dir,
         config_sync_file_infos_per_inode,
+        hash_cache,
     )
 
     logger.getChild(f"site[{site_id}]").debug(
@@ -3078,7 +3091,12 @@ class AutomationGetConfigSyncState(AutomationCommand):
 
     def execute(self, api_request: list[ReplicationPath]) -> GetConfigSyncStateResponse:
         with store.lock_checkmk_configuration(configuration_lockfile):
-            file_infos = _get_config_sync_file_infos(api_request, base_dir=cmk.utils.paths.omd_root)
+            hash_cache = ConfigSyncFileHashCache.load()
+            file_infos = _get_config_sync_file_infos(
+                api_request, base_dir=cmk.utils.paths.omd_root, hash_cache=hash_cache
+            )
+            hash_cache.log_statistics(logger)
+            hash_cache.save()
             transport_file_infos = {
                 k: (v.st_mode, v.st_size, v.link_target, v.file_hash) for k, v in file_infos.items()
             }
@@ -3118,6 +3136,7 @@ def _get_config_sync_file_infos(
     replication_paths: list[ReplicationPath],
     base_dir: Path,
     config_sync_file_infos_per_inode: Mapping[int, ConfigSyncFileInfo] | None = None,
+    hash_cache: ConfigSyncFileHashCache | None = None,
 ) -> ConfigSyncFileInfos:
     """Scans the given replication paths for the information needed for the config sync
 
@@ -3137,7 +3156,9 @@ def _get_config_sync_file_infos(
             continue  # Only report back existing things
 
         if replication_path.ty == ReplicationPathType.FILE:
-            infos[replication_path.site_path] = _get_config_sync_file_info(replication_path_full)
+            infos[replication_path.site_path] = _get_config_sync_file_info(
+                replication_path_full, hash_cache
+            )
 
         elif replication_path.ty == ReplicationPathType.DIR:
             _get_replication_dir_config_sync_file_infos(
@@ -3146,6 +3167,7 @@ def _get_config_sync_file_infos(
                 base_dir,
                 replication_path_full,
                 replication_path.excludes,
+                hash_cache,
             )
         else:
             raise NotImplementedError()
@@ -3158,6 +3180,7 @@ def _get_replication_dir_config_sync_file_infos(
     base_dir: Path,
     replication_path: str,
     replication_path_excludes: Sequence[str],
+    hash_cache: ConfigSyncFileHashCache | None = None,
 ) -> None:
     # Use os functionality instead of pathlib since it is faster
     for root, dir_names, file_names in os.walk(replication_path):
@@ -3177,22 +3200,100 @@ def _get_replication_dir_config_sync_file_infos(
                 ):
                     infos[valid_site_path] = sync_file_info
                 else:
-                    infos[valid_site_path] = _get_config_sync_file_info(config_sync_path)
+                    infos[valid_site_path] = _get_config_sync_file_info(
+                        config_sync_path, hash_cache
+                    )
             except FileNotFoundError:  # e.g. broken symlinks
-                infos[valid_site_path] = _get_config_sync_file_info(config_sync_path)
+                infos[valid_site_path] = _get_config_sync_file_info(config_sync_path, hash_cache)
 
 
-def _get_config_sync_file_info(file_path: str) -> ConfigSyncFileInfo:
+def _get_config_sync_file_info(
+    file_path: str, hash_cache: ConfigSyncFileHashCache | None = None
+) -> ConfigSyncFileInfo:
     stat = os.lstat(file_path)
-    is_symlink = os.path.islink(file_path)
+    if S_ISLNK(stat.st_mode):
+        return ConfigSyncFileInfo(stat.st_mode, stat.st_size, os.readlink(file_path), None)
     return ConfigSyncFileInfo(
         stat.st_mode,
         stat.st_size,
-        os.readlink(str(file_path)) if is_symlink else None,
-        _create_config_sync_file_hash(file_path) if not is_symlink else None,
+        None,
+        (
+            _create_config_sync_file_hash(file_path)
+            if hash_cache is None
+            else hash_cache.file_hash(file_path, stat)
+        ),
     )
 
 
+class ConfigSyncFileHashCache:
+    """Persisted hashes of the files handled by the config sync
+
+    Hashing all replicated files on every activation is expensive with big configurations.
+    A hash is reused as long as the file is the same inode with the same size, mtime and ctime.
+
+    Files changed shortly before they were hashed are not persisted. With a coarse timestamp
+    granularity they could be changed again without a visible change of the timestamps.
+    Entries of files not seen during the last scan are dropped when saving.
+    """
+
+    _RACY_WINDOW_NS: Final = 2 * 10**9
+
+    def __init__(self, path: Path) -> None:
+        self._path: Final = path
+        self._cached: dict[tuple[int, int], tuple[int, int, int, str]] = {}
+        self._seen: dict[tuple[int, int], tuple[int, int, int, str]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def load(cls, path: Path | None = None) -> ConfigSyncFileHashCache:
+        cache = cls(path or _config_sync_file_hash_cache_path())
+        try:
+            cached = store.load_object_from_pickle_file(cache._path, default={})
+        except Exception:
+            logger.exception("Ignoring invalid config sync file hash cache %s", cache._path)
+            cached = {}
+        if isinstance(cached, dict):
+            cache._cached = cached
+        return cache
+
+    def file_hash(self, file_path: str, stat: os.stat_result) -> str:
+        key = (stat.st_dev, stat.st_ino)
+        signature = (stat.st_size, stat.st_mtime_ns, stat.st_ctime_ns)
+        for known in (self._seen.get(key), self._cached.get(key)):
+            if known is not None and known[:3] == signature:
+                self.hits += 1
+                self._seen[key] = known
+                return known[3]
+
+        self.misses += 1
+        file_hash = _create_config_sync_file_hash(file_path)
+        # A change during or right before hashing may not be visible in the timestamps
+        if max(stat.st_mtime_ns, stat.st_ctime_ns) < time.time_ns() - self._RACY_WINDOW_NS:
+            self._seen[key] = (*signature, file_hash)
+        return file_hash
+
+    def save(self) -> None:
+        if self._seen == self._cached:
+            return
+        store.makedirs(self._path.parent)
+        store.save_object_to_pickle_file(self._path, self._seen)
+        self._cached = dict(self._seen)
+
+    def log_statistics(self, site_logger: logging.Logger) -> None:
+        if total := self.hits + self.misses:
+            site_logger.info(
+                "Config sync file hash cache: %d of %d files unchanged (%.1f%%)",
+                self.hits,
+                total,
+                100.0 * self.hits / total,
+            )
+
+
+def _config_sync_file_hash_cache_path() -> Path:
+    return wato_var_dir() / "config_sync_file_hashes.pickle"
+
+
 def _create_config_sync_file_hash(file_path: str) -> str:
     sha256 = hashlib.sha256()
     with open(file_path, "rb") as f:
@@ -6,7 +6,7 @@
 
 import contextlib
 import hashlib
-from collections.abc import Callable, MutableMapping, Sequence
+from collections.abc import Callable, Iterable, Mapping, MutableMapping, Sequence
 from functools import partial
 from typing import assert_never
 
@@ -128,6 +128,27 @@ def get_snmp_table(
     return new_info
 
 
+def prefetch_snmp_tables(
+    trees: Iterable[tuple[SectionName | None, BackendSNMPTree]],
+    *,
+    walk_cache: Mapping[tuple[str, str, bool], SNMPRowInfo],
+    backend: SNMPBackend,
+) -> None:
+    """Let the backend walk the columns of the tables in advance, see `SNMPBackend.prefetch`"""
+    oids: dict[tuple[OID, SNMPContext], None] = {}
+    for section_name, tree in trees:
+        contexts = backend.config.snmpv3_contexts_of(section_name).contexts
+        context_hash = _context_hash(contexts)
+        for oid in tree.oids:
+            if isinstance(oid.column, SpecialColumn):
+                continue
+            fetchoid = f"{tree.base}.{oid.column}"
+            if (fetchoid, context_hash, oid.save_to_cache) not in walk_cache:
+                oids.update(dict.fromkeys((fetchoid, context) for context in contexts))
+    if oids:
+        backend.prefetch(oids)
+
+
 def _make_index_rows(
     max_column: SNMPRowInfo,
     index_format: SpecialColumn,
@@ -186,11 +207,7 @@ def get_snmpwalk(
     backend: SNMPBackend,
     log: Callable[[str], None],
 ) -> SNMPRowInfo:
-    contexts = backend.config.snmpv3_contexts_of(section_name).contexts
-    context_string = "-".join(["no_context" if not c else c for c in contexts])
-
-    # contexts are hashed in order not to exceed max pathname length
-    context_hash = hashlib.shake_256(context_string.encode("utf-8")).hexdigest(15)
+    context_hash = _context_hash(backend.config.snmpv3_contexts_of(section_name).contexts)
 
     with contextlib.suppress(KeyError):
         cache_info = walk_cache[(fetchoid, context_hash, save_walk_cache)]
@@ -243,6 +260,12 @@ def get_snmpwalk(
     return rowinfo
 
 
+def _context_hash(contexts: Sequence[SNMPContext]) -> str:
+    context_string = "-".join(["no_context" if not c else c for c in contexts])
+    # contexts are hashed in order not to exceed max pathname length
+    return hashlib.shake_256(context_string.encode("utf-8")).hexdigest(15)
+
+
 def _decode_column(
     column: list[SNMPRawValue],
     value_encoding: SNMPValueEncoding,
@@ -57,6 +57,7 @@ class SNMPBackendEnum(enum.Enum):
     INLINE = "Inline"
     CLASSIC = "Classic"
     STORED_WALK = "StoredWalk"
+    ASYNC = "Async"
 
     def serialize(self) -> str:
         return self.name
@@ -221,6 +222,13 @@ class SNMPBackend(abc.ABC):
     ) -> SNMPRowInfo:
         return []
 
+    def prefetch(self, oids: Iterable[tuple[OID, SNMPContext]]) -> None:
+        """Walk the given OIDs in the given contexts in advance
+
+        Backends that can walk concurrently do so here, and return the
+        prefetched rows from `walk`.  The others simply walk later.
+        """
+
 
 class SpecialColumn(enum.IntEnum):
     # Until we remove all but the first, its worth having an enum
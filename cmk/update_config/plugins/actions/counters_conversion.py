@@ -14,14 +14,6 @@ import cmk.utils.paths
 from cmk.update_config.registry import update_action_registry, UpdateAction
 
 
-def _is_json(raw: str) -> bool:
-    try:
-        _ = json.loads(raw)
-    except json.JSONDecodeError:
-        return False
-    return True
-
-
 def _ls(counters_path: Path) -> Sequence[Path]:
     try:
         return list(counters_path.iterdir())
@@ -36,12 +28,13 @@ class ConvertCounters(UpdateAction):
     @staticmethod
     def convert_counter_files(counters_path: Path) -> None:
         for f in _ls(counters_path):
-            if not (content := f.read_text().strip()) or _is_json(content):
+            # Only the old format is a dict, the current formats are JSON lists or binary.
+            if not (content := f.read_bytes().strip()).startswith(b"{"):
                 continue
 
             f.write_text(
                 json.dumps(
-                    [(k, repr(v)) for k, v in ast.literal_eval(content).items()],
+                    [(k, repr(v)) for k, v in ast.literal_eval(content.decode()).items()],
                 )
             )
 
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+# Copyright (C) 2024 Checkmk GmbH - License: GNU General Public License v2
+# This file is part of Checkmk (https://checkmk.com). It is subject to the terms and
+# conditions defined in the file COPYING, which is part of this source code package.
+"""Sets of hosts as bitsets
+
+Every configured host gets a dense integer id. A set of hosts is then a
+Python int with the bit of every member set, and the rule conditions can be
+evaluated with a few `&`, `|` and `~` operations on these ints instead of
+iterating the hosts one by one.
+"""
+
+from collections.abc import Iterable, Iterator, Sequence, Set
+from typing import Final
+
+from cmk.utils.hostaddress import HostName
+
+__all__ = ["HostIndex", "HostSet"]
+
+
+class HostIndex:
+    """Maps the hosts to their ids and back"""
+
+    def __init__(self, hosts: Iterable[HostName]) -> None:
+        self.names: Final[Sequence[HostName]] = list(dict.fromkeys(hosts))
+        self.ids: Final[dict[HostName, int]] = {name: i for i, name in enumerate(self.names)}
+        self.all: Final = (1 << len(self.names)) - 1
+
+    def bits_of_ids(self, ids: Iterable[int]) -> int:
+        # Setting the bits one by one would copy the (big) int for every host.
+        packed = bytearray(len(self.names) // 8 + 1)
+        for i in ids:
+            packed[i >> 3] |= 1 << (i & 7)
+        return int.from_bytes(packed, "little")
+
+    def bits(self, hosts: Iterable[HostName]) -> int:
+        """The bitset of the given hosts, unknown hosts are ignored"""
+        ids = self.ids
+        return self.bits_of_ids(i for h in hosts if (i := ids.get(h)) is not None)
+
+    def ids_of(self, bits: int) -> Iterator[int]:
+        binary = format(bits, "b")[::-1]
+        i = binary.find("1")
+        while i != -1:
+            yield i
+            i = binary.find("1", i + 1)
+
+    def names_of(self, bits: int) -> Iterator[HostName]:
+        names = self.names
+        return (names[i] for i in self.ids_of(bits))
+
+
+class HostSet(Set[HostName]):
+    """An immutable set of hosts backed by a bitset of a `HostIndex`"""
+
+    __slots__ = ("_index", "bits", "_packed")
+
+    def __init__(self, index: HostIndex, bits: int) -> None:
+        self._index: Final = index
+        self.bits: Final = bits
+        self._packed: bytes | None = None
+
+    def __contains__(self, hostname: object) -> bool:
+        if (i := self._index.ids.get(hostname)) is None:  # type: ignore[call-overload]
+            return False
+        if self._packed is None:
+            # Shifting the int would copy it for every lookup, a byte lookup does not.
+            self._packed = self.bits.to_bytes(len(self._index.names) // 8 + 1, "little")
+        return bool(self._packed[i >> 3] & (1 << (i & 7)))
+
+    def __iter__(self) -> Iterator[HostName]:
+        return self._index.names_of(self.bits)
+
+    def __len__(self) -> int:
+        return self.bits.bit_count()
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({set(self)!r})"
+
+    @classmethod
+    def _from_iterable(  # type: ignore[override]
+        cls, it: Iterable[HostName]
+    ) -> frozenset[HostName]:
+        # Results of the set operators (`&`, `|`, ...) are plain frozensets.
+        return frozenset(it)
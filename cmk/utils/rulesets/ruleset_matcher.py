@@ -6,7 +6,7 @@
 
 import contextlib
 import dataclasses
-from collections.abc import Callable, Iterable, Iterator, Mapping, Sequence
+from collections.abc import Callable, Iterable, Iterator, Mapping, Sequence, Set
 from re import Pattern
 from typing import (
     Any,
@@ -42,6 +42,7 @@ from cmk.utils.servicename import Item, ServiceName
 from cmk.utils.tags import TagConfig, TagGroupID, TagID
 
 from .conditions import HostOrServiceConditions, HostOrServiceConditionsSimple
+from .host_index import HostIndex, HostSet
 
 RulesetName = str  # Could move to a less cluttered module as it is often used on its own.
 TRuleValue = TypeVar("TRuleValue")
@@ -99,7 +100,7 @@ PreprocessedServiceRuleset: TypeAlias = list[
     tuple[
         RuleID,
         TRuleValue,
-        set[HostName],
+        Set[HostName],
         LabelGroups,
         LabelGroupsCacheId,
         PreprocessedPattern,
@@ -263,7 +264,7 @@ class RulesetMatcher:
 
         # When the requested host is part of the local sites configuration,
         # then use only the sites hosts for processing the rules
-        with_foreign_hosts = hostname not in self.ruleset_optimizer.all_processed_hosts()
+        with_foreign_hosts = not self.ruleset_optimizer.is_processed_host(hostname)
 
         optimized_ruleset: Mapping[HostName | HostAddress, Sequence[TRuleValue]] = (
             self.ruleset_optimizer.get_host_ruleset(ruleset, with_foreign_hosts)
@@ -383,9 +384,7 @@ class RulesetMatcher:
         ruleset: Sequence[RuleSpec[TRuleValue]],
     ) -> Iterator[TRuleValue]:
         """Returns a generator of the values of the matched rules"""
-        with_foreign_hosts = (
-            match_object.host_name not in self.ruleset_optimizer.all_processed_hosts()
-        )
+        with_foreign_hosts = not self.ruleset_optimizer.is_processed_host(match_object.host_name)
         optimized_ruleset = self.ruleset_optimizer.get_service_ruleset(ruleset, with_foreign_hosts)
 
         ruleset_id = id(ruleset)
@@ -517,32 +516,30 @@ class RulesetOptimizer:
 
         self._all_configured_hosts = all_configured_hosts
 
+        # The rule conditions are evaluated on bitsets of these host ids
+        self._host_index = HostIndex(all_configured_hosts)
+        self._tag_bits = self._compute_tag_bits()
+        self._path_bits = self._compute_path_bits()
+
         # Contains all hostnames which are currently relevant for this cache.
         # Every active host or a subset of the active hosts when multiprocessing
         # is enabled.
         self._all_processed_hosts = self._all_configured_hosts
-
-        # A factor which indicates how much hosts share the same host tag configuration (excluding folders).
-        # len(all_processed_hosts) / len(different tag combinations)
-        # It is used to determine the best rule evualation method
-        self._all_processed_hosts_similarity = 1.0
+        self._processed_host_names = frozenset(self._all_processed_hosts)
+        self._processed_bits = self._host_index.all
 
         self.__service_ruleset_cache: dict[tuple[int, bool], PreprocessedServiceRuleset] = {}
         self.__host_ruleset_cache: dict[tuple[int, bool], Mapping[HostAddress, Sequence[Any]]] = {}
-        self._all_matching_hosts_match_cache: dict[
-            tuple[ConditionCacheID, bool], set[HostName]
-        ] = {}
+        self._all_matching_hosts_match_cache: dict[tuple[ConditionCacheID, bool], HostSet] = {}
 
-        # Reference dirname -> hosts in this dir including subfolders
-        self._folder_host_lookup: dict[tuple[bool, str], set[HostName]] = {}
+        # Reference (with foreign hosts, dirname) -> hosts in this dir including subfolders
+        self._folder_bits: dict[tuple[bool, str], int] = {}
 
-        # Provides a list of hosts with the same hosttags, excluding the folder
-        self._hosts_grouped_by_tags: dict[tuple[tuple[TagGroupID, TagID], ...], set[HostName]] = {}
-        # Reference hostname -> tag group reference
-        self._host_grouped_ref: dict[HostName, tuple[tuple[TagGroupID, TagID], ...]] = {}
-
-        # TODO: Clean this one up?
-        self._initialize_host_lookup()
+        # Label key/value -> hosts having it. Only covers the hosts in `_label_indexed_bits`,
+        # because the labels are expensive to compute and only needed for the hosts
+        # passing the other conditions.
+        self._label_bits: dict[tuple[str, str], int] = {}
+        self._label_indexed_bits = 0
 
         self._debug_matching_stats = debug_matching_stats
         self.matching_stats: dict[int, HostRulesetMatchingStats | ServiceRulesetMatchingStats] = {}
@@ -559,6 +556,9 @@ class RulesetOptimizer:
         """Returns a set of all processed hosts"""
         return self._all_processed_hosts
 
+    def is_processed_host(self, hostname: HostName | HostAddress) -> bool:
+        return hostname in self._processed_host_names
+
     def set_all_processed_hosts(self, all_processed_hosts: Iterable[HostName]) -> None:
         involved_clusters: set[HostName] = set()
         involved_nodes: set[HostName] = set()
@@ -576,23 +576,13 @@ class RulesetOptimizer:
         nodes_and_clusters.intersection_update(self._all_configured_hosts)
         self._all_processed_hosts = list(nodes_and_clusters)
 
-        # The folder host lookup includes a list of all -processed- hosts within a given
-        # folder. Any update with set_all_processed hosts invalidates this cache, because
-        # the scope of relevant hosts has changed. This is -good-, since the values in this
-        # lookup are iterated one by one later on in all_matching_hosts
-        self._folder_host_lookup = {}
+        self._processed_host_names = frozenset(self._all_processed_hosts)
+        self._processed_bits = self._host_index.bits(self._all_processed_hosts)
 
-        used_groups = {
-            self._host_grouped_ref.get(hostname, ()) for hostname in self._all_processed_hosts
-        }
-
-        if not used_groups:
-            self._all_processed_hosts_similarity = 1.0
-            return
-
-        self._all_processed_hosts_similarity = (
-            1.0 * len(self._all_processed_hosts) / len(used_groups)
-        )
+        # The folder lookup only includes the -processed- hosts within a given folder.
+        # Any update with set_all_processed hosts invalidates this cache, because
+        # the scope of relevant hosts has changed.
+        self._folder_bits = {}
 
     def _compute_all_matching_hosts_stats(
         self, ruleset_id: int, condition_id: tuple[ConditionCacheID, bool]
@@ -610,7 +600,7 @@ class RulesetOptimizer:
         self,
         ruleset_id: int,
         rule: RuleSpec[TRuleValue],
-        all_matching_hosts: set[HostName],
+        all_matching_hosts: Set[HostName],
     ) -> None:
         rule_id = rule.get("id", "MISSING_RULE_ID")
         for hostname in all_matching_hosts:
@@ -624,9 +614,9 @@ class RulesetOptimizer:
 
     def _get_matching_hosts(
         self, ruleset_id: int, rule: RuleSpec[TRuleValue], with_foreign_hosts: bool
-    ) -> set[HostName]:
+    ) -> Set[HostName]:
         if is_disabled(rule):
-            return set()
+            return frozenset()
 
         all_matching_hosts = self._all_matching_hosts(rule["condition"], with_foreign_hosts)
         if self._debug_matching_stats:
@@ -745,79 +735,43 @@ class RulesetOptimizer:
             with_foreign_hosts,
         )
 
-    def _all_matching_hosts(  # pylint: disable=too-many-branches
+    def _all_matching_hosts(
         self, condition: RuleConditionsSpec, with_foreign_hosts: bool
-    ) -> set[HostName]:
+    ) -> Set[HostName]:
         """Returns a set containing the names of hosts that match the given
         tags and hostlist conditions."""
-        hostlist = condition.get("host_name")
-        tag_conditions: Mapping[TagGroupID, TagCondition] = condition.get("host_tags", {})
-        label_groups: LabelGroups = condition.get("host_label_groups", [])
-        rule_path = condition.get("host_folder", "/")
-
         cache_id = self._get_cache_id(condition, with_foreign_hosts)
         try:
             return self._all_matching_hosts_match_cache[cache_id]
         except KeyError:
             pass
 
-        # Thin out the valid hosts further. If the rule is located in a folder
-        # we only need the intersection of the folders hosts and the previously determined valid_hosts
-        valid_hosts = self._get_hosts_within_folder(rule_path, with_foreign_hosts)
-
-        if tag_conditions and hostlist is None and not label_groups:
-            # TODO: Labels could also be optimized like the tags
-            matched_by_tags = self._match_hosts_by_tags(cache_id, valid_hosts, tag_conditions)
-            if matched_by_tags is not None:
-                return matched_by_tags
-
-        matching: set[HostName] = set()
-        only_specific_hosts = (
-            hostlist is not None
-            and not isinstance(hostlist, dict)
-            and all(not isinstance(x, dict) for x in hostlist)
+        matching = self._all_matching_hosts_match_cache[cache_id] = HostSet(
+            self._host_index, self._matching_bits(condition, with_foreign_hosts)
         )
+        return matching
 
+    def _matching_bits(self, condition: RuleConditionsSpec, with_foreign_hosts: bool) -> int:
+        hostlist = condition.get("host_name")
         if hostlist == []:
-            pass  # Empty host list -> Nothing matches
+            return 0  # Empty host list -> Nothing matches
 
-        elif not tag_conditions and not label_groups and not hostlist:
-            # If no tags are specified and the hostlist only include @all (all hosts)
-            matching = valid_hosts
-
-        elif (
-            not tag_conditions and not label_groups and only_specific_hosts and hostlist is not None
-        ):
-            # If no tags are specified and there are only specific hosts we already have the matches
-            matching = valid_hosts.intersection(hostlist)
-
-        else:
-            # If the rule has only exact host restrictions, we can thin out the list of hosts to check
-            if only_specific_hosts and hostlist is not None:
-                hosts_to_check = valid_hosts.intersection(hostlist)
-            else:
-                hosts_to_check = valid_hosts
-
-            for hostname in hosts_to_check:
-                # When no tag matching is requested, do not filter by tags. Accept all hosts
-                # and filter only by hostlist
-                if tag_conditions and not matches_host_tags(
-                    self._host_tags[hostname],
-                    tag_conditions,
-                ):
-                    continue
-
-                if label_groups:
-                    host_labels = self.labels_of_host(hostname)
-                    if not matches_labels(host_labels, label_groups):
-                        continue
+        # Thin out the valid hosts with the cheap conditions first. The labels and
+        # host name patterns are only evaluated for the remaining hosts.
+        matching = self._get_hosts_within_folder(
+            condition.get("host_folder", "/"), with_foreign_hosts
+        )
+        for taggroup_id, tag_condition in condition.get("host_tags", {}).items():
+            if not matching:
+                return 0
+            matching &= self._tag_condition_bits(taggroup_id, tag_condition)
 
-                if not matches_host_name(hostlist, hostname):
-                    continue
+        if matching and hostlist:
+            matching = self._host_name_bits(hostlist, matching)
 
-                matching.add(hostname)
+        if matching and (label_groups := condition.get("host_label_groups", [])):
+            matching = self._label_groups_bits(label_groups, matching)
 
-        self._all_matching_hosts_match_cache[cache_id] = matching
         return matching
 
     @staticmethod
@@ -854,98 +808,101 @@ class RulesetOptimizer:
             rule_path,
         )
 
-    # TODO: Generalize this optimization: Build some kind of key out of the tag conditions
-    # (positive, negative, ...). Make it work with the new tag group based "$or" handling.
-    def _match_hosts_by_tags(
-        self,
-        cache_id: tuple[ConditionCacheID, bool],
-        valid_hosts: set[HostName],
-        tag_conditions: Mapping[TagGroupID, TagCondition],
-    ) -> set[HostName] | None:
-        matching = set()
-        negative_match_tags = set()
-        positive_match_tags = set()
-        for taggroup_id, tag_condition in tag_conditions.items():
-            if isinstance(tag_condition, dict):
-                if "$ne" in tag_condition:
-                    negative_match_tags.add(
-                        (
-                            taggroup_id,
-                            cast(TagConditionNE, tag_condition)["$ne"],
-                        )
-                    )
-                    continue
+    def _compute_tag_bits(self) -> dict[tuple[TagGroupID, TagID | None], int]:
+        host_ids: dict[tuple[TagGroupID, TagID | None], list[int]] = {}
+        for hostname, i in self._host_index.ids.items():
+            for tag in self._host_tags.get(hostname, ()):
+                host_ids.setdefault(tag, []).append(i)
+        return {tag: self._host_index.bits_of_ids(ids) for tag, ids in host_ids.items()}
 
-                if "$or" in tag_condition:
-                    return None  # Can not be optimized, makes _all_matching_hosts proceed
+    def _compute_path_bits(self) -> dict[str, int]:
+        host_ids: dict[str, list[int]] = {}
+        for hostname, i in self._host_index.ids.items():
+            host_ids.setdefault(self._host_paths.get(hostname, "/"), []).append(i)
+        return {path: self._host_index.bits_of_ids(ids) for path, ids in host_ids.items()}
 
-                if "$nor" in tag_condition:
-                    return None  # Can not be optimized, makes _all_matching_hosts proceed
+    def _get_hosts_within_folder(self, folder_path: str, with_foreign_hosts: bool) -> int:
+        cache_id = with_foreign_hosts, folder_path
+        with contextlib.suppress(KeyError):
+            return self._folder_bits[cache_id]
 
-                raise NotImplementedError()
+        hosts_in_folder = 0
+        for host_path, bits in self._path_bits.items():
+            if host_path.startswith(folder_path):
+                hosts_in_folder |= bits
 
-            positive_match_tags.add((taggroup_id, tag_condition))
+        if not with_foreign_hosts:
+            hosts_in_folder &= self._processed_bits
 
-        # TODO:
-        # if has_specific_folder_tag or self._all_processed_hosts_similarity < 3.0:
-        if self._all_processed_hosts_similarity < 3.0:
-            # Without shared folders
-            for hostname in valid_hosts:
-                if positive_match_tags <= self._host_tags[
-                    hostname
-                ] and not negative_match_tags.intersection(self._host_tags[hostname]):
-                    matching.add(hostname)
+        return self._folder_bits.setdefault(cache_id, hosts_in_folder)
 
-            self._all_matching_hosts_match_cache[cache_id] = matching
-            return matching
+    def _tag_condition_bits(self, taggroup_id: TagGroupID, tag_condition: TagCondition) -> int:
+        if isinstance(tag_condition, dict):
+            if "$ne" in tag_condition:
+                return self._host_index.all & ~self._tag_bits.get(
+                    (taggroup_id, cast(TagConditionNE, tag_condition)["$ne"]), 0
+                )
 
-        # With shared folders
-        checked_hosts: set[str] = set()
-        for hostname in valid_hosts:
-            if hostname in checked_hosts:
-                continue
+            if "$or" in tag_condition:
+                return self._tag_bits_of_any(
+                    taggroup_id, cast(TagConditionOR, tag_condition)["$or"]
+                )
 
-            hosts_with_same_tag = self._filter_hosts_with_same_tags_as_host(hostname, valid_hosts)
-            checked_hosts.update(hosts_with_same_tag)
+            if "$nor" in tag_condition:
+                return self._host_index.all & ~self._tag_bits_of_any(
+                    taggroup_id, tag_condition["$nor"]
+                )
 
-            if positive_match_tags <= self._host_tags[
-                hostname
-            ] and not negative_match_tags.intersection(self._host_tags[hostname]):
-                matching.update(hosts_with_same_tag)
+            raise NotImplementedError()
 
-        self._all_matching_hosts_match_cache[cache_id] = matching
-        return matching
+        return self._tag_bits.get((taggroup_id, tag_condition), 0)
 
-    def _filter_hosts_with_same_tags_as_host(
-        self,
-        hostname: HostName,
-        hosts: set[HostName],
-    ) -> set[HostName]:
-        return self._hosts_grouped_by_tags[self._host_grouped_ref[hostname]].intersection(hosts)
+    def _tag_bits_of_any(self, taggroup_id: TagGroupID, tag_ids: Iterable[TagID | None]) -> int:
+        bits = 0
+        for tag_id in tag_ids:
+            bits |= self._tag_bits.get((taggroup_id, tag_id), 0)
+        return bits
 
-    def _get_hosts_within_folder(self, folder_path: str, with_foreign_hosts: bool) -> set[HostName]:
-        cache_id = with_foreign_hosts, folder_path
-        if cache_id not in self._folder_host_lookup:
-            hosts_in_folder = set()
-            relevant_hosts = (
-                self._all_configured_hosts if with_foreign_hosts else self._all_processed_hosts
-            )
+    def _host_name_bits(self, hostlist: HostOrServiceConditions, candidates: int) -> int:
+        negate, host_entries = parse_negated_condition_list(hostlist)
+        if all(not isinstance(entry, dict) for entry in host_entries):
+            listed = self._host_index.bits(cast(Iterable[HostName], host_entries))
+            return candidates & ~listed if negate else candidates & listed
+
+        return self._host_index.bits(
+            hostname
+            for hostname in self._host_index.names_of(candidates)
+            if matches_host_name(hostlist, hostname)
+        )
 
-            for hostname in relevant_hosts:
-                host_path = self._host_paths.get(hostname, "/")
-                if host_path.startswith(folder_path):
-                    hosts_in_folder.add(hostname)
+    def _label_groups_bits(self, label_groups: LabelGroups, candidates: int) -> int:
+        """Evaluates the label groups like `matches_labels`, but for all candidates at once"""
+        self._index_labels(candidates)
+        overall_match = candidates
+        for group_operator, label_group in label_groups:
+            group_match = candidates
+            for label_operator, label in label_group:
+                if not label:
+                    continue
+                key, value = label.split(":")
+                label_match = self._label_bits.get((key, value), 0)
+                group_match = _and_or_not_bits(group_match, label_match, label_operator)
+            overall_match = _and_or_not_bits(overall_match, group_match, group_operator)
+        return overall_match & candidates
 
-            self._folder_host_lookup[cache_id] = hosts_in_folder
-            return hosts_in_folder
+    def _index_labels(self, hosts: int) -> None:
+        if not (missing := hosts & ~self._label_indexed_bits):
+            return
 
-        return self._folder_host_lookup[cache_id]
+        host_ids: dict[tuple[str, str], list[int]] = {}
+        for i in self._host_index.ids_of(missing):
+            for label in self.labels_of_host(self._host_index.names[i]).items():
+                host_ids.setdefault(label, []).append(i)
 
-    def _initialize_host_lookup(self) -> None:
-        for hostname in self._all_configured_hosts:
-            group_ref = tuple(sorted(self._host_tags[hostname]))
-            self._hosts_grouped_by_tags.setdefault(group_ref, set()).add(hostname)
-            self._host_grouped_ref[hostname] = group_ref
+        for label, ids in host_ids.items():
+            bits = self._host_index.bits_of_ids(ids)
+            self._label_bits[label] = self._label_bits.get(label, 0) | bits
+        self._label_indexed_bits |= missing
 
     def labels_of_host(self, hostname: HostName) -> Labels:
         """Returns the effective set of host labels from all available sources
@@ -1160,6 +1117,19 @@ def matches_labels(object_labels: Labels | None, required_label_groups: LabelGro
     return overall_match
 
 
+def _and_or_not_bits(
+    given_group_match: int, new_single_match: int, operator: AndOrNotLiteral
+) -> int:
+    """Like `_and_or_not_group_match`, but for bitsets of hosts"""
+    match operator:
+        case "and":
+            return given_group_match & new_single_match
+        case "or":
+            return given_group_match | new_single_match
+        case "not":
+            return given_group_match & ~new_single_match
+
+
 def _and_or_not_group_match(
     given_group_match: bool, new_single_match: bool, operator: AndOrNotLiteral
 ) -> bool:
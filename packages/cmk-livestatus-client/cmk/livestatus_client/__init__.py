@@ -17,16 +17,17 @@ import json
 import os
 import re
 import select
+import selectors
 import socket
 import ssl
 import threading
 import time
-from collections.abc import Iterator, Sequence
-from dataclasses import dataclass, field
+from collections.abc import Callable, Iterator, Sequence
+from dataclasses import dataclass, field, replace
 from enum import Enum
 from functools import cache
 from io import BytesIO
-from typing import Any, Literal, NamedTuple, NewType, TypedDict
+from typing import Any, Literal, NamedTuple, NewType, NoReturn, TypedDict
 
 from opentelemetry import trace
 
@@ -167,9 +168,8 @@ class LivestatusTestingError(RuntimeError):
 
 tracer = trace.get_tracer("cmk.livestatus_client")
 
-# TODO: This mechanism does not take different connection options into account
-# Keep a global array of persistent connections
-persistent_connections: dict[str, socket.socket] = {}
+# Timeout for receiving the body of a response once its header has been received
+_RESPONSE_BODY_TIMEOUT = 30.0
 
 # Regular expression for removing Cache: headers if caching is not allowed
 remove_cache_regex = re.compile("\nCache:[^\n]*")
@@ -482,6 +482,176 @@ DeadSite = dict[str, str | int | Exception | SiteConfiguration]
 #   '----------------------------------------------------------------------'
 
 
+class PoolKey(NamedTuple):
+    """Connections can only be shared between sites with the same connection options"""
+
+    socketurl: str
+    tls: bool
+    verify: bool
+    ca_file_path: str | None
+
+
+@dataclass
+class ConnectionPoolStats:
+    """Statistics of the pooled connections to one livestatus socket"""
+
+    idle: int = 0
+    in_use: int = 0
+    created: int = 0
+    reused: int = 0
+    returned: int = 0
+    # Closed because the pool of the socket was full when they were returned
+    discarded: int = 0
+    # Closed because they were idle for too long
+    evicted: int = 0
+    # Closed by the peer or otherwise broken while being idle
+    unhealthy: int = 0
+
+
+class ConnectionPool:
+    """Idle kept alive connections to the livestatus sockets
+
+    SingleSiteConnection objects with persistence enabled take their socket from
+    the pool when they connect and put it back when they are disconnected, as long
+    as no response is pending on it. Sockets which have been idle for longer than
+    max_idle_time seconds are closed, as are the ones the peer has closed in the
+    meantime. At most max_idle sockets are kept per livestatus socket.
+    """
+
+    def __init__(self, max_idle: int = 8, max_idle_time: float = 300.0) -> None:
+        self.max_idle = max_idle
+        self.max_idle_time = max_idle_time
+        self._lock = threading.Lock()
+        # Most recently returned sockets last
+        self._idle: dict[PoolKey, list[tuple[socket.socket, float]]] = {}
+        self._stats: dict[str, ConnectionPoolStats] = {}
+
+    def checkout(
+        self, key: PoolKey, create: Callable[[], socket.socket]
+    ) -> tuple[socket.socket, bool]:
+        """Return an idle socket or a new one created by create() and whether it is reused"""
+        stale = []
+        try:
+            with self._lock:
+                stats = self._stats.setdefault(key.socketurl, ConnectionPoolStats())
+                stale = self._evict(key, time.monotonic())
+                idle = self._idle.get(key, [])
+                while idle:
+                    site_socket, _returned_at = idle.pop()
+                    stats.idle -= 1
+                    if self._is_healthy(site_socket):
+                        stats.reused += 1
+                        stats.in_use += 1
+                        return site_socket, True
+                    stats.unhealthy += 1
+                    stale.append(site_socket)
+        finally:
+            _close_sockets(stale)
+
+        # Connecting may take some time, the pool must not be blocked meanwhile
+        site_socket = create()
+        with self._lock:
+            stats.created += 1
+            stats.in_use += 1
+        return site_socket, False
+
+    def checkin(self, key: PoolKey, site_socket: socket.socket) -> None:
+        """Return a socket which is not needed anymore and has no response pending"""
+        with self._lock:
+            stats = self._stats.setdefault(key.socketurl, ConnectionPoolStats())
+            stats.in_use -= 1
+            stats.returned += 1
+            stale = self._evict(key, now := time.monotonic())
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.max_idle:
+                idle.append((site_socket, now))
+                stats.idle += 1
+            else:
+                stats.discarded += 1
+                stale.append(site_socket)
+        _close_sockets(stale)
+
+    def discard(self, key: PoolKey, site_socket: socket.socket) -> None:
+        """Close a socket which has been taken from the pool and can not be reused"""
+        with self._lock:
+            self._stats.setdefault(key.socketurl, ConnectionPoolStats()).in_use -= 1
+        _close_sockets([site_socket])
+
+    def evict_idle(self) -> None:
+        """Close all sockets which have been idle for too long"""
+        with self._lock:
+            now = time.monotonic()
+            stale = [s for key in self._idle for s in self._evict(key, now)]
+        _close_sockets(stale)
+
+    def clear(self) -> None:
+        """Close all idle sockets"""
+        with self._lock:
+            stale = [s for idle in self._idle.values() for s, _returned_at in idle]
+            self._idle.clear()
+            for stats in self._stats.values():
+                stats.idle = 0
+        _close_sockets(stale)
+
+    def reset_after_fork(self) -> None:
+        """Forget the sockets of the parent in a forked child process
+
+        The idle sockets are shared with the parent, using them in both processes would
+        mix up the responses. The lock may have been held by another thread of the parent.
+        """
+        self._lock = threading.Lock()
+        stale = [s for idle in self._idle.values() for s, _returned_at in idle]
+        self._idle = {}
+        self._stats = {}
+        _close_sockets(stale)
+
+    def stats(self) -> dict[str, ConnectionPoolStats]:
+        """The statistics per livestatus socket URL"""
+        with self._lock:
+            return {url: replace(stats) for url, stats in self._stats.items()}
+
+    def _evict(self, key: PoolKey, now: float) -> list[socket.socket]:
+        idle = self._idle.get(key, [])
+        # The least recently returned sockets come first
+        num_expired = next(
+            (n for n, (_s, since) in enumerate(idle) if now - since < self.max_idle_time),
+            len(idle),
+        )
+        expired = [s for s, _returned_at in idle[:num_expired]]
+        del idle[:num_expired]
+        stats = self._stats[key.socketurl]
+        stats.idle -= num_expired
+        stats.evicted += num_expired
+        return expired
+
+    @staticmethod
+    def _is_healthy(site_socket: socket.socket) -> bool:
+        # An idle socket has nothing to read, unless the peer has closed it (or sent garbage).
+        try:
+            return site_socket.fileno() != -1 and not is_socket_readable(site_socket, 0)
+        except (OSError, ValueError):
+            return False
+
+
+def _close_sockets(sockets: Sequence[socket.socket]) -> None:
+    for site_socket in sockets:
+        try:
+            site_socket.close()
+        except OSError:
+            pass
+
+
+connection_pool = ConnectionPool()
+
+
+def _reset_connection_pool_after_fork() -> None:
+    connection_pool.reset_after_fork()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_connection_pool_after_fork)
+
+
 def parse_socket_url(url: str) -> tuple[socket.AddressFamily, str | tuple[str, int]]:
     """Parses a Livestatus socket URL to address family and address
 
@@ -553,6 +723,8 @@ class SingleSiteConnection(Helpers):
         self.allow_cache = allow_cache
         self.socketurl = socketurl
         self.socket: socket.socket | None = None
+        # Whether the socket can not be used for the next query before something is read from it
+        self.response_pending = False
         self.timeout: int | None = None
         self.successful_persistence = False
         self._output_format = LivestatusOutputFormat.PYTHON
@@ -578,18 +750,21 @@ class SingleSiteConnection(Helpers):
         if self.socket:
             self.socket.settimeout(float(timeout))
 
-    def _try_get_persisted_connection(self) -> socket.socket | None:
-        if self.persist and self.socketurl in persistent_connections:
-            self.successful_persistence = True
-            return persistent_connections[self.socketurl]
-        return None
+    @property
+    def pool_key(self) -> PoolKey:
+        return PoolKey(self.socketurl, self.tls, self.tls_verify, self._tls_ca_file_path)
 
     def connect(self) -> None:
-        if (site_socket := self._try_get_persisted_connection()) is None:
+        if self.socket is not None:
+            self.disconnect()
+        if self.persist:
+            site_socket, self.successful_persistence = connection_pool.checkout(
+                self.pool_key, self._create_new_socket_connection
+            )
+        else:
             site_socket = self._create_new_socket_connection()
-            if self.persist:
-                persistent_connections[self.socketurl] = site_socket
         self.socket = site_socket
+        self.response_pending = False
 
     def _create_new_socket_connection(self) -> socket.socket:
         self.successful_persistence = False
@@ -659,23 +834,27 @@ class SingleSiteConnection(Helpers):
         )
 
     def disconnect(self) -> None:
+        if self.persist and self.socket is not None and not self.response_pending:
+            # Keep the connection open for the next connection object of the process
+            connection_pool.checkin(self.pool_key, self.socket)
+            self.socket = None
+            return
         self._close_socket()
 
     def _close_socket(self) -> None:
         if self.socket is not None:
-            try:
-                self.socket.close()
-            except OSError:
-                pass
+            if self.persist:
+                connection_pool.discard(self.pool_key, self.socket)
+            else:
+                try:
+                    self.socket.close()
+                except OSError:
+                    pass
 
             self.socket = None
 
         if self.persist:
             self.successful_persistence = False
-            try:
-                del persistent_connections[self.socketurl]
-            except KeyError:
-                pass
 
     def receive_data(self, size: int, timeout: float | None = None) -> bytes:
         if self.socket is None:
@@ -721,7 +900,7 @@ class SingleSiteConnection(Helpers):
                     self.receive_raw_response(str_query, query.suppress_exceptions), query
                 )
             except MKLivestatusQueryError:
-                self.disconnect()
+                self._close_socket()
                 raise
 
     def build_query(self, query_obj: Query, add_headers: str) -> str:
@@ -752,6 +931,7 @@ class SingleSiteConnection(Helpers):
             raise MKLivestatusSocketError("Socket to '%s' is not connected" % self.socketurl)
 
         try:
+            self.response_pending = True
             self.socket.sendall(query.encode("utf-8") + b"\n\n")
             if getattr(self.collect_queries, "active", False):
                 self.collect_queries.queries.append(query)
@@ -776,38 +956,11 @@ class SingleSiteConnection(Helpers):
         timeout_at: float | None = None,
     ) -> bytes:
         try:
-            # Headers are always ASCII encoded
-            resp = self.receive_data(16)
-            code = resp[0:3].decode("ascii")
-            try:
-                length = int(resp[4:15].lstrip())
-            except Exception:
-                self.disconnect()
-                raise MKLivestatusSocketError(
-                    f"Malformed response header {resp!r}. Livestatus TCP socket might be "
-                    "unreachable or wrong encryption settings are used."
-                )
-
-            # Apply a lower timeout for the content because the data is already available
-            # in the socket. The liveproxyd (same system) has the complete data available
-            # while the data from a standard connection can still take some time.
-            # 30 seconds should be more than enough for the maximum telegram size of 100MB
-            data = self.receive_data(length, 30)
-
+            code, data = self._receive_response()
             if code == "200":
                 return data
 
-            error_info = data.decode("utf-8")
-            if code == "404":
-                raise MKLivestatusTableNotFoundError(f"Not Found ({code}): {error_info!r}")
-
-            if code == "413":
-                raise MKLivestatusPayloadTooLargeError(error_info)
-
-            if code == "502":
-                raise MKLivestatusBadGatewayError(error_info)
-
-            raise MKLivestatusQueryError(f"{code}: {error_info}")
+            raise _response_error(code, data.decode("utf-8"))
 
         except (MKLivestatusSocketClosed, OSError) as e:
             # In case of an IO error or the other side having
@@ -847,11 +1000,32 @@ class SingleSiteConnection(Helpers):
             # FIXME: ? self.disconnect()
             raise MKLivestatusSocketError("Unhandled exception: %s" % e)
 
+    def _receive_response(self) -> tuple[str, bytes]:
+        # Headers are always ASCII encoded
+        resp = self.receive_data(16)
+        code = resp[0:3].decode("ascii")
+        try:
+            length = int(resp[4:15].lstrip())
+        except Exception:
+            self._close_socket()
+            raise MKLivestatusSocketError(
+                f"Malformed response header {resp!r}. Livestatus TCP socket might be "
+                "unreachable or wrong encryption settings are used."
+            )
+
+        # Apply a lower timeout for the content because the data is already available
+        # in the socket. The liveproxyd (same system) has the complete data available
+        # while the data from a standard connection can still take some time.
+        # 30 seconds should be more than enough for the maximum telegram size of 100MB
+        data = self.receive_data(length, _RESPONSE_BODY_TIMEOUT)
+        self.response_pending = False
+        return code, data
+
     def parse_raw_response(self, raw_response: bytes, query: Query) -> LivestatusResponse:
         data = raw_response.decode("utf-8")
         try:
             response: LivestatusResponse = (
-                json.loads(data) if query.supports_json_format() else ast.literal_eval(data)
+                json.loads(data) if query.supports_json_format() else _parse_python3_output(data)
             )
             return response
         except (ValueError, SyntaxError):
@@ -873,22 +1047,87 @@ class SingleSiteConnection(Helpers):
         self.limit = limit
 
     def query(self, query: QueryTypes, add_headers: str = "") -> LivestatusResponse:
-        # Normalize argument types
-        normalized_add_headers = add_headers
-        normalized_query = Query(query) if not isinstance(query, Query) else query
-
-        if self.limit is not None:
-            normalized_query = Query(
-                "%sLimit: %d\n" % (normalized_query, self.limit),
-                normalized_query.suppress_exceptions,
-            )
-
-        response = self.do_query(normalized_query, normalized_add_headers)
+        response = self.do_query(self._normalize_query(query), add_headers)
         if self.prepend_site:
             for row in response:
                 row.insert(0, b"")
         return response
 
+    def query_pipelined(
+        self, queries: Sequence[QueryTypes], add_headers: str = ""
+    ) -> list[LivestatusResponse]:
+        """Send several queries at once and receive their responses afterwards
+
+        The core answers the queries sent on a kept alive connection one after another,
+        so all of them only need a single round trip. The result is the same as of
+        calling query() for every query, the first failing query raises its error. As
+        with query(), errors which are not in the suppress_exceptions of their query
+        are raised as MKLivestatusSocketError.
+        """
+        normalized_queries = [self._normalize_query(query) for query in queries]
+        str_queries = []
+        for normalized_query in normalized_queries:
+            with _livestatus_output_format_switcher(normalized_query, self):
+                str_queries.append(self.build_query(normalized_query, add_headers))
+
+        with tracer.start_as_current_span(
+            "query_pipelined",
+            kind=trace.SpanKind.CLIENT,
+            attributes={
+                "cmk.livestatus.target_site_id": str(self.site_name),
+                "cmk.livestatus.num_queries": len(str_queries),
+            },
+        ):
+            raw_responses = self._receive_pipelined_responses(str_queries)
+
+        responses = []
+        for (code, data), normalized_query in zip(raw_responses, normalized_queries):
+            if code != "200":
+                try:
+                    raise _response_error(code, data.decode("utf-8"))
+                except normalized_query.suppress_exceptions:
+                    raise
+                except Exception as e:
+                    raise MKLivestatusSocketError("Unhandled exception: %s" % e)
+            try:
+                response = self.parse_raw_response(data, normalized_query)
+            except MKLivestatusQueryError:
+                self._close_socket()
+                raise
+            if self.prepend_site:
+                for row in response:
+                    row.insert(0, b"")
+            responses.append(response)
+        return responses
+
+    def _receive_pipelined_responses(
+        self, str_queries: Sequence[str], do_reconnect: bool = True
+    ) -> list[tuple[str, bytes]]:
+        if not str_queries:
+            return []
+        self.send_query("\n\n".join(str_queries))
+        responses: list[tuple[str, bytes]] = []
+        try:
+            for _str_query in str_queries:
+                responses.append(self._receive_response())
+        except (MKLivestatusSocketClosed, OSError) as e:
+            self._close_socket()
+            # A kept alive connection may have been closed by the peer before the queries
+            # arrived, see receive_raw_response(). Nothing has been answered in this case.
+            if do_reconnect and not responses:
+                return self._receive_pipelined_responses(str_queries, do_reconnect=False)
+            raise MKLivestatusSocketError(str(e))
+        return responses
+
+    def _normalize_query(self, query: QueryTypes) -> Query:
+        normalized_query = Query(query) if not isinstance(query, Query) else query
+        if self.limit is None:
+            return normalized_query
+        return Query(
+            "%sLimit: %d\n" % (normalized_query, self.limit),
+            normalized_query.suppress_exceptions,
+        )
+
     def command(
         self,
         command: str,
@@ -915,6 +1154,8 @@ class SingleSiteConnection(Helpers):
         assert self.socket is not None  # TODO: refactor to avoid assert
 
         try:
+            # The core closes the connection after a request without "KeepAlive: on"
+            self.response_pending = True
             self.socket.sendall(command.encode("utf-8") + b"\n\n")
         except OSError as e:
             self._close_socket()
@@ -970,6 +1211,183 @@ class ConnectedSite(NamedTuple):
 
 ConnectedSites = list[ConnectedSite]
 
+# Amount of data read from a site socket at once while streaming responses
+_STREAM_CHUNK_SIZE = 65536
+
+
+class _RowParser:
+    """Parses the rows of a response while its body is being received
+
+    The core renders every row of a python3/JSON response on a line of its own
+    ("[row,\\nrow,\\n...row]\\n") and escapes line breaks within the values. All
+    complete lines received so far can thus be parsed at once and the parser
+    only holds back the last incomplete line.
+
+        >>> parser = _RowParser(json.loads)
+        >>> parser.feed(b'[["a", 1],\\n["b"')
+        [['a', 1]]
+        >>> parser.feed(b', 2]]\\n')
+        [['b', 2]]
+        >>> parser.close()
+        []
+
+    Bodies without line breaks are parsed when they are complete:
+
+        >>> parser = _RowParser(ast.literal_eval)
+        >>> parser.feed(b"[['a'], ['b']]")
+        []
+        >>> parser.close()
+        [['a'], ['b']]
+    """
+
+    def __init__(self, parse: Callable[[str], Any]) -> None:
+        self._parse = parse
+        self._pending = bytearray()
+        self._started = False
+        self._complete = False
+
+    def feed(self, data: bytes) -> list[LivestatusRow]:
+        self._pending += data
+        if (end := self._pending.rfind(b"\n")) == -1:
+            return []
+        lines = bytes(self._pending[:end])
+        del self._pending[: end + 1]
+        return self._parse_lines(lines)
+
+    def close(self) -> list[LivestatusRow]:
+        rows = self._parse_lines(bytes(self._pending))
+        self._pending.clear()
+        if not self._complete:
+            raise MKLivestatusQueryError("Malformed raw response output")
+        return rows
+
+    def _parse_lines(self, lines: bytes) -> list[LivestatusRow]:
+        text = lines.decode("utf-8").strip()
+        if not text:
+            return []
+        if self._complete:
+            raise MKLivestatusQueryError("Malformed raw response output")
+        if not self._started:
+            if not text.startswith("["):
+                raise MKLivestatusQueryError("Malformed raw response output")
+            text = text[1:]
+            self._started = True
+        # All but the last row are followed by a comma, the last one by the closing bracket.
+        if text.endswith(","):
+            text = "[" + text[:-1] + "]"
+        else:
+            text = "[" + text
+            self._complete = True
+        try:
+            rows = self._parse(text)
+        except (ValueError, SyntaxError):
+            raise MKLivestatusQueryError("Malformed raw response output")
+        if not isinstance(rows, list) or not all(isinstance(row, list) for row in rows):
+            raise MKLivestatusQueryError("Malformed raw response output")
+        return rows
+
+
+class _StreamedResponse:
+    """The state of receiving the response of a single site"""
+
+    def __init__(
+        self,
+        connected_site: ConnectedSite,
+        str_query: str,
+        query: Query,
+        span: trace.Span,
+    ) -> None:
+        self.connected_site = connected_site
+        self.str_query = str_query
+        self.span = span
+        self.done = False
+        self._parser = _RowParser(
+            json.loads if query.supports_json_format() else _parse_python3_output
+        )
+        self._header = b""
+        self._code = ""
+        self._remaining = 0
+        self._error_info = bytearray()
+        self._received_data = False
+        self._retried = False
+        timeout = connected_site.connection.timeout
+        self.deadline = None if timeout is None else time.monotonic() + timeout
+
+    @property
+    def socket(self) -> socket.socket:
+        if (sock := self.connected_site.connection.socket) is None:
+            raise MKLivestatusSocketError(f"Socket to site {self.connected_site.id} is closed")
+        return sock
+
+    def has_pending_data(self) -> bool:
+        sock = self.connected_site.connection.socket
+        return isinstance(sock, ssl.SSLSocket) and sock.pending() > 0
+
+    def may_retry(self) -> bool:
+        """Whether the query can be sent again after the connection was lost
+
+        Like in receive_raw_response(), a kept alive connection may have been closed
+        by the peer before the query arrived.
+        """
+        return not (self._retried or self._received_data)
+
+    def retry(self) -> None:
+        self._retried = True
+        connection = self.connected_site.connection
+        connection.disconnect()
+        connection.connect()
+        connection.send_query(self.str_query)
+
+    def receive(self) -> list[LivestatusRow]:
+        """Read what is available on the socket and return the rows completed by it"""
+        if len(self._header) < 16:
+            self._receive_header()
+            return []
+
+        data = self._recv(min(self._remaining, _STREAM_CHUNK_SIZE))
+        self._remaining -= len(data)
+        if self._code != "200":
+            self._error_info += data
+            if not self._remaining:
+                self.connected_site.connection.response_pending = False
+                raise _response_error(self._code, self._error_info.decode("utf-8"))
+            return []
+
+        rows = self._parser.feed(data)
+        if not self._remaining:
+            self.connected_site.connection.response_pending = False
+            rows += self._parser.close()
+            self.done = True
+        return rows
+
+    def _receive_header(self) -> None:
+        # Headers are always ASCII encoded
+        self._header += self._recv(16 - len(self._header))
+        if len(self._header) < 16:
+            return
+        self._code = self._header[0:3].decode("ascii")
+        try:
+            self._remaining = int(self._header[4:15].lstrip())
+        except ValueError:
+            self.connected_site.connection.disconnect()
+            raise MKLivestatusSocketError(
+                f"Malformed response header {self._header!r}. Livestatus TCP socket might be "
+                "unreachable or wrong encryption settings are used."
+            )
+        self.deadline = time.monotonic() + _RESPONSE_BODY_TIMEOUT
+        if not self._remaining:
+            if self._code != "200":
+                raise _response_error(self._code, "")
+            raise MKLivestatusQueryError("Malformed raw response output")
+
+    def _recv(self, size: int) -> bytes:
+        if not (data := self.socket.recv(size)):
+            raise MKLivestatusSocketClosed(
+                "Read zero data from socket, remote peer closed connection."
+            )
+        self._received_data = True
+        return data
+
 
 class MultiSiteConnection(Helpers):
     def __init__(  # pylint: disable=too-many-branches
@@ -1362,6 +1780,144 @@ class MultiSiteConnection(Helpers):
                 }
         return result
 
+    def query_stream(
+        self, query: QueryTypes, add_headers: str = ""
+    ) -> Iterator[tuple[SiteId, LivestatusResponse]]:
+        """Query all sites in parallel and yield the rows of each site as they arrive
+
+        In contrast to query(), the rows of fast sites are available before the slow
+        sites have answered and the responses are never held in memory completely.
+        The rows are yielded in batches together with the ID of the site they come
+        from. Every site has its own timeout (see the site configuration), sites which
+        do not answer in time are considered dead, just like sites with other errors.
+
+        The Limit: is applied to every site, see query_parallel().
+        """
+        normalized_query = Query(query) if not isinstance(query, Query) else query
+
+        stillalive = []
+        if self.only_sites is not None:
+            connect_to_sites = [c for c in self.connections if c[0] in self.only_sites]
+            # Unused sites are assumed to be alive
+            stillalive.extend([c for c in self.connections if c[0] not in self.only_sites])
+        else:
+            connect_to_sites = self.connections
+
+        with _livestatus_output_format_switcher(normalized_query, self):
+            sent_queries = self._send_queries(
+                normalized_query,
+                add_headers,
+                connect_to_sites,
+                limit_header="Limit: %d\n" % self.limit if self.limit is not None else "",
+            )
+
+        # The spans can not be the current ones: The consumer runs between the yields.
+        responses = [
+            _StreamedResponse(
+                connected_site,
+                str_query,
+                normalized_query,
+                tracer.start_span(
+                    f"receive_from_site[{connected_site.id}]",
+                    kind=trace.SpanKind.CONSUMER,
+                    links=[trace.Link(request_span.get_span_context())],
+                    attributes={
+                        "cmk.livestatus.query": str_query,
+                        "cmk.livestatus.target_site_id": str(connected_site.id),
+                    },
+                ),
+            )
+            for str_query, request_span, connected_site in sent_queries
+        ]
+
+        with selectors.DefaultSelector() as selector:
+            try:
+                for response in responses:
+                    selector.register(response.socket, selectors.EVENT_READ, response)
+                yield from self._stream_responses(normalized_query, selector, stillalive)
+            finally:
+                for key in list(selector.get_map().values()):
+                    # Not completely received, e.g. because the consumer stopped early. The
+                    # rest of the response must not be read by the next query.
+                    response = key.data
+                    response.connected_site.connection.disconnect()
+                    response.span.end()
+                    stillalive.append(response.connected_site)
+                self.connections = stillalive
+
+    def _stream_responses(
+        self, query: Query, selector: selectors.BaseSelector, stillalive: ConnectedSites
+    ) -> Iterator[tuple[SiteId, LivestatusResponse]]:
+        # The sockets are looked up by their data: Sockets which have been closed in the
+        # meantime have no file descriptor anymore.
+        def unregister(response: _StreamedResponse) -> None:
+            for key in selector.get_map().values():
+                if key.data is response:
+                    selector.unregister(key.fileobj)
+                    return
+
+        def finish(response: _StreamedResponse, exception: Exception | None = None) -> None:
+            unregister(response)
+            response.span.end()
+            if exception is None:
+                stillalive.append(response.connected_site)
+                return
+            response.connected_site.connection.disconnect()
+            self.deadsites[response.connected_site.id] = {
+                "exception": exception,
+                "site": response.connected_site.config,
+            }
+
+        while selector.get_map():
+            now = time.monotonic()
+            for key in list(selector.get_map().values()):
+                if key.data.deadline is not None and key.data.deadline <= now:
+                    finish(key.data, MKLivestatusSocketError("Timeout while reading response"))
+            active: list[_StreamedResponse] = [k.data for k in selector.get_map().values()]
+            if not active:
+                return
+
+            # SSL sockets may have data pending which select() does not know about
+            ready = [r for r in active if r.has_pending_data()]
+            deadlines = [r.deadline for r in active if r.deadline is not None]
+            timeout = 0.0 if ready else (max(min(deadlines) - now, 0) if deadlines else None)
+            ready += [k.data for k, _events in selector.select(timeout) if k.data not in ready]
+
+            for response in ready:
+                site_id = response.connected_site.id
+                try:
+                    rows = response.receive()
+                except query.suppress_exceptions:
+                    # Mostly handles exception types MKLivestatusTableNotFoundError
+                    finish(response)
+                    continue
+                except LivestatusTestingError:
+                    raise
+                except (MKLivestatusSocketClosed, OSError) as e:
+                    if not response.may_retry():
+                        finish(response, e)
+                        continue
+                    unregister(response)
+                    try:
+                        response.retry()
+                        selector.register(response.socket, selectors.EVENT_READ, response)
+                    except LivestatusTestingError:
+                        raise
+                    except Exception as retry_exception:
+                        finish(response, retry_exception)
+                    continue
+                except Exception as e:
+                    finish(response, e)
+                    continue
+
+                if response.done:
+                    finish(response)
+                if rows:
+                    if self.prepend_site:
+                        for row in rows:
+                            row.insert(0, site_id)
+                    yield site_id, LivestatusResponse(rows)
+
     def command(self, command: str, sitename: SiteId | None = SiteId("local")) -> None:
         if sitename in self.deadsites:
             raise MKLivestatusSocketError(
@@ -1489,6 +2045,59 @@ def _combine_query(query: str, headers: str | list[str]) -> str:
     return query + "\n" + headers
 
 
+# An escaped double quote breaks the replacement of None, JSON combines surrogate pairs
+_NON_JSON_ESCAPE = re.compile(r'\\(?:"|u[dD][89a-fA-F])')
+
+
+def _parse_python3_output(data: str) -> Any:
+    """Parse the python3 output of the core, which is nearly JSON
+
+    ast.literal_eval() is more than ten times slower than json.loads() on large
+    responses. The python3 output only differs from JSON by None instead of null,
+    byte strings (blob columns) and 8 digit unicode escapes. The core escapes
+    double quotes within strings, like all other special characters, so every
+    second part between two double quotes is a string and None can be replaced
+    in the other ones. Whatever is no valid JSON then is parsed the slow way, as
+    is an escaped double quote or surrogate, which JSON would read differently.
+
+        >>> _parse_python3_output('[["None",None,1.5e+06,{"a":[1]}]]')
+        [['None', None, 1500000.0, {'a': [1]}]]
+        >>> _parse_python3_output('[[b"\\\\x00",None,"\\\\U0001f600"]]')
+        [[b'\\x00', None, '😀']]
+        >>> _parse_python3_output('[["\\\\"None\\\\"",None]]')
+        [['"None"', None]]
+    """
+    if _NON_JSON_ESCAPE.search(data):
+        return ast.literal_eval(data)
+    json_data = data
+    if "None" in data:
+        parts = data.split('"')
+        parts[::2] = [part.replace("None", "null") for part in parts[::2]]
+        json_data = '"'.join(parts)
+    try:
+        # NaN and Infinity are no python literals, the core does not send them anyway.
+        return json.loads(json_data, parse_constant=_reject_constant)
+    except ValueError:
+        return ast.literal_eval(data)
+
+
+def _reject_constant(constant: str) -> NoReturn:
+    raise ValueError(f"Invalid constant: {constant}")
+
+
+def _response_error(code: str, error_info: str) -> MKLivestatusException:
+    if code == "404":
+        return MKLivestatusTableNotFoundError(f"Not Found ({code}): {error_info!r}")
+
+    if code == "413":
+        return MKLivestatusPayloadTooLargeError(error_info)
+
+    if code == "502":
+        return MKLivestatusBadGatewayError(error_info)
+
+    return MKLivestatusQueryError(f"{code}: {error_info}")
+
+
 def is_socket_readable(sock: socket.socket, select_timeout: float = 1.0) -> bool:
     # SSL sockets may not return any fileno in the select, since the data lingers around in pending
     # https://stackoverflow.com/questions/3187565/select-and-ssl-in-python
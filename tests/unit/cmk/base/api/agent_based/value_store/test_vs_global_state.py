@@ -3,9 +3,9 @@
 # This file is part of Checkmk (https://checkmk.com). It is subject to the terms and
 # conditions defined in the file COPYING, which is part of this source code package.
 
-from pytest import MonkeyPatch
+from pathlib import Path
 
-from cmk.ccc import store
+from pytest import MonkeyPatch
 
 from cmk.utils.hostaddress import HostName
 
@@ -16,17 +16,14 @@ from cmk.base.api.agent_based.value_store import ValueStoreManager
 from cmk.agent_based.v1.value_store import get_value_store, set_value_store_manager
 
 
-def test_load_host_value_store_loads_file(monkeypatch: MonkeyPatch) -> None:
+def test_load_host_value_store_loads_file(monkeypatch: MonkeyPatch, tmp_path: Path) -> None:
     service_id = ServiceID(CheckPluginName("test_service"), None)
     raw_content = (
         '[[["test_load_host_value_store_loads_file", "test_service", null, "loaded_file"], "True"]]'
     )
 
-    monkeypatch.setattr(
-        store,
-        "load_text_from_file",
-        lambda *_a, **_kw: raw_content,
-    )
+    monkeypatch.setattr(ValueStoreManager, "STORAGE_PATH", tmp_path)
+    (tmp_path / "test_load_host_value_store_loads_file").write_text(raw_content)
 
     with set_value_store_manager(
         ValueStoreManager(HostName("test_load_host_value_store_loads_file")),
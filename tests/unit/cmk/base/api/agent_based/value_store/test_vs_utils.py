@@ -3,23 +3,30 @@
 # This file is part of Checkmk (https://checkmk.com). It is subject to the terms and
 # conditions defined in the file COPYING, which is part of this source code package.
 
+# pylint: disable=protected-access
+
+import json
 from ast import literal_eval
+from collections.abc import MutableMapping
 from pathlib import Path
-from unittest.mock import Mock
+from typing import Any
 
 import pytest
 
-from cmk.ccc import store
-
 from cmk.utils.hostaddress import HostName
 
 from cmk.checkengine.checking import CheckPluginName, ServiceID
 
 from cmk.base.api.agent_based.value_store._utils import (
+    _decode_frames,
+    _decode_value,
     _DiskSyncedMapping,
     _DynamicDiskSyncedMapping,
-    _StaticDiskSyncedMapping,
+    _encode_value,
+    _JournaledDiskSyncedMapping,
+    _MAGIC,
     _ValueStore,
+    _ValueStoreKey,
     ValueStoreManager,
 )
 
@@ -78,77 +85,11 @@ class Test_DynamicDiskSyncedMapping:
         assert _TEST_KEY not in ddsm
 
 
-class Test_StaticDiskSyncedMapping:
-    def _mock_load(self, mocker):
-        stored_item_states = (
-            '{("check1", None, "stored-user-key-1"): 23,'
-            ' ("check2", "item", "stored-user-key-2"): 42}'
-        )
-
-        mocker.patch.object(
-            store,
-            "load_text_from_file",
-            side_effect=lambda *a, **kw: stored_item_states,
-        )
-
-    def _mock_store(self, mocker):
-        mocker.patch.object(
-            store,
-            "save_text_to_file",
-            autospec=True,
-        )
-
-    @staticmethod
-    def _get_sdsm(
-        tmp_path: Path,
-    ) -> _StaticDiskSyncedMapping[tuple[str, str | None, str], object]:
-        return _StaticDiskSyncedMapping(
-            path=tmp_path / "test-host",
-            log_debug=lambda msg: None,
-            serializer=repr,
-            deserializer=literal_eval,
-        )
-
-    def test_mapping_features(self, mocker: Mock, tmp_path: Path) -> None:
-        self._mock_load(mocker)
-        sdsm = self._get_sdsm(tmp_path)
-        assert sdsm.get(("check_no", None, "moo")) is None
-        with pytest.raises(KeyError):
-            _ = sdsm[("check_no", None, "moo")]
-        assert len(sdsm) == 2
-
-        assert sdsm.get(("check1", None, "stored-user-key-1")) == 23
-        assert sdsm[("check2", "item", "stored-user-key-2")] == 42
-        assert list(sdsm) == [
-            ("check1", None, "stored-user-key-1"),
-            ("check2", "item", "stored-user-key-2"),
-        ]
-        assert len(sdsm) == 2
-
-    def test_store(self, mocker: Mock, tmp_path: Path) -> None:
-        self._mock_load(mocker)
-        self._mock_store(mocker)
-
-        sdsm = self._get_sdsm(tmp_path)
-
-        sdsm.disksync(
-            removed={("check2", "item", "stored-user-key-2")},
-            updated=[(("check3", "el Barto", "Ay caramba"), "ASDF")],
-        )
-
-        expected_values = {
-            ("check1", None, "stored-user-key-1"): 23,
-            ("check3", "el Barto", "Ay caramba"): "ASDF",
-        }
-        written = store.save_text_to_file.call_args.args[1]  # type: ignore[attr-defined]
-        assert written == repr(expected_values)
-        assert list(sdsm.items()) == list(expected_values.items())
-
-
 class Test_DiskSyncedMapping:
     @staticmethod
-    def _get_dsm() -> _DiskSyncedMapping:
-        dynstore: _DynamicDiskSyncedMapping[tuple[str, str, str], str] = _DynamicDiskSyncedMapping()
+    def _get_dsm() -> MutableMapping[Any, Any]:
+        # The overlay logic does not depend on the types of the keys and values.
+        dynstore: _DynamicDiskSyncedMapping[Any, Any] = _DynamicDiskSyncedMapping()
         dynstore.update(
             {
                 ("dyn", "key", "1"): "dyn-val-1",
@@ -213,14 +154,139 @@ class Test_DiskSyncedMapping:
         assert sorted(dsm) == [("dyn", "key", "1"), ("stat", "key", "2")]
 
 
+@pytest.mark.parametrize(
+    "value",
+    [
+        None,
+        True,
+        False,
+        0,
+        -(2**63),
+        2**63,
+        -0.0,
+        1.5e-300,
+        "",
+        "äöü \udcff",
+        (),
+        (1, 2.5, ("nested", None, [True])),
+        [1, [2, (3,)]],
+        {"dict": (1, 2)},
+        {1, 2},
+        b"bytes",
+        (1, {"mixed": 2}),
+    ],
+)
+def test_value_encoding(value: object) -> None:
+    decoded = _decode_value(_encode_value(value))
+    assert decoded == value == literal_eval(repr(value))
+    assert repr(decoded) == repr(value)
+
+
+def test_value_encoding_is_compact() -> None:
+    assert _encode_value(1.5)[:1] == b"f"
+    assert _encode_value((1700000000.0, 4711))[:1] == b"t"
+    assert len(_encode_value((1700000000.0, 4711))) < len(repr((1700000000.0, 4711)))
+    assert _encode_value(HostName("heute")) == b"r'heute'"
+
+
+_KEY_A: _ValueStoreKey = (HostName("host"), "check", "item", "a")
+_KEY_B: _ValueStoreKey = (HostName("host"), "check", None, "b")
+
+
+class Test_JournaledDiskSyncedMapping:
+    @staticmethod
+    def _get_jdsm(path: Path) -> _JournaledDiskSyncedMapping:
+        return _JournaledDiskSyncedMapping(path=path, log_debug=lambda msg: None)
+
+    def test_roundtrip(self, tmp_path: Path) -> None:
+        path = tmp_path / "host"
+        jdsm = self._get_jdsm(path)
+        assert not jdsm
+        jdsm.disksync(updated=[(_KEY_A, b"a"), (_KEY_B, b"b")])
+        assert path.read_bytes().startswith(_MAGIC)
+
+        other = self._get_jdsm(path)
+        assert dict(other) == {_KEY_A: b"a", _KEY_B: b"b"}
+
+        jdsm.disksync(removed={_KEY_A}, updated=[(_KEY_B, b"c")])
+        assert other._offset < path.stat().st_size
+        other.disksync()
+        assert dict(other) == dict(jdsm) == {_KEY_B: b"c"}
+        assert other._offset == path.stat().st_size
+
+    def test_changes_are_appended(self, tmp_path: Path) -> None:
+        path = tmp_path / "host"
+        jdsm = self._get_jdsm(path)
+        jdsm.disksync(updated=[(_KEY_A, b"a"), (_KEY_B, b"b")])
+        inode = path.stat().st_ino
+
+        jdsm.disksync(updated=[(_KEY_A, b"a"), (_KEY_B, b"c")])
+        assert path.stat().st_ino == inode
+        assert jdsm._changes == 3
+
+        jdsm.disksync(updated=[(_KEY_A, b"a")])
+        assert jdsm._changes == 3
+
+    def test_compaction(self, tmp_path: Path) -> None:
+        path = tmp_path / "host"
+        jdsm = self._get_jdsm(path)
+        other = self._get_jdsm(path)
+        for n in range(200):
+            jdsm.disksync(updated=[(_KEY_A, str(n).encode())])
+
+        assert jdsm._changes < 100
+        other.disksync()
+        assert dict(other) == {_KEY_A: b"199"}
+
+    def test_incomplete_record_is_ignored(self, tmp_path: Path) -> None:
+        path = tmp_path / "host"
+        jdsm = self._get_jdsm(path)
+        jdsm.disksync(updated=[(_KEY_A, b"a")])
+        jdsm.disksync(updated=[(_KEY_B, b"b")])
+        content = path.read_bytes()
+        path.write_bytes(content[:-1])
+
+        jdsm = self._get_jdsm(path)
+        assert dict(jdsm) == {_KEY_A: b"a"}
+
+        jdsm.disksync(updated=[(_KEY_B, b"c")])
+        assert dict(self._get_jdsm(path)) == {_KEY_A: b"a", _KEY_B: b"c"}
+
+    def test_replaced_file_of_same_size_is_read(self, tmp_path: Path) -> None:
+        path = tmp_path / "host"
+        self._get_jdsm(path).disksync(updated=[(_KEY_A, b"a")])
+        other = self._get_jdsm(path)
+
+        # Rewritten in place: the same inode and the same size, but a new generation
+        replacement = tmp_path / "replacement"
+        self._get_jdsm(replacement).disksync(updated=[(_KEY_A, b"b")])
+        with path.open("r+b") as f:
+            f.write(replacement.read_bytes())
+        assert path.stat().st_size == other._offset
+
+        other.disksync()
+        assert dict(other) == {_KEY_A: b"b"}
+
+    def test_json_file_is_read(self, tmp_path: Path) -> None:
+        path = tmp_path / "host"
+        path.write_text(json.dumps([[list(_KEY_A), "(1, 2.5)"], [list(_KEY_B), "'b'"]]))
+
+        jdsm = self._get_jdsm(path)
+        assert {k: _decode_value(v) for k, v in jdsm.items()} == {_KEY_A: (1, 2.5), _KEY_B: "b"}
+
+        jdsm.disksync(removed={_KEY_B})
+        assert path.read_bytes().startswith(_MAGIC)
+        assert {k: _decode_value(v) for k, v in self._get_jdsm(path).items()} == {_KEY_A: (1, 2.5)}
+
+
 class Test_ValueStore:
     @staticmethod
     def _get_store() -> _ValueStore:
         host_name = HostName("moritz")
         return _ValueStore(
             data={
-                (host_name, "check1", "item", "key1"): "42",
-                (host_name, "check2", "item", "key2"): "23",
+                (host_name, "check1", "item", "key1"): _encode_value(42),
+                (host_name, "check2", "item", "key2"): _encode_value(23),
             },
             service_id=(CheckPluginName("check1"), "item"),
             host_name=host_name,
@@ -264,3 +330,54 @@ class TestValueStoreManager:
             assert vsm.active_service_interface["key"] == "outer"
 
         assert vsm.active_service_interface is None
+
+    @staticmethod
+    def test_values_are_persisted(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+        monkeypatch.setattr(ValueStoreManager, "STORAGE_PATH", tmp_path)
+        service = ServiceID(CheckPluginName("unit_test"), "item")
+
+        vsm = ValueStoreManager(HostName("test-host"))
+        with vsm.namespace(service):
+            assert vsm.active_service_interface is not None
+            vsm.active_service_interface["rate"] = (1700000000.0, 4711)
+            vsm.active_service_interface["state"] = {"levels": [1, 2]}
+        vsm.save()
+
+        vsm = ValueStoreManager(HostName("test-host"))
+        with vsm.namespace(service):
+            assert vsm.active_service_interface is not None
+            assert dict(vsm.active_service_interface) == {
+                "rate": (1700000000.0, 4711),
+                "state": {"levels": [1, 2]},
+            }
+
+
+def test_value_store_appends_only_the_changes(tmp_path: Path) -> None:
+    host_name = HostName("test-host")
+    values = {
+        (host_name, "interfaces", f"{n}", f"{counter}"): (1700000000.0 + n, n * 4711)
+        for n in range(500)
+        for counter in ("in", "out", "inerr", "outerr")
+    }
+    path = tmp_path / "journal"
+    journaled = _JournaledDiskSyncedMapping(path=path, log_debug=lambda msg: None)
+    journaled.disksync(updated=[(k, _encode_value(v)) for k, v in values.items()])
+    size = path.stat().st_size
+
+    # saving unchanged values writes nothing
+    journaled = _JournaledDiskSyncedMapping(path=path, log_debug=lambda msg: None)
+    journaled.disksync(updated=[(k, _encode_value(v)) for k, v in values.items()])
+    assert path.stat().st_size == size
+
+    # a save appends one frame of only the changed values
+    for n in range(10):
+        journaled = _JournaledDiskSyncedMapping(path=path, log_debug=lambda msg: None)
+        changed = {k: (v[0] + 60 * (n + 1), 0) for k, v in list(values.items())[n * 4 : n * 4 + 4]}
+        journaled.disksync(updated=[(k, _encode_value(v)) for k, v in changed.items()])
+
+        appended = path.read_bytes()[size:]
+        frame: dict[_ValueStoreKey, bytes] = {}
+        assert _decode_frames(appended, frame) == (len(appended), len(changed))
+        assert frame == {k: _encode_value(v) for k, v in changed.items()}
+        assert len(appended) < 100 * len(changed)
+        size += len(appended)
@@ -278,3 +278,13 @@ def test_prediction_injection() -> None:
             ("my_reference_metric", *prediction),
         )
     }
+
+
+def test_snmp_fetch_scheduler_is_started_once_per_process(monkeypatch: MonkeyPatch) -> None:
+    monkeypatch.setattr(checkers, "_scheduler", None)
+    scheduler = checkers._snmp_fetch_scheduler()
+    assert checkers._snmp_fetch_scheduler() is scheduler
+
+    # As in a forked process
+    monkeypatch.setattr(checkers, "_scheduler", (-1, scheduler))
+    assert checkers._snmp_fetch_scheduler() is not scheduler
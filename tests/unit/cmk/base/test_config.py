@@ -6,6 +6,7 @@
 # pylint: disable=protected-access
 
 import itertools
+import pickle
 import re
 import shutil
 import socket
@@ -23,7 +24,7 @@ from cmk.ccc.exceptions import MKGeneralException
 
 import cmk.utils.paths
 from cmk.utils.config_path import VersionedConfigPath
-from cmk.utils.hostaddress import HostName
+from cmk.utils.hostaddress import HostAddress, HostName
 from cmk.utils.ip_lookup import IPStackConfig
 from cmk.utils.legacy_check_api import LegacyCheckDefinition
 from cmk.utils.rulesets import RuleSetName
@@ -2955,6 +2956,66 @@ class TestPackedConfigStore:
         assert precompiled_check_config.exists()
         assert store.read() == {"abc": 1}
 
+    def test_host_values_are_unpickled_on_access(self, store: config.PackedConfigStore) -> None:
+        helper_config = {
+            "abc": 1,
+            "ipaddresses": {HostName(f"host{n}"): HostAddress(f"10.0.0.{n}") for n in range(10)},
+            "host_attributes": {HostName("host1"): {"alias": "Host 1"}, HostName("host2"): {}},
+            "host_labels": {},
+        }
+        store.write(helper_config)
+
+        packed = store.read()
+        assert packed == helper_config
+
+        packed = store.read()
+        ipaddresses = packed["ipaddresses"]
+        assert isinstance(ipaddresses, config._PackedHostValues)
+        assert ipaddresses.get(HostName("host3")) == "10.0.0.3"
+        assert HostName("host4") in ipaddresses
+        assert HostName("unknown") not in ipaddresses
+        assert list(ipaddresses._values) == [HostName("host3")]
+
+    def test_read_legacy_file(self, store: config.PackedConfigStore) -> None:
+        store.path.parent.mkdir(parents=True, exist_ok=True)
+        store.path.write_bytes(pickle.dumps({"abc": 1, "ipaddresses": {"host1": "10.0.0.1"}}))
+        assert store.read() == {"abc": 1, "ipaddresses": {"host1": "10.0.0.1"}}
+
+    def test_read_decodes_only_accessed_hosts(
+        self, store: config.PackedConfigStore, monkeypatch: MonkeyPatch
+    ) -> None:
+        helper_config: dict[str, dict[HostName, Any]] = {
+            "host_attributes": {
+                HostName(f"host{n}"): {
+                    "alias": f"Host number {n}",
+                    "labels": {f"label{m}": f"value{m}" for m in range(10)},
+                }
+                for n in range(1000)
+            },
+            "ipaddresses": {HostName(f"host{n}"): HostAddress("127.0.0.1") for n in range(1000)},
+        }
+        store.write(helper_config)
+
+        decoded: list[int] = []
+        loads = pickle.loads
+
+        def _loads(data: bytes | memoryview, /, **kwargs: Any) -> Any:
+            decoded.append(len(data))
+            return loads(data, **kwargs)
+
+        monkeypatch.setattr(pickle, "loads", _loads)
+        packed = store.read()
+        assert len(decoded) == 1  # only the global part
+
+        host_attributes = packed["host_attributes"]
+        expected = helper_config["host_attributes"][HostName("host42")]
+        assert host_attributes[HostName("host42")] == expected
+        assert host_attributes[HostName("host42")] is host_attributes[HostName("host42")]
+        assert HostName("host999") in host_attributes
+        assert len(decoded) == 2
+        assert list(host_attributes._values) == [HostName("host42")]
+        assert not packed["ipaddresses"]._values
+
 
 def test__extract_check_plugins(monkeypatch: MonkeyPatch) -> None:
     duplicate_plugin = {
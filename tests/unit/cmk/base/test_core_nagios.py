@@ -10,8 +10,9 @@ import io
 import itertools
 import os
 import socket
+import time
 from collections import Counter
-from collections.abc import Mapping, Sequence
+from collections.abc import Callable, Mapping, Sequence
 from pathlib import Path
 from typing import Any, Literal
 
@@ -23,9 +24,11 @@ from tests.testlib.base import Scenario
 import cmk.ccc.debug
 import cmk.ccc.version as cmk_version
 
-from cmk.utils import paths
+from cmk.utils import config_warnings, ip_lookup, paths
 from cmk.utils.config_path import VersionedConfigPath
 from cmk.utils.hostaddress import HostAddress, HostName
+from cmk.utils.licensing.cre_handler import CRELicensingHandler
+from cmk.utils.tags import TagGroupID, TagID
 
 from cmk.checkengine.checking import CheckPluginName
 from cmk.checkengine.discovery import AutocheckEntry
@@ -866,3 +869,99 @@ def test_create_nagios_config_commands(
 
     assert license_counter["services"] == 1
     assert outfile.getvalue() == expected_result
+
+
+def _sharding_scenario(monkeypatch: MonkeyPatch, num_hosts: int) -> config.ConfigCache:
+    monkeypatch.setattr(config, "get_resource_macros", lambda: {})
+    ts = Scenario()
+    for n in range(num_hosts):
+        ts.add_host(
+            HostName(f"host{n:04d}"),
+            tags={TagGroupID("agent"): TagID("no-agent" if n % 3 else "cmk-agent")},
+        )
+    # All but one host have an IP address, the lookup of "host0004" fails
+    ts.set_option(
+        "ipaddresses",
+        {HostName(f"host{n:04d}"): HostAddress("127.0.0.1") for n in range(num_hosts) if n != 4},
+    )
+    ts.set_option(
+        "host_check_commands",
+        [
+            {
+                "id": "01",
+                "condition": {"host_name": [{"$regex": ".*[05]$"}]},
+                "value": ("service", "PING"),
+            }
+        ],
+    )
+    ts.set_ruleset(
+        "custom_checks",
+        [
+            {
+                "id": "02",
+                "condition": {"host_name": [{"$regex": ".*7$"}]},
+                "value": {"service_description": "Custom", "command_name": "custom-command"},
+            },
+            {
+                "id": "03",
+                "condition": {"host_name": [HostName("host0001"), HostName("host0002")]},
+                "value": {"service_description": ""},
+            },
+        ],
+    )
+    return ts.apply(monkeypatch)
+
+
+def _create_config(
+    config_cache: config.ConfigCache, processes: int
+) -> tuple[str, list[str], Mapping[HostName, Exception]]:
+    ip_address_of = config.ConfiguredIPLookup(
+        config_cache, error_handler=ip_lookup.CollectFailedHosts()
+    )
+    config_warnings.initialize()
+    outfile = io.StringIO()
+    core_nagios.create_config(
+        outfile,
+        VersionedConfigPath(42),
+        config_cache,
+        sorted(config_cache.hosts_config.hosts),
+        licensing_handler=CRELicensingHandler(),
+        passwords={},
+        ip_address_of=ip_address_of,
+        processes=processes,
+    )
+    return (
+        outfile.getvalue(),
+        sorted(config_warnings.g_configuration_warnings),
+        dict(ip_address_of.error_handler.failed_ip_lookups),
+    )
+
+
+def test_create_config_sharded_is_identical(monkeypatch: MonkeyPatch) -> None:
+    config_cache = _sharding_scenario(monkeypatch, 50)
+    sharded = _create_config(config_cache, processes=3)
+    serial = _create_config(config_cache, processes=1)
+
+    assert sharded[0] == serial[0]
+    assert sharded[0].count("check-mk-host-custom-") == 2 * 10
+    assert "check-mk-host-custom-10\n" in sharded[0]
+    assert sharded[1] == serial[1] and len(serial[1]) == 2
+    assert sharded[2].keys() == serial[2].keys() == {HostName("host0004")}
+
+
+
+@pytest.mark.slow
+def test_create_config_sharded_benchmark(
+    monkeypatch: MonkeyPatch, record_property: Callable[[str, object], None]
+) -> None:
+    config_cache = _sharding_scenario(monkeypatch, 400)
+
+    before = time.perf_counter()
+    sharded, *_rest = _create_config(config_cache, processes=4)
+    record_property("duration_sharded", time.perf_counter() - before)
+
+    before = time.perf_counter()
+    serial, *_rest = _create_config(config_cache, processes=1)
+    record_property("duration_serial", time.perf_counter() - before)
+
+    assert sharded == serial
@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+# Copyright (C) 2024 Checkmk GmbH - License: GNU General Public License v2
+# This file is part of Checkmk (https://checkmk.com). It is subject to the terms and
+# conditions defined in the file COPYING, which is part of this source code package.
+
+# pylint: disable=protected-access
+
+import copy
+import pickle
+from pathlib import Path
+from typing import Any
+
+import pytest
+
+from livestatus import SiteId
+
+import cmk.bi.compiler
+import cmk.bi.data_fetcher
+import cmk.bi.searcher
+from cmk.bi.compiler import BICompiler, CompilationStats, CompiledAggregationStore
+from cmk.bi.data_fetcher import BIStructureFetcher, SiteProgramStart
+from cmk.bi.packs import BIAggregationPacks
+from cmk.bi.searcher import BISearcher
+from cmk.bi.trees import BICompiledAggregation
+
+from tests.unit.cmk.bi.conftest import DUMMY_SITES_CALLBACK, MockBIAggregationPack
+
+
+def _compile_default_aggregation(
+    bi_packs: BIAggregationPacks, bi_searcher: BISearcher
+) -> BICompiledAggregation:
+    aggregation = bi_packs.get_aggregation("default_aggregation")
+    assert aggregation is not None
+    return aggregation.compile(bi_searcher)
+
+
+def test_compiled_aggregation_store(
+    tmp_path: Path,
+    bi_packs_sample_config: BIAggregationPacks,
+    bi_searcher_with_sample_config: BISearcher,
+) -> None:
+    compiled = _compile_default_aggregation(bi_packs_sample_config, bi_searcher_with_sample_config)
+    (tmp_path / "default_aggregation.new").touch()
+    (tmp_path / "frozen").mkdir()
+
+    store = CompiledAggregationStore(tmp_path)
+    store.save("default_aggregation", compiled)
+    assert store.ids() == ["default_aggregation"]
+    assert store.get("unknown") is None
+    assert store.get_branch("unknown", "Host heute") is None
+
+    # Another process only reads the index of the aggregation when it is accessed
+    other_store = CompiledAggregationStore(tmp_path)
+    assert not other_store._indices
+    loaded = other_store.get("default_aggregation")
+    assert loaded is not None
+    assert loaded.serialize() == compiled.serialize()
+    assert list(other_store._indices) == ["default_aggregation"]
+    # ... and unpickles it once
+    assert other_store.get("default_aggregation") is loaded
+
+    # A new compilation replaces the file
+    compiled.branches = compiled.branches[:1]
+    store.save("default_aggregation", compiled)
+    reloaded = other_store.get("default_aggregation")
+    assert reloaded is not None and reloaded is not loaded
+    assert reloaded.serialize() == compiled.serialize()
+
+    (tmp_path / "default_aggregation").unlink()
+    assert other_store.get("default_aggregation") is None
+    assert not other_store._indices
+
+
+def test_compiled_aggregation_store_loads_single_branches(
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+    bi_packs_sample_config: BIAggregationPacks,
+    bi_searcher_with_sample_config: BISearcher,
+) -> None:
+    compiled = _compile_default_aggregation(bi_packs_sample_config, bi_searcher_with_sample_config)
+    assert len(compiled.branches) > 1
+    CompiledAggregationStore(tmp_path).save("default_aggregation", compiled)
+
+    store = CompiledAggregationStore(tmp_path)
+    unpickled: list[dict[str, Any]] = []
+    loads = pickle.loads
+
+    def _loads(data: bytes, /, **kwargs: Any) -> Any:
+        unpickled.append(result := loads(data, **kwargs))
+        return result
+
+    monkeypatch.setattr(pickle, "loads", _loads)
+    for branch in compiled.branches:
+        title = branch.properties.title
+        unpickled.clear()
+        loaded = store.get_branch("default_aggregation", title)
+        assert loaded is not None
+        assert loaded.serialize() == branch.serialize()
+        # Only the branch itself, the index is read once per file
+        assert [schema["properties"]["title"] for schema in unpickled[-1:]] == [title]
+        assert len(unpickled) <= 2
+
+    unpickled.clear()
+    assert store.get_branch("default_aggregation", "unknown") is None
+    assert not unpickled
+
+
+def test_compiled_aggregation_store_reads_pickled_schema(
+    tmp_path: Path,
+    bi_packs_sample_config: BIAggregationPacks,
+    bi_searcher_with_sample_config: BISearcher,
+) -> None:
+    compiled = _compile_default_aggregation(bi_packs_sample_config, bi_searcher_with_sample_config)
+    (tmp_path / "default_aggregation").write_bytes(pickle.dumps(compiled.serialize()))
+    (tmp_path / "empty").touch()
+
+    store = CompiledAggregationStore(tmp_path)
+    loaded = store.get("default_aggregation")
+    assert loaded is not None
+    assert loaded.serialize() == compiled.serialize()
+    branch = compiled.branches[0]
+    loaded_branch = store.get_branch("default_aggregation", branch.properties.title)
+    assert loaded_branch is not None
+    assert loaded_branch.serialize() == branch.serialize()
+    assert store.get("empty") is None
+    assert store.get_branch("empty", branch.properties.title) is None
+
+
+def test_host_regex_caches_survive_new_hosts(bi_searcher_with_sample_config: BISearcher) -> None:
+    hosts = bi_searcher_with_sample_config.hosts
+    matched, _groups = bi_searcher_with_sample_config.get_host_name_matches(
+        list(hosts.values()), "heute.*"
+    )
+    assert {host.name for host in matched} == {"heute", "heute_clone"}
+
+    other_searcher = BISearcher()
+    other_searcher.set_hosts(hosts)
+    assert other_searcher._host_regex_match_cache["heute.*$"].keys() == {"heute", "heute_clone"}
+    matched, groups = other_searcher.get_host_name_matches(list(hosts.values()), "heute.*")
+    assert {host.name for host in matched} == {"heute", "heute_clone"}
+    assert groups == {"heute": (), "heute_clone": ()}
+
+    other_searcher.cleanup()
+    assert not bi_searcher_with_sample_config._host_regex_match_cache
+
+
+
+def test_host_regex_caches_are_bounded(
+    bi_searcher_with_sample_config: BISearcher, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    hosts = bi_searcher_with_sample_config.hosts
+    bi_searcher_with_sample_config.get_host_name_matches(list(hosts.values()), "heute.*")
+    bi_searcher_with_sample_config.set_hosts(hosts)
+    assert bi_searcher_with_sample_config._host_regex_match_cache
+
+    monkeypatch.setattr(cmk.bi.searcher, "_HOST_REGEX_CACHE_LIMIT", 1)
+    BISearcher().set_hosts(hosts)
+    assert not bi_searcher_with_sample_config._host_regex_match_cache
+    assert not bi_searcher_with_sample_config._host_regex_miss_cache
+
+class _FakeStructureSites:
+    def __init__(self, structure_fetcher: BIStructureFetcher) -> None:
+        self._structure_fetcher = structure_fetcher
+        self.hosts: dict = {}
+
+    def fetch_missing_data(self, missing_program_starts: set[SiteProgramStart]) -> None:
+        for site_id, timestamp in missing_program_starts:
+            self._structure_fetcher.add_site_data(site_id, self.hosts)
+            self._structure_fetcher._marshal_save_data(
+                self._structure_fetcher._path_site_structure_data
+                / self._structure_fetcher._site_data_filename(site_id, timestamp),
+                self.hosts,
+            )
+
+
+def _incremental_compiler(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> tuple[BICompiler, _FakeStructureSites, list[int]]:
+    from .bi_test_data import sample_config
+
+    monkeypatch.setattr(cmk.bi.compiler, "get_cache_dir", lambda: tmp_path)
+    monkeypatch.setattr(cmk.bi.data_fetcher, "get_cache_dir", lambda: tmp_path)
+    monkeypatch.setattr(cmk.bi.compiler, "frozen_aggregations_dir", tmp_path / "frozen")
+    monkeypatch.setattr(
+        cmk.bi.compiler, "path_compiled_aggregations", tmp_path / "compiled_aggregations"
+    )
+    monkeypatch.setattr(
+        cmk.bi.compiler,
+        "compiled_aggregation_store",
+        CompiledAggregationStore(tmp_path / "compiled_aggregations"),
+    )
+
+    packs_config: dict[str, Any] = copy.deepcopy(sample_config.bi_packs_config)
+    aggregation = copy.deepcopy(packs_config["packs"][0]["aggregations"][0])
+    aggregation["id"] = "heute_general"
+    aggregation["node"]["search"] = {
+        "type": "host_search",
+        "conditions": {
+            "host_folder": "",
+            "host_label_groups": [],
+            "host_tags": {},
+            "host_choice": {"type": "host_name_regex", "pattern": "heute$"},
+        },
+        "refer_to": "host",
+    }
+    aggregation["node"]["action"]["rule_id"] = "general"
+    packs_config["packs"][0]["aggregations"].append(aggregation)
+
+    compiler = BICompiler("", DUMMY_SITES_CALLBACK)
+    compiler._bi_packs = MockBIAggregationPack(packs_config)
+    sites = _FakeStructureSites(compiler._bi_structure_fetcher)
+    # The structure data of livestatus has plain str keys
+    sites.hosts = {str(k): v for k, v in copy.deepcopy(sample_config.bi_structure_states).items()}
+    monkeypatch.setattr(
+        compiler._bi_structure_fetcher, "_fetch_missing_data", sites.fetch_missing_data
+    )
+
+    program_start = [1000]
+    monkeypatch.setattr(
+        compiler,
+        "compute_current_configstatus",
+        lambda: {
+            "configfile_timestamp": 1.0,
+            "online_sites": {(SiteId("heute"), program_start[0])},
+            "known_sites": {(SiteId("heute"), program_start[0])},
+        },
+    )
+    monkeypatch.setattr(compiler, "_generate_part_of_aggregation_lookup", lambda _aggr: None)
+    return compiler, sites, program_start
+
+
+def _recompile(compiler: BICompiler) -> CompilationStats:
+    compiler.compilation_stats = None
+    compiler._bi_structure_fetcher.cleanup()
+    compiler.bi_searcher.cleanup()
+    compiler.cleanup()
+    compiler.load_compiled_aggregations()
+    assert compiler.compilation_stats is not None
+    return compiler.compilation_stats
+
+
+def _serialized(compiler: BICompiler) -> dict[str, object]:
+    return {
+        aggr_id: aggregation.serialize()
+        for aggr_id, aggregation in compiler.compiled_aggregations.items()
+    }
+
+
+def test_incremental_compilation(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    compiler, sites, program_start = _incremental_compiler(tmp_path, monkeypatch)
+
+    stats = _recompile(compiler)
+    assert not stats.incremental
+    assert (stats.num_aggregations, stats.num_compiled) == (2, 2)
+    host_queries, hosts = compiler._load_compilation_dependencies()["aggregations"]["heute_general"]
+    assert ("host_name_regex", "heute$") in host_queries
+    assert hosts == {"heute"}
+
+    # The structure did not change, e.g. the core has been reloaded
+    program_start[0] += 1
+    stats = _recompile(compiler)
+    assert stats.incremental
+    assert (stats.num_changed_hosts, stats.num_compiled) == (0, 0)
+
+    # Only the aggregation of all hosts refers to the changed host
+    host = list(sites.hosts["heute_clone"])
+    host[7] = "New alias"
+    sites.hosts["heute_clone"] = tuple(host)
+    program_start[0] += 1
+    stats = _recompile(compiler)
+    assert stats.incremental
+    assert (stats.num_changed_hosts, stats.num_compiled) == (1, 1)
+    incremental = _serialized(compiler)
+
+    (tmp_path / "compilation_dependencies").unlink()
+    program_start[0] += 1
+    stats = _recompile(compiler)
+    assert not stats.incremental
+    assert stats.num_compiled == 2
+    assert _serialized(compiler) == incremental
+
+
+def test_changed_configuration_compiles_everything(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    compiler, _sites, _program_start = _incremental_compiler(tmp_path, monkeypatch)
+    _recompile(compiler)
+
+    monkeypatch.setattr(compiler, "_get_compilation_timestamp", lambda: 0.0)
+    stats = _recompile(compiler)
+    assert not stats.incremental
+    assert stats.num_compiled == 2
+
+
+def test_frozen_branches_leave_the_stored_aggregation_untouched(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    compiler, _sites, _program_start = _incremental_compiler(tmp_path, monkeypatch)
+    aggregation = compiler._bi_packs.get_aggregation("heute_general")
+    assert aggregation is not None
+    aggregation.computation_options.freeze_aggregations = True
+    _recompile(compiler)
+
+    for _request in range(2):
+        compiler.cleanup()
+        compiler.load_compiled_aggregations()
+        assert not compiler.compiled_aggregations["heute_general"].branches
+        assert "frozen_heute_general_General State" in compiler.compiled_aggregations
+
+    stored = cmk.bi.compiler.compiled_aggregation_store.get("heute_general")
+    assert stored is not None and stored.branches
@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+# Copyright (C) 2024 Checkmk GmbH - License: GNU General Public License v2
+# This file is part of Checkmk (https://checkmk.com). It is subject to the terms and
+# conditions defined in the file COPYING, which is part of this source code package.
+
+# pylint: disable=protected-access
+
+import time
+from collections.abc import Callable
+from typing import Any, cast
+
+import pytest
+
+from cmk.utils.hostaddress import HostName
+from cmk.utils.tags import TagGroupID, TagID
+
+import cmk.bi.searcher
+from cmk.bi.lib import BIHostData, BIHostSearchMatch, BIServiceData
+from cmk.bi.searcher import BISearcher, literal_prefixes
+
+from tests.unit.cmk.bi.conftest import MockBIAggregationPack
+
+_ROLES = ("db", "web", "app")
+
+
+def _synthetic_hosts(num_hosts: int) -> dict[str, BIHostData]:
+    hosts: dict[str, BIHostData] = {}
+    for n in range(num_hosts):
+        role = _ROLES[n % 3]
+        criticality = "prod" if n % 2 else "test"
+        host_name = HostName(f"{role}{n:05}")
+        hosts[host_name] = BIHostData(
+            "heute",
+            {
+                (TagGroupID("criticality"), TagID(criticality)),
+                (TagGroupID("role"), TagID(role)),
+                (TagGroupID("tcp"), TagID("tcp")),
+            },
+            {"env": criticality, "rack": f"rack{n % 50}"},
+            f"{role}/rack{n % 50}",
+            {
+                **{f"Interface {i}": BIServiceData(set(), {}) for i in range(1, 25)},
+                **{f"Filesystem /fs{i}": BIServiceData(set(), {}) for i in range(10)},
+                "CPU load": BIServiceData(set(), {"type": "cpu"}),
+                "Memory": BIServiceData(set(), {}),
+                "Uptime": BIServiceData(set(), {}),
+            },
+            cast(tuple[HostName], ()),
+            cast(tuple[HostName], ()),
+            f"{role.capitalize()} server {n:05}",
+            host_name,
+        )
+    return hosts
+
+
+def _unindexed(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(cmk.bi.searcher, "literal_prefixes", lambda _pattern: None)
+    monkeypatch.setattr(
+        cmk.bi.searcher._SearchIndex, "candidates", lambda _self, _conditions: None
+    )
+
+
+def _host_conditions(**conditions: Any) -> dict:
+    return {
+        "host_choice": {"type": "all_hosts"},
+        "host_folder": "",
+        "host_tags": {},
+        "host_label_groups": [],
+        **conditions,
+    }
+
+
+_SEARCHES = [
+    _host_conditions(host_choice={"type": "host_name_regex", "pattern": "web0001(.)"}),
+    _host_conditions(host_choice={"type": "host_name_regex", "pattern": "db00003"}),
+    _host_conditions(host_choice={"type": "host_name_regex", "pattern": "(db|app)000(1.)"}),
+    _host_conditions(host_choice={"type": "host_alias_regex", "pattern": "Web server 0001(.)"}),
+    _host_conditions(host_choice={"type": "host_alias_regex", "pattern": "App|Db server 00011"}),
+    _host_conditions(host_folder="web/rack7"),
+    _host_conditions(host_tags={"criticality": "prod", "role": {"$or": ["db", "app"]}}),
+    _host_conditions(host_tags={"role": {"$ne": "db"}, "criticality": {"$nor": ["test"]}}),
+    _host_conditions(host_tags={"criticality": "unknown"}),
+    _host_conditions(host_label_groups=[("and", [("and", "rack:rack3"), ("or", "rack:rack4")])]),
+    _host_conditions(host_label_groups=[("and", [("and", "env:prod"), ("not", "rack:rack5")])]),
+    _host_conditions(
+        host_label_groups=[("and", [("and", "rack:rack1")]), ("or", [("and", "rack:rack2")])]
+    ),
+    _host_conditions(host_label_groups=[("not", [("and", "env:test")])]),
+    _host_conditions(
+        host_choice={"type": "host_name_regex", "pattern": "app.*"},
+        host_folder="app",
+        host_tags={"criticality": "test"},
+        host_label_groups=[("and", [("and", "rack:rack9")])],
+    ),
+]
+
+
+@pytest.mark.parametrize("conditions", _SEARCHES)
+def test_indexed_host_search(monkeypatch: pytest.MonkeyPatch, conditions: dict) -> None:
+    hosts = _synthetic_hosts(600)
+    searcher = BISearcher()
+    searcher.set_hosts(hosts)
+    indexed = searcher.search_hosts(conditions)
+    searcher.cleanup()
+
+    _unindexed(monkeypatch)
+    searcher.set_hosts(hosts)
+    assert indexed == searcher.search_hosts(conditions)
+
+
+@pytest.mark.parametrize(
+    "pattern",
+    ["Interface 1.*", "Interface 2$", "CPU load|Memory", "Filesystem /fs[1-3]", "Up", "(.*)"],
+)
+def test_indexed_service_description_matches(
+    monkeypatch: pytest.MonkeyPatch, pattern: str
+) -> None:
+    hosts = _synthetic_hosts(300)
+    searcher = BISearcher()
+    searcher.set_hosts(hosts)
+    for host_matches in (
+        [BIHostSearchMatch(host, (host.name,)) for host in hosts.values()],
+        [BIHostSearchMatch(hosts["web00001"], ("web00001",))],
+    ):
+        indexed = searcher.get_service_description_matches(host_matches, pattern)
+        with monkeypatch.context() as m:
+            _unindexed(m)
+            assert indexed == searcher.get_service_description_matches(host_matches, pattern)
+
+
+@pytest.mark.parametrize(
+    "pattern, expected",
+    [
+        ("heute", ["heute"]),
+        ("^heute_", ["heute_"]),
+        ("heute.*", ["heute"]),
+        ("heu?te", ["he"]),
+        ("heu+te", ["heu"]),
+        ("ab{2}", ["a"]),
+        (r"srv\.db\d+", ["srv.db"]),
+        ("Interface (1|2)|CPU [a-z]+|Memory", ["Interface ", "CPU ", "Memory"]),
+        ("[ab]c", None),
+        ("(?i)heute", None),
+        ("heute|.*", None),
+        ("(heute|morgen)", None),
+        (r"\d+", None),
+    ],
+)
+def test_literal_prefixes(pattern: str, expected: list[str] | None) -> None:
+    assert literal_prefixes(pattern) == expected
+
+
+def _rule(rule_id: str, nodes: list[dict]) -> dict:
+    return {
+        "aggregation_function": {"count": 1, "restrict_state": 2, "type": "worst"},
+        "computation_options": {"disabled": False},
+        "id": rule_id,
+        "node_visualization": {"style_config": {}, "type": "none"},
+        "nodes": nodes,
+        "params": {"arguments": ["HOSTNAME"]},
+        "properties": {
+            "comment": "",
+            "docu_url": "",
+            "icon": "",
+            "state_messages": {},
+            "title": f"{rule_id} $HOSTNAME$",
+        },
+    }
+
+
+def _service_node(service_regex: str) -> dict:
+    return {
+        "action": {
+            "host_regex": "$HOSTNAME$",
+            "service_regex": service_regex,
+            "type": "state_of_service",
+        },
+        "search": {"type": "empty"},
+    }
+
+
+def _aggregation(aggr_id: str, **conditions: Any) -> dict:
+    return {
+        "aggregation_visualization": {
+            "ignore_rule_styles": False,
+            "layout_id": "builtin_default",
+            "line_style": "round",
+        },
+        "computation_options": {
+            "disabled": False,
+            "escalate_downtimes_as_warn": False,
+            "use_hard_states": False,
+        },
+        "groups": {"names": ["Synthetic"], "paths": []},
+        "id": aggr_id,
+        "node": {
+            "action": {
+                "params": {"arguments": ["$HOSTNAME$"]},
+                "rule_id": "host",
+                "type": "call_a_rule",
+            },
+            "search": {
+                "conditions": _host_conditions(**conditions),
+                "refer_to": "host",
+                "type": "host_search",
+            },
+        },
+    }
+
+
+def _synthetic_bi_pack() -> MockBIAggregationPack:
+    # Many aggregations, each selecting a few of the hosts
+    aggregations = (
+        [
+            _aggregation(
+                f"rack{rack}",
+                host_tags={"criticality": "prod"},
+                host_label_groups=[("and", [("and", f"rack:rack{rack}")])],
+                host_folder=f"db/rack{rack}",
+            )
+            for rack in range(50)
+        ]
+        + [
+            _aggregation(
+                f"web{n}",
+                host_choice={"type": "host_alias_regex", "pattern": f"Web server 0{n}(.*)"},
+            )
+            for n in range(100, 150)
+        ]
+        + [
+            _aggregation(
+                f"app{n}", host_choice={"type": "host_name_regex", "pattern": f"app0{n}(.*)"}
+            )
+            for n in range(100, 150)
+        ]
+    )
+    rules = [
+        _rule(
+            "host",
+            [
+                {
+                    "action": {"host_regex": "$HOSTNAME$", "type": "state_of_host"},
+                    "search": {"type": "empty"},
+                },
+                _service_node("Interface 1.*"),
+            ],
+        )
+    ]
+    return MockBIAggregationPack(
+        {
+            "packs": [
+                {
+                    "aggregations": aggregations,
+                    "contact_groups": [],
+                    "id": "synthetic",
+                    "public": True,
+                    "rules": rules,
+                    "title": "Synthetic",
+                }
+            ]
+        }
+    )
+
+
+def _compile(
+    bi_packs: MockBIAggregationPack, hosts: dict[str, BIHostData], monkeypatch: pytest.MonkeyPatch
+) -> tuple[list, int]:
+    """The compiled aggregations and the number of hosts their host choices were evaluated on"""
+    evaluated = 0
+    filter_host_choice = BISearcher.filter_host_choice
+    narrow_hosts = BISearcher._narrow_hosts
+
+    def _filter_host_choice(
+        self: BISearcher, hosts: list[BIHostData], condition: dict
+    ) -> tuple[list[BIHostData], dict]:
+        nonlocal evaluated
+        evaluated += len(hosts)
+        return filter_host_choice(self, hosts, condition)
+
+    def _narrow_hosts(hosts: list[BIHostData], candidates: set[str]) -> list[BIHostData]:
+        nonlocal evaluated
+        narrowed = narrow_hosts(hosts, candidates)
+        evaluated -= len(hosts) - len(narrowed)
+        return narrowed
+
+    with monkeypatch.context() as m:
+        m.setattr(BISearcher, "filter_host_choice", _filter_host_choice)
+        m.setattr(BISearcher, "_narrow_hosts", staticmethod(_narrow_hosts))
+        searcher = BISearcher()
+        searcher.set_hosts(hosts)
+        compiled = [aggr.compile(searcher) for aggr in bi_packs.get_all_aggregations()]
+        searcher.cleanup()
+    return [x.serialize() for x in compiled], evaluated
+
+
+def test_indexed_compilation_narrows_the_hosts(
+    monkeypatch: pytest.MonkeyPatch, record_property: Callable[[str, object], None]
+) -> None:
+    bi_packs = _synthetic_bi_pack()
+    hosts = _synthetic_hosts(1500)
+
+    before = time.perf_counter()
+    indexed, evaluated_indexed = _compile(bi_packs, hosts, monkeypatch)
+    record_property("duration_indexed", time.perf_counter() - before)
+
+    _unindexed(monkeypatch)
+    before = time.perf_counter()
+    unindexed, evaluated_unindexed = _compile(bi_packs, hosts, monkeypatch)
+    record_property("duration_unindexed", time.perf_counter() - before)
+
+    assert indexed == unindexed
+    assert evaluated_unindexed == 150 * len(hosts)
+    # Every host choice is only evaluated on the hosts it selects
+    assert evaluated_indexed == sum(len(x["branches"]) for x in indexed) == 334
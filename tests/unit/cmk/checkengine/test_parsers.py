@@ -10,7 +10,7 @@ import itertools
 import logging
 import time
 from collections import defaultdict
-from collections.abc import Sequence
+from collections.abc import Mapping, Sequence
 from pathlib import Path
 
 import pytest
@@ -542,12 +542,17 @@ class TestAgentParser:
         monkeypatch.setattr(
             SectionStore,
             "load",
-            lambda self: {
+            lambda self, section_names=None: {
                 SectionName("persisted"): (42, 69, [["content"]]),
             },
         )
+        monkeypatch.setattr(
+            SectionStore,
+            "load_validity",
+            lambda self: {SectionName("persisted"): (42, 69)},
+        )
         # Patch IO:
-        monkeypatch.setattr(SectionStore, "store", lambda self, sections: None)
+        monkeypatch.setattr(SectionStore, "store", lambda self, sections, **kwargs: None)
 
         raw_data = AgentRawData(
             b"\n".join(
@@ -920,12 +925,17 @@ class TestSNMPParser:
         monkeypatch.setattr(
             SectionStore,
             "load",
-            lambda self: {
+            lambda self, section_names=None: {
                 SectionName("persisted"): (42, 69, [["content"]]),
             },
         )
+        monkeypatch.setattr(
+            SectionStore,
+            "load_validity",
+            lambda self: {SectionName("persisted"): (42, 69)},
+        )
         # Patch IO:
-        monkeypatch.setattr(SectionStore, "store", lambda self, sections: None)
+        monkeypatch.setattr(SectionStore, "store", lambda self, sections, **kwargs: None)
 
         raw_data = sections
 
@@ -938,15 +948,28 @@ class TestSNMPParser:
 
 
 class MockStore(SectionStore):
-    def __init__(self, path: str | Path, sections: object, *, logger: logging.Logger) -> None:
+    def __init__(
+        self, path: str | Path, sections: Mapping[SectionName, tuple], *, logger: logging.Logger
+    ) -> None:
         super().__init__(path, logger=logger)
         self._sections = sections
 
-    def store(self, sections):
-        self._sections = copy.copy(sections)
+    def store(self, sections, *, removed=None):
+        if removed is None:
+            self._sections = copy.copy(sections)
+        else:
+            self._sections = {
+                **{k: v for k, v in self._sections.items() if k not in removed},
+                **sections,
+            }
+
+    def load(self, section_names=None):
+        if section_names is None:
+            return copy.copy(self._sections)
+        return {name: self._sections[name] for name in section_names if name in self._sections}
 
-    def load(self):
-        return copy.copy(self._sections)
+    def load_validity(self):
+        return {name: entry[:2] for name, entry in self._sections.items()}
 
 
 class TestAgentPersistentSectionHandling:
@@ -1190,7 +1213,7 @@ class TestSNMPPersistedSectionHandling:
         parser = SNMPParser(
             HostName("testhost"),
             section_store,
-            check_intervals={},
+            check_intervals={SectionName("stored"): 60},
             host_check_interval=60,
             keep_outdated=True,
             logger=logger,
@@ -1232,7 +1255,7 @@ class TestSNMPPersistedSectionHandling:
         parser = SNMPParser(
             HostName("testhost"),
             section_store,
-            check_intervals={},
+            check_intervals={SectionName("stored"): 60},
             host_check_interval=60,
             keep_outdated=True,
             logger=logger,
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+# Copyright (C) 2024 Checkmk GmbH - License: GNU General Public License v2
+# This file is part of Checkmk (https://checkmk.com). It is subject to the terms and
+# conditions defined in the file COPYING, which is part of this source code package.
+
+# pylint: disable=protected-access
+
+import logging
+import multiprocessing
+import os
+from collections.abc import Iterable, Iterator, Sequence
+from pathlib import Path
+
+import pytest
+
+import cmk.ccc.store as _store
+
+from cmk.utils.sectionname import SectionName
+
+from cmk.checkengine.parser import SectionStore
+
+_Content = Sequence[Sequence[str]]
+
+
+@pytest.fixture(name="store")
+def fixture_store(tmp_path: Path) -> SectionStore[_Content]:
+    return SectionStore[_Content](tmp_path / "persisted" / "host", logger=logging.getLogger("test"))
+
+
+def _update(
+    store: SectionStore[_Content],
+    sections: dict[SectionName, _Content],
+    now: int,
+    interval: int,
+    section_names: Iterable[SectionName] | None = None,
+) -> dict[SectionName, _Content]:
+    cache_info: dict[SectionName, tuple[int, int]] = {}
+    return dict(
+        store.update(
+            sections,
+            cache_info,
+            lambda _name: (now, now + interval),
+            lambda valid_until, now: valid_until < now,
+            now=now,
+            keep_outdated=False,
+            section_names=section_names,
+        )
+    )
+
+
+def test_store_and_load(store: SectionStore[_Content]) -> None:
+    sections: dict[SectionName, tuple[int, int, _Content]] = {
+        SectionName("a"): (1, 2, [["a"]]),
+        SectionName("b"): (3, 4, [["b", "c"]]),
+    }
+    store.store(sections)
+
+    assert sorted(p.name for p in store.path.iterdir() if not p.name.startswith(".")) == ["a", "b"]
+    assert store.load() == sections
+    assert store.load_validity() == {SectionName("a"): (1, 2), SectionName("b"): (3, 4)}
+
+    store.store({SectionName("b"): (3, 4, [["b", "c"]])})
+    assert store.load() == {SectionName("b"): (3, 4, [["b", "c"]])}
+
+
+def test_only_changed_sections_are_written(
+    store: SectionStore[_Content], monkeypatch: pytest.MonkeyPatch
+) -> None:
+    _update(store, {SectionName(f"section{n}"): [[str(n)]] for n in range(50)}, 1000, 60)
+
+    written: list[SectionName] = []
+    write_section = SectionStore._write_section
+
+    def _write_section(
+        self: SectionStore[_Content], name: SectionName, entry: tuple[int, int, _Content]
+    ) -> bool:
+        if changed := write_section(self, name, entry):
+            written.append(name)
+        return changed
+
+    monkeypatch.setattr(SectionStore, "_write_section", _write_section)
+    result = _update(store, {SectionName("section7"): [["new"]]}, 1010, 60)
+
+    assert written == [SectionName("section7")]
+    assert result[SectionName("section7")] == [["new"]]
+    assert result[SectionName("section8")] == [["8"]]
+    assert len(store.load()) == 50
+
+
+def test_only_used_sections_are_loaded(
+    store: SectionStore[_Content], monkeypatch: pytest.MonkeyPatch
+) -> None:
+    _update(store, {SectionName("old"): [["old"]]}, 1000, 10)
+    _update(store, {SectionName(f"section{n}"): [[str(n)]] for n in range(3)}, 1005, 60)
+
+    loaded: list[SectionName] = []
+    read_sections = SectionStore._read_sections
+
+    def _read_sections(
+        self: SectionStore[_Content],
+        *,
+        with_content: bool,
+        section_names: Iterable[SectionName] | None = None,
+    ) -> Iterator[tuple[SectionName, tuple]]:
+        for name, entry in read_sections(
+            self, with_content=with_content, section_names=section_names
+        ):
+            if with_content:
+                loaded.append(name)
+            yield name, entry
+
+    monkeypatch.setattr(SectionStore, "_read_sections", _read_sections)
+    result = _update(store, {SectionName("section0"): [["new"]]}, 1020, 60)
+
+    assert sorted(loaded) == [SectionName("section1"), SectionName("section2")]
+    assert result == {
+        SectionName("section0"): [["new"]],
+        SectionName("section1"): [["1"]],
+        SectionName("section2"): [["2"]],
+    }
+
+
+def test_unneeded_sections_are_left_untouched(store: SectionStore[_Content]) -> None:
+    _update(store, {SectionName(f"section{n}"): [[str(n)]] for n in range(3)}, 1000, 60)
+    mtime = (store.path / "section2").stat().st_mtime_ns
+
+    result = _update(
+        store, {SectionName("section0"): [["new"]]}, 1010, 60, [SectionName("section1")]
+    )
+
+    assert result == {SectionName("section0"): [["new"]], SectionName("section1"): [["1"]]}
+    assert (store.path / "section2").stat().st_mtime_ns == mtime
+    assert store.load()[SectionName("section2")] == (1000, 1060, [["2"]])
+
+
+def test_store_compares_the_content(store: SectionStore[_Content]) -> None:
+    store.store({SectionName("a"): (1, 2, [["a"]])})
+    mtime = (store.path / "a").stat().st_mtime_ns
+
+    store.store({SectionName("a"): (1, 2, [["a"]])})
+    assert (store.path / "a").stat().st_mtime_ns == mtime
+
+    store.store({SectionName("a"): (1, 2, [["changed"]])})
+    assert store.load() == {SectionName("a"): (1, 2, [["changed"]])}
+
+
+def test_outdated_sections_are_removed(store: SectionStore[_Content]) -> None:
+    _update(store, {SectionName("old"): [["old"]]}, 1000, 60)
+    assert _update(store, {SectionName("new"): [["new"]]}, 2000, 60) == {
+        SectionName("new"): [["new"]]
+    }
+    assert list(store.load()) == [SectionName("new")]
+    assert not (store.path / "old").exists()
+
+
+def test_single_file_store_is_converted(store: SectionStore[_Content]) -> None:
+    store.path.parent.mkdir(parents=True)
+    _store.save_object_to_pickle_file(store.path, {"legacy": (1000, 1100, [["legacy"]])})
+    assert store.load() == {SectionName("legacy"): (1000, 1100, [["legacy"]])}
+    assert store.load_validity() == {SectionName("legacy"): (1000, 1100)}
+
+    result = _update(store, {SectionName("new"): [["new"]]}, 1010, 60)
+
+    assert result == {SectionName("legacy"): [["legacy"]], SectionName("new"): [["new"]]}
+    assert store.path.is_dir()
+    assert store.load_validity() == {
+        SectionName("legacy"): (1000, 1100),
+        SectionName("new"): (1010, 1070),
+    }
+
+
+def test_single_file_store_is_converted_under_the_lock(
+    store: SectionStore[_Content], monkeypatch: pytest.MonkeyPatch
+) -> None:
+    store.path.parent.mkdir(parents=True)
+    _store.save_object_to_pickle_file(store.path, {"legacy": (1000, 1100, [["legacy"]])})
+
+    locked: list[bool] = []
+    convert_single_file = SectionStore._convert_single_file
+
+    def _convert_single_file(self: SectionStore[_Content]) -> None:
+        locked.append(_store.have_lock(self.path.with_name(f"{self.path.name}.lock")))
+        convert_single_file(self)
+
+    monkeypatch.setattr(SectionStore, "_convert_single_file", _convert_single_file)
+    store.store(store.load())
+
+    assert locked == [True]
+    assert store.load_validity() == {SectionName("legacy"): (1000, 1100)}
+
+
+def test_nothing_is_created_without_sections(store: SectionStore[_Content]) -> None:
+    assert store.update({}, {}, lambda _name: None, lambda *_args: False, 0, False) == {}
+    assert not store.path.exists()
+
+
+def test_devnull_store() -> None:
+    store = SectionStore[_Content](os.devnull, logger=logging.getLogger("test"))
+    store.store({SectionName("a"): (1, 2, [["a"]])})
+    assert store.load() == {}
+    assert store.load_validity() == {}
+
+
+def _update_many(path: Path, worker: int) -> None:
+    store = SectionStore[_Content](path, logger=logging.getLogger("test"))
+    for n in range(20):
+        _update(store, {SectionName(f"worker{worker}_{n}"): [[str(n)]]}, 1000, 60)
+
+
+def test_concurrent_updates_are_not_lost(store: SectionStore[_Content]) -> None:
+    context = multiprocessing.get_context("fork")
+    processes = [
+        context.Process(target=_update_many, args=(store.path, worker)) for worker in range(3)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+    assert all(process.exitcode == 0 for process in processes)
+    assert len(store.load()) == 60
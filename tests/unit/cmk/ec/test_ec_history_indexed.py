@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+# Copyright (C) 2024 Checkmk GmbH - License: GNU General Public License v2
+# This file is part of Checkmk (https://checkmk.com). It is subject to the terms and
+# conditions defined in the file COPYING, which is part of this source code package.
+"""EC History file backend with segment indexes"""
+
+# pylint: disable=protected-access
+
+import logging
+from collections.abc import Iterable, Sequence
+from pathlib import Path
+
+import pytest
+
+from cmk.utils.hostaddress import HostName
+
+import cmk.ec.export as ec
+from cmk.ec.config import Config
+from cmk.ec.history import quote_tab
+from cmk.ec.history_file import FileHistory, index_dir
+from cmk.ec.history_indexed import _Segment, IndexedFileHistory
+from cmk.ec.main import StatusTableEvents, StatusTableHistory
+from cmk.ec.query import QueryGET, StatusTable
+
+_NOW = 1_700_000_000.0
+_DAY = 86400
+
+
+@pytest.fixture(name="history_indexed")
+def fixture_history_indexed(settings: ec.Settings, config: Config) -> IndexedFileHistory:
+    return IndexedFileHistory(
+        settings,
+        config | {"archive_mode": "indexed_file"},
+        logging.getLogger("cmk.mkeventd"),
+        StatusTableEvents.columns,
+        StatusTableHistory.columns,
+    )
+
+
+def _history_line(history_time: float, what: str, event: ec.Event) -> bytes:
+    """The same format as written by FileHistory.add()"""
+    columns = [quote_tab(str(history_time)), quote_tab(what), b"", b""]
+    columns += [quote_tab(event.get(name[6:], default)) for name, default in StatusTableEvents.columns]
+    return b"\t".join(columns) + b"\n"
+
+
+def _write_logs(history_dir: Path, num_days: int, events_per_day: int) -> None:
+    history_dir.mkdir(parents=True, exist_ok=True)
+    event_id = 0
+    for day in range(num_days):
+        period = int(_NOW) - (num_days - day) * _DAY
+        lines = []
+        for num in range(events_per_day):
+            event_id += 1
+            event = ec.Event(
+                id=event_id,
+                host=HostName(f"host{event_id % 50}"),
+                core_host=HostName(f"host{event_id % 50}") if event_id % 3 else None,
+                application=f"app{event_id % 7}",
+                rule_id=f"rule{event_id % 11}",
+                text=f"Message number {event_id}",
+                first=period + num,
+                last=period + num,
+                contact_groups=("admins",) if event_id % 2 else None,
+            )
+            lines.append(_history_line(period + num, "NEW", event))
+            if event_id % 4 == 0:
+                lines.append(_history_line(period + num + 0.5, "DELETE", event))
+        (history_dir / f"{period}.log").write_bytes(b"".join(lines))
+
+
+def _query(history: FileHistory, *headers: str) -> QueryGET:
+    logger = logging.getLogger("cmk.mkeventd")
+
+    def get_table(name: str) -> StatusTable:
+        assert name == "history"
+        return StatusTableHistory(logger, history)
+
+    return QueryGET(get_table, ["GET history", *headers], logger)
+
+
+def _get(history: FileHistory, *headers: str) -> list[Sequence[object]]:
+    return list(history.get(_query(history, *headers)))
+
+
+@pytest.mark.parametrize(
+    "headers",
+    [
+        (),
+        ("Filter: event_host = host7",),
+        ("Filter: event_host ~ host1[0-9]",),
+        ("Filter: event_host in host1 host2 unknown",),
+        ("Filter: event_id = 42",),
+        ("Filter: event_id in 4 5 6 1000",),
+        ("Filter: event_id > 290",),
+        ("Filter: history_what = DELETE", "Filter: event_application = app3"),
+        ("Filter: event_core_host = ", "Filter: event_host = host9"),
+        ("Filter: event_rule_id = rule4", "Filter: event_text ~ number 1"),
+        (f"Filter: history_time >= {_NOW - 2 * _DAY}", "Filter: event_host = host3"),
+        (f"Filter: history_time < {_NOW - 4 * _DAY}",),
+        ("Filter: event_host = nothere",),
+    ],
+)
+def test_same_result_as_file_history(
+    history: FileHistory, history_indexed: IndexedFileHistory, headers: Sequence[str]
+) -> None:
+    _write_logs(history_indexed._settings.paths.history_dir.value, 5, 60)
+    expected = _get(history, *headers)
+    assert _get(history_indexed, *headers) == expected
+    # and again with the indexes built by the previous query
+    assert _get(history_indexed, *headers) == expected
+
+
+def test_limit_returns_newest_entries_first(
+    history: FileHistory, history_indexed: IndexedFileHistory
+) -> None:
+    _write_logs(history_indexed._settings.paths.history_dir.value, 3, 10)
+    rows = _get(history_indexed, "Filter: event_host ~ host", "Limit: 5")
+    assert rows == _get(history, "Filter: event_host ~ host")[:5]
+
+
+def test_index_follows_appended_entries(history_indexed: IndexedFileHistory) -> None:
+    history_indexed.add(ec.Event(id=1, host=HostName("host1"), text="first"), "NEW")
+    assert [row[7] for row in _get(history_indexed, "Filter: event_host = host1")] == ["first"]
+
+    history_indexed.add(ec.Event(id=2, host=HostName("host1"), text="second"), "NEW")
+    history_indexed.add(ec.Event(id=3, host=HostName("host2"), text="other"), "NEW")
+    assert [row[7] for row in _get(history_indexed, "Filter: event_host = host1")] == [
+        "second",
+        "first",
+    ]
+    assert [row[0] for row in _get(history_indexed, "Filter: event_id = 3")] == [3]
+
+
+def test_index_is_persisted(
+    settings: ec.Settings, config: Config, history_indexed: IndexedFileHistory
+) -> None:
+    history_dir = history_indexed._settings.paths.history_dir.value
+    _write_logs(history_dir, 2, 20)
+    expected = _get(history_indexed, "Filter: event_host = host5")
+    assert sorted(p.name for p in history_dir.glob("*.idx")) == sorted(
+        index_dir(p).name for p in history_dir.glob("*.log")
+    )
+
+    reloaded = IndexedFileHistory(
+        settings,
+        config,
+        logging.getLogger("cmk.mkeventd"),
+        StatusTableEvents.columns,
+        StatusTableHistory.columns,
+    )
+    assert _get(reloaded, "Filter: event_host = host5") == expected
+
+
+def test_index_is_rebuilt_for_replaced_log_file(history_indexed: IndexedFileHistory) -> None:
+    history_dir = history_indexed._settings.paths.history_dir.value
+    _write_logs(history_dir, 1, 20)
+    assert len(_get(history_indexed, "Filter: event_host = host5")) == 1
+
+    (log_file,) = history_dir.glob("*.log")
+    log_file.write_bytes(_history_line(_NOW, "NEW", ec.Event(id=1, host=HostName("host5"), text="new")))
+    assert [row[7] for row in _get(history_indexed, "Filter: event_host = host5")] == ["new"]
+
+
+def test_incomplete_last_line_is_not_indexed(history_indexed: IndexedFileHistory) -> None:
+    history_dir = history_indexed._settings.paths.history_dir.value
+    history_dir.mkdir(parents=True, exist_ok=True)
+    line = _history_line(_NOW, "NEW", ec.Event(id=1, host=HostName("host1"), text="complete"))
+    log_file = history_dir / f"{int(_NOW)}.log"
+    log_file.write_bytes(line + line[:20])
+    assert len(_get(history_indexed)) == 1
+
+    with log_file.open("ab") as f:
+        f.write(line[20:])
+    assert [row[0] for row in _get(history_indexed)] == [2, 1]
+
+
+def test_expiry_removes_index(history_indexed: IndexedFileHistory) -> None:
+    history_dir = history_indexed._settings.paths.history_dir.value
+    _write_logs(history_dir, 2, 5)
+    _get(history_indexed)
+    assert list(history_dir.glob("*.idx"))
+
+    history_indexed.flush()
+    assert not list(history_dir.glob("*.log"))
+    assert not list(history_dir.glob("*.idx"))
+    assert _get(history_indexed) == []
+
+
+def test_indexed_history_reads_only_matching_lines(
+    history: FileHistory, history_indexed: IndexedFileHistory, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    _write_logs(history_indexed._settings.paths.history_dir.value, 30, 500)
+    headers = ("Filter: event_host = host17", f"Filter: history_time >= {_NOW - 10 * _DAY}")
+    expected = _get(history, *headers)
+
+    read_lines: dict[Path, int] = {}
+    read_rows = IndexedFileHistory._read_rows
+
+    def _read_rows(
+        self: IndexedFileHistory,
+        path: Path,
+        segment: _Segment,
+        rows: Iterable[int],
+        query: QueryGET,
+        limit: int | None,
+    ) -> list[Sequence[object]]:
+        rows = list(rows)
+        read_lines[path] = len(rows)
+        return read_rows(self, path, segment, rows, query, limit)
+
+    monkeypatch.setattr(IndexedFileHistory, "_read_rows", _read_rows)
+
+    assert _get(history_indexed, *headers) == expected
+    # Only the log files of the last ten days, and in them only the lines of the host
+    assert len(read_lines) == 10
+    assert sum(read_lines.values()) == len(expected)
@@ -6,15 +6,24 @@
 
 import logging
 import sqlite3
-from collections.abc import Iterator
+import threading
+import time
+from collections.abc import Iterator, Sequence
 
 import pytest
 
 from cmk.utils.hostaddress import HostName
 
 import cmk.ec.export as ec
-from cmk.ec.history_sqlite import filters_to_sqlite_query, SQLiteHistory
-from cmk.ec.main import StatusTableHistory
+from cmk.ec.config import Config
+from cmk.ec.history_sqlite import (
+    BackgroundWriter,
+    filters_to_sqlite_query,
+    SQLiteHistory,
+    SQLiteSettings,
+)
+from cmk.ec.main import StatusTableEvents, StatusTableHistory
+from cmk.ec.perfcounters import Perfcounters
 from cmk.ec.query import QueryFilter, QueryGET, StatusTable
 
 
@@ -218,3 +227,126 @@ def test_housekeeping(history_sqlite: SQLiteHistory) -> None:
         history_sqlite.housekeeping()
         cur.execute("SELECT count(*) FROM history;")
         assert cur.fetchone()["count(*)"] == 1
+
+
+@pytest.fixture(name="history_sqlite_async")
+def fixture_history_sqlite_async(
+    settings: ec.Settings, config: Config, perfcounters: Perfcounters
+) -> SQLiteHistory:
+    return SQLiteHistory(
+        SQLiteSettings.from_settings(
+            settings, database=settings.paths.history_dir.value / "history.sqlite"
+        ),
+        config | {"archive_mode": "sqlite", "sqlite_async_writes": True},
+        logging.getLogger("cmk.mkeventd"),
+        StatusTableEvents.columns,
+        StatusTableHistory.columns,
+        perfcounters,
+    )
+
+
+def _get_texts(history: SQLiteHistory) -> list[str]:
+    logger = logging.getLogger("cmk.mkeventd")
+
+    def get_table(name: str) -> StatusTable:
+        assert name == "history"
+        return StatusTableHistory(logger, history)
+
+    rows = history.get(QueryGET(get_table, ["GET history"], logger))
+    return [row["text"] for row in rows]  # type: ignore[call-overload]
+
+
+def test_async_writes_are_visible_in_get(history_sqlite_async: SQLiteHistory) -> None:
+    for n in range(50):
+        history_sqlite_async.add(ec.Event(host=HostName("host"), text=f"text {n}"), "NEW")
+    assert _get_texts(history_sqlite_async) == [f"text {n}" for n in range(50)]
+
+    history_sqlite_async.flush()
+    assert _get_texts(history_sqlite_async) == []
+    history_sqlite_async.close()
+
+
+def test_async_writes_are_persisted_on_close(
+    history_sqlite_async: SQLiteHistory, perfcounters: Perfcounters
+) -> None:
+    for n in range(20):
+        history_sqlite_async.add(ec.Event(host=HostName("host"), text=f"text {n}"), "NEW")
+    history_sqlite_async.close()
+
+    database = history_sqlite_async._settings.database
+    assert database != ":memory:"
+    with sqlite3.connect(database) as connection:
+        assert connection.execute("SELECT count(*) FROM history;").fetchone() == (20,)
+    assert perfcounters._gauges["history_buffer_fill"] == 0
+    assert perfcounters._times["history_commit"] > 0
+
+
+class _SlowWriter:
+    def __init__(self, delay: float) -> None:
+        self.delay = delay
+        self.batches: list[list[int]] = []
+        self.release = threading.Event()
+        self.release.set()
+
+    def __call__(self, batch: Sequence[Sequence[object]]) -> None:
+        self.release.wait()
+        time.sleep(self.delay)
+        self.batches.append([entry[0] for entry in batch])  # type: ignore[misc]
+
+
+def test_background_writer_batches_and_drains(perfcounters: Perfcounters) -> None:
+    write = _SlowWriter(delay=0.0)
+    write.release.clear()
+    writer = BackgroundWriter(
+        write,
+        lambda: None,
+        logging.getLogger("cmk.mkeventd"),
+        perfcounters,
+        buffer_size=1000,
+        batch_size=10,
+    )
+    # Adding does not wait for the writer, which is stuck with its first batch
+    for n in range(200):
+        writer.add((n,))
+    assert perfcounters._gauges["history_buffer_fill"] >= 190
+
+    write.release.set()
+    writer.stop()
+
+    assert [n for batch in write.batches for n in batch] == list(range(200))
+    assert all(len(batch) <= 10 for batch in write.batches)
+    assert len(write.batches) <= 21  # The first batch, then the full ones
+    assert perfcounters._gauges["history_buffer_fill"] == 0
+
+
+def test_background_writer_blocks_when_full(perfcounters: Perfcounters) -> None:
+    write = _SlowWriter(delay=0.0)
+    write.release.clear()
+    writer = BackgroundWriter(
+        write,
+        lambda: None,
+        logging.getLogger("cmk.mkeventd"),
+        perfcounters,
+        buffer_size=5,
+        batch_size=1,
+    )
+    for n in range(5):
+        writer.add((n,))
+
+    added = threading.Event()
+
+    def add_one_more() -> None:
+        writer.add((5,))
+        writer.add((6,))
+        added.set()
+
+    threading.Thread(target=add_one_more).start()
+    # The writer is stuck with the first entry, so the buffer stays full
+    assert not added.wait(0.1)
+    assert perfcounters._gauges["history_buffer_fill"] <= 5
+
+    write.release.set()
+    assert added.wait(5)
+    writer.flush()
+    writer.stop()
+    assert [n for batch in write.batches for n in batch] == list(range(7))
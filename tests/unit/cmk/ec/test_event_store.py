@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+# Copyright (C) 2024 Checkmk GmbH - License: GNU General Public License v2
+# This file is part of Checkmk (https://checkmk.com). It is subject to the terms and
+# conditions defined in the file COPYING, which is part of this source code package.
+
+from typing import cast
+
+import pytest
+
+from tests.unit.cmk.ec.helpers import new_event
+
+from cmk.utils.hostaddress import HostName
+
+from cmk.ec.event import Event
+from cmk.ec.event_store import EventStore
+from cmk.ec.main import EventStatus, PackedEventStatus
+
+
+def _event(event_id: int, rule_id: str = "815", host: str = "test-host") -> Event:
+    event = new_event(Event(rule_id=rule_id, host=HostName(host), core_host=HostName(host)))
+    event["id"] = event_id
+    return event
+
+
+def test_insertion_order_is_kept() -> None:
+    store = EventStore(_event(i) for i in (3, 1, 2))
+    assert [e["id"] for e in store] == [3, 1, 2]
+    assert store.oldest() is store.get(3)
+
+
+def test_lookup_by_index() -> None:
+    events = [
+        _event(1, rule_id="a", host="h1"),
+        _event(2, rule_id="b", host="h1"),
+        _event(3, rule_id="a", host="h2"),
+    ]
+    store = EventStore(events)
+
+    assert store.by_rule("a") == [events[0], events[2]]
+    assert store.by_host("h1") == [events[0], events[1]]
+    assert store.by_core_host(HostName("h2")) == [events[2]]
+    assert store.by_phase("open") == events
+    assert store.oldest_by_rule("b") is events[1]
+    assert store.oldest_by_host("h2") is events[2]
+    assert store.oldest_by_rule("unknown") is None
+    assert store.by_host("unknown") == []
+
+
+def test_remove() -> None:
+    events = [_event(1), _event(2)]
+    store = EventStore(events)
+
+    store.remove(events[0])
+
+    assert len(store) == 1
+    assert events[0] not in store
+    assert store.get(1) is None
+    assert store.oldest() is events[1]
+    assert store.by_rule("815") == [events[1]]
+    with pytest.raises(KeyError):
+        store.remove(events[0])
+
+
+def test_remove_uses_identity_not_equality() -> None:
+    store = EventStore([_event(1)])
+    with pytest.raises(KeyError):
+        store.remove(_event(1))
+    assert len(store) == 1
+
+
+def test_add_duplicate_id() -> None:
+    store = EventStore([_event(1)])
+    with pytest.raises(ValueError):
+        store.add(_event(1))
+
+
+def test_reindex_keeps_insertion_order() -> None:
+    events = [_event(1), _event(2), _event(3)]
+    store = EventStore(events)
+
+    events[0]["phase"] = "ack"
+    store.reindex(events[0])
+    events[2]["phase"] = "ack"
+    store.reindex(events[2])
+    assert store.by_phase("ack") == [events[0], events[2]]
+
+    events[1]["phase"] = "ack"
+    store.reindex(events[1])
+    assert store.by_phase("ack") == events
+    assert store.by_phase("open") == []
+    assert store.by_rule_and_phase("815", "ack") == events
+
+
+def test_reindex_host() -> None:
+    events = [_event(1, host="h1"), _event(2, host="h2")]
+    store = EventStore(events)
+
+    events[1]["host"] = HostName("h1")
+    store.reindex(events[1])
+
+    assert store.by_host("h1") == events
+    assert store.oldest_by_host("h2") is None
+
+
+class _CountingEvent(dict):
+    """An event counting how often its fields are read"""
+
+    reads = 0
+
+    def __getitem__(self, key):  # type: ignore[no-untyped-def]
+        _CountingEvent.reads += 1
+        return super().__getitem__(key)
+
+    def get(self, key, default=None):  # type: ignore[no-untyped-def]
+        _CountingEvent.reads += 1
+        return super().get(key, default)
+
+
+def _fill_event_status(event_status: EventStatus, num_events: int) -> None:
+    event_status.unpack_status(
+        PackedEventStatus(
+            next_event_id=num_events + 1,
+            events=[
+                cast(Event, _CountingEvent(_event(num + 1, f"rule-{num % 100}", f"host-{num}")))
+                for num in range(num_events)
+            ],
+            rule_stats={},
+            interval_starts={},
+        )
+    )
+
+
+def _reads_of_events(event_status: EventStatus, num_events: int) -> int:
+    _fill_event_status(event_status, num_events)
+    _CountingEvent.reads = 0
+    for num in range(250):
+        event_status.remove_oldest_event("by_rule", Event(rule_id=f"rule-{num % 100}"))
+        event_status.remove_oldest_event("by_host", Event(host=HostName(f"host-{2 * num + 1}")))
+        event_status.event(num_events - num)
+    return _CountingEvent.reads
+
+
+def test_event_status_per_event_cost_is_flat(event_status: EventStatus) -> None:
+    # With linear scans the fields of all events would be read
+    assert _reads_of_events(event_status, 1_000) == _reads_of_events(event_status, 50_000)
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+# Copyright (C) 2024 Checkmk GmbH - License: GNU General Public License v2
+# This file is part of Checkmk (https://checkmk.com). It is subject to the terms and
+# conditions defined in the file COPYING, which is part of this source code package.
+
+# pylint: disable=protected-access
+
+import logging
+import random
+import socket
+import threading
+import time
+from collections.abc import Iterator, Sequence
+
+import pytest
+
+from tests.unit.cmk.ec.helpers import FakeStatusSocket
+
+from cmk.ec.event import create_event_from_syslog_message, Event
+from cmk.ec.ingestion import IngestionPipeline, Message, receive_datagrams
+from cmk.ec.main import EventServer, StatusServer
+from cmk.ec.perfcounters import Perfcounters
+
+
+def _parse_slowly(messages: Sequence[Message]) -> list[Event]:
+    time.sleep(random.uniform(0, 0.002))  # let the workers finish out of order
+    return [create_event_from_syslog_message(m, a, None) for m, a in messages]
+
+
+class _Collector:
+    def __init__(self, delay: float = 0.0) -> None:
+        self.texts: list[str] = []
+        self.delay = delay
+        self.release = threading.Event()
+        self.release.set()
+
+    def __call__(self, events: Sequence[Event]) -> None:
+        self.release.wait()
+        time.sleep(self.delay)
+        self.texts.extend(e["text"] for e in events)
+
+
+def _pipeline(
+    perfcounters: Perfcounters, collector: _Collector, max_queued_messages: int = 1000
+) -> IngestionPipeline:
+    return IngestionPipeline(
+        logging.getLogger("cmk.mkeventd"),
+        perfcounters,
+        _parse_slowly,
+        collector,
+        num_workers=4,
+        max_queued_messages=max_queued_messages,
+    )
+
+
+def test_pipeline_keeps_submission_order(perfcounters: Perfcounters) -> None:
+    collector = _Collector()
+    pipeline = _pipeline(perfcounters, collector)
+    pipeline.start()
+    expected: list[str] = []
+    for batch in range(50):
+        messages = [f"message {batch}/{n}".encode() for n in range(batch % 7)]
+        expected.extend(m.decode() for m in messages)
+        pipeline.submit([(m, ("10.0.0.1", 514)) for m in messages], may_drop=False)
+    pipeline.stop()
+
+    assert collector.texts == expected
+    assert pipeline.queue_depth == 0
+    assert 0 < pipeline.max_queue_depth <= 1000
+
+
+def test_pipeline_drops_only_when_allowed(perfcounters: Perfcounters) -> None:
+    collector = _Collector()
+    collector.release.clear()  # block the processing
+    pipeline = _pipeline(perfcounters, collector, max_queued_messages=10)
+    pipeline.start()
+
+    assert pipeline.submit([(b"first", None)] * 8, may_drop=True)
+    assert not pipeline.submit([(b"dropped", None)] * 3, may_drop=True)
+    assert pipeline.queue_depth == 8
+    assert perfcounters._counters["ingest_drops"] == 3
+
+    def release_later() -> None:
+        time.sleep(0.05)
+        collector.release.set()
+
+    threading.Thread(target=release_later).start()
+    # Waits for the processing instead of dropping
+    assert pipeline.submit([(b"second", None)] * 3, may_drop=False)
+    pipeline.stop()
+
+    assert collector.texts == ["first"] * 8 + ["second"] * 3
+    assert perfcounters._counters["ingest_drops"] == 3
+
+
+def test_pipeline_accepts_oversized_batch_when_empty(perfcounters: Perfcounters) -> None:
+    collector = _Collector()
+    pipeline = _pipeline(perfcounters, collector, max_queued_messages=2)
+    pipeline.start()
+    assert pipeline.submit([(b"big", None)] * 5, may_drop=True)
+    pipeline.stop()
+    assert collector.texts == ["big"] * 5
+
+
+def test_pipeline_decouples_receiving_from_processing(perfcounters: Perfcounters) -> None:
+    collector = _Collector(delay=0.01)
+    pipeline = _pipeline(perfcounters, collector)
+    pipeline.start()
+    before = time.perf_counter()
+    for n in range(20):
+        pipeline.submit([(b"message %d" % n, None)], may_drop=True)
+    submitted = time.perf_counter() - before
+    pipeline.stop()
+
+    # Inline processing would take at least 20 * 10ms
+    assert submitted < 0.1
+    assert len(collector.texts) == 20
+
+
+@pytest.fixture(name="datagram_sockets")
+def fixture_datagram_sockets() -> Iterator[tuple[socket.socket, socket.socket]]:
+    sender, receiver = socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM)
+    yield sender, receiver
+    sender.close()
+    receiver.close()
+
+
+def test_receive_datagrams(datagram_sockets: tuple[socket.socket, socket.socket]) -> None:
+    sender, receiver = datagram_sockets
+    for n in range(5):
+        sender.send(b"datagram %d" % n)
+
+    assert [d for d, _a in receive_datagrams(receiver, 3, 4096)] == [
+        b"datagram 0",
+        b"datagram 1",
+        b"datagram 2",
+    ]
+    assert [d for d, _a in receive_datagrams(receiver, 3, 4096)] == [
+        b"datagram 3",
+        b"datagram 4",
+    ]
+
+
+def test_ingestion_status_columns(event_server: EventServer, status_server: StatusServer) -> None:
+    assert len(event_server.status_columns()) == len(list(event_server.get_status())[0])
+
+    s = FakeStatusSocket(
+        b"GET status\nColumns: status_ingest_queue_depth status_ingest_queue_max_depth "
+        b"status_ingest_drops\n"
+    )
+    status_server.handle_client(s, True, "127.0.0.1")
+    assert s.get_response() == [
+        ["status_ingest_queue_depth", "status_ingest_queue_max_depth", "status_ingest_drops"],
+        [0, 0, 0],
+    ]
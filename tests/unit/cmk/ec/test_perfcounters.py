@@ -115,6 +115,8 @@ def test_perfcounters_correct_status_values() -> None:
     for _x in range(2):
         c.count("rule_tries")
 
+    c.set_gauge("history_buffer_fill", 7)
+
     for column_name, column_value in zip([n for n, _d in c.status_columns()], c.get_status()):
         if column_name.startswith("status_average_") and column_name.endswith("_time"):
             counter_name = column_name.split("_")[-2]
@@ -128,6 +130,9 @@ def test_perfcounters_correct_status_values() -> None:
             counter_name = column_name.split("_")[-2]
             assert column_value == c._rates.get(counter_name, 0.0)
 
+        elif column_name.removeprefix("status_") in c._gauges:
+            assert column_value == c._gauges[column_name.removeprefix("status_")]
+
         elif column_name.startswith("status_"):
             counter_name = "_".join(column_name.split("_")[1:])
             assert column_value == c._counters[counter_name], "Invalid value {!r}: {!r}".format(
@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+# Copyright (C) 2024 Checkmk GmbH - License: GNU General Public License v2
+# This file is part of Checkmk (https://checkmk.com). It is subject to the terms and
+# conditions defined in the file COPYING, which is part of this source code package.
+
+# pylint: disable=protected-access
+
+import logging
+import re
+from collections.abc import Sequence
+
+import pytest
+
+from tests.unit.cmk.ec.helpers import new_event
+
+from livestatus import SiteId
+
+from cmk.utils.hostaddress import HostName
+
+import cmk.ec.export as ec
+import cmk.ec.rule_prefilter as rule_prefilter
+from cmk.ec.config import Config, Rule, ServiceLevel, TextPattern
+from cmk.ec.event import Event
+from cmk.ec.main import create_history, EventServer, StatusTableEvents, StatusTableHistory
+from cmk.ec.perfcounters import Perfcounters
+from cmk.ec.rule_matcher import compile_rule, MatchSuccess, RuleMatcher
+from cmk.ec.rule_prefilter import LiteralMatcher, normalize_text, required_literals, RulePrefilter
+
+
+@pytest.mark.parametrize(
+    "pattern, expected",
+    [
+        ("link down", {"link down"}),
+        ("störung am gerät", {"rung am ger"}),
+        ("ab", None),
+        (re.compile("foo.*bar", re.I), {"foo"}),
+        (re.compile("Interface (Gi|Te)[0-9/]+ state (up|down)", re.I), {"interface "}),
+        (re.compile("(connection refused|timed out)", re.I), {"connection refused", "timed out"}),
+        (re.compile("(refused|to)", re.I), None),
+        (re.compile("(?:kernel: )+oops", re.I), {"kernel: "}),
+        (re.compile("(kernel: )*oops", re.I), {"oops"}),
+        (re.compile("^[a-z]+$", re.I), None),
+        (re.compile("(?P<user>[a-z]+) logged in", re.I), {" logged in"}),
+    ],
+)
+def test_required_literals(pattern: TextPattern, expected: set[str] | None) -> None:
+    assert required_literals(pattern) == (None if expected is None else frozenset(expected))
+
+
+def test_required_literals_without_regex_parser(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(rule_prefilter, "_parser", None)
+    assert required_literals(re.compile("link down", re.I)) is None
+    assert required_literals("link down") == frozenset({"link down"})
+
+
+def test_required_literals_with_failing_regex_parser(monkeypatch: pytest.MonkeyPatch) -> None:
+    def parse(pattern: str, flags: int) -> object:
+        raise AttributeError("changed internals")
+
+    monkeypatch.setattr(rule_prefilter._parser, "parse", parse)  # type: ignore[attr-defined]
+    assert required_literals(re.compile("link down", re.I)) is None
+    assert RulePrefilter([_rule("1", match=re.compile("link down", re.I))]).num_indexed_rules == 0
+
+
+@pytest.mark.parametrize(
+    "text",
+    ["ſession opened", "SESSION OPENED", "SEſSİON OPENED", "ſeſſıon opened"],
+)
+def test_normalize_text_like_ignorecase(text: str) -> None:
+    pattern = re.compile("session opened", re.I)
+    assert pattern.search(text)
+    requirement = required_literals(pattern)
+    assert requirement is not None
+    assert any(literal in normalize_text(text) for literal in requirement)
+
+
+def test_literal_matcher_overlapping() -> None:
+    matcher = LiteralMatcher({"she": [1], "he": [2], "hers": [3], "his": [4], "ushe": [5]})
+    assert matcher.find("ushers") == {1, 2, 3, 5}
+    assert matcher.find("this") == {4}
+    assert matcher.find("") == set()
+    assert LiteralMatcher({}).find("anything") == set()
+
+
+def _rule(rule_id: str, pack: str = "default", **kwargs: object) -> Rule:
+    rule = Rule(
+        actions=[],
+        autodelete=False,
+        disabled=False,
+        id=rule_id,
+        pack=pack,
+        sl=ServiceLevel(precedence="message", value=0),
+        state=-1,
+        drop=True,
+    )
+    rule.update(kwargs)  # type: ignore[typeddict-item]
+    return rule
+
+
+def _compiled(rule: Rule) -> Rule:
+    compile_rule(rule)
+    return rule
+
+
+_CORPUS = [
+    "Accepted publickey for root from 10.1.2.3 port 52416 ssh2",
+    "Failed password for invalid user admin from 10.9.8.7 port 2222 ssh2",
+    "pam_unix(cron:session): session opened for user root by (uid=0)",
+    "pam_unix(cron:ſession): ſession closed for user root",
+    "Interface GigabitEthernet0/1, changed state to down",
+    "Interface GigabitEthernet0/1, changed state to up",
+    "kernel: EXT4-fs error (device sda1): ext4_find_entry:1455: inode #2",
+    "kernel: Out of memory: Killed process 4711 (java)",
+    "postfix/smtp[123]: connect to mx.example.com[1.2.3.4]:25: Connection refused",
+    "DROP IN=eth0 OUT= SRC=192.168.1.17 DST=192.168.1.1 PROTO=TCP DPT=23",
+    "Störung am Gerät 17 behoben",
+    "CPU temperature above threshold, cpu clock throttled",
+    "",
+]
+
+
+def _events() -> list[Event]:
+    return [
+        new_event(
+            Event(
+                text=text,
+                host=HostName(host),
+                application=application,
+                core_host=HostName(host),
+                priority=priority,
+            )
+        )
+        for text in _CORPUS
+        for host in ("switch01", "Switch02", "web01")
+        for application in ("", "sshd", "CRON", "kernel")
+        for priority in (2, 6)
+    ]
+
+
+def _rules() -> list[Rule]:
+    rules = [
+        _rule("plain", match="session opened"),
+        _rule("regex", match="(Failed|Accepted) (password|publickey) for"),
+        _rule("cancel", match="changed state to down", match_ok="changed state to up"),
+        _rule("host", match_host="switch02", match="changed state"),
+        _rule("host-regex", match_host="switch0[0-9]", match="changed state"),
+        _rule("app", match_application="cron", match=".*session closed"),
+        _rule("app-cancel", match_application="cro", cancel_application="sshd"),
+        _rule("inverted", match="Connection refused", invert_matching=True),
+        _rule("umlaut", match="störung"),
+        _rule("prio", match="throttled", match_priority=(0, 3)),
+        _rule("no-literal", match="^[A-Z]+ "),
+        _rule("unconditional"),
+    ]
+    return [_compiled(rule) for rule in rules]
+
+
+def _matching_rules(matcher: RuleMatcher, rules: Sequence[Rule], event: Event) -> list[Rule]:
+    return [r for r in rules if isinstance(matcher.event_rule_matches(r, event), MatchSuccess)]
+
+
+def test_prefilter_never_drops_matching_rules() -> None:
+    matcher = RuleMatcher(None, SiteId("heute"), lambda _tp: True)
+    rules = _rules()
+    prefilter = RulePrefilter(rules)
+    assert prefilter.num_indexed_rules == 9
+
+    for event in _events():
+        selected = prefilter.select(rules, event)
+        assert [r for r in rules if r in selected] == selected  # order is kept
+        assert _matching_rules(matcher, rules, event) == _matching_rules(matcher, selected, event)
+
+
+def test_prefilter_selects_by_host_and_application() -> None:
+    rules = _rules()
+    prefilter = RulePrefilter(rules)
+
+    event = new_event(Event(text="link changed state", host=HostName("SWITCH02"), application=""))
+    assert [r["id"] for r in prefilter.select(rules, event)] == [
+        "host",
+        "host-regex",
+        "inverted",
+        "no-literal",
+        "unconditional",
+    ]
+
+    event = new_event(Event(text="nothing", host=HostName("web01"), application="crond"))
+    assert [r["id"] for r in prefilter.select(rules, event)] == [
+        "app-cancel",
+        "inverted",
+        "no-literal",
+        "unconditional",
+    ]
+
+
+def _syslog_rule_packs(num_packs: int, rules_per_pack: int) -> list[ec.ECRulePackSpec]:
+    return [
+        ec.ECRulePackSpec(
+            id=f"pack{p}",
+            title=f"Pack {p}",
+            disabled=False,
+            rules=[
+                _rule(
+                    f"pack{p}-rule{r}",
+                    pack=f"pack{p}",
+                    match=f"(link|interface) eth{p}/{r} (is )?(down|flapping)",
+                    match_ok=f"eth{p}/{r} (is )?up",
+                )
+                if r % 2
+                else _rule(
+                    f"pack{p}-rule{r}",
+                    pack=f"pack{p}",
+                    match_application=f"daemon{p}x{r}",
+                    match=r"error code [0-9]+",
+                )
+                for r in range(rules_per_pack)
+            ]
+            + [_rule(f"pack{p}-catch-all", pack=f"pack{p}", match="^catch all")],
+        )
+        for p in range(num_packs)
+    ]
+
+
+def _syslog_corpus(num_packs: int, rules_per_pack: int) -> list[Event]:
+    events = []
+    for n in range(300):
+        p, r = n % num_packs, (7 * n) % rules_per_pack
+        text, application = [
+            (f"Link eth{p}/{r} is down", "kernel"),
+            (f"interface eth{p}/{r} up", "kernel"),
+            ("Error code 17 while writing", f"daemon{p}x{r}"),
+            ("catch all the things", "anything"),
+            ("nothing matches this message at all", "cron"),
+        ][n % 5]
+        events.append(
+            new_event(
+                Event(
+                    text=text,
+                    application=application,
+                    host=HostName(f"host{n}"),
+                    core_host=HostName(f"host{n}"),
+                )
+            )
+        )
+    return events
+
+
+def _process_corpus(
+    event_server: EventServer, settings: ec.Settings, config: Config, events: Sequence[Event]
+) -> None:
+    history = create_history(
+        settings,
+        config,
+        logging.getLogger("cmk.mkeventd"),
+        StatusTableEvents.columns,
+        StatusTableHistory.columns,
+    )
+    event_server.reload_configuration(config, history=history)
+    for event in events:
+        event_server.process_potential_event(event.copy())
+
+
+def test_prefilter_on_syslog_corpus(
+    event_server: EventServer, settings: ec.Settings, config: Config, perfcounters: Perfcounters
+) -> None:
+    config = config | {"rule_packs": _syslog_rule_packs(10, 60)}
+    events = _syslog_corpus(10, 60)
+
+    _process_corpus(event_server, settings, config | {"rule_optimizer": False}, events)
+    counters_without = perfcounters._counters.copy()
+    rule_stats_without = list(event_server._event_status.get_rule_stats())
+    event_server._event_status.reset_counters(None)
+
+    _process_corpus(event_server, settings, config, events)
+    counters_with = {k: v - counters_without[k] for k, v in perfcounters._counters.items()}
+    rule_stats_with = list(event_server._event_status.get_rule_stats())
+
+    assert rule_stats_with == rule_stats_without  # same first matches
+    assert counters_with["rule_hits"] == counters_without["rule_hits"]
+    assert counters_with["drops"] == counters_without["drops"]
+    assert counters_without["prefilter_skips"] == 0
+    assert counters_with["prefilter_skips"] > 0
+    assert counters_with["rule_tries"] * 10 < counters_without["rule_tries"]
+    assert perfcounters._times["rule_matching"] > 0
@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+# Copyright (C) 2024 Checkmk GmbH - License: GNU General Public License v2
+# This file is part of Checkmk (https://checkmk.com). It is subject to the terms and
+# conditions defined in the file COPYING, which is part of this source code package.
+"""A stand-in for an SNMP agent, serving a stored walk on a local UDP port"""
+
+import bisect
+import hmac
+import logging
+import re
+import socket
+import threading
+import time
+from pathlib import Path
+from types import TracebackType
+
+from cmk.fetchers.snmp_backend import _ber as ber
+from cmk.fetchers.snmp_backend import StoredWalkSNMPBackend
+from cmk.fetchers.snmp_backend._usm import USMUser
+from cmk.fetchers.snmp_backend._utils import strip_snmp_value
+
+_UNKNOWN_ENGINE_ID = ".1.3.6.1.6.3.15.1.1.4.0"
+_NOT_IN_TIME_WINDOW = ".1.3.6.1.6.3.15.1.1.2.0"
+
+
+def _oid_tuple(oid: str) -> tuple[int, ...]:
+    return tuple(int(arc) for arc in oid.strip(".").split("."))
+
+
+def _typed_value(value: bytes) -> tuple[int, bytes]:
+    # Stored walks have no types, guess some to exercise the decoding.
+    if re.fullmatch(rb"-?\d{1,9}", value):
+        number = int(value)
+        return ber.Tag.INTEGER, number.to_bytes(number.bit_length() // 8 + 1, "big", signed=True)
+    if re.fullmatch(rb"\d{10,19}", value):
+        number = int(value)
+        return ber.Tag.COUNTER64, number.to_bytes(number.bit_length() // 8 + 1, "big")
+    if re.fullmatch(rb"(\.\d+){2,}", value):
+        oid = ber._oid(value.decode())  # pylint: disable=protected-access
+        return ber.Tag.OBJECT_IDENTIFIER, oid[2:]
+    return ber.Tag.OCTET_STRING, value
+
+
+class SNMPResponder:
+    """Answers SNMP requests from a stored walk
+
+    Supports SNMPv1 and SNMPv2c with any community, and SNMPv3 with the given
+    user.  Responses are sent after `delay` seconds, so requests overlap like
+    with a remote device.  The first responses are held back until `hold`
+    requests are in flight, so only concurrent requests are answered at all.
+    """
+
+    def __init__(
+        self,
+        walk: Path,
+        *,
+        user: USMUser | None = None,
+        delay: float = 0.0,
+        hold: int = 0,
+        engine_id: bytes = b"\x80\x00\x1f\x88\x04responder",
+    ) -> None:
+        rows = sorted(
+            (
+                (_oid_tuple(line.split(None, 1)[0]), line.split(None, 1))
+                for line in StoredWalkSNMPBackend.read_walk_from_path(
+                    walk, logging.getLogger("responder")
+                )
+            ),
+            key=lambda row: row[0],
+        )
+        self._keys = [key for key, _parts in rows]
+        self._rows = [
+            ("." + parts[0].strip("."), strip_snmp_value(parts[1] if len(parts) > 1 else ""))
+            for _key, parts in rows
+        ]
+        self._user = user
+        self._delay = delay
+        self._hold = hold
+        self._held: list[tuple[bytes, tuple[str, int]]] = []
+        self.engine_id = engine_id
+        self.engine_boots = 1
+        self._started = time.monotonic()
+        self._auth_key, self._priv_key = user.keys(engine_id) if user else (b"", b"")
+        self._salt = 0
+
+        self.requests: list[int] = []
+        """The tags of the received PDUs"""
+        self.reports: list[str] = []
+        """The OIDs of the sent reports"""
+        self.max_in_flight = 0
+        self._in_flight = 0
+        self._lock = threading.Lock()
+
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._socket.bind(("127.0.0.1", 0))
+        self._socket.settimeout(0.05)
+        self._stopped = threading.Event()
+        self.port: int = self._socket.getsockname()[1]
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+
+    def __enter__(self) -> "SNMPResponder":
+        self._thread.start()
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc_val: BaseException | None,
+        exc_tb: TracebackType | None,
+    ) -> None:
+        self._stopped.set()
+        self._thread.join()
+        self._socket.close()
+
+    @property
+    def engine_time(self) -> int:
+        return int(time.monotonic() - self._started)
+
+    def _serve(self) -> None:
+        while not self._stopped.is_set():
+            try:
+                data, address = self._socket.recvfrom(65535)
+            except TimeoutError:
+                continue
+            try:
+                response = self._respond(data)
+            except ValueError:
+                continue
+            if response is None:
+                continue
+            with self._lock:
+                self._in_flight += 1
+                self.max_in_flight = max(self.max_in_flight, self._in_flight)
+                self._held.append((response, address))
+                if self._in_flight < self._hold:
+                    continue
+                self._hold = 0
+                released, self._held = self._held, []
+            for response, address in released:
+                threading.Timer(self._delay, self._send, (response, address)).start()
+
+    def _send(self, response: bytes, address: tuple[str, int]) -> None:
+        with self._lock:
+            self._in_flight -= 1
+            if not self._stopped.is_set():
+                self._socket.sendto(response, address)
+
+    def _respond(self, data: bytes) -> bytes | None:
+        if ber.message_version(data) != 3:
+            version, community, pdu = ber.decode_community_message(data)
+            self.requests.append(pdu.tag)
+            return ber.encode_community_message(
+                version, community, ber.encode_pdu(self._response(pdu, v1=version == 0))
+            )
+        return self._respond_v3(data)
+
+    def _respond_v3(self, data: bytes) -> bytes | None:
+        assert self._user is not None
+        message = ber.decode_v3_message(data)
+        usm = ber.decode_usm_parameters(message.security_parameters)
+
+        if usm.engine_id != self.engine_id:
+            _context_engine_id, _context_name, pdu = ber.decode_scoped_pdu(message.data)
+            return self._report(message.msg_id, pdu.request_id, _UNKNOWN_ENGINE_ID)
+
+        if self._user.authenticates:
+            auth = message.auth_parameters
+            zeroed = data[: auth.start] + bytes(auth.stop - auth.start) + data[auth.stop :]
+            if not hmac.compare_digest(self._user.mac(self._auth_key, zeroed), usm.auth_parameters):
+                return None
+            if (
+                usm.engine_boots != self.engine_boots
+                or abs(usm.engine_time - self.engine_time) > 150
+            ):
+                return self._report(message.msg_id, 0, _NOT_IN_TIME_WINDOW, authenticated=True)
+
+        scoped_pdu = message.data
+        if self._user.encrypts:
+            scoped_pdu = self._user.decrypt(
+                self._priv_key,
+                usm.engine_boots,
+                usm.engine_time,
+                usm.priv_parameters,
+                ber.decode_encrypted_pdu(scoped_pdu),
+            )
+        _context_engine_id, context_name, pdu = ber.decode_scoped_pdu(scoped_pdu)
+        self.requests.append(pdu.tag)
+        return self._encode_v3(
+            message.msg_id,
+            context_name,
+            self._response(pdu, v1=False),
+            authenticated=self._user.authenticates,
+        )
+
+    def _report(
+        self, msg_id: int, request_id: int, oid: str, *, authenticated: bool = False
+    ) -> bytes:
+        self.reports.append(oid)
+        report = ber.PDU(
+            ber.Tag.REPORT, request_id, 0, 0, [ber.VarBind(oid, ber.Tag.COUNTER32, b"\x01")]
+        )
+        return self._encode_v3(msg_id, b"", report, authenticated=authenticated)
+
+    def _encode_v3(
+        self, msg_id: int, context_name: bytes, pdu: ber.PDU, *, authenticated: bool
+    ) -> bytes:
+        assert self._user is not None
+        engine_time = self.engine_time
+        data = ber.encode_scoped_pdu(self.engine_id, context_name, ber.encode_pdu(pdu))
+        priv_parameters = b""
+        encrypted = authenticated and self._user.encrypts and pdu.tag != ber.Tag.REPORT
+        if encrypted:
+            self._salt += 1
+            ciphertext, priv_parameters = self._user.encrypt(
+                self._priv_key, self.engine_boots, engine_time, self._salt, data
+            )
+            data = ber.encode_encrypted_pdu(ciphertext)
+        message, auth = ber.encode_v3_message(
+            msg_id=msg_id,
+            max_size=65507,
+            flags=(0x01 if authenticated else 0) | (0x02 if encrypted else 0),
+            usm=ber.USMParameters(
+                engine_id=self.engine_id,
+                engine_boots=self.engine_boots,
+                engine_time=engine_time,
+                user_name=self._user.user_name if authenticated else b"",
+                auth_parameters=bytes(self._user.mac_length if authenticated else 0),
+                priv_parameters=priv_parameters,
+            ),
+            data=data,
+        )
+        if not authenticated:
+            return message
+        mac = self._user.mac(self._auth_key, message)
+        return message[: auth.start] + mac + message[auth.stop :]
+
+    def _response(self, pdu: ber.PDU, *, v1: bool) -> ber.PDU:
+        varbinds: list[ber.VarBind] = []
+        if pdu.tag == ber.Tag.GET_REQUEST:
+            for index, varbind in enumerate(pdu.varbinds, 1):
+                position = bisect.bisect_left(self._keys, _oid_tuple(varbind.oid))
+                if position < len(self._keys) and self._keys[position] == _oid_tuple(varbind.oid):
+                    varbinds.append(self._varbind(position))
+                elif v1:
+                    return ber.PDU(ber.Tag.RESPONSE, pdu.request_id, 2, index, pdu.varbinds)
+                else:
+                    varbinds.append(ber.VarBind(varbind.oid, ber.Tag.NO_SUCH_OBJECT, b""))
+        else:
+            # Not interleaved for several varbinds, the backend walks one OID per request.
+            repetitions = pdu.error_index if pdu.tag == ber.Tag.GET_BULK_REQUEST else 1
+            for index, varbind in enumerate(pdu.varbinds, 1):
+                position = bisect.bisect_right(self._keys, _oid_tuple(varbind.oid))
+                for _repetition in range(repetitions):
+                    if position < len(self._keys):
+                        varbinds.append(self._varbind(position))
+                        position += 1
+                    elif v1:
+                        return ber.PDU(ber.Tag.RESPONSE, pdu.request_id, 2, index, pdu.varbinds)
+                    else:
+                        varbinds.append(ber.VarBind(varbind.oid, ber.Tag.END_OF_MIB_VIEW, b""))
+                        break
+        return ber.PDU(ber.Tag.RESPONSE, pdu.request_id, 0, 0, varbinds)
+
+    def _varbind(self, position: int) -> ber.VarBind:
+        oid, value = self._rows[position]
+        return ber.VarBind(oid, *_typed_value(value))
+
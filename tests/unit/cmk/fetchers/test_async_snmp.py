@@ -0,0 +1,340 @@
+#!/usr/bin/env python3
+# Copyright (C) 2024 Checkmk GmbH - License: GNU General Public License v2
+# This file is part of Checkmk (https://checkmk.com). It is subject to the terms and
+# conditions defined in the file COPYING, which is part of this source code package.
+
+# pylint: disable=protected-access
+
+import logging
+from collections.abc import Iterator
+from pathlib import Path
+
+import pytest
+
+from cmk.utils.hostaddress import HostAddress, HostName
+
+from cmk.snmplib import (
+    SNMPBackendEnum,
+    SNMPContextTimeout,
+    SNMPCredentials,
+    SNMPHostConfig,
+    SNMPVersion,
+)
+
+from cmk.fetchers.snmp_backend import _ber as ber
+from cmk.fetchers.snmp_backend import (
+    AsyncSNMPBackend,
+    ClassicSNMPBackend,
+    StoredWalkSNMPBackend,
+)
+from cmk.fetchers.snmp_backend._usm import localize_key, password_to_key, USMUser
+
+from .snmp_responder import SNMPResponder
+
+_WALK = """\
+.1.3.6.1.2.1.1.1.0 "Linux router 6.1"
+.1.3.6.1.2.1.1.2.0 .1.3.6.1.4.1.8072.3.2.10
+.1.3.6.1.2.1.1.5.0 "router"
+.1.3.6.1.2.1.2.1.0 3
+.1.3.6.1.2.1.2.2.1.2.1 "lo"
+.1.3.6.1.2.1.2.2.1.2.2 "eth0"
+.1.3.6.1.2.1.2.2.1.2.10 "eth9"
+.1.3.6.1.2.1.2.2.1.3.1 24
+.1.3.6.1.2.1.2.2.1.3.2 6
+.1.3.6.1.2.1.2.2.1.3.10 6
+.1.3.6.1.2.1.2.2.1.14.1 -1
+.1.3.6.1.2.1.31.1.1.1.6.2 18446744073709551615
+.1.3.6.1.4.1.9.1 "B2 E0 7D 2C 4D 15 "
+.1.3.6.1.4.1.90 ""
+"""
+
+_OIDS = [
+    ".1.3.6.1.2.1.1",
+    ".1.3.6.1.2.1.2.2.1.2",
+    ".1.3.6.1.2.1.2.2.1.3",
+    ".1.3.6.1.2.1.2.2.1",
+    ".1.3.6.1.2.1.31.1.1.1.6",
+    ".1.3.6.1.4.1",
+    ".1.3.6.1.4.1.90",
+    ".1.3.6.1.2.1.2.2.1.4",
+]
+
+_USER = ("authPriv", "SHA-256", "checkmk", "authpass", "AES", "privpass")
+
+
+def _config(
+    port: int,
+    *,
+    snmp_version: SNMPVersion = SNMPVersion.V2C,
+    credentials: SNMPCredentials = "public",
+    bulkwalk_enabled: bool = True,
+    bulk_walk_size_of: int = 3,
+    timeout: float = 0.5,
+) -> SNMPHostConfig:
+    return SNMPHostConfig(
+        is_ipv6_primary=False,
+        hostname=HostName("router"),
+        ipaddress=HostAddress("127.0.0.1"),
+        credentials=credentials,
+        port=port,
+        bulkwalk_enabled=bulkwalk_enabled,
+        snmp_version=snmp_version,
+        bulk_walk_size_of=bulk_walk_size_of,
+        timing={"timeout": timeout, "retries": 1},
+        oid_range_limits={},
+        snmpv3_contexts=[],
+        character_encoding=None,
+        snmp_backend=SNMPBackendEnum.ASYNC,
+    )
+
+
+@pytest.fixture(name="walk")
+def fixture_walk(tmp_path: Path) -> Path:
+    (path := tmp_path / "router").write_text(_WALK)
+    return path
+
+
+@pytest.fixture(name="responder")
+def fixture_responder(walk: Path) -> Iterator[SNMPResponder]:
+    with SNMPResponder(walk) as responder:
+        yield responder
+
+
+def _stored_walk(walk: Path) -> StoredWalkSNMPBackend:
+    return StoredWalkSNMPBackend(
+        _config(161), logging.getLogger("test"), walk, index_dir=walk.parent / "index"
+    )
+
+
+@pytest.mark.parametrize(
+    "auth_protocol, hash_name, key, localized_key",
+    [
+        # RFC 3414 A.3.1
+        (
+            "md5",
+            "md5",
+            "9faf3283884e92834ebc9847d8edd963",
+            "526f5eed9fcce26f8964c2930787d82b",
+        ),
+        # RFC 3414 A.3.2
+        (
+            "sha",
+            "sha1",
+            "9fb5cc0381497b3793528939ff788d5d79145211",
+            "6695febc9288e36282235fc7151f128497b38f3f",
+        ),
+    ],
+)
+def test_rfc3414_key_localization(
+    auth_protocol: str, hash_name: str, key: str, localized_key: str
+) -> None:
+    engine_id = bytes.fromhex("000000000000000000000002")
+    assert password_to_key(b"maplesyrup", hash_name).hex() == key
+    assert localize_key(bytes.fromhex(key), engine_id, hash_name).hex() == localized_key
+    user = USMUser.from_credentials(
+        ("authPriv", auth_protocol, "checkmk", "maplesyrup", "DES", "maplesyrup")
+    )
+    auth_key, priv_key = user.keys(engine_id)
+    assert auth_key.hex() == localized_key
+    assert priv_key.hex() == localized_key[:32]
+
+
+@pytest.mark.parametrize(
+    "credentials",
+    [
+        ("authPriv", "SHA-256", "checkmk", "authpass", "AES", "privpass"),
+        ("authPriv", "md5", "checkmk", "authpass", "DES", "privpass"),
+        ("authPriv", "sha", "checkmk", "authpass", "AES-256", "privpass"),
+    ],
+)
+def test_usm_encryption_roundtrip(credentials: tuple[str, ...]) -> None:
+    user = USMUser.from_credentials(credentials)
+    _auth_key, priv_key = user.keys(b"\x80\x00\x1f\x88\x04engine")
+    plaintext = ber.encode_scoped_pdu(b"engine", b"", b"\x05\x00")
+    ciphertext, salt = user.encrypt(priv_key, 3, 1234, 42, plaintext)
+    assert ciphertext[: len(plaintext)] != plaintext
+    assert user.decrypt(priv_key, 3, 1234, salt, ciphertext)[: len(plaintext)] == plaintext
+
+
+def test_ber_pdu_roundtrip() -> None:
+    pdu = ber.PDU(
+        ber.Tag.GET_BULK_REQUEST,
+        2**31 - 1,
+        0,
+        10,
+        [
+            ber.VarBind(".1.3.6.1.4.1.4294967295.0", ber.Tag.NULL, b""),
+            ber.VarBind(".2.999.1", ber.Tag.OCTET_STRING, b"x" * 300),
+        ],
+    )
+    version, community, decoded = ber.decode_community_message(
+        ber.encode_community_message(1, b"public", ber.encode_pdu(pdu))
+    )
+    assert (version, community, decoded) == (1, b"public", pdu)
+
+
+def test_ber_rejects_truncated_messages() -> None:
+    message = ber.encode_community_message(
+        1, b"public", ber.encode_pdu(ber.PDU(ber.Tag.GET_REQUEST, 1, 0, 0, []))
+    )
+    with pytest.raises(ValueError):
+        ber.decode_community_message(message[:-1])
+
+
+@pytest.mark.parametrize(
+    "snmp_version, bulkwalk_enabled, credentials",
+    [
+        (SNMPVersion.V1, False, "public"),
+        (SNMPVersion.V2C, False, "public"),
+        (SNMPVersion.V2C, True, "public"),
+        (SNMPVersion.V3, True, ("noAuthNoPriv", "checkmk")),
+        (SNMPVersion.V3, True, ("authNoPriv", "SHA-512", "checkmk", "authpass")),
+        (SNMPVersion.V3, True, _USER),
+        (SNMPVersion.V3, False, ("authPriv", "md5", "checkmk", "authpass", "DES", "privpass")),
+    ],
+)
+def test_walk_equals_stored_walk(
+    walk: Path,
+    snmp_version: SNMPVersion,
+    bulkwalk_enabled: bool,
+    credentials: SNMPCredentials,
+) -> None:
+    user = USMUser.from_credentials(credentials) if isinstance(credentials, tuple) else None
+    stored = _stored_walk(walk)
+    with SNMPResponder(walk, user=user) as responder:
+        backend = AsyncSNMPBackend(
+            _config(
+                responder.port,
+                snmp_version=snmp_version,
+                credentials=credentials,
+                bulkwalk_enabled=bulkwalk_enabled,
+            ),
+            logging.getLogger("test"),
+        )
+        for oid in _OIDS:
+            assert backend.walk(oid, context="") == stored.walk(oid, context=""), oid
+    assert (ber.Tag.GET_BULK_REQUEST in responder.requests) is (
+        bulkwalk_enabled and snmp_version is not SNMPVersion.V1
+    )
+
+
+def test_walk_renders_values(responder: SNMPResponder) -> None:
+    backend = AsyncSNMPBackend(_config(responder.port), logging.getLogger("test"))
+    assert backend.walk(".1.3.6.1.2.1.1.2", context="") == [
+        (".1.3.6.1.2.1.1.2.0", b".1.3.6.1.4.1.8072.3.2.10")
+    ]
+    assert backend.walk(".1.3.6.1.2.1.2.2.1.14", context="") == [(".1.3.6.1.2.1.2.2.1.14.1", b"-1")]
+    assert backend.walk(".1.3.6.1.2.1.31.1.1.1.6", context="") == [
+        (".1.3.6.1.2.1.31.1.1.1.6.2", b"18446744073709551615")
+    ]
+
+
+@pytest.mark.parametrize(
+    "value, snmpwalk_output",
+    [
+        (b"Linux router 6.1", '"Linux router 6.1"'),
+        (b"  padded\t", '"  padded\t"'),
+        (b"", '""'),
+        (b"c:\\", '"c:\\\\"'),
+        (b"\xb2\xe0}, ", '"B2 E0 7D 2C 20 "'),
+        (b" \x00", '"20 00 "'),
+    ],
+)
+def test_octet_strings_are_rendered_like_the_classic_backend(
+    value: bytes, snmpwalk_output: str
+) -> None:
+    # The output of `snmpwalk -OQ -OU -On -Ot` for the same varbind
+    classic = ClassicSNMPBackend(_config(161), logging.getLogger("test"))
+    oid = ".1.3.6.1.2.1.1.1.0"
+    assert [(oid, ber.render_value(ber.VarBind(oid, ber.Tag.OCTET_STRING, value)))] == (
+        classic._get_rowinfo_from_walk_output([f"{oid} = {snmpwalk_output}\n"])
+    )
+
+
+def test_walk_of_a_scalar(responder: SNMPResponder) -> None:
+    backend = AsyncSNMPBackend(_config(responder.port), logging.getLogger("test"))
+    assert backend.walk(".1.3.6.1.2.1.1.5.0", context="") == [(".1.3.6.1.2.1.1.5.0", b"router")]
+    assert responder.requests[-1] == ber.Tag.GET_REQUEST
+
+
+@pytest.mark.parametrize("snmp_version", [SNMPVersion.V1, SNMPVersion.V2C])
+def test_get(walk: Path, snmp_version: SNMPVersion) -> None:
+    with SNMPResponder(walk) as responder:
+        backend = AsyncSNMPBackend(
+            _config(responder.port, snmp_version=snmp_version), logging.getLogger("test")
+        )
+        assert backend.get(".1.3.6.1.2.1.1.5.0", context="") == b"router"
+        assert backend.get(".1.3.6.1.2.1.2.2.1.3.*", context="") == b"24"
+        assert backend.get(".1.3.6.1.2.1.1.3.0", context="") is None
+        assert backend.get(".1.3.6.1.4.1.90.*", context="") is None
+
+
+def test_v3_engine_is_discovered_once(walk: Path) -> None:
+    with SNMPResponder(walk, user=USMUser.from_credentials(_USER)) as responder:
+        backend = AsyncSNMPBackend(
+            _config(responder.port, snmp_version=SNMPVersion.V3, credentials=_USER),
+            logging.getLogger("test"),
+        )
+        assert backend.get(".1.3.6.1.2.1.1.5.0", context="") == b"router"
+        assert backend.get(".1.3.6.1.2.1.1.5.0", context="") == b"router"
+    assert responder.reports == [".1.3.6.1.6.3.15.1.1.4.0"]  # unknownEngineID
+    assert responder.requests == [ber.Tag.GET_REQUEST] * 2
+
+
+def test_v3_resynchronizes_the_engine_time(walk: Path) -> None:
+    with SNMPResponder(walk, user=USMUser.from_credentials(_USER)) as responder:
+        backend = AsyncSNMPBackend(
+            _config(responder.port, snmp_version=SNMPVersion.V3, credentials=_USER),
+            logging.getLogger("test"),
+        )
+        assert backend.get(".1.3.6.1.2.1.1.5.0", context="") == b"router"
+        # The device rebooted
+        responder.engine_boots += 1
+        assert backend.get(".1.3.6.1.2.1.1.1.0", context="") == b"Linux router 6.1"
+    assert responder.reports[-1] == ".1.3.6.1.6.3.15.1.1.2.0"  # notInTimeWindow
+
+
+def test_v3_wrong_password(walk: Path) -> None:
+    with SNMPResponder(walk, user=USMUser.from_credentials(_USER)) as responder:
+        credentials = (*_USER[:3], "wrongpass", *_USER[4:])
+        backend = AsyncSNMPBackend(
+            _config(
+                responder.port, snmp_version=SNMPVersion.V3, credentials=credentials, timeout=0.1
+            ),
+            logging.getLogger("test"),
+        )
+        with pytest.raises(SNMPContextTimeout):
+            backend.walk(".1.3.6.1.2.1.1", context="")
+
+
+def test_timeout(walk: Path) -> None:
+    with SNMPResponder(walk) as responder:
+        port = responder.port
+    backend = AsyncSNMPBackend(_config(port, timeout=0.1), logging.getLogger("test"))
+    with pytest.raises(SNMPContextTimeout):
+        backend.walk(".1.3.6.1.2.1.1", context="")
+    assert backend.get(".1.3.6.1.2.1.1.5.0", context="") is None
+
+
+@pytest.mark.parametrize("max_in_flight", [3, 10])
+def test_prefetch_walks_concurrently(walk: Path, max_in_flight: int) -> None:
+    concurrent = min(max_in_flight, len(_OIDS))
+    # Nothing is answered unless the first requests of the walks are sent at once.
+    with SNMPResponder(walk, delay=0.01, hold=concurrent) as responder:
+        backend = AsyncSNMPBackend(
+            _config(responder.port, bulk_walk_size_of=1),
+            logging.getLogger("test"),
+            max_in_flight=max_in_flight,
+        )
+        oids = [(oid, "") for oid in _OIDS]
+
+        backend.prefetch(oids)
+        num_requests = len(responder.requests)
+
+        assert responder.max_in_flight == concurrent
+
+        expected = _stored_walk(walk)
+        for oid, context in oids:
+            assert backend.walk(oid, context=context) == expected.walk(oid, context=context)
+        # Served from the prefetched walks
+        assert len(responder.requests) == num_requests
@@ -6,12 +6,20 @@
 # pylint: disable=protected-access
 
 import logging
+import os
 from pathlib import Path
 
 import pytest
 
+from cmk.utils.hostaddress import HostAddress, HostName
+
+from cmk.snmplib import SNMPBackendEnum, SNMPHostConfig, SNMPVersion
+
 import cmk.fetchers.snmp_backend._utils as utils
+import cmk.fetchers.snmp_backend._walk_index as walk_index
+import cmk.fetchers.snmp_backend.stored_walk as stored_walk
 from cmk.fetchers.snmp_backend import StoredWalkSNMPBackend
+from cmk.fetchers.snmp_backend._walk_index import WalkIndex
 
 
 @pytest.mark.parametrize(
@@ -29,21 +37,6 @@ def test_strip_snmp_value(value: str, expected: bytes) -> None:
 
 @pytest.mark.usefixtures("create_files")
 class TestStoredWalkSNMPBackend:
-    @pytest.mark.parametrize(
-        "a, b, result",
-        [
-            ("1.2.3", "1.2.3", 0),
-            ("1.2.3", ".1.2.3", 0),
-            (".1.2.3", "1.2.3", 0),
-            (".1.2.3", ".1.2.3", 0),
-            ("1.2.3", "1.2.3.4", 0),
-            ("1.2.3.4", "1.2.3", 1),
-            ("1.2.3", "4.5.6", -1),
-        ],
-    )
-    def test_compare_oids(self, a: str, b: str, result: int) -> None:
-        assert StoredWalkSNMPBackend._compare_oids(a, b) == result
-
     def test_read_walk_data(self, tmpdir: Path) -> None:
         assert StoredWalkSNMPBackend.read_walk_from_path(
             tmpdir / "walkdata" / "1.txt", logging.getLogger("test")
@@ -66,3 +59,146 @@ def create_files(tmpdir):
     p1.write(".1.2.3 foo\n.1.2.4 bar\nfoobar\n")
     p2 = (tmpdir / "walkdata").join("2.txt")
     p2.write(".1.2.3 foo\n\n\n.1.2.5 test\n")
+
+
+_WALK = """\
+.1.3.6.1.2.1.1.1.0 "Linux"
+.1.3.6.1.2.1.1.5.0 "router"
+.1.3.6.1.2.1.2.2.1.2.1 "lo"
+.1.3.6.1.2.1.2.2.1.2.2 "eth0
+with a newline"
+.1.3.6.1.2.1.2.2.1.2.10 "eth9"
+.1.3.6.1.2.1.2.2.1.20.1 0
+.1.3.6.1.2.1.2.2.1.3.1 24
+.1.3.6.1.4.1.9.1 "B2 E0 7D 2C 4D 15 "
+.1.3.6.1.4.1.90 ""
+.1.3.6.1.4.1.4294967295.1 1
+"""
+
+
+@pytest.fixture(name="walk_backend")
+def fixture_walk_backend(tmp_path: Path) -> StoredWalkSNMPBackend:
+    stored_walk._INDEX_CACHE.clear()
+    (tmp_path / "walks").mkdir()
+    (path := tmp_path / "walks" / "router").write_text(_WALK)
+    return StoredWalkSNMPBackend(
+        SNMPHostConfig(
+            is_ipv6_primary=False,
+            hostname=HostName("router"),
+            ipaddress=HostAddress("127.0.0.1"),
+            credentials="public",
+            port=161,
+            bulkwalk_enabled=True,
+            snmp_version=SNMPVersion.V2C,
+            bulk_walk_size_of=10,
+            timing={},
+            oid_range_limits={},
+            snmpv3_contexts=[],
+            character_encoding=None,
+            snmp_backend=SNMPBackendEnum.STORED_WALK,
+        ),
+        logging.getLogger("test"),
+        path,
+        index_dir=tmp_path / "index",
+    )
+
+
+@pytest.mark.parametrize(
+    "oid, expected",
+    [
+        (
+            ".1.3.6.1.2.1.2.2.1.2",
+            [
+                (".1.3.6.1.2.1.2.2.1.2.1", b"lo"),
+                (".1.3.6.1.2.1.2.2.1.2.2", b"eth0\nwith a newline"),
+                (".1.3.6.1.2.1.2.2.1.2.10", b"eth9"),
+            ],
+        ),
+        (".1.3.6.1.2.1.2.2.1.2.*", [(".1.3.6.1.2.1.2.2.1.2.1", b"lo")]),
+        ("1.3.6.1.2.1.1.5.0", [(".1.3.6.1.2.1.1.5.0", b"router")]),
+        (".1.3.6.1.4.1.9", [(".1.3.6.1.4.1.9.1", b"\xb2\xe0},M\x15")]),
+        (".1.3.6.1.4.1.4294967295", [(".1.3.6.1.4.1.4294967295.1", b"1")]),
+        (".1.3.6.1.2.1.1.1.0.*", []),
+        (".1.3.6.1.2.1.1.2", []),
+        (".1.3.6.1.5", []),
+    ],
+)
+def test_walk_index(walk_backend: StoredWalkSNMPBackend, oid: str, expected: list) -> None:
+    assert walk_backend.walk(oid, context="") == expected
+
+
+def test_walk_index_get(walk_backend: StoredWalkSNMPBackend) -> None:
+    assert walk_backend.get(".1.3.6.1.2.1.1.5.0", context="") == b"router"
+    assert walk_backend.get(".1.3.6.1.2.1.2.2.1.3.*", context="") == b"24"
+    assert walk_backend.get(".1.3.6.1.2.1.2.2.1", context="") is None
+
+
+def test_walk_index_unsorted_walk(walk_backend: StoredWalkSNMPBackend) -> None:
+    walk_backend.path.write_text("".join(reversed(_WALK.splitlines(keepends=True)[5:])))
+    assert [oid for oid, _value in walk_backend.walk(".1.3.6.1", context="")] == [
+        ".1.3.6.1.2.1.2.2.1.2.10",
+        ".1.3.6.1.2.1.2.2.1.3.1",
+        ".1.3.6.1.2.1.2.2.1.20.1",
+        ".1.3.6.1.4.1.9.1",
+        ".1.3.6.1.4.1.90",
+        ".1.3.6.1.4.1.4294967295.1",
+    ]
+
+
+def test_walk_index_is_shared(
+    walk_backend: StoredWalkSNMPBackend, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    expected = walk_backend.walk(".1.3.6.1.2", context="")
+    assert walk_backend.index_dir is not None
+    assert (walk_backend.index_dir / "router").exists()
+
+    # A new process loads the index instead of parsing the walk.
+    stored_walk._INDEX_CACHE.clear()
+    monkeypatch.setattr(walk_index, "_MMAP_MIN_SIZE", 0)
+
+    def _read_walk_from_path(*_args: object) -> list[str]:
+        raise AssertionError("the walk is parsed again")
+
+    monkeypatch.setattr(StoredWalkSNMPBackend, "read_walk_from_path", _read_walk_from_path)
+    assert walk_backend.walk(".1.3.6.1.2", context="") == expected
+
+
+def test_walk_index_is_cached_by_path(
+    walk_backend: StoredWalkSNMPBackend, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    expected = walk_backend.walk(".1.3.6.1.2", context="")
+
+    def _load_index(*_args: object) -> WalkIndex:
+        raise AssertionError("the index is loaded again")
+
+    monkeypatch.setattr(stored_walk, "_load_index", _load_index)
+    other_backend = StoredWalkSNMPBackend(
+        walk_backend.config, logging.getLogger("other"), walk_backend.path
+    )
+    assert other_backend.walk(".1.3.6.1.2", context="") == expected
+    assert list(stored_walk._INDEX_CACHE) == [walk_backend.path]
+
+
+def test_walk_index_is_invalidated(walk_backend: StoredWalkSNMPBackend) -> None:
+    assert walk_backend.get(".1.3.6.1.2.1.1.5.0", context="") == b"router"
+
+    walk_backend.path.write_text(_WALK.replace('"router"', '"switch"'))
+    os.utime(walk_backend.path, ns=(0, 0))
+    assert walk_backend.get(".1.3.6.1.2.1.1.5.0", context="") == b"switch"
+
+    stored_walk._INDEX_CACHE.clear()
+    assert walk_backend.get(".1.3.6.1.2.1.1.5.0", context="") == b"switch"
+
+
+def test_walk_index_rejects_broken_files(tmp_path: Path) -> None:
+    data = WalkIndex.serialize("walk", 1, 2, [".1.2 1\n", ".1.3 2\n"])
+    assert len(WalkIndex(data)) == 2
+
+    (path := tmp_path / "index").write_bytes(data[:-1])
+    assert WalkIndex.load(path, "walk", 1, 2) is None
+    path.write_bytes(b"")
+    assert WalkIndex.load(path, "walk", 1, 2) is None
+    path.write_bytes(data)
+    assert WalkIndex.load(path, "walk", 1, 3) is None
+    assert WalkIndex.load(path, "other walk", 1, 2) is None
+    assert WalkIndex.load(path, "walk", 1, 2) is not None
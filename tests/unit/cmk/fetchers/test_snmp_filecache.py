@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+# Copyright (C) 2024 Checkmk GmbH - License: GNU General Public License v2
+# This file is part of Checkmk (https://checkmk.com). It is subject to the terms and
+# conditions defined in the file COPYING, which is part of this source code package.
+
+# pylint: disable=protected-access
+
+import time
+from collections.abc import Callable, Mapping
+from pathlib import Path
+
+import pytest
+
+from cmk.utils.sectionname import SectionName
+
+from cmk.snmplib import SNMPRawData
+
+import cmk.fetchers.filecache._snmp as snmp_cache
+from cmk.fetchers import Mode
+from cmk.fetchers.filecache import FileCacheMode, MaxAge, SNMPFileCache
+
+
+@pytest.fixture(name="file_cache")
+def fixture_file_cache(tmp_path: Path) -> SNMPFileCache:
+    return SNMPFileCache(
+        path_template=str(tmp_path / "snmp" / "{mode}" / "host"),
+        max_age=MaxAge.unlimited(),
+        simulation=False,
+        use_only_cache=False,
+        file_cache_mode=FileCacheMode.READ_WRITE,
+    )
+
+
+def _legacy_cache_file(raw_data: SNMPRawData) -> bytes:
+    return (repr({str(k): v for k, v in raw_data.items()}) + "\n").encode("utf-8")
+
+
+def _interface_walk(num_interfaces: int) -> SNMPRawData:
+    return {
+        SectionName("if64"): [
+            [
+                [
+                    str(n),
+                    f"GigabitEthernet0/{n}",
+                    "6",
+                    "1000000000",
+                    "1" if n % 3 else "2",
+                    str(n * 4711),
+                    str(n * 17),
+                    "0",
+                    "0",
+                    "0",
+                    str(n * 42),
+                    "0",
+                    "0",
+                    "0",
+                    "0",
+                    f"uplink {n}",
+                    [0, 27, 33, n % 256, 1, 2],
+                    "1",
+                ]
+                for n in range(num_interfaces)
+            ]
+        ],
+        SectionName("snmp_info"): [[["Cisco IOS Software", "1.3.6.1.4.1.9", "", "sw01", ""]]],
+        SectionName("hr_mem"): [[["Physical memory", "1024", "2048", "1024"]]],
+    }
+
+
+@pytest.mark.parametrize(
+    "raw_data",
+    [
+        {},
+        {SectionName("empty"): []},
+        {SectionName("empty_table"): [[]]},
+        _interface_walk(5),
+        {
+            SectionName("mixed"): [
+                [["äöü", "\udcff", "", "1.3.6.1.2.1.2.2.1.1.4"], [[], [255, 0, 1], "x"]],
+                [[["nested", ("tuple", 1)], None, -3, 2**40, [2**70]]],
+            ]
+        },
+    ],
+)
+def test_binary_roundtrip(file_cache: SNMPFileCache, raw_data: SNMPRawData) -> None:
+    file_cache.write(raw_data, Mode.CHECKING)
+    path = file_cache._make_path(file_cache.path_template, mode=Mode.CHECKING)
+    assert path.read_bytes().startswith(snmp_cache._MAGIC)
+
+    cached = file_cache.read(Mode.CHECKING)
+    assert cached == raw_data
+    assert SNMPFileCache._from_cache_file(path.read_bytes()) == raw_data
+
+
+def test_sections_are_decoded_on_access(file_cache: SNMPFileCache) -> None:
+    raw_data = _interface_walk(10)
+    file_cache.write(raw_data, Mode.CHECKING)
+
+    cached = file_cache.read(Mode.CHECKING)
+    assert isinstance(cached, snmp_cache._CachedSections)
+    assert set(cached) == set(raw_data)
+    assert not cached._decoded
+
+    assert cached[SectionName("hr_mem")] == raw_data[SectionName("hr_mem")]
+    assert list(cached._decoded) == [SectionName("hr_mem")]
+    with pytest.raises(KeyError):
+        _unused = cached[SectionName("unknown")]
+
+
+def test_legacy_cache_file_is_read(file_cache: SNMPFileCache) -> None:
+    raw_data = _interface_walk(3)
+    path = file_cache._make_path(file_cache.path_template, mode=Mode.CHECKING)
+    path.parent.mkdir(parents=True)
+    path.write_bytes(_legacy_cache_file(raw_data))
+
+    assert file_cache.read(Mode.CHECKING) == raw_data
+
+
+def test_empty_cache_file_is_ignored(file_cache: SNMPFileCache) -> None:
+    path = file_cache._make_path(file_cache.path_template, mode=Mode.CHECKING)
+    path.parent.mkdir(parents=True)
+    path.touch()
+
+    assert file_cache.read(Mode.CHECKING) is None
+
+
+def test_fallback_to_legacy_format(file_cache: SNMPFileCache) -> None:
+    raw_data: Mapping[SectionName, object] = {SectionName("odd"): [[[True, 1.5]]]}
+    file_cache.write(raw_data, Mode.CHECKING)  # type: ignore[arg-type]
+    path = file_cache._make_path(file_cache.path_template, mode=Mode.CHECKING)
+
+    assert path.read_bytes().startswith(b"{")
+    assert file_cache.read(Mode.CHECKING) == raw_data
+
+
+def test_truncated_cache_file_is_rejected(file_cache: SNMPFileCache) -> None:
+    encoded = SNMPFileCache._to_cache_file(_interface_walk(10))
+    with pytest.raises(ValueError):
+        SNMPFileCache._from_cache_file(encoded[:-100])
+
+
+def test_binary_cache_file_format() -> None:
+    raw_data = _interface_walk(500)
+    encoded = SNMPFileCache._to_cache_file(raw_data)
+
+    assert encoded.startswith(snmp_cache._MAGIC)
+    pos = len(snmp_cache._MAGIC)
+    (num_sections,) = snmp_cache._COUNT.unpack_from(encoded, pos)
+    pos += snmp_cache._COUNT.size
+    index = {}
+    for _section in range(num_sections):
+        name_size, offset, size = snmp_cache._INDEX_ENTRY.unpack_from(encoded, pos)
+        pos += snmp_cache._INDEX_ENTRY.size
+        index[encoded[pos : pos + name_size].decode()] = (offset, size)
+        pos += name_size
+    assert sorted(index) == sorted(str(name) for name in raw_data)
+
+    # The payloads follow the index without gaps
+    payloads = sorted(index.values())
+    assert payloads[0][0] == pos
+    assert all(o + s == next_o for (o, s), (next_o, _s) in zip(payloads, payloads[1:]))
+    assert payloads[-1][0] + payloads[-1][1] == len(encoded)
+
+    # The strings of the interface table are stored only once
+    offset, _size = index["if64"]
+    num_strings, _string_size, num_tokens, _token_size = snmp_cache._SECTION_HEADER.unpack_from(
+        encoded, offset
+    )
+    assert num_strings < num_tokens / 4
+    assert len(encoded) < len(_legacy_cache_file(raw_data))
+
+    assert SNMPFileCache._from_cache_file(encoded) == raw_data
+
+
+@pytest.mark.slow
+def test_binary_cache_file_read_benchmark(
+    tmp_path: Path, record_property: Callable[[str, object], None]
+) -> None:
+    raw_data = _interface_walk(5000)
+    legacy_path = tmp_path / "legacy"
+    legacy_path.write_bytes(_legacy_cache_file(raw_data))
+    binary_path = tmp_path / "binary"
+    binary_path.write_bytes(SNMPFileCache._to_cache_file(raw_data))
+
+    before = time.perf_counter()
+    legacy = SNMPFileCache._from_cache_file(legacy_path.read_bytes())
+    record_property("duration_legacy", time.perf_counter() - before)
+
+    before = time.perf_counter()
+    binary = dict(SNMPFileCache._from_cache_file(binary_path.read_bytes()))
+    record_property("duration_binary", time.perf_counter() - before)
+
+    assert binary == legacy == raw_data
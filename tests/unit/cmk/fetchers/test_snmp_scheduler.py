@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+# Copyright (C) 2024 Checkmk GmbH - License: GNU General Public License v2
+# This file is part of Checkmk (https://checkmk.com). It is subject to the terms and
+# conditions defined in the file COPYING, which is part of this source code package.
+
+import logging
+from pathlib import Path
+
+import pytest
+
+from cmk.ccc.exceptions import OnError
+
+import cmk.utils.resulttype as result
+from cmk.utils.hostaddress import HostAddress, HostName
+from cmk.utils.sectionname import SectionName
+
+from cmk.snmplib import (
+    BackendOIDSpec,
+    BackendSNMPTree,
+    SNMPBackendEnum,
+    SNMPDetectSpec,
+    SNMPHostConfig,
+    SNMPVersion,
+)
+
+import cmk.fetchers._snmp as snmp_fetcher
+from cmk.fetchers import (
+    DeviceLimits,
+    Mode,
+    SNMPFetcher,
+    SNMPFetchScheduler,
+    SNMPScanConfig,
+    SNMPSectionMeta,
+)
+from cmk.fetchers.filecache import FileCacheMode, MaxAge, SNMPFileCache
+from cmk.fetchers.snmp import SNMPPluginStore, SNMPPluginStoreItem
+
+from .snmp_responder import SNMPResponder
+
+_WALK = "".join(
+    f'.1.3.6.1.2.1.2.2.1.2.{i} "eth{i}"\n.1.3.6.1.2.1.2.2.1.3.{i} 6\n' for i in range(1, 21)
+)
+
+_SECTION = SectionName("interfaces")
+
+_TABLE = [[f"eth{i}", "6"] for i in range(1, 21)]
+
+
+@pytest.fixture(autouse=True)
+def plugin_store(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(
+        SNMPFetcher,
+        "plugin_store",
+        SNMPPluginStore(
+            {
+                _SECTION: SNMPPluginStoreItem(
+                    trees=[
+                        BackendSNMPTree(
+                            base=".1.3.6.1.2.1.2.2.1",
+                            oids=[
+                                BackendOIDSpec("2", "string", False),
+                                BackendOIDSpec("3", "string", False),
+                            ],
+                        )
+                    ],
+                    detect_spec=SNMPDetectSpec([[]]),
+                    inventory=False,
+                )
+            }
+        ),
+    )
+
+
+@pytest.fixture(name="walk")
+def fixture_walk(tmp_path: Path) -> Path:
+    (path := tmp_path / "walk").write_text(_WALK)
+    return path
+
+
+def _fetcher(tmp_path: Path, hostname: str, port: int) -> SNMPFetcher:
+    return SNMPFetcher(
+        sections={
+            _SECTION: SNMPSectionMeta(
+                checking=True, disabled=False, redetect=False, fetch_interval=None
+            )
+        },
+        scan_config=SNMPScanConfig(
+            on_error=OnError.RAISE,
+            missing_sys_description=False,
+            oid_cache_dir=tmp_path,
+        ),
+        do_status_data_inventory=False,
+        section_store_path=tmp_path / hostname / "sections",
+        stored_walk_path=tmp_path,
+        walk_cache_path=tmp_path / hostname,
+        snmp_config=SNMPHostConfig(
+            is_ipv6_primary=False,
+            hostname=HostName(hostname),
+            ipaddress=HostAddress("127.0.0.1"),
+            credentials="public",
+            port=port,
+            bulkwalk_enabled=True,
+            snmp_version=SNMPVersion.V2C,
+            bulk_walk_size_of=5,
+            timing={"timeout": 1, "retries": 0},
+            oid_range_limits={},
+            snmpv3_contexts=[],
+            character_encoding=None,
+            snmp_backend=SNMPBackendEnum.ASYNC,
+        ),
+    )
+
+
+def _file_cache(
+    tmp_path: Path, hostname: str, file_cache_mode: FileCacheMode = FileCacheMode.DISABLED
+) -> SNMPFileCache:
+    return SNMPFileCache(
+        path_template=str(tmp_path / hostname / "cache"),
+        max_age=MaxAge.unlimited(),
+        simulation=False,
+        use_only_cache=False,
+        file_cache_mode=file_cache_mode,
+    )
+
+
+def test_fetch_many_devices_concurrently(
+    tmp_path: Path, walk: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    def _make_backend(*_args: object, **_kwargs: object) -> None:
+        raise AssertionError("the fetcher makes a backend of its own")
+
+    monkeypatch.setattr(snmp_fetcher, "make_backend", _make_backend)
+    devices = [f"device{n}" for n in range(8)]
+    delay = 0.01
+    # Nothing is answered unless the walks of all the devices are in flight at once.
+    with SNMPResponder(walk, delay=delay, hold=2 * len(devices)) as responder:
+        fetchers = [_fetcher(tmp_path, device, responder.port) for device in devices]
+        with SNMPFetchScheduler(logging.getLogger("test")) as scheduler:
+            results = scheduler.fetch(
+                [
+                    (_file_cache(tmp_path, device), fetcher)
+                    for device, fetcher in zip(devices, fetchers)
+                ],
+                Mode.CHECKING,
+            )
+
+    assert results == [result.OK({_SECTION: [_TABLE]})] * len(devices)
+    assert responder.max_in_flight >= 2 * len(devices)
+
+    assert sorted(scheduler.latencies) == devices
+    assert sum(latencies.count for latencies in scheduler.latencies.values()) == len(
+        responder.requests
+    )
+    for latencies in scheduler.latencies.values():
+        assert latencies.timeouts == 0
+        assert latencies.quantile(0.5) >= delay
+
+
+def test_max_in_flight_per_device(tmp_path: Path, walk: Path) -> None:
+    with SNMPResponder(walk, delay=0.02) as responder:
+        with SNMPFetchScheduler(
+            logging.getLogger("test"), limits=lambda _config: DeviceLimits(max_in_flight=1)
+        ) as scheduler:
+            assert scheduler.fetch(
+                [(_file_cache(tmp_path, "device"), _fetcher(tmp_path, "device", responder.port))],
+                Mode.CHECKING,
+            ) == [result.OK({_SECTION: [_TABLE]})]
+    assert responder.max_in_flight == 1
+
+
+def test_file_cache_is_used(tmp_path: Path, walk: Path) -> None:
+    file_cache = _file_cache(tmp_path, "device", FileCacheMode.READ_WRITE)
+    with SNMPResponder(walk) as responder:
+        fetcher = _fetcher(tmp_path, "device", responder.port)
+        with SNMPFetchScheduler(logging.getLogger("test")) as scheduler:
+            assert scheduler.fetch([(file_cache, fetcher)], Mode.CHECKING) == [
+                result.OK({_SECTION: [_TABLE]})
+            ]
+            num_requests = len(responder.requests)
+            assert scheduler.fetch([(file_cache, fetcher)], Mode.CHECKING) == [
+                result.OK({_SECTION: [_TABLE]})
+            ]
+    assert num_requests > 0
+    assert len(responder.requests) == num_requests
+
+
+def test_timeout_budget(tmp_path: Path, walk: Path) -> None:
+    with SNMPResponder(walk) as responder:
+        port = responder.port  # Nobody answers anymore
+    fetcher = _fetcher(tmp_path, "device", port)
+
+    with SNMPFetchScheduler(
+        logging.getLogger("test"), limits=lambda _config: DeviceLimits(budget=0.2)
+    ) as scheduler:
+        (fetched,) = scheduler.fetch([(_file_cache(tmp_path, "device"), fetcher)], Mode.CHECKING)
+
+    assert fetched.is_error()
+    assert scheduler.latencies[HostName("device")].timeouts >= 1
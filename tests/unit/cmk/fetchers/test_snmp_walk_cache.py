@@ -6,45 +6,170 @@
 # pylint: disable=protected-access
 
 import logging
-from collections.abc import Iterable, MutableMapping
 from pathlib import Path
 
+import pytest
+
+from cmk.ccc import store
+
 from cmk.snmplib import SNMPRowInfo
 
 from cmk.fetchers._snmp import WalkCache
+from cmk.fetchers._walkcache import CachedWalks, encode_walks
+
+
+def _column(fetchoid: str, num_rows: int) -> SNMPRowInfo:
+    return [(f"{fetchoid}.{i}", f"value {i}".encode()) for i in range(num_rows)]
+
 
+_WALKS = {
+    (".1.3.6.1.2.1.2.2.1.2", "12c3d4a"): _column(".1.3.6.1.2.1.2.2.1.2", 3),
+    (".1.3.6.1.2.1.2.2.1.3", "12c3d4a"): _column(".1.3.6.1.2.1.2.2.1.3", 3),
+    (".1.3.6.1.2.1.1.1.0", "12c3d4a"): [(".1.3.6.1.2.1.1.1.0", b"Linux")],
+    (".1.2.3", ""): [(".1.2.30.1", b"\x00\xff"), (".1.3.4", b"")],
+    (".1.2.4", "e3b0c44"): [],
+}
 
-class MockWalkCache(WalkCache):
-    def __init__(self, mockdata: MutableMapping[str, SNMPRowInfo], path: Path) -> None:
-        super().__init__(path, logging.getLogger("test"))
-        self.mock_stored_on_fs = mockdata
 
-    def _read_row(self, path: Path) -> SNMPRowInfo:
-        return self.mock_stored_on_fs[str(path.name)]
+def _walk_cache(path: Path) -> WalkCache:
+    return WalkCache(path, logging.getLogger("test"))
 
-    def _write_row(self, path: Path, rowinfo: SNMPRowInfo) -> None:
-        self.mock_stored_on_fs[str(path.name)] = rowinfo
 
-    def _iterfiles(self) -> Iterable[Path]:
-        return (Path(k) for k in self.mock_stored_on_fs)
+class TestCachedWalks:
+    def test_roundtrip(self) -> None:
+        cached = CachedWalks(encode_walks(_WALKS))
+        assert dict(cached) == _WALKS
+        assert (".1.2.3", "") in cached
+        assert (".1.2.3", "12c3d4a") not in cached
+
+    def test_rows_share_their_oids(self) -> None:
+        cached = CachedWalks(encode_walks(_WALKS))
+        assert sorted(cached._oids) == ["", ".0", ".1", ".1.3.4", ".2", "0.1"]
+
+    def test_rejects_broken_files(self) -> None:
+        encoded = encode_walks(_WALKS)
+        with pytest.raises(ValueError):
+            CachedWalks(b"")
+        with pytest.raises(ValueError):
+            CachedWalks(encoded[:-100])
 
 
 class TestWalkCache:
-    def test_oid2name_roundtrip(self) -> None:
-        fetchoid, context_hash = ".3.1.4.1.5.9.2.6.5.3.5", "12c3d4a"
-        assert (fetchoid, context_hash) == WalkCache._name2oid(
-            WalkCache._oid2name(fetchoid, context_hash)
-        )
+    def test_save_and_load(self, tmp_path: Path) -> None:
+        cache = _walk_cache(tmp_path)
+        for (fetchoid, context_hash), rows in _WALKS.items():
+            cache[(fetchoid, context_hash, True)] = rows
+        cache[(".9.9.9", "", False)] = [(".9.9.9.1", b"not saved")]
+        cache.save()
+        assert [p.name for p in tmp_path.iterdir()] == ["walks"]
 
-    def test_cache_keeps_stored_data(self, tmp_path: Path) -> None:
-        fetchoid, context_hash = ".1.2.3", "12c3d4a"
-        path = f"OID{fetchoid}-{context_hash}"
-        cache = MockWalkCache({path: [("23", b"43")]}, tmp_path)
+        cache = _walk_cache(tmp_path)
+        cache.load()
+        assert len(cache) == len(_WALKS)
+        assert (".9.9.9", "", False) not in cache
+        assert (".1.2.3", "", False) not in cache
+        assert (".1.2.3", "", True) in cache
+        assert dict(cache) == {(*key, True): rows for key, rows in _WALKS.items()}
 
+    def test_load_decodes_on_access(self, tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+        store.save_bytes_to_file(tmp_path / "walks", encode_walks(_WALKS))
+        decoded: list[tuple[str, str]] = []
+        getitem = CachedWalks.__getitem__
+
+        def _getitem(self: CachedWalks, key: tuple[str, str]) -> SNMPRowInfo:
+            decoded.append(key)
+            return getitem(self, key)
+
+        monkeypatch.setattr(CachedWalks, "__getitem__", _getitem)
+
+        cache = _walk_cache(tmp_path)
+        cache.load()
+        assert (".1.2.3", "", True) in cache
+        assert not decoded
+
+        assert cache[(".1.2.3", "", True)] == _WALKS[(".1.2.3", "")]
+        assert cache[(".1.2.3", "", True)] == _WALKS[(".1.2.3", "")]
+        assert decoded == [(".1.2.3", "")]
+
+    def test_save_only_if_changed(self, tmp_path: Path) -> None:
+        store.save_bytes_to_file(tmp_path / "walks", encode_walks(_WALKS))
+        mtime = (tmp_path / "walks").stat().st_mtime_ns
+
+        cache = _walk_cache(tmp_path)
+        cache.load()
+        assert cache[(".1.2.3", "", True)]
+        cache[(".9.9.9", "", False)] = []
+        cache.save()
+        assert (tmp_path / "walks").stat().st_mtime_ns == mtime
+
+        del cache[(".1.2.4", "e3b0c44", True)]
+        cache[(".9.9.9", "", True)] = [(".9.9.9.1", b"new")]
+        cache.save()
+
+        cache = _walk_cache(tmp_path)
+        cache.load()
+        assert dict(cache) == {
+            **{(*key, True): rows for key, rows in _WALKS.items() if key != (".1.2.4", "e3b0c44")},
+            (".9.9.9", "", True): [(".9.9.9.1", b"new")],
+        }
+
+    def test_clear(self, tmp_path: Path) -> None:
+        store.save_bytes_to_file(tmp_path / "walks", encode_walks(_WALKS))
+        cache = _walk_cache(tmp_path)
+        cache.load()
+        cache.clear()
+        assert not list(tmp_path.iterdir())
+        assert not cache
+
+    def test_broken_and_old_files_are_replaced(self, tmp_path: Path) -> None:
+        (tmp_path / "walks").write_bytes(b"CMKWALK\x01garbage")
+        (tmp_path / "OID.1.2.3-12c3d4a").write_text("[('.1.2.3.1', b'old')]")
+
+        cache = _walk_cache(tmp_path)
+        cache.load()
         assert not cache
+        cache[(".1.2.3", "12c3d4a", True)] = [(".1.2.3.1", b"new")]
+        cache.save()
 
+        assert [p.name for p in tmp_path.iterdir()] == ["walks"]
+        cache = _walk_cache(tmp_path)
         cache.load()
+        assert dict(cache) == {(".1.2.3", "12c3d4a", True): [(".1.2.3.1", b"new")]}
 
-        assert (fetchoid, "12c3d4a", True) in cache
+    def test_only_accessed_walks_are_decoded(
+        self, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        walks = {
+            (f".1.3.6.1.2.1.2.2.1.{column}", "12c3d4a"): _column(
+                f".1.3.6.1.2.1.2.2.1.{column}", 2000
+            )
+            for column in range(1, 23)
+        }
+        legacy_path = tmp_path / "legacy"
+        legacy_path.mkdir()
+        for (fetchoid, context_hash), rows in walks.items():
+            store.save_object_to_file(legacy_path / f"OID{fetchoid}-{context_hash}", rows)
+        cache = _walk_cache(tmp_path / "binary")
+        for (fetchoid, context_hash), rows in walks.items():
+            cache[(fetchoid, context_hash, True)] = rows
         cache.save()
-        assert path in cache.mock_stored_on_fs
+
+        decoded: list[tuple[str, str]] = []
+        getitem = CachedWalks.__getitem__
+
+        def _getitem(self: CachedWalks, key: tuple[str, str]) -> SNMPRowInfo:
+            decoded.append(key)
+            return getitem(self, key)
+
+        monkeypatch.setattr(CachedWalks, "__getitem__", _getitem)
+
+        # Using two columns of the cached table
+        cache = _walk_cache(tmp_path / "binary")
+        cache.load()
+        used = [cache[(f".1.3.6.1.2.1.2.2.1.{column}", "12c3d4a", True)] for column in (2, 8)]
+
+        assert used == [walks[(f".1.3.6.1.2.1.2.2.1.{column}", "12c3d4a")] for column in (2, 8)]
+        assert decoded == [(f".1.3.6.1.2.1.2.2.1.{column}", "12c3d4a") for column in (2, 8)]
+        assert sum(p.stat().st_size for p in (tmp_path / "binary").iterdir()) < sum(
+            p.stat().st_size for p in legacy_path.iterdir()
+        )
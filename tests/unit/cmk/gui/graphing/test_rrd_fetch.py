@@ -3,7 +3,8 @@
 # This file is part of Checkmk (https://checkmk.com). It is subject to the terms and
 # conditions defined in the file COPYING, which is part of this source code package.
 
-from collections.abc import Iterable, Iterator, Mapping
+import time
+from collections.abc import Callable, Iterable, Iterator, Mapping, Sequence
 from contextlib import contextmanager
 
 import pytest
@@ -14,6 +15,7 @@ from cmk.utils.hostaddress import HostName
 from cmk.utils.livestatus_helpers.testing import MockLiveStatusConnection
 from cmk.utils.metrics import MetricName
 
+from cmk.gui import sites
 from cmk.gui.config import active_config
 from cmk.gui.graphing._formatter import AutoPrecision
 from cmk.gui.graphing._graph_specification import (
@@ -25,6 +27,8 @@ from cmk.gui.graphing._graph_specification import (
 from cmk.gui.graphing._graph_templates import TemplateGraphSpecification
 from cmk.gui.graphing._legacy import CheckMetricEntry
 from cmk.gui.graphing._rrd_fetch import (
+    _fetch_rrd_data,
+    _group_needed_rrd_data_by_service,
     _reverse_translate_into_all_potentially_relevant_metrics,
     fetch_rrd_data_for_graph,
     translate_and_merge_rrd_columns,
@@ -51,7 +55,7 @@ def _setup_livestatus(mock_livestatus: MockLiveStatusConnection) -> Iterator[Non
         )
         mock_live.expect_query(
             """GET services
-Columns: rrddata:temp:temp.max:1681985455:1681999855:20
+Columns: host_name service_description rrddata:temp:temp.max:1681985455:1681999855:20
 Filter: host_name = my-host
 Filter: service_description = Temperature Zone 6
 ColumnHeaders: off
@@ -141,6 +145,115 @@ def test_fetch_rrd_data_for_graph_with_conversion(
         }
 
 
+
+def _load_key(site: str, host_name: str) -> RRDDataKey:
+    return RRDDataKey(SiteId(site), HostName(host_name), "CPU load", "load1", "max", 1)
+
+
+def test_fetch_rrd_data_of_all_services_in_one_query(
+    mock_livestatus: MockLiveStatusConnection,
+    request_context: None,
+) -> None:
+    column = "rrddata:load1:load1.max:0:60:20"
+    with mock_livestatus(expect_status_query=True) as mock_live:
+        mock_live.add_table(
+            "services",
+            [
+                {"host_name": "host-a", "service_description": "CPU load", column: [0, 60, 20, 1]},
+                {"host_name": "host-a", "service_description": "Memory", column: [0, 60, 20, 2]},
+                {"host_name": "host-b", "service_description": "CPU load", column: [0, 60, 20, 3]},
+            ],
+            site="NO_SITE",
+        )
+        mock_live.add_table(
+            "services",
+            [
+                {"host_name": "host-b", "service_description": "CPU load", column: [0, 60, 20, 4]},
+                {"host_name": "host-c", "service_description": "CPU load", column: [0, 60, 20, 5]},
+            ],
+            site="remote",
+        )
+        mock_live.expect_query(
+            f"""GET services
+Columns: host_name service_description {column}
+Filter: host_name = host-a
+Filter: service_description = CPU load
+And: 2
+Filter: host_name = host-b
+Filter: service_description = CPU load
+And: 2
+Filter: host_name = host-c
+Filter: service_description = CPU load
+And: 2
+Or: 3
+ColumnHeaders: off
+
+            """,
+            sites=["NO_SITE", "remote"],
+        )
+        keys = [_load_key("NO_SITE", "host-a"), _load_key("NO_SITE", "host-b")]
+        keys.append(_load_key("remote", "host-c"))
+
+        assert dict(
+            _fetch_rrd_data(
+                _group_needed_rrd_data_by_service(keys),
+                None,
+                GraphDataRange(time_range=(0, 60), step=20),
+            )
+        ) == {
+            _load_key("NO_SITE", "host-a"): [0, 60, 20, 1],
+            _load_key("NO_SITE", "host-b"): [0, 60, 20, 3],
+            _load_key("remote", "host-c"): [0, 60, 20, 5],
+        }
+
+
+class _RemoteSites:
+    """Answers the RRD queries like the sites do, counting the queries"""
+
+    def __init__(self, services: Sequence[tuple[SiteId, str, str]]) -> None:
+        self.services = services
+        self.num_queries = 0
+
+    def set_only_sites(self, only_sites: list[SiteId] | None = None) -> None:
+        pass
+
+    def set_prepend_site(self, prepend_site: bool) -> None:
+        pass
+
+    def query(self, query: str) -> list[list[object]]:
+        self.num_queries += 1
+        host_names = {
+            line.split(" = ", 1)[1] for line in query.splitlines() if "Filter: host_name" in line
+        }
+        return [
+            [site, host_name, service_description, [0, 60, 20, n]]
+            for n, (site, host_name, service_description) in enumerate(self.services)
+            if host_name in host_names
+        ]
+
+
+def test_fetch_rrd_data_of_many_services_in_one_query(
+    monkeypatch: pytest.MonkeyPatch, record_property: Callable[[str, object], None]
+) -> None:
+    keys = [_load_key(f"site{n % 2}", f"host{n}") for n in range(500)]
+    remote_sites = _RemoteSites([(k.site_id, k.host_name, k.service_name) for k in keys])
+    monkeypatch.setattr(sites, "live", lambda: remote_sites)
+
+    before = time.perf_counter()
+    rrd_data = dict(
+        _fetch_rrd_data(
+            _group_needed_rrd_data_by_service(keys),
+            None,
+            GraphDataRange(time_range=(0, 60), step=20),
+        )
+    )
+    record_property("duration_500_services", time.perf_counter() - before)
+
+    assert remote_sites.num_queries == 1
+    assert list(rrd_data) == keys
+    assert rrd_data[keys[42]] == [0, 60, 20, 42]
+
+
 def test_translate_and_merge_rrd_columns() -> None:
     assert translate_and_merge_rrd_columns(
         MetricName("my_metric"),
@@ -3,13 +3,16 @@
 # This file is part of Checkmk (https://checkmk.com). It is subject to the terms and
 # conditions defined in the file COPYING, which is part of this source code package.
 
+import random
+import time
+from collections.abc import Callable
 from typing import Literal
 
 import pytest
 
 from cmk.ccc.exceptions import MKGeneralException
 
-from cmk.gui.graphing._timeseries import time_series_math
+from cmk.gui.graphing._timeseries import op_func_wrapper, time_series_math, time_series_operators
 from cmk.gui.graphing._type_defs import Operators
 from cmk.gui.time_series import TimeSeries
 
@@ -29,3 +32,72 @@ def test__time_series_math_exc_symbol(args: tuple[Literal["%"], list[TimeSeries]
 def test__time_series_math_stable_singles(operator: Operators) -> None:
     test_ts = TimeSeries([0, 180, 60, 6, 5, 10, None, -2, -3.14])
     assert time_series_math(operator, [test_ts]) == test_ts
+
+
+def _time_series_math_reference(operator: Operators, operands: list[TimeSeries]) -> TimeSeries:
+    # Applies the operator point by point, as time_series_math used to do
+    _title, op_func = time_series_operators()[operator]
+    return TimeSeries(
+        [op_func_wrapper(op_func, list(tsp)) for tsp in zip(*operands)], operands[0].twindow
+    )
+
+
+@pytest.mark.parametrize("operator", ["+", "*", "-", "/", "MAX", "MIN", "AVERAGE", "MERGE"])
+def test__time_series_math_matches_pointwise_operators(operator: Operators) -> None:
+    rng = random.Random(operator)
+    operands = [
+        TimeSeries(
+            [rng.choice([None, 0, rng.uniform(-10, 10)]) for _ in range(50 + n)],
+            time_window=(0, 3000, 60),
+        )
+        for n in range(2 if operator in ("-", "/") else 3)
+    ]
+
+    result = time_series_math(operator, operands)
+    reference = _time_series_math_reference(operator, operands)
+    assert result is not None
+    assert [v is None for v in result] == [v is None for v in reference]
+    assert result.values == pytest.approx(reference.values)
+
+
+def test__time_series_math_long_series() -> None:
+    rng = random.Random(4711)
+    operands = [
+        TimeSeries(
+            [None if rng.random() < 0.1 else rng.random() for _ in range(20000)],
+            time_window=(0, 20000 * 60, 60),
+        )
+        for _n in range(5)
+    ]
+
+    for operator in ("+", "MAX", "AVERAGE"):
+        result = time_series_math(operator, operands)
+        reference = _time_series_math_reference(operator, operands)
+        assert result is not None
+        assert [v is None for v in result] == [v is None for v in reference]
+        assert result.values == pytest.approx(reference.values)
+
+
+@pytest.mark.slow
+def test__time_series_math_long_series_benchmark(
+    record_property: Callable[[str, object], None],
+) -> None:
+    rng = random.Random(4711)
+    operands = [
+        TimeSeries(
+            [None if rng.random() < 0.1 else rng.random() for _ in range(20000)],
+            time_window=(0, 20000 * 60, 60),
+        )
+        for _n in range(5)
+    ]
+
+    before = time.perf_counter()
+    reference = _time_series_math_reference("AVERAGE", operands)
+    record_property("duration_list", time.perf_counter() - before)
+
+    before = time.perf_counter()
+    result = time_series_math("AVERAGE", operands)
+    record_property("duration_array", time.perf_counter() - before)
+
+    assert result is not None
+    assert result.values == pytest.approx(reference.values)
@@ -3,10 +3,20 @@
 # This file is part of Checkmk (https://checkmk.com). It is subject to the terms and
 # conditions defined in the file COPYING, which is part of this source code package.
 
+import math
+import random
+import time
+from collections.abc import Callable
 
 import pytest
 
-from cmk.gui.time_series import rrd_timestamps, TimeSeries, TimeSeriesValues, TimeWindow
+from cmk.gui.time_series import (
+    aggregation_functions,
+    rrd_timestamps,
+    TimeSeries,
+    TimeSeriesValues,
+    TimeWindow,
+)
 
 
 @pytest.mark.parametrize(
@@ -101,3 +111,111 @@ class TestTimeseries:
             ).count(None)
             == 2
         )
+
+    def test_values_are_stored_as_array(self) -> None:
+        ts = TimeSeries([0, 30, 10, 1, None, 3])
+        assert ts.array.tolist()[::2] == [1.0, 3.0]
+        assert math.isnan(ts.array[1])
+        assert not ts.array.flags.writeable
+
+        ts.values = [None, 2]
+        assert ts.values == [None, 2.0]
+        assert len(ts) == 2
+        assert ts == TimeSeries([None, 2.0], time_window=(0, 30, 10))
+
+    def test_conversion_which_is_not_vectorizable(self) -> None:
+        assert TimeSeries(
+            [0, 30, 10, 1, None, -3],
+            conversion=lambda v: math.copysign(round(v), 1),
+        ).values == [1, None, 3]
+
+
+def _random_values(rng: random.Random, length: int) -> list[float | None]:
+    return [None if rng.random() < 0.2 else rng.uniform(-100, 100) for _ in range(length)]
+
+
+def _forward_fill_resample_reference(ts: TimeSeries, twindow: TimeWindow) -> TimeSeriesValues:
+    # The former implementation working on lists
+    idx_max = len(ts.values) - 1
+    return [ts.values[max(0, min(int((t - ts.start) / ts.step), idx_max))] for t in range(*twindow)]
+
+
+def _downsample_reference(ts: TimeSeries, twindow: TimeWindow, cf: str) -> TimeSeriesValues:
+    # The former implementation working on lists
+    dwsa = []
+    co: list[float | None] = []
+    desired_times = rrd_timestamps(twindow)
+    i = 0
+    for t, val in ts.time_data_pairs():
+        if t > desired_times[i]:
+            dwsa.append(aggregation_functions(co, cf))
+            co = []
+            i += 1
+        co.append(val)
+
+    diff_len = len(desired_times) - len(dwsa)
+    if diff_len > 0:
+        dwsa.append(aggregation_functions(co, cf))
+        dwsa += [None] * (diff_len - 1)
+    return dwsa
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_resampling_matches_reference(seed: int) -> None:
+    rng = random.Random(seed)
+    step = rng.choice([10, 30, 60])
+    start = rng.randrange(0, 600, step)
+    ts = TimeSeries(_random_values(rng, 120), time_window=(start, start + 120 * step, step))
+
+    fine_step = rng.choice([1, 5, step])
+    fine = (start + rng.randrange(-60, 60), start + 120 * step + rng.randrange(-60, 60), fine_step)
+    assert ts.forward_fill_resample(fine) == _forward_fill_resample_reference(ts, fine)
+
+    coarse_step = step * rng.choice([2, 3, 7])
+    coarse = (start + rng.randrange(0, 60), start + 120 * step + coarse_step, coarse_step)
+    for cf in ("max", "min", "average"):
+        downsampled = ts.downsample(coarse, cf)
+        reference = _downsample_reference(ts, coarse, cf)
+        assert [v is None for v in downsampled] == [v is None for v in reference]
+        assert downsampled == pytest.approx(reference)
+
+
+def test_downsample_invalid_consolidation_function() -> None:
+    with pytest.raises(ValueError, match="Invalid Aggregation function"):
+        TimeSeries([0, 40, 10, 1, 2, 3, 4]).downsample((0, 40, 20), "median")
+    assert TimeSeries([0, 40, 10, None, None]).downsample((0, 40, 20), "median") == [None, None]
+
+
+def test_resampling_long_series() -> None:
+    rng = random.Random(4711)
+    ts = TimeSeries(_random_values(rng, 50000), time_window=(0, 50000 * 60, 60))
+    coarse = (0, 50000 * 60, 300)
+    fine = (0, 50000 * 60, 20)
+
+    for cf in ("max", "average"):
+        downsampled = ts.downsample(coarse, cf)
+        reference = _downsample_reference(ts, coarse, cf)
+        assert [v is None for v in downsampled] == [v is None for v in reference]
+        assert downsampled == pytest.approx(reference)
+    assert ts.forward_fill_resample(fine) == _forward_fill_resample_reference(ts, fine)
+
+
+@pytest.mark.slow
+def test_resampling_long_series_benchmark(record_property: Callable[[str, object], None]) -> None:
+    rng = random.Random(4711)
+    ts = TimeSeries(_random_values(rng, 50000), time_window=(0, 50000 * 60, 60))
+    coarse = (0, 50000 * 60, 300)
+    fine = (0, 50000 * 60, 20)
+
+    before = time.perf_counter()
+    reference = _downsample_reference(ts, coarse, "average")
+    reference_filled = _forward_fill_resample_reference(ts, fine)
+    record_property("duration_list", time.perf_counter() - before)
+
+    before = time.perf_counter()
+    downsampled = ts.downsample(coarse, "average")
+    filled = ts.forward_fill_resample(fine)
+    record_property("duration_array", time.perf_counter() - before)
+
+    assert downsampled == pytest.approx(reference)
+    assert filled == reference_filled
@@ -28,7 +28,11 @@ from cmk.gui.background_job import BackgroundProcessInterface
 from cmk.gui.background_job._defines import BackgroundJobDefines
 from cmk.gui.http import Request
 from cmk.gui.watolib import activate_changes
-from cmk.gui.watolib.activate_changes import ActivationCleanupBackgroundJob, ConfigSyncFileInfo
+from cmk.gui.watolib.activate_changes import (
+    ActivationCleanupBackgroundJob,
+    ConfigSyncFileHashCache,
+    ConfigSyncFileInfo,
+)
 from cmk.gui.watolib.config_sync import ReplicationPath
 
 logger = logging.getLogger(__name__)
@@ -428,6 +432,67 @@ def _create_get_config_sync_file_infos_test_config(base_dir: Path) -> None:
     base_dir.joinpath("links/working-symlink-to-file").symlink_to("../etc/d3/xyz")
 
 
+
+def test_config_sync_file_hash_cache(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    base_dir = tmp_path / "replication"
+    _create_get_config_sync_file_infos_test_config(base_dir)
+    replication_paths = [
+        ReplicationPath("dir", "d4-multiple-files", "etc/d4", []),
+        ReplicationPath("file", "f1", "etc/f1", []),
+        ReplicationPath("dir", "links", "links", []),
+    ]
+    cache_path = tmp_path / "hashes.pickle"
+    monkeypatch.setattr(ConfigSyncFileHashCache, "_RACY_WINDOW_NS", 0)
+
+    hash_cache = ConfigSyncFileHashCache.load(cache_path)
+    expected = activate_changes._get_config_sync_file_infos(
+        replication_paths, base_dir, hash_cache=hash_cache
+    )
+    assert expected == activate_changes._get_config_sync_file_infos(replication_paths, base_dir)
+    assert (hash_cache.hits, hash_cache.misses) == (0, 5)
+    hash_cache.save()
+
+    hashed: list[str] = []
+    create_hash = activate_changes._create_config_sync_file_hash
+
+    def _create_config_sync_file_hash(file_path: str) -> str:
+        hashed.append(os.path.relpath(file_path, base_dir))
+        return create_hash(file_path)
+
+    monkeypatch.setattr(
+        activate_changes, "_create_config_sync_file_hash", _create_config_sync_file_hash
+    )
+    base_dir.joinpath("etc/d4/x1").write_text("Döng1", encoding="utf-8")
+
+    hash_cache = ConfigSyncFileHashCache.load(cache_path)
+    sync_infos = activate_changes._get_config_sync_file_infos(
+        replication_paths, base_dir, hash_cache=hash_cache
+    )
+    assert hashed == ["etc/d4/x1"]
+    assert (hash_cache.hits, hash_cache.misses) == (4, 1)
+    assert sync_infos == {
+        **expected,
+        "etc/d4/x1": expected["etc/d4/x1"]._replace(
+            file_hash="814d8055a6fc127617c8bee4cd332c845042345220fe94240ca0f86970ce1550"
+        ),
+    }
+
+
+def test_config_sync_file_hash_cache_skips_recent_changes(tmp_path: Path) -> None:
+    file_path = tmp_path / "hosts.mk"
+    file_path.write_text("all_hosts += []", encoding="utf-8")
+    cache_path = tmp_path / "hashes.pickle"
+
+    hash_cache = ConfigSyncFileHashCache.load(cache_path)
+    file_hash = hash_cache.file_hash(str(file_path), file_path.stat())
+    assert file_hash == activate_changes._create_config_sync_file_hash(str(file_path))
+    hash_cache.save()
+
+    hash_cache = ConfigSyncFileHashCache.load(cache_path)
+    assert hash_cache.file_hash(str(file_path), file_path.stat()) == file_hash
+    assert (hash_cache.hits, hash_cache.misses) == (0, 1)
+
+
 def test_get_file_names_to_sync(request_context: None) -> None:
     remote, central = _get_test_file_infos()
     sync_delta = activate_changes.get_file_names_to_sync(
@@ -95,6 +95,7 @@ def test_registered_configvars() -> None:
         "bulk_discovery_default_settings",
         "check_mk_perfdata_with_times",
         "cluster_max_cachefile_age",
+        "config_generation_processes",
         "crash_report_target",
         "crash_report_url",
         "custom_service_attributes",
@@ -118,6 +119,7 @@ def test_registered_configvars() -> None:
         "housekeeping_interval",
         "sqlite_housekeeping_interval",
         "sqlite_freelist_size",
+        "sqlite_async_writes",
         "user_security_notification_duration",
         "http_proxies",
         "inventory_check_autotrigger",
@@ -5,8 +5,10 @@
 
 # pylint: disable=protected-access, redefined-outer-name
 
+import dataclasses
 import logging
-from collections.abc import Iterator
+import time
+from collections.abc import Callable, Iterator, Mapping, Sequence
 from pathlib import Path
 
 import pytest
@@ -20,7 +22,15 @@ from cmk.utils.log import logger
 from cmk.utils.paths import snmp_scan_cache_dir
 from cmk.utils.sectionname import SectionName
 
-from cmk.snmplib import OID, SNMPBackend, SNMPBackendEnum, SNMPHostConfig, SNMPVersion
+from cmk.snmplib import (
+    OID,
+    SNMPBackend,
+    SNMPBackendEnum,
+    SNMPDetectBaseType,
+    SNMPDetectSpec,
+    SNMPHostConfig,
+    SNMPVersion,
+)
 
 import cmk.fetchers._snmpcache as snmp_cache
 import cmk.fetchers._snmpscan as snmp_scan
@@ -259,3 +269,284 @@ def test_gather_available_raw_section_names_defaults(backend: SNMPBackend, tmp_p
         SectionName("snmp_info"),
         SectionName("snmp_uptime"),
     }
+
+
+@pytest.mark.usefixtures("cache_oids")
+@pytest.mark.parametrize("use_detection_cache", [True, False])
+def test_gather_available_raw_section_names_detection_cache(
+    backend: SNMPBackend, tmp_path: Path, use_detection_cache: bool
+) -> None:
+    assert snmp_scan.gather_available_raw_section_names(
+        [(s.name, s.detect_spec) for s in agent_based_register.iter_all_snmp_sections()],
+        scan_config=snmp_scan.SNMPScanConfig(
+            on_error=OnError.RAISE,
+            missing_sys_description=False,
+            oid_cache_dir=tmp_path,
+            use_detection_cache=use_detection_cache,
+        ),
+        backend=backend,
+    )
+    assert (tmp_path / ".detection").exists() is use_detection_cache
+
+
+class FleetBackend(SNMPBackend):
+    """A device of a synthetic fleet, counting the OIDs it is asked for"""
+
+    def __init__(self, config: SNMPHostConfig, values: Mapping[OID, str]) -> None:
+        super().__init__(config, logger)
+        self.values = values
+        self.gets: list[OID] = []
+
+    def get(self, /, oid, *, context):
+        self.gets.append(oid)
+        return self.values.get(oid)
+
+    def walk(self, /, oid, *, context, **kw):
+        raise NotImplementedError("walk")
+
+
+_CISCO_SECTIONS = {SectionName("cisco"), SectionName("cisco_fan")}
+
+_SECTIONS = [
+    (SectionName("cisco"), SNMPDetectSpec([[(snmp_scan.OID_SYS_OBJ, ".1.3.6.1.4.1.9.*", True)]])),
+    (
+        SectionName("cisco_fan"),
+        SNMPDetectSpec(
+            [
+                [
+                    (snmp_scan.OID_SYS_DESCR, ".*cisco.*", True),
+                    (".1.3.6.1.4.1.9.9.13.1.4.1.2.1", ".*", True),
+                ]
+            ]
+        ),
+    ),
+    (SectionName("hp"), SNMPDetectSpec([[(".1.3.6.1.4.1.11.2.14.11.1.2.1.0", ".*", True)]])),
+]
+
+_CISCO = {
+    snmp_scan.OID_SYS_DESCR: "Cisco IOS Software, C2960 Software, Version 15.0(2)SE11",
+    snmp_scan.OID_SYS_OBJ: ".1.3.6.1.4.1.9.1.1208",
+    ".1.3.6.1.4.1.9.9.13.1.4.1.2.1": "Fan 1",
+}
+
+_HP = {
+    snmp_scan.OID_SYS_DESCR: "HP J9280A Switch 2510G-48, revision Y.11.54",
+    snmp_scan.OID_SYS_OBJ: ".1.3.6.1.4.1.11.2.3.7.11.87",
+    ".1.3.6.1.4.1.11.2.14.11.1.2.1.0": "2510G-48",
+}
+
+
+def _device(name: str, values: Mapping[OID, str]) -> FleetBackend:
+    return FleetBackend(dataclasses.replace(SNMPConfig, hostname=HostName(name)), values)
+
+
+def _scan(
+    backend: SNMPBackend,
+    sections: Sequence[snmp_scan.SNMPScanSection],
+    detection_cache: snmp_cache.DetectionCache | None,
+    tmp_path: Path,
+) -> frozenset[SectionName]:
+    snmp_cache.initialize_single_oid_cache(
+        backend.config.hostname, backend.config.ipaddress, cache_dir=tmp_path
+    )
+    snmp_scan._prefetch_description_object(backend=backend)
+    return snmp_scan._find_sections(
+        sections, on_error=OnError.RAISE, backend=backend, detection_cache=detection_cache
+    )
+
+
+@pytest.fixture
+def detection_cache(tmp_path: Path) -> Iterator[snmp_cache.DetectionCache]:
+    yield snmp_cache.DetectionCache(tmp_path / ".detection")
+    snmp_cache.cleanup_host_caches()
+
+
+@pytest.fixture
+def evaluations(monkeypatch: pytest.MonkeyPatch) -> list[SNMPDetectBaseType]:
+    """The evaluated detect specifications"""
+    evaluated: list[SNMPDetectBaseType] = []
+    evaluate = snmp_scan._evaluate_snmp_detection
+
+    def _evaluate_snmp_detection(
+        *, detect_spec: SNMPDetectBaseType, oid_value_getter: Callable[[str], str | None]
+    ) -> bool:
+        evaluated.append(detect_spec)
+        return evaluate(detect_spec=detect_spec, oid_value_getter=oid_value_getter)
+
+    monkeypatch.setattr(snmp_scan, "_evaluate_snmp_detection", _evaluate_snmp_detection)
+    return evaluated
+
+
+def test_detection_is_memoized(
+    detection_cache: snmp_cache.DetectionCache,
+    evaluations: list[SNMPDetectBaseType],
+    tmp_path: Path,
+) -> None:
+    first = _device("switch1", _CISCO)
+    assert _scan(first, _SECTIONS, detection_cache, tmp_path) == _CISCO_SECTIONS
+    assert len(first.gets) == 4
+    # All sections with the known values, then cisco_fan and hp with the device
+    assert len(evaluations) == 5
+
+    evaluations.clear()
+    second = _device("switch2", _CISCO)
+    assert _scan(second, _SECTIONS, detection_cache, tmp_path) == _CISCO_SECTIONS
+    assert second.gets == first.gets
+    assert evaluations == [_SECTIONS[1][1], _SECTIONS[2][1]]
+
+    evaluations.clear()
+    other = _device("switch3", _HP)
+    assert _scan(other, _SECTIONS, detection_cache, tmp_path) == {SectionName("hp")}
+    # cisco_fan is decided by the system description
+    assert other.gets == [
+        snmp_scan.OID_SYS_DESCR,
+        snmp_scan.OID_SYS_OBJ,
+        ".1.3.6.1.4.1.11.2.14.11.1.2.1.0",
+    ]
+    assert len(evaluations) == 4
+
+
+def test_detection_depends_on_other_oids(
+    detection_cache: snmp_cache.DetectionCache, tmp_path: Path
+) -> None:
+    first = _device("switch1", _CISCO)
+    assert _scan(first, _SECTIONS, detection_cache, tmp_path) == _CISCO_SECTIONS
+
+    # Same system description and object, but without fans
+    second = _device(
+        "switch2",
+        {oid: value for oid, value in _CISCO.items() if oid != ".1.3.6.1.4.1.9.9.13.1.4.1.2.1"},
+    )
+    assert _scan(second, _SECTIONS, detection_cache, tmp_path) == {SectionName("cisco")}
+    assert ".1.3.6.1.4.1.9.9.13.1.4.1.2.1" in second.gets
+
+
+def test_detection_is_memoized_for_faked_descriptions(
+    detection_cache: snmp_cache.DetectionCache, tmp_path: Path
+) -> None:
+    for name in ("switch1", "switch2"):
+        snmp_cache.initialize_single_oid_cache(
+            HostName(name), SNMPConfig.ipaddress, cache_dir=tmp_path
+        )
+        snmp_scan._fake_description_object(logger)
+        device = _device(name, _HP)
+        assert snmp_scan._find_sections(
+            _SECTIONS, on_error=OnError.RAISE, backend=device, detection_cache=detection_cache
+        ) == {SectionName("hp")}
+        assert device.gets == [".1.3.6.1.4.1.11.2.14.11.1.2.1.0"]
+
+
+def test_failing_detection_is_left_undecided(
+    detection_cache: snmp_cache.DetectionCache, tmp_path: Path
+) -> None:
+    sections = [
+        *_SECTIONS,
+        (
+            SectionName("broken"),
+            SNMPDetectSpec([[(snmp_scan.OID_SYS_DESCR,)]]),  # type: ignore[list-item]
+        ),
+    ]
+    snmp_cache.initialize_single_oid_cache(
+        HostName("switch1"), SNMPConfig.ipaddress, cache_dir=tmp_path
+    )
+    device = _device("switch1", _CISCO)
+    snmp_scan._prefetch_description_object(backend=device)
+    assert snmp_scan._find_sections(
+        sections, on_error=OnError.IGNORE, backend=device, detection_cache=detection_cache
+    ) == _CISCO_SECTIONS
+
+    with pytest.raises(ValueError):
+        _scan(_device("switch2", _CISCO), sections, detection_cache, tmp_path)
+
+
+def test_detection_cache_is_invalidated_by_plugin_changes(
+    detection_cache: snmp_cache.DetectionCache,
+    evaluations: list[SNMPDetectBaseType],
+    tmp_path: Path,
+) -> None:
+    _scan(_device("switch1", _CISCO), _SECTIONS, detection_cache, tmp_path)
+
+    evaluations.clear()
+    changed = [
+        *_SECTIONS[:2],
+        (SectionName("hp"), SNMPDetectSpec([[(snmp_scan.OID_SYS_DESCR, "hp.*", True)]])),
+    ]
+    device = _device("switch2", _CISCO)
+    assert _scan(device, changed, detection_cache, tmp_path) == _CISCO_SECTIONS
+    assert len(device.gets) == 3
+    assert len(evaluations) == 4
+
+
+def test_detection_cache_expires(
+    detection_cache: snmp_cache.DetectionCache,
+    evaluations: list[SNMPDetectBaseType],
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    _scan(_device("switch1", _CISCO), _SECTIONS, detection_cache, tmp_path)
+
+    evaluations.clear()
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now + detection_cache.MAX_AGE)
+    _scan(_device("switch2", _CISCO), _SECTIONS, detection_cache, tmp_path)
+    assert len(evaluations) == 5
+
+
+def test_detection_cache_persists(
+    detection_cache: snmp_cache.DetectionCache,
+    evaluations: list[SNMPDetectBaseType],
+    tmp_path: Path,
+) -> None:
+    _scan(_device("switch1", _CISCO), _SECTIONS, detection_cache, tmp_path)
+    detection_cache.save()
+
+    evaluations.clear()
+    device = _device("switch2", _CISCO)
+    loaded = snmp_cache.DetectionCache.load(detection_cache.path)
+    assert _scan(device, _SECTIONS, loaded, tmp_path) == _CISCO_SECTIONS
+    assert len(evaluations) == 2
+
+
+def test_broken_detection_cache_is_ignored(tmp_path: Path) -> None:
+    (path := tmp_path / ".detection").write_text("{'version': 2, 'results': {")
+    detection_cache = snmp_cache.DetectionCache.load(path)
+    assert detection_cache.lookup("fingerprint", ((snmp_scan.OID_SYS_DESCR, "x"),)) is None
+
+
+@pytest.mark.usefixtures("fix_register")
+def test_detection_of_fleet(evaluations: list[SNMPDetectBaseType], tmp_path: Path) -> None:
+    sections = [(s.name, s.detect_spec) for s in agent_based_register.iter_all_snmp_sections()]
+    assert sections
+    models = [
+        _CISCO,
+        _HP,
+        {
+            snmp_scan.OID_SYS_DESCR: "Linux router 5.10.0-23-amd64 #1 SMP x86_64",
+            snmp_scan.OID_SYS_OBJ: ".1.3.6.1.4.1.8072.3.2.10",
+            ".1.3.6.1.2.1.25.1.1.0": "123456",
+        },
+    ]
+    fleet = [(f"device{n}", models[n % len(models)]) for n in range(90)]
+
+    def scan_fleet(
+        detection_cache: snmp_cache.DetectionCache | None,
+    ) -> tuple[list[frozenset[SectionName]], list[list[OID]], int]:
+        evaluations.clear()
+        devices = [_device(name, values) for name, values in fleet]
+        found = [_scan(device, sections, detection_cache, tmp_path) for device in devices]
+        return found, [device.gets for device in devices], len(evaluations)
+
+    try:
+        found, gets, num_evaluations = scan_fleet(None)
+        found_memoized, gets_memoized, num_evaluations_memoized = scan_fleet(
+            snmp_cache.DetectionCache(tmp_path / ".detection")
+        )
+    finally:
+        snmp_cache.cleanup_host_caches()
+
+    assert found_memoized == found
+    assert found[0] != found[1]
+    # The same OIDs are needed, but most detections are decided once per model.
+    assert gets_memoized == gets
+    assert num_evaluations == len(fleet) * len(sections)
+    assert num_evaluations_memoized < num_evaluations / 5
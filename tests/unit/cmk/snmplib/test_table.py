@@ -28,6 +28,7 @@ from cmk.snmplib import (
     BackendSNMPTree,
     ensure_str,
     get_snmp_table,
+    prefetch_snmp_tables,
     SNMPBackend,
     SNMPBackendEnum,
     SNMPContextConfig,
@@ -262,3 +263,29 @@ def test_walk_raises_on_timeout_without_snmpv3_context_stop_on_timeout() -> None
         )
 
     assert type(excinfo.value) is SNMPContextTimeout  # pylint: disable=unidiomatic-typecheck
+
+
+def test_prefetch_snmp_tables_skips_special_columns_and_cached_walks() -> None:
+    class Backend(SNMPTestBackend):
+        def __init__(self) -> None:
+            super().__init__(SNMPConfig, logging.getLogger("test"))
+            self.prefetched: list[tuple[str, str]] = []
+
+        def prefetch(self, oids):
+            self.prefetched.extend(oids)
+
+    tree = BackendSNMPTree(
+        base=".1.2.3",
+        oids=[
+            BackendOIDSpec(SpecialColumn.END, "string", False),
+            BackendOIDSpec("1", "string", False),
+            BackendOIDSpec("2", "string", True),
+        ],
+    )
+    backend = Backend()
+    prefetch_snmp_tables(
+        [(SectionName("one"), tree), (SectionName("two"), tree)],
+        walk_cache={(".1.2.3.2", _snmp_table._context_hash([""]), True): []},
+        backend=backend,
+    )
+    assert backend.prefetched == [(".1.2.3.1", "")]
@@ -40,3 +40,19 @@ def test_old_files_are_converted(tmp_path: Path) -> None:
     with vsm.namespace(service):
         assert vsm.active_service_interface
         assert vsm.active_service_interface["user-key"] == 42
+
+
+def test_binary_files_are_ignored(tmp_path: Path) -> None:
+    host = HostAddress("heute")
+    service = ServiceID(CheckPluginName("plugin"), "item")
+    ValueStoreManager.STORAGE_PATH = tmp_path
+    vsm = ValueStoreManager(host)
+    with vsm.namespace(service):
+        assert vsm.active_service_interface is not None
+        vsm.active_service_interface["user-key"] = {"levels": (1, 2)}
+    vsm.save()
+    content = (tmp_path / str(host)).read_bytes()
+
+    ConvertCounters.convert_counter_files(tmp_path)
+
+    assert (tmp_path / str(host)).read_bytes() == content
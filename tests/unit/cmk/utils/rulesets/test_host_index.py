@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+# Copyright (C) 2024 Checkmk GmbH - License: GNU General Public License v2
+# This file is part of Checkmk (https://checkmk.com). It is subject to the terms and
+# conditions defined in the file COPYING, which is part of this source code package.
+
+from collections.abc import Set
+
+from cmk.utils.hostaddress import HostName
+from cmk.utils.rulesets.host_index import HostIndex, HostSet
+
+_HOSTS = [HostName(f"host{n}") for n in range(20)]
+
+
+def test_host_index_roundtrip() -> None:
+    index = HostIndex([*_HOSTS, _HOSTS[0]])
+    assert index.names == _HOSTS
+    assert index.all == 2**20 - 1
+
+    bits = index.bits([HostName("host3"), HostName("host17"), HostName("unknown")])
+    assert bits == 2**3 + 2**17
+    assert list(index.ids_of(bits)) == [3, 17]
+    assert list(index.names_of(bits)) == [HostName("host3"), HostName("host17")]
+    assert index.bits([]) == 0
+
+
+def test_host_set() -> None:
+    index = HostIndex(_HOSTS)
+    hosts: Set[HostName] = HostSet(index, index.bits(_HOSTS[8:12]))
+
+    assert len(hosts) == 4
+    assert HostName("host8") in hosts
+    assert HostName("host12") not in hosts
+    assert HostName("unknown") not in hosts
+    assert hosts == set(_HOSTS[8:12])
+    assert set(_HOSTS[8:12]) == hosts
+    assert hosts & {HostName("host9"), HostName("host1")} == {HostName("host9")}
+    assert not HostSet(index, 0)
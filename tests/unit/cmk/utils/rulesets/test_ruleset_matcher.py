@@ -5,7 +5,8 @@
 
 # pylint: disable=protected-access
 
-from collections.abc import Mapping, Sequence
+import time
+from collections.abc import Callable, Mapping, Sequence
 from typing import Any
 
 import pytest
@@ -16,10 +17,14 @@ from tests.testlib.base import Scenario
 from cmk.utils.hostaddress import HostName
 from cmk.utils.rulesets.ruleset_matcher import (
     LabelManager,
+    matches_host_name,
+    matches_host_tags,
+    matches_labels,
     matches_tag_condition,
     RuleConditionsSpec,
     RulesetMatcher,
     RulesetMatchObject,
+    RulesetOptimizer,
     RuleSpec,
     TagCondition,
 )
@@ -859,3 +864,137 @@ def test_matches_tag_condition(
         )
         is expected_result
     )
+
+
+def _synthetic_config(
+    num_hosts: int,
+) -> tuple[
+    list[HostName],
+    dict[HostName, Mapping[TagGroupID, TagID]],
+    dict[HostName, str],
+    dict[HostName, Mapping[str, str]],
+]:
+    hosts = [HostName(f"host{n:06d}") for n in range(num_hosts)]
+    host_tags: dict[HostName, Mapping[TagGroupID, TagID]] = {
+        h: {
+            TagGroupID("criticality"): TagID(("prod", "test", "critical", "offline")[n % 4]),
+            TagGroupID("networking"): TagID(("lan", "wan", "dmz")[n % 3]),
+            TagGroupID("agent"): TagID("cmk-agent" if n % 5 else "no-agent"),
+            **({TagGroupID("snmp"): TagID("snmp")} if n % 5 == 0 else {}),
+        }
+        for n, h in enumerate(hosts)
+    }
+    host_paths = {h: f"/wato/dc{n % 10}/rack{n % 100}/hosts.mk" for n, h in enumerate(hosts)}
+    host_labels: dict[HostName, Mapping[str, str]] = {
+        h: {"os": ("linux", "windows", "aix")[n % 3], "env": ("prod", "dev")[n % 2]}
+        for n, h in enumerate(hosts)
+    }
+    return hosts, host_tags, host_paths, host_labels
+
+
+_SYNTHETIC_RULES: Sequence[RuleConditionsSpec] = [
+    {},
+    {"host_tags": {TagGroupID("criticality"): TagID("prod")}},
+    {
+        "host_tags": {
+            TagGroupID("criticality"): {"$ne": TagID("offline")},
+            TagGroupID("networking"): {"$or": [TagID("lan"), TagID("dmz")]},
+        },
+        "host_folder": "/wato/dc3/",
+    },
+    {
+        "host_tags": {TagGroupID("snmp"): TagID("snmp"), TagGroupID("agent"): TagID("no-agent")},
+        "host_label_groups": [("and", [("and", "os:linux"), ("or", "os:aix")])],
+    },
+    {
+        "host_tags": {TagGroupID("networking"): {"$nor": [TagID("wan")]}},
+        "host_label_groups": [("and", [("and", "env:prod")]), ("not", [("and", "os:windows")])],
+    },
+    {"host_name": [HostName("host000042"), HostName("host099999"), HostName("unknown")]},
+    {
+        "host_name": {"$nor": [HostName("host000001"), HostName("host000002")]},
+        "host_folder": "/wato/dc1/rack11/",
+    },
+    {
+        "host_tags": {TagGroupID("criticality"): TagID("critical")},
+        "host_name": [{"$regex": "host0[0-4]"}],
+    },
+    {"host_name": []},
+]
+
+
+def _matches_reference(
+    condition: RuleConditionsSpec,
+    hostname: HostName,
+    host_tags: Mapping[HostName, Mapping[TagGroupID, TagID]],
+    host_paths: Mapping[HostName, str],
+    host_labels: Mapping[HostName, Mapping[str, str]],
+) -> bool:
+    """Evaluates the condition for a single host, like the optimizer used to do"""
+    return (
+        host_paths[hostname].startswith(condition.get("host_folder", "/"))
+        and matches_host_tags(set(host_tags[hostname].items()), condition.get("host_tags", {}))
+        and matches_labels(host_labels[hostname], condition.get("host_label_groups", []))
+        and matches_host_name(condition.get("host_name"), hostname)
+    )
+
+
+def _synthetic_matcher(
+    num_hosts: int, monkeypatch: MonkeyPatch
+) -> tuple[RulesetMatcher, Sequence[RuleSpec[int]], dict[HostName, list[int]]]:
+    hosts, host_tags, host_paths, host_labels = _synthetic_config(num_hosts)
+    monkeypatch.setattr(RulesetOptimizer, "_discovered_labels_of_host", lambda *args: {})
+    monkeypatch.setattr(RulesetOptimizer, "_builtin_labels_of_host", lambda *args: {})
+    matcher = RulesetMatcher(
+        host_tags=dict(host_tags),
+        host_paths=host_paths,
+        label_manager=LabelManager(
+            explicit_host_labels=host_labels,
+            host_label_rules=(),
+            service_label_rules=(),
+            discovered_labels_of_service=lambda *args, **kw: {},
+        ),
+        all_configured_hosts=hosts,
+        clusters_of={},
+        nodes_of={},
+    )
+    ruleset: Sequence[RuleSpec[int]] = [
+        {"id": str(n), "value": n, "condition": condition}
+        for n, condition in enumerate(_SYNTHETIC_RULES)
+    ]
+    expected: dict[HostName, list[int]] = {}
+    for rule in ruleset:
+        for hostname in hosts:
+            if _matches_reference(rule["condition"], hostname, host_tags, host_paths, host_labels):
+                expected.setdefault(hostname, []).append(rule["value"])
+    return matcher, ruleset, expected
+
+
+def test_ruleset_optimizer_synthetic_hosts(monkeypatch: MonkeyPatch) -> None:
+    matcher, ruleset, expected = _synthetic_matcher(500, monkeypatch)
+    host = HostName("host000042")
+
+    assert (
+        matcher.ruleset_optimizer.get_host_ruleset(ruleset, with_foreign_hosts=False) == expected
+    )
+    assert list(matcher.get_host_values(host, ruleset)) == expected[host]
+
+    service_ruleset = matcher.ruleset_optimizer.get_service_ruleset(ruleset, False)
+    assert [host in hosts for _id, _v, hosts, *_rest in service_ruleset] == [
+        v in expected[host] for v in range(len(ruleset))
+    ]
+
+
+@pytest.mark.slow
+def test_ruleset_optimizer_synthetic_100k_hosts_benchmark(
+    monkeypatch: MonkeyPatch, record_property: Callable[[str, object], None]
+) -> None:
+    before = time.perf_counter()
+    matcher, ruleset, expected = _synthetic_matcher(100000, monkeypatch)
+    record_property("duration_setup_and_reference", time.perf_counter() - before)
+
+    before = time.perf_counter()
+    host_ruleset = matcher.ruleset_optimizer.get_host_ruleset(ruleset, with_foreign_hosts=False)
+    record_property("duration_compiled", time.perf_counter() - before)
+
+    assert host_ruleset == expected
@@ -7,11 +7,16 @@
 
 # pylint: disable=redefined-outer-name
 
+import ast
 import errno
+import json
+import os
 import socket
 import ssl
-from collections.abc import Sequence
-from contextlib import closing
+import threading
+import time
+from collections.abc import Callable, Iterator, Sequence
+from contextlib import closing, suppress
 from pathlib import Path
 
 import pytest
@@ -19,6 +24,9 @@ from pytest import MonkeyPatch
 
 import livestatus
 
+import cmk.livestatus_client
+from cmk.livestatus_client import _RowParser
+
 # FIXME: Somehow tools disagree about the order...
 from omdlib.certs import CertificateAuthority  # pylint: disable=wrong-import-order
 
@@ -341,3 +349,447 @@ def test_livestatus_lql(
     result: str,
 ) -> None:
     assert livestatus.livestatus_lql(*args) == result
+
+
+_ROWS = [["heute", 0, 1.5, ["a", "b"], "x\ny"], ["gestern", 1, -1.0, [], "ä,]"]]
+
+
+@pytest.mark.parametrize(
+    "body, parse",
+    [
+        (
+            ("[" + ",\n".join(json.dumps(row) for row in _ROWS) + "]\n").encode("utf-8"),
+            json.loads,
+        ),
+        (("[" + ",\n".join(repr(row) for row in _ROWS) + "]\n").encode("utf-8"), ast.literal_eval),
+        (repr(_ROWS).encode("utf-8"), ast.literal_eval),
+        (b"[]\n", json.loads),
+    ],
+)
+def test_row_parser(body: bytes, parse: Callable[[str], object]) -> None:
+    expected = parse(body.decode("utf-8"))
+    for chunk_size in (1, 7, len(body)):
+        parser = _RowParser(parse)
+        rows = []
+        for start in range(0, len(body), chunk_size):
+            rows += parser.feed(body[start : start + chunk_size])
+        rows += parser.close()
+        assert rows == expected
+
+
+@pytest.mark.parametrize("body", [b'[["a"],\n["b"]', b'["a"]]\n', b'[["a"]]\n["b"]\n'])
+def test_row_parser_malformed(body: bytes) -> None:
+    parser = _RowParser(json.loads)
+    with pytest.raises(livestatus.MKLivestatusQueryError):
+        parser.feed(body)
+        parser.close()
+
+
+def _response(rows: list[list[object]]) -> list[bytes]:
+    """The header and the lines of a python3 response, as the core renders them"""
+    lines = [repr(row).encode("utf-8") + b",\n" for row in rows]
+    lines[0] = b"[" + lines[0]
+    lines[-1] = lines[-1][:-2] + b"]\n"
+    return [b"200 %11d\n" % sum(len(line) for line in lines), *lines]
+
+
+def _serve_livestatus(path: Path, *chunks: bytes | threading.Event) -> threading.Thread:
+    """Answer one query with the given chunks, waiting for the events in between"""
+    server = socket.socket(socket.AF_UNIX)
+    server.bind(str(path))
+    server.listen(1)
+
+    def serve() -> None:
+        with closing(server), closing(server.accept()[0]) as connection:
+            query = b""
+            while not query.endswith(b"\n\n"):
+                query += connection.recv(4096)
+            for chunk in chunks:
+                if isinstance(chunk, threading.Event):
+                    chunk.wait(10)
+                else:
+                    connection.sendall(chunk)
+
+    thread = threading.Thread(target=serve, daemon=True)
+    thread.start()
+    return thread
+
+
+def test_query_stream(tmp_path: Path) -> None:
+    slow_rows = [[f"slow{n}", n] for n in range(3)]
+    fast_rows = [["fast", 1], ["fast", 2]]
+    fast_received = threading.Event()
+    first_slow_row_received = threading.Event()
+    slow_header, *slow_lines = _response(slow_rows)
+    servers = [
+        _serve_livestatus(
+            tmp_path / "slow",
+            slow_header,
+            fast_received,
+            slow_lines[0],
+            first_slow_row_received,
+            *slow_lines[1:],
+        ),
+        _serve_livestatus(tmp_path / "fast", b"".join(_response(fast_rows))),
+    ]
+    live = livestatus.MultiSiteConnection(
+        livestatus.SiteConfigurations(
+            {
+                livestatus.SiteId("slow"): {"socket": f"unix:{tmp_path / 'slow'}", "timeout": 5},
+                livestatus.SiteId("fast"): {"socket": f"unix:{tmp_path / 'fast'}", "timeout": 5},
+            }
+        )
+    )
+    live.set_prepend_site(True)
+
+    batches = []
+    for site_id, rows in live.query_stream("GET services\nColumns: description state\n"):
+        batches.append((site_id, rows))
+        (fast_received if site_id == "fast" else first_slow_row_received).set()
+
+    for server in servers:
+        server.join(10)
+    assert batches[0] == ("fast", [["fast", *row] for row in fast_rows])
+    # The slow site only continues once its first row has been received.
+    assert batches[1] == ("slow", [["slow", *slow_rows[0]]])
+    assert [row for _site_id, rows in batches[2:] for row in rows] == [
+        ["slow", *row] for row in slow_rows[1:]
+    ]
+    assert sorted(live.alive_sites()) == ["fast", "slow"]
+    assert not live.dead_sites()
+
+
+def test_query_stream_site_timeout(tmp_path: Path) -> None:
+    hanging = threading.Event()
+    servers = [
+        _serve_livestatus(tmp_path / "hanging", hanging),
+        _serve_livestatus(tmp_path / "fast", *_response([["fast"]])),
+    ]
+    live = livestatus.MultiSiteConnection(
+        livestatus.SiteConfigurations(
+            {
+                livestatus.SiteId("hanging"): {
+                    "socket": f"unix:{tmp_path / 'hanging'}",
+                    "timeout": 1,
+                },
+                livestatus.SiteId("fast"): {"socket": f"unix:{tmp_path / 'fast'}", "timeout": 5},
+            }
+        )
+    )
+
+    try:
+        assert list(live.query_stream("GET hosts\nColumns: name\n")) == [("fast", [["fast"]])]
+    finally:
+        hanging.set()
+        for server in servers:
+            server.join(10)
+    assert live.alive_sites() == ["fast"]
+    assert "Timeout" in str(live.dead_sites()[livestatus.SiteId("hanging")]["exception"])
+
+
+class _LivestatusServer:
+    """Answers the queries on kept alive connections with their first line"""
+
+    def __init__(self, path: Path) -> None:
+        self.socketurl = f"unix:{path}"
+        self.num_connections = 0
+        self._connections: list[socket.socket] = []
+        self._server = socket.socket(socket.AF_UNIX)
+        self._server.bind(str(path))
+        self._server.listen(8)
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self) -> None:
+        while True:
+            try:
+                connection = self._server.accept()[0]
+            except OSError:
+                return
+            self.num_connections += 1
+            self._connections.append(connection)
+            threading.Thread(target=self._serve, args=(connection,), daemon=True).start()
+
+    def _serve(self, connection: socket.socket) -> None:
+        with closing(connection), suppress(OSError):
+            received = b""
+            while data := connection.recv(4096):
+                received += data
+                while b"\n\n" in received:
+                    request, received = received.split(b"\n\n", 1)
+                    first_line = request.split(b"\n", 1)[0].decode("utf-8")
+                    if first_line == "GET unknown":
+                        code, body = 404, b"Table 'unknown' does not exist."
+                    else:
+                        code, body = 200, repr([[first_line]]).encode("utf-8") + b"\n"
+                    connection.sendall(b"%3d %11d\n" % (code, len(body)) + body)
+
+    def close_connections(self) -> None:
+        for connection in self._connections:
+            with suppress(OSError):
+                connection.shutdown(socket.SHUT_RDWR)
+
+    def close(self) -> None:
+        self._server.close()
+        self.close_connections()
+
+
+@pytest.fixture(name="livestatus_server")
+def fixture_livestatus_server(tmp_path: Path) -> Iterator[_LivestatusServer]:
+    server = _LivestatusServer(tmp_path / "live")
+    yield server
+    server.close()
+
+
+@pytest.fixture(name="pool")
+def fixture_pool(monkeypatch: MonkeyPatch) -> Iterator[livestatus.ConnectionPool]:
+    pool = livestatus.ConnectionPool(max_idle=2)
+    monkeypatch.setattr(cmk.livestatus_client, "connection_pool", pool)
+    yield pool
+    pool.clear()
+
+
+def _query_once(
+    server: _LivestatusServer, query: str = "GET hosts"
+) -> livestatus.LivestatusResponse:
+    live = livestatus.SingleSiteConnection(server.socketurl, persist=True)
+    try:
+        return live.query(query)
+    finally:
+        live.disconnect()
+
+
+def test_connection_pool_reuses_connections(
+    livestatus_server: _LivestatusServer, pool: livestatus.ConnectionPool
+) -> None:
+    for _run in range(3):
+        assert _query_once(livestatus_server) == [["GET hosts"]]
+
+    assert livestatus_server.num_connections == 1
+    assert pool.stats() == {
+        livestatus_server.socketurl: livestatus.ConnectionPoolStats(
+            idle=1, in_use=0, created=1, reused=2, returned=3
+        )
+    }
+
+
+def test_connection_pool_not_persisted(
+    livestatus_server: _LivestatusServer, pool: livestatus.ConnectionPool
+) -> None:
+    for _run in range(2):
+        live = livestatus.SingleSiteConnection(livestatus_server.socketurl)
+        assert live.query("GET hosts") == [["GET hosts"]]
+        live.disconnect()
+
+    assert livestatus_server.num_connections == 2
+    assert not pool.stats()
+
+
+def test_connection_pool_health_check(
+    livestatus_server: _LivestatusServer, pool: livestatus.ConnectionPool
+) -> None:
+    _query_once(livestatus_server)
+    livestatus_server.close_connections()
+    assert _query_once(livestatus_server) == [["GET hosts"]]
+
+    stats = pool.stats()[livestatus_server.socketurl]
+    assert (stats.created, stats.reused, stats.unhealthy, stats.idle) == (2, 0, 1, 1)
+
+
+def test_connection_pool_idle_eviction(
+    livestatus_server: _LivestatusServer, pool: livestatus.ConnectionPool
+) -> None:
+    _query_once(livestatus_server)
+    pool.max_idle_time = 0.0
+    pool.evict_idle()
+
+    stats = pool.stats()[livestatus_server.socketurl]
+    assert (stats.idle, stats.evicted) == (0, 1)
+
+
+def test_connection_pool_max_idle(
+    livestatus_server: _LivestatusServer, pool: livestatus.ConnectionPool
+) -> None:
+    connections = [
+        livestatus.SingleSiteConnection(livestatus_server.socketurl, persist=True)
+        for _n in range(3)
+    ]
+    for live in connections:
+        live.connect()
+    assert pool.stats()[livestatus_server.socketurl].in_use == 3
+    for live in connections:
+        live.disconnect()
+
+    stats = pool.stats()[livestatus_server.socketurl]
+    assert (stats.in_use, stats.idle, stats.discarded) == (0, 2, 1)
+
+
+def test_connection_with_pending_response_is_not_pooled(
+    livestatus_server: _LivestatusServer, pool: livestatus.ConnectionPool
+) -> None:
+    live = livestatus.SingleSiteConnection(livestatus_server.socketurl, persist=True)
+    live.send_query("GET hosts")
+    live.disconnect()
+
+    stats = pool.stats()[livestatus_server.socketurl]
+    assert (stats.in_use, stats.idle, stats.returned) == (0, 0, 0)
+
+
+def test_query_pipelined(
+    livestatus_server: _LivestatusServer, pool: livestatus.ConnectionPool
+) -> None:
+    live = livestatus.SingleSiteConnection(livestatus_server.socketurl, persist=True)
+    live.set_prepend_site(True)
+    assert live.query_pipelined(["GET hosts", "GET services", "GET status"]) == [
+        [[b"", "GET hosts"]],
+        [[b"", "GET services"]],
+        [[b"", "GET status"]],
+    ]
+    assert live.query_pipelined([]) == []
+
+    with pytest.raises(livestatus.MKLivestatusTableNotFoundError):
+        live.query_pipelined(["GET hosts", "GET unknown", "GET status"])
+    # All responses have been read, the connection can still be used.
+    assert live.query("GET contacts") == [[b"", "GET contacts"]]
+    live.disconnect()
+
+    assert livestatus_server.num_connections == 1
+    assert pool.stats()[livestatus_server.socketurl].idle == 1
+
+    live = livestatus.SingleSiteConnection(livestatus_server.socketurl, persist=True)
+    live.set_prepend_site(True)
+    with pytest.raises(livestatus.MKLivestatusSocketError):
+        live.query_pipelined(
+            ["GET hosts", livestatus.Query("GET unknown", suppress_exceptions=())]
+        )
+    assert live.query("GET contacts") == [[b"", "GET contacts"]]
+    live.disconnect()
+
+
+@pytest.mark.filterwarnings("ignore:This process .* is multi-threaded:DeprecationWarning")
+def test_connection_pool_is_reset_in_forked_child(
+    livestatus_server: _LivestatusServer, pool: livestatus.ConnectionPool
+) -> None:
+    _query_once(livestatus_server)
+    assert pool.stats()[livestatus_server.socketurl].idle == 1
+
+    if (pid := os.fork()) == 0:
+        os._exit(0 if not pool.stats() and not pool._idle else 1)
+    _pid, status = os.waitpid(pid, 0)
+    assert os.waitstatus_to_exitcode(status) == 0
+
+    # The parent still uses its connection
+    assert _query_once(livestatus_server) == [["GET hosts"]]
+    assert livestatus_server.num_connections == 1
+
+
+def _render_python3(value: object) -> str:
+    """Render a value like the python3 renderer of the core does"""
+    if value is None:
+        return "None"
+    if isinstance(value, str):
+        return (
+            '"'
+            + "".join(
+                c if 32 <= ord(c) <= 127 and c not in '"\\' else "\\u%04x" % ord(c) for c in value
+            )
+            + '"'
+        )
+    if isinstance(value, list):
+        return "[" + ",".join(_render_python3(v) for v in value) + "]"
+    return repr(value)
+
+
+def _services_response(num_rows: int) -> bytes:
+    rows = [
+        [
+            f"host{n // 40:05}",
+            f"Interface {n % 40}",
+            n % 4,
+            1,
+            1700000000 + n,
+            0.25 * n,
+            f'OK - In: {n} B/s, Out: {2 * n} B/s, Speed: "None"\nSee details',
+            ["network", "switches"],
+            None if n % 7 else 3,
+        ]
+        for n in range(num_rows)
+    ]
+    return ("[" + ",\n".join(_render_python3(row) for row in rows) + "]\n").encode("utf-8")
+
+
+_UNESCAPED_STRINGS = ("äöü", "日本語", "😀")
+
+_SPECIAL_STRINGS = [
+    "",
+    "None",
+    "äöü € 日本語",
+    'say "None"',
+    "tab\there, new\nline",
+    "back\\slash\\",
+    "\x00\x1f\x7f",
+    "😀",
+]
+
+
+@pytest.mark.parametrize(
+    "raw_response",
+    [
+        _services_response(2000),
+        _render_python3([[s, None, len(s), [s, None]] for s in _SPECIAL_STRINGS]).encode("utf-8"),
+        # Not escaped by the core, but possible in the python3 syntax
+        ("[" + ",".join(f"[{s!r},None]" for s in _SPECIAL_STRINGS) + "]").encode("utf-8"),
+        ("[" + ",".join(f'["{s}",None]' for s in _UNESCAPED_STRINGS) + "]").encode("utf-8"),
+        b'[["say \\"None\\"",None,"\\\\",None]]',
+        b'[["\\ud83d\\ude00",None]]',
+        b"[[-1.5e-3,1e+10,-0,12345678901234567890,[],[[1,None]]]]",
+    ],
+)
+def test_parse_python3_response_matches_literal_eval(raw_response: bytes) -> None:
+    live = livestatus.SingleSiteConnection("unix:/tmp/live")
+    query = livestatus.Query("GET services\nColumns: host_name description state\n")
+    response = live.parse_raw_response(raw_response, query)
+    expected = ast.literal_eval(raw_response.decode("utf-8"))
+    assert response == expected
+    assert [[type(v) for v in row] for row in response] == [
+        [type(v) for v in row] for row in expected
+    ]
+
+
+@pytest.mark.slow
+def test_parse_python3_response_benchmark(record_property: Callable[[str, object], None]) -> None:
+    live = livestatus.SingleSiteConnection("unix:/tmp/live")
+    query = livestatus.Query("GET services\nColumns: host_name description state\n")
+    raw_response = _services_response(20000)
+
+    before = time.perf_counter()
+    expected = ast.literal_eval(raw_response.decode("utf-8"))
+    record_property("duration_literal_eval", time.perf_counter() - before)
+
+    before = time.perf_counter()
+    response = live.parse_raw_response(raw_response, query)
+    record_property("duration_parse_raw_response", time.perf_counter() - before)
+
+    assert response == expected
+
+
+@pytest.mark.parametrize(
+    "raw_response",
+    [
+        b'[[b"\\x00\\xff",None]]\n',
+        b'[["\\U0001f600"]]\n',
+        b"[['single', 'quoted', None]]",
+        b'[["it\'s"]]',
+    ],
+)
+def test_parse_python3_response_fallback(raw_response: bytes) -> None:
+    live = livestatus.SingleSiteConnection("unix:/tmp/live")
+    assert live.parse_raw_response(raw_response, livestatus.Query("GET hosts")) == (
+        ast.literal_eval(raw_response.decode("utf-8"))
+    )
+
+
+@pytest.mark.parametrize("raw_response", [b"[[inf]]", b"[[NaN]]", b"[[None"])
+def test_parse_python3_response_malformed(raw_response: bytes) -> None:
+    live = livestatus.SingleSiteConnection("unix:/tmp/live")
+    with pytest.raises(livestatus.MKLivestatusQueryError):
+        live.parse_raw_response(raw_response, livestatus.Query("GET hosts"))